@@ -0,0 +1,181 @@
+# Copyright 2014, Oliver Nagy <olitheolix@gmail.com>
+#
+# This file is part of Azrael (https://github.com/olitheolix/azrael)
+#
+# Azrael is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# Azrael is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with Azrael. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Asyncio version of ``Client``.
+
+``AsyncClient`` has the same methods as ``Client`` but they return
+awaitables instead of blocking until Clerk replies. It uses a DEALER socket
+and prefixes every request with a unique request ID, which Clerk returns
+with the reply. This allows arbitrarily many requests to be in flight at
+once, eg. to control thousands of objects from a single process::
+
+    client = AsyncClient()
+    rets = await asyncio.gather(*[client.getStateVariables(_) for _ in IDs])
+
+This module requires ``zmq.asyncio`` (pyzmq 15 or later).
+"""
+import zmq
+import asyncio
+import itertools
+import zmq.asyncio
+
+import azrael.client
+import azrael.config as config
+import azrael.protocol_json as json
+
+from azrael.util import RetVal
+from azrael.typecheck import typecheck
+
+
+class AsyncClient(azrael.client.Client):
+    """
+    Asyncio version of ``Client``.
+
+    All instances must be used from the same event loop.
+
+    :param str addr: Address of Clerk.
+    """
+    @typecheck
+    def __init__(self, addr_clerk: str=config.addr_clerk):
+        super().__init__(addr_clerk)
+
+        # Replace the blocking REQ socket with an asynchronous DEALER socket.
+        self.sock_cmd.close(linger=0)
+        self.ctx.term()
+        self.ctx = zmq.asyncio.Context()
+        self.sock_cmd = self.ctx.socket(zmq.DEALER)
+        self.sock_cmd.linger = 0
+        self.sock_cmd.connect(addr_clerk)
+
+        # The futures of all requests in flight (keyed by request ID), and
+        # the task that reads the replies.
+        self.pending = {}
+        self.reqIDs = itertools.count()
+        self.reader = None
+
+    def close(self):
+        """
+        Cancel all requests in flight and close the socket.
+        """
+        if self.reader is not None:
+            self.reader.cancel()
+            self.reader = None
+        for future in self.pending.values():
+            future.cancel()
+        self.pending.clear()
+        if self.sock_cmd is not None:
+            self.sock_cmd.close(linger=0)
+            self.sock_cmd = None
+
+    async def readReplies(self):
+        """
+        Resolve the futures of the requests in flight with their replies.
+
+        This coroutine returns once there are no more requests in flight.
+        """
+        while len(self.pending) > 0:
+            frames = await self.sock_cmd.recv_multipart()
+            if len(frames) != 3 or frames[1] != b'':
+                self.logit.warning('Invalid reply from Clerk')
+                continue
+            future = self.pending.pop(frames[0], None)
+            if (future is not None) and not future.done():
+                future.set_result(frames[2].decode('utf8'))
+
+    @typecheck
+    async def sendToClerk(self, cmd: str, data: dict):
+        """
+        Send data to Clerk and return the response.
+
+        See ``Client.sendToClerk``.
+
+        :param str cmd: command word
+        :param dict data: payload (must be JSON encodeable)
+        :return: Payload data in whatever form it arrives.
+        :rtype: any
+        """
+        try:
+            payload = json.dumps({'cmd': cmd, 'payload': data})
+        except (ValueError, TypeError) as err:
+            return RetVal(False, 'JSON encoding error', None)
+
+        # Register the request and send it to Clerk.
+        reqID = next(self.reqIDs).to_bytes(8, 'little')
+        future = asyncio.Future()
+        self.pending[reqID] = future
+        try:
+            await self.sock_cmd.send_multipart(
+                [reqID, b'', payload.encode('utf8')])
+
+            # Start reading replies unless another request already does.
+            if (self.reader is None) or self.reader.done():
+                self.reader = asyncio.ensure_future(self.readReplies())
+            payload = await future
+        finally:
+            self.pending.pop(reqID, None)
+        return self.parseReply(payload)
+
+    @typecheck
+    async def serialiseAndSend(self, cmd: str, *args):
+        """
+        Serialise ``args``, send it to Clerk, and return de-serialised reply.
+
+        See ``Client.serialiseAndSend``.
+
+        :param str cmd: name of command.
+        :return: deserialised reply.
+        :rtype: any
+        """
+        # Sanity checks.
+        assert cmd in self.codec
+
+        # Convenience.
+        ToClerk_Encode, FromClerk_Decode = self.codec[cmd]
+
+        # Encode the arguments and send them to Clerk.
+        ok, data = ToClerk_Encode(*args)
+        if not ok:
+            return RetVal(False, 'Protocol error', None)
+        ret = await self.sendToClerk(cmd, data)
+        if not ret.ok:
+            return ret
+
+        # Command completed without error. Return the decode output.
+        return FromClerk_Decode(ret.data)
+
+    async def addTemplates(self, templates: list):
+        """
+        See ``Client.addTemplates``.
+        """
+        # The parent method returns a coroutine, unless the templates are
+        # invalid.
+        ret = super().addTemplates(templates)
+        if asyncio.iscoroutine(ret):
+            ret = await ret
+        return ret
+
+    @typecheck
+    async def batch(self, cmds: (list, tuple)):
+        """
+        See ``Client.batch``.
+        """
+        ret = self.encodeBatch(cmds)
+        if not ret.ok:
+            return ret
+        ret = await self.sendToClerk('batch', ret.data)
+        return self.decodeBatch(cmds, ret)
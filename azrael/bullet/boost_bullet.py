@@ -17,6 +17,7 @@
 
 import sys
 import logging
+import collections
 import IPython
 import azrael.util
 
@@ -38,6 +39,54 @@ BulletData = bullet_data.BulletData
 _BulletData = bullet_data._BulletData
 RetVal = azrael.util.RetVal
 
+# Number of collision filter groups for resident objects. Bullet stores the
+# filter masks as signed 16 Bit integers.
+NUM_FILTER_GROUPS = 15
+
+
+@typecheck
+def assignFilterGroups(collSets: (tuple, list), current: dict):
+    """
+    Return the collision filter group for every object in ``collSets``.
+
+    Every group is a single bit. The objects of a set share a group, and no
+    two sets share one unless there are more than ``NUM_FILTER_GROUPS``
+    sets. In that case the sets are spread evenly over all groups, and the
+    objects of sets in the same group can collide.
+
+    Bullet can only change the group of an object by re-adding it to the
+    world. Every set therefore keeps the ``current`` group of most of its
+    objects, unless a larger set already has it.
+
+    :param list collSets: list of collision sets (lists of objIDs).
+    :param dict current: {objID: group} of the objects in the world.
+    :return: {objID: group}
+    :rtype: dict
+    """
+    collSets = [_ for _ in collSets if len(_) > 0]
+    order = sorted(range(len(collSets)), key=lambda _: -len(collSets[_]))
+    numSets = {1 << _: 0 for _ in range(NUM_FILTER_GROUPS)}
+
+    # Let the sets keep their current group if it is still available.
+    setGroup = {}
+    for idx in order:
+        votes = collections.Counter(
+            [current[_] for _ in collSets[idx] if _ in current])
+        for group, _ in votes.most_common():
+            if numSets.get(group, None) == 0:
+                setGroup[idx] = group
+                numSets[group] = 1
+                break
+
+    # Assign the least used group to all other sets.
+    for idx in order:
+        if idx not in setGroup:
+            group = min(numSets, key=numSets.get)
+            setGroup[idx] = group
+            numSets[group] += 1
+    return {objID: setGroup[idx]
+            for idx, subset in enumerate(collSets) for objID in subset}
+
 
 class PyBulletPhys():
     """
@@ -79,6 +128,17 @@ class PyBulletPhys():
         self.motion_states = {}
         self.collision_shapes = {}
 
+        # Shared collision shapes. Every entry is a dictionary with the
+        # 'shape', its 'inertia' for unit mass, and the number of bodies
+        # ('refs') that use it. The ``shapeKeys`` map every objID to its
+        # cache entry.
+        self.shapeCache = {}
+        self.shapeKeys = {}
+
+        # The objects that currently reside in the Bullet world (see
+        # ``stepResident``), and their collision filter group.
+        self.resident = {}
+
     def removeObject(self, objIDs: (list, tuple)):
         """
         Remove ``objIDs`` from Bullet and return the number of removed objects.
@@ -96,10 +156,15 @@ class PyBulletPhys():
             if objID not in self.all_objs:
                 continue
 
+            # Remove the object from the world if it is resident.
+            if objID in self.resident:
+                self.dynamicsWorld.remove_rigidbody(self.all_objs[objID])
+                del self.resident[objID]
+
             # Delete the object from all caches.
             del self.all_objs[objID]
             del self.motion_states[objID]
-            del self.collision_shapes[objID]
+            self._releaseCollisionShape(objID)
             cnt += 1
 
         # Return the total number of removed objects.
@@ -120,6 +185,10 @@ class PyBulletPhys():
         :param int max_substeps: maximum number of sub-steps.
         :return: Success
         """
+        # This method must not mix with ``stepResident``.
+        if len(self.resident) > 0:
+            return RetVal(False, 'World contains resident objects', None)
+
         # Add the objects from the cache to the Bullet simulation.
         for objID in objIDs:
             # Abort immediately if the object does not exist in the local
@@ -146,6 +215,70 @@ class PyBulletPhys():
             self.dynamicsWorld.remove_rigidbody(self.all_objs[objID])
         return RetVal(True, None, None)
 
+    @typecheck
+    def stepResident(self, collSets: (tuple, list), dt: (int, float),
+                     max_substeps: int):
+        """
+        Step all objects in all ``collSets`` by ``dt`` in a persistent world.
+
+        Unlike ``compute``, the objects remain in the Bullet world after the
+        step. This preserves the broadphase pair cache of Bullet and avoids
+        rebuilding it every time.
+
+        Collision filter groups keep the collision sets apart (see
+        ``assignFilterGroups``). Objects only need to be re-added to the world
+        if their group changes, or if they were not in the world before.
+        Objects not in any set leave the world (but not the engine).
+
+        Bullet has only ``NUM_FILTER_GROUPS`` groups. If there are more sets
+        then some must share a group, and their objects can collide during
+        the step. The broadphase only separates sets whose AABBs do not
+        overlap, so this requires objects that move further than the gap
+        between their sets within a single step.
+
+        This method aborts immediately if one or more objIDs do not exist.
+
+        :param list collSets: list of collision sets (lists of objIDs).
+        :param float dt: time step in seconds
+        :param int max_substeps: maximum number of sub-steps.
+        :return: Success
+        """
+        # Determine the filter group for every object.
+        groups = assignFilterGroups(collSets, self.resident)
+
+        # Abort immediately if one or more objects do not exist.
+        for objID in groups:
+            if objID not in self.all_objs:
+                msg = 'Object <{}> does not exist'.format(objID)
+                return RetVal(False, msg, None)
+
+        # Remove all objects from the world that are not part of any set
+        # anymore, or whose filter group has changed.
+        for objID, group in list(self.resident.items()):
+            if groups.get(objID, None) != group:
+                self.dynamicsWorld.remove_rigidbody(self.all_objs[objID])
+                del self.resident[objID]
+
+        # Add the new objects to the world and activate them, as Bullet may
+        # otherwise decide to simply set their velocity to zero and ignore
+        # them. Resident objects wake up by themselves once they are touched.
+        for objID, group in groups.items():
+            if objID in self.resident:
+                continue
+            obj = self.all_objs[objID]
+            try:
+                self.dynamicsWorld.add_rigid_body(obj, group, group)
+            except TypeError:
+                # Boost.Python raises an ArgumentError (a TypeError) if the
+                # bindings lack the overload with filter group and mask.
+                msg = 'Bullet bindings do not support collision filters'
+                return RetVal(False, msg, None)
+            obj.activate()
+            self.resident[objID] = group
+
+        self.dynamicsWorld.step_simulation(dt, max_substeps)
+        return RetVal(True, None, None)
+
     def applyForceAndTorque(self, objID, force, torque):
         """
         Apply a ``force`` and ``torque`` to the center of mass of ``objID``.
@@ -172,6 +305,50 @@ class PyBulletPhys():
         obj.clear_forces()
         obj.apply_central_force(b_force)
         obj.apply_torque(b_torque)
+
+        # Wake the object up in case it was asleep.
+        obj.activate()
+        return RetVal(True, None, None)
+
+    def applyForceAndTorqueBatch(self, objIDs: (list, tuple),
+                                 force: np.ndarray, torque: np.ndarray):
+        """
+        Apply the ``force`` and ``torque`` rows to the center of mass of the
+        corresponding ``objIDs``.
+
+        This is the batch version of ``applyForceAndTorque`` for the N x 3
+        'force' and 'torque' columns of Leonard's object store. The Boost
+        bindings have no batch setter either, but this method converts the
+        arrays only once and skips the per-object sanity checks and return
+        values.
+
+        This method aborts immediately if one or more objects in ``objIDs`` do
+        not exist.
+
+        :param list objIDs: the IDs of all objects to update.
+        :param np.ndarray force: N x 3 forces.
+        :param np.ndarray torque: N x 3 torques.
+        :return: Success
+        """
+        if not (len(objIDs) == len(force) == len(torque)):
+            msg = 'objIDs, force, and torque have different length'
+            return RetVal(False, msg, None)
+
+        # Abort immediately if one or more objects don't exist.
+        all_objs = self.all_objs
+        for objID in objIDs:
+            if objID not in all_objs:
+                msg = 'Cannot set force of unknown object <{}>'.format(objID)
+                return RetVal(False, msg, None)
+
+        # Clear the pending forces, apply the new ones, and wake the objects
+        # up (see ``applyForceAndTorque``).
+        for objID, f, t in zip(objIDs, force.tolist(), torque.tolist()):
+            obj = all_objs[objID]
+            obj.clear_forces()
+            obj.apply_central_force(btVector3(*f))
+            obj.apply_torque(btVector3(*t))
+            obj.activate()
         return RetVal(True, None, None)
 
     def applyForce(self, objID: int, force, rel_pos):
@@ -254,6 +431,94 @@ class PyBulletPhys():
                             axesLockRot, 0))
         return RetVal(True, None, out[0])
 
+    def getObjectDataBatch(self, objIDs: (list, tuple), out=None):
+        """
+        Return the packed State Variables of all ``objIDs``.
+
+        Every row of the returned array contains the State Vector of one
+        object in the ``bullet_data.pack`` format. The optional ``out``
+        argument is a pre-allocated array with at least ``len(objIDs)`` rows.
+
+        The Boost bindings have no batch accessors. This method therefore
+        still queries every attribute of every object individually, but
+        avoids the intermediate ``_BulletData`` tuples of ``getObjectData``.
+
+        This method aborts immediately if one or more objects in ``objIDs`` do
+        not exist.
+
+        :param list objIDs: the IDs of all objects to retrieve.
+        :param np.ndarray out: (optional) output array.
+        :return: N x ``bullet_data.packedSize`` array.
+        :rtype: np.ndarray
+        """
+        # Abort immediately if one or more objects don't exist.
+        all_objs = self.all_objs
+        for objID in objIDs:
+            if objID not in all_objs:
+                msg = 'Cannot find object with ID <{}>'.format(objID)
+                return RetVal(False, msg, None)
+
+        # Allocate the output array if necessary.
+        if out is None:
+            out = np.zeros((len(objIDs), bullet_data.packedSize), np.float64)
+        else:
+            out = out[:len(objIDs)]
+
+        # Convenience.
+        sl = bullet_data._BulletDataSlices
+        col_scale, col_imass = sl['scale'].start, sl['imass'].start
+        col_rest, col_ts = sl['restitution'].start, sl['lastChanged'].start
+        rot, pos, cshape = sl['orientation'], sl['position'], sl['cshape']
+        vLin, vRot = sl['velocityLin'], sl['velocityRot']
+        lockLin, lockRot = sl['axesLockLin'], sl['axesLockRot']
+
+        # Copy the attributes of every object into its row.
+        for row, objID in zip(out, objIDs):
+            obj = all_objs[objID]
+            meta = obj.azrael[1]
+            trans = obj.get_center_of_mass_transform()
+            q, p = trans.get_rotation(), trans.get_origin()
+            v, w = obj.linear_velocity, obj.angular_velocity
+            fLin, fRot = obj.linear_factor, obj.angular_factor
+
+            row[col_scale] = meta.scale
+            row[col_imass] = obj.inv_mass
+            row[col_rest] = obj.restitution
+            row[rot] = (q.x, q.y, q.z, q.w)
+            row[pos] = (p.x, p.y, p.z)
+            row[vLin] = (v.x, v.y, v.z)
+            row[vRot] = (w.x, w.y, w.z)
+            row[cshape] = meta.cshape
+            row[lockLin] = (fLin.x, fLin.y, fLin.z)
+            row[lockRot] = (fRot.x, fRot.y, fRot.z)
+            row[col_ts] = 0
+        return RetVal(True, None, out)
+
+    def setObjectDataBatch(self, objIDs: (list, tuple), data: np.ndarray):
+        """
+        Update the State Variables of all ``objIDs`` with the packed ``data``.
+
+        Every row of ``data`` contains the State Vector of one object in the
+        ``bullet_data.pack`` format. New objects are created automatically.
+
+        :param list objIDs: the IDs of all objects to update.
+        :param np.ndarray data: N x ``bullet_data.packedSize`` array.
+        :return: Success
+        """
+        if len(objIDs) != len(data):
+            return RetVal(False, 'objIDs and data have different length', None)
+
+        # Convert the data to Python lists in one go and assemble the
+        # ``_BulletData`` tuples from the row slices.
+        sl = bullet_data._BulletDataSlices
+        slices = [sl[_] for _ in _BulletData._fields]
+        for objID, row in zip(objIDs, data.tolist()):
+            fields = [row[_] for _ in slices]
+            fields = [_[0] if len(_) == 1 else _ for _ in fields]
+            fields[-1] = int(fields[-1])
+            self._setObjectData(objID, _BulletData(*fields))
+        return RetVal(True, None, None)
+
     @typecheck
     def setObjectData(self, objID: int, obj: _BulletData):
         """
@@ -265,6 +530,12 @@ class PyBulletPhys():
         :param ``_BulletData`` obj: object description.
         :return: Success
         """
+        return self._setObjectData(objID, obj)
+
+    def _setObjectData(self, objID: int, obj: _BulletData):
+        """
+        Same as ``setObjectData`` but without the type checks.
+        """
         # Create the Rigid Body if it does not yet exist.
         if objID not in self.all_objs:
             self.createRigidBody(objID, obj)
@@ -311,8 +582,10 @@ class PyBulletPhys():
         # Apply the new mass and inertia.
         body.set_mass_props(m, i)
 
-        # Overwrite the old BulletData instance with the latest version.
+        # Overwrite the old BulletData instance with the latest version, and
+        # wake the object up in case it was asleep.
         body.azrael = (objID, obj)
+        body.activate()
         return RetVal(True, None, None)
 
     @typecheck
@@ -320,33 +593,79 @@ class PyBulletPhys():
         """
         Return the correct Bullet collision shape based on ``obj``.
 
-        This is a convenience method only.
+        All bodies with the same shape type, dimensions, and scale share the
+        same collision shape. The cache creates it on demand and releases it
+        once no body uses it anymore. If ``objID`` previously used a
+        different shape then this method releases it.
 
         :param int objID: object ID.
         :param _BulletData obj: Azrael's meta data that describes the body.
         :return: Bullet collision shape.
         """
-        # Instantiate a new collision shape.
+        # Determine the cache key.
         if obj.cshape[0] == 3:
-            # Sphere.
-            cshape = pybullet.btSphereShape(obj.scale)
+            key = (3, float(obj.scale))
         elif obj.cshape[0] == 4:
-            # Prism.
-            w, h, l = obj.scale * np.array(obj.cshape[1:]) / 2
-            cshape = pybullet.btBoxShape(btVector3(w, h, l))
+            key = (4, float(obj.scale), tuple(obj.cshape[1:]))
         else:
             # Empty- or unrecognised collision shape.
             if obj.cshape[0] != 0:
                 print('Unrecognised collision shape ', obj.cshape)
-
-            # The actual collision shape.
-            cshape = pybullet.btEmptyShape()
+            key = (0, )
+
+        # Nothing to do if the object already uses this shape.
+        if self.shapeKeys.get(objID, None) == key:
+            return RetVal(True, None, self.collision_shapes[objID])
+
+        # Instantiate a new collision shape unless it is already cached.
+        if key not in self.shapeCache:
+            if key[0] == 3:
+                # Sphere.
+                cshape = pybullet.btSphereShape(obj.scale)
+            elif key[0] == 4:
+                # Prism.
+                w, h, l = obj.scale * np.array(obj.cshape[1:]) / 2
+                cshape = pybullet.btBoxShape(btVector3(w, h, l))
+            else:
+                cshape = pybullet.btEmptyShape()
+
+            # The inertia is proportional to the mass. Compute it once for
+            # unit mass.
+            inertia = btVector3(0, 0, 0)
+            cshape.calculate_local_inertia(1.0, inertia)
+            inertia = (inertia.x, inertia.y, inertia.z)
+            self.shapeCache[key] = {'shape': cshape, 'inertia': inertia,
+                                    'refs': 0}
+
+        # Release the previous shape of the object and reference the new one.
+        entry = self.shapeCache[key]
+        entry['refs'] += 1
+        self._releaseCollisionShape(objID)
+        self.shapeKeys[objID] = key
 
         # Add the collision shape to a list. Albeit not explicitly used
         # anywhere this is necessary regradless to ensure the underlying points
         # are kept alive (Bullet does not own them but accesses them).
-        self.collision_shapes[objID] = cshape
-        return RetVal(True, None, cshape)
+        self.collision_shapes[objID] = entry['shape']
+        return RetVal(True, None, entry['shape'])
+
+    def _releaseCollisionShape(self, objID: int):
+        """
+        Release the collision shape of ``objID``.
+
+        The shape leaves the cache once no other body uses it.
+
+        :param int objID: object ID.
+        """
+        key = self.shapeKeys.pop(objID, None)
+        self.collision_shapes.pop(objID, None)
+        if key is None:
+            return
+
+        entry = self.shapeCache[key]
+        entry['refs'] -= 1
+        if entry['refs'] == 0:
+            del self.shapeCache[key]
 
     @typecheck
     def createRigidBody(self, objID: int, obj: _BulletData):
@@ -368,15 +687,12 @@ class PyBulletPhys():
         # Create a motion state for the initial orientation and position.
         ms = pybullet.btDefaultMotionState(pybullet.btTransform(rot, pos))
 
-        # Ask Bullet to compute the mass and inertia for us. The inertia will
-        # be passed as a reference whereas the 'mass' is irrelevant due to how
-        # the C++ function was wrapped.
+        # Scale the cached unit mass inertia of the shape.
         inertia = btVector3(0, 0, 0)
         mass = 1.0 / obj.imass
         if obj.imass > 1E-4:
-            # The calcuate_local_inertia function will update the `inertia`
-            # variable directly.
-            cshape.calculate_local_inertia(mass, inertia)
+            unit = self.shapeCache[self.shapeKeys[objID]]['inertia']
+            inertia = btVector3(*[mass * _ for _ in unit])
 
         # Compute inertia magnitude and warn about unreasonable values.
         if (inertia.length > 20) or (inertia.length < 1E-5):
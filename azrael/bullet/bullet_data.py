@@ -44,6 +44,18 @@ _BulletData = namedtuple('_BulletData',
                          'position velocityLin velocityRot cshape '
                          'axesLockLin axesLockRot lastChanged')
 
+# Number of floats that every field occupies in a packed State Vector.
+_BulletDataWidths = (1, 1, 1, 4, 3, 3, 3, 4, 3, 3, 1)
+
+# Slice of every field in a packed State Vector.
+_BulletDataSlices = {}
+_ofs = 0
+for _name, _width in zip(_BulletData._fields, _BulletDataWidths):
+    _BulletDataSlices[_name] = slice(_ofs, _ofs + _width)
+    _ofs += _width
+packedSize = _ofs
+del _ofs, _name, _width
+
 
 @typecheck
 def BulletData(scale: (int, float)=1,
@@ -147,3 +159,40 @@ class BulletDataOverride(_BulletData):
 
         # Create the ``_BulletData`` named tuple.
         return super().__new__(cls, **kwargs_all)
+
+
+def pack(sv: _BulletData):
+    """
+    Return ``sv`` as a flat array of ``packedSize`` floats.
+
+    The fields appear in the same order as in ``_BulletData``.
+
+    :param _BulletData sv: State Vector.
+    :return: packed State Vector.
+    :rtype: np.ndarray
+    """
+    out = np.zeros(packedSize, np.float64)
+    for name, sl in _BulletDataSlices.items():
+        out[sl] = getattr(sv, name)
+    return out
+
+
+def unpack(data: np.ndarray):
+    """
+    Return the ``_BulletData`` tuple for the packed State Vector ``data``.
+
+    This is the inverse of ``pack``.
+
+    :param np.ndarray data: packed State Vector.
+    :return: State Vector.
+    :rtype: _BulletData
+    """
+    data = data.tolist()
+    out = {}
+    for name, sl in _BulletDataSlices.items():
+        if sl.stop - sl.start == 1:
+            out[name] = data[sl.start]
+        else:
+            out[name] = data[sl]
+    out['lastChanged'] = int(out['lastChanged'])
+    return _BulletData(**out)
@@ -19,6 +19,7 @@ import sys
 import pytest
 import IPython
 import cytoolz
+import collections
 import azrael.bullet.boost_bullet
 import azrael.physics_interface as physAPI
 import azrael.bullet.bullet_data as bullet_data
@@ -76,6 +77,50 @@ def test_getset_object():
     print('Test passed')
 
 
+def test_getset_object_batch():
+    """
+    Send/retrieve several objects at once and verify the integrity.
+    """
+    # Create three different objects.
+    objIDs = [1, 2, 5]
+    objs = [bullet_data.BulletData(
+        scale=1 + _, imass=2 + _, cshape=[3, 1, 1, 1], restitution=0.5,
+        orientation=[0, 1, 0, 0], position=[_, 2 * _, 3 * _],
+        velocityLin=[0.1 * _, 0, 0], velocityRot=[0, 0.2 * _, 0])
+        for _ in objIDs]
+    data = np.array([bullet_data.pack(_) for _ in objs])
+
+    # Instantiate Bullet engine.
+    bullet = azrael.bullet.boost_bullet.PyBulletPhys(1)
+
+    # Request an invalid object ID and pass mismatched arguments.
+    assert not bullet.getObjectDataBatch([1]).ok
+    assert not bullet.setObjectDataBatch(objIDs[:2], data).ok
+
+    # Send the objects to Bullet and request them back.
+    assert bullet.setObjectDataBatch(objIDs, data).ok
+    ret = bullet.getObjectDataBatch(objIDs)
+    assert ret.ok
+    assert ret.data.shape == (3, bullet_data.packedSize)
+    for obj, sv in zip(objs, ret.data):
+        assert isEqualBD(obj, bullet_data.unpack(sv))
+
+    # The batch data must match the one from the single object API.
+    for objID, sv in zip(objIDs, ret.data):
+        assert isEqualBD(bullet.getObjectData([objID]).data,
+                         bullet_data.unpack(sv))
+
+    # Use a pre-allocated output buffer (larger than necessary).
+    buf = np.zeros((10, bullet_data.packedSize))
+    ret = bullet.getObjectDataBatch(objIDs[::-1], buf)
+    assert ret.ok
+    assert ret.data.shape == (3, bullet_data.packedSize)
+    assert np.array_equal(buf[:3], ret.data)
+    assert isEqualBD(objs[-1], bullet_data.unpack(buf[0]))
+
+    print('Test passed')
+
+
 def test_update_object():
     """
     Add an object to Bullet, then change its parameters.
@@ -118,7 +163,8 @@ def test_update_object():
     print('Test passed')
 
 
-@pytest.mark.parametrize('force_fun_id', ['applyForce', 'applyForceAndTorque'])
+@pytest.mark.parametrize('force_fun_id', ['applyForce', 'applyForceAndTorque',
+                                          'applyForceAndTorqueBatch'])
 def test_apply_force(force_fun_id):
     """
     Create object, send it to Bullet, apply a force, progress the simulation,
@@ -148,6 +194,10 @@ def test_apply_force(force_fun_id):
         applyForceFun = bullet.applyForce
     elif force_fun_id == 'applyForceAndTorque':
         applyForceFun = bullet.applyForceAndTorque
+    elif force_fun_id == 'applyForceAndTorqueBatch':
+        def applyForceFun(objID, force, torque):
+            assert bullet.applyForceAndTorqueBatch(
+                [objID], force[None, :], torque[None, :]).ok
     else:
         assert False
     applyForceFun(objID, force, np.zeros(3, np.float64))
@@ -425,13 +475,181 @@ def test_modify_cshape():
     print('Test passed')
 
 
+def test_step_resident():
+    """
+    Objects must remain in the world with ``stepResident`` and only collide
+    with objects in the same collision set.
+
+    Like in the previous test, the two cubes interpenetrate and Bullet will
+    push them apart, but only if they are in the same collision set.
+    """
+    # Constants and paramters for this test.
+    objID_a, objID_b = 10, 20
+    pos_a = [-0.8, -0.8, 0]
+    pos_b = [0.8, 0.8, 0]
+    cs_cube = [4, 2, 2, 2]
+    obj_a = bullet_data.BulletData(position=pos_a, cshape=cs_cube)
+    obj_b = bullet_data.BulletData(position=pos_b, cshape=cs_cube)
+
+    # Instantiate Bullet engine.
+    bullet = azrael.bullet.boost_bullet.PyBulletPhys(1)
+    bullet.setObjectData(objID_a, obj_a)
+    bullet.setObjectData(objID_b, obj_b)
+
+    # Unknown objects must be rejected.
+    assert not bullet.stepResident([[objID_a, 30]], 1.0, 60).ok
+    assert len(bullet.resident) == 0
+
+    # Separate collision sets: the objects must not move.
+    assert bullet.stepResident([[objID_a], [objID_b]], 1.0, 60).ok
+    assert set(bullet.resident) == {objID_a, objID_b}
+    assert bullet.resident[objID_a] != bullet.resident[objID_b]
+    assert isEqualBD(bullet.getObjectData([objID_a]).data, obj_a)
+    assert isEqualBD(bullet.getObjectData([objID_b]).data, obj_b)
+
+    # The ``compute`` method must refuse to work with resident objects.
+    assert not bullet.compute([objID_a, objID_b], 1.0, 60).ok
+
+    # Same collision set: Bullet must move the objects away from each other.
+    assert bullet.stepResident([[objID_a, objID_b]], 1.0, 60).ok
+    assert bullet.resident[objID_a] == bullet.resident[objID_b]
+    ret = bullet.getObjectData([objID_a])
+    assert ret.data.position[0] < obj_a.position[0]
+    ret = bullet.getObjectData([objID_b])
+    assert ret.data.position[0] > obj_b.position[0]
+
+    # Objects not in any set must leave the world, and removed objects must
+    # leave it too.
+    assert bullet.stepResident([[objID_a]], 1.0, 60).ok
+    assert set(bullet.resident) == {objID_a}
+    assert bullet.removeObject([objID_a]).data == 1
+    assert len(bullet.resident) == 0
+    assert bullet.compute([objID_b], 1.0, 60).ok
+
+    print('Test passed')
+
+
+def test_assign_filter_groups():
+    """
+    Collision sets must only share a filter group if there are more sets
+    than groups, and keep their group from one step to the next.
+    """
+    assignFilterGroups = azrael.bullet.boost_bullet.assignFilterGroups
+    numGroups = azrael.bullet.boost_bullet.NUM_FILTER_GROUPS
+
+    def groupsOfSets(collSets, groups):
+        out = []
+        for subset in collSets:
+            assert len({groups[_] for _ in subset}) == 1
+            out.append(groups[subset[0]])
+        return out
+
+    # No sets.
+    assert assignFilterGroups([], {}) == {}
+    assert assignFilterGroups([[]], {}) == {}
+
+    # The sets must have different groups, even if their smallest objIDs
+    # are equal modulo the number of groups. Every group must be a single
+    # bit of a signed 16 Bit integer.
+    collSets = [[1, 2], [1 + numGroups], [1 + 2 * numGroups, 3]]
+    groups = assignFilterGroups(collSets, {})
+    ret = groupsOfSets(collSets, groups)
+    assert len(set(ret)) == 3
+    assert all([(0 < _ < 2 ** 15) and (_ & (_ - 1) == 0) for _ in ret])
+
+    # The sets must keep their groups if objects move between them. The
+    # larger set wins if two sets claim the same group.
+    new = [[1, 2, 3], [1 + numGroups], [1 + 2 * numGroups]]
+    ret_new = groupsOfSets(new, assignFilterGroups(new, groups))
+    assert ret_new[:2] == ret[:2]
+    assert len(set(ret_new)) == 3
+
+    # Up to ``numGroups`` sets never share a group.
+    collSets = [[_] for _ in range(numGroups)]
+    ret = groupsOfSets(collSets, assignFilterGroups(collSets, {}))
+    assert len(set(ret)) == numGroups
+
+    # More sets than groups: the sets must share the groups evenly. The
+    # objects of sets in the same group can then collide (see
+    # ``stepResident``).
+    collSets = [[_] for _ in range(2 * numGroups + 1)]
+    ret = groupsOfSets(collSets, assignFilterGroups(collSets, {}))
+    cnt = collections.Counter(ret)
+    assert len(cnt) == numGroups
+    assert sorted(cnt.values())[-2:] == [2, 3]
+    assert min(cnt.values()) == 2
+
+    print('Test passed')
+
+
+def test_shape_cache():
+    """
+    Bodies with identical collision shapes must share them, and the cache
+    must release shapes once no body uses them anymore.
+    """
+    cs_cube = [4, 2, 2, 2]
+    cs_sphere = [3, 1, 1, 1]
+
+    # Instantiate Bullet engine.
+    bullet = azrael.bullet.boost_bullet.PyBulletPhys(1)
+
+    # Three identical cubes and one sphere.
+    for objID in range(3):
+        obj = bullet_data.BulletData(position=[3 * objID, 0, 0],
+                                     cshape=cs_cube)
+        assert bullet.setObjectData(objID, obj).ok
+    obj = bullet_data.BulletData(position=[0, 5, 0], cshape=cs_sphere)
+    assert bullet.setObjectData(10, obj).ok
+    assert len(bullet.shapeCache) == 2
+    assert bullet.collision_shapes[0] is bullet.collision_shapes[2]
+    assert bullet.collision_shapes[0] is not bullet.collision_shapes[10]
+
+    # The inertia must be the same as without the cache.
+    pybullet = azrael.bullet.boost_bullet.pybullet
+    inertia = pybullet.btVector3(0, 0, 0)
+    box = pybullet.btBoxShape(pybullet.btVector3(1, 1, 1))
+    box.calculate_local_inertia(1.0, inertia)
+    i = bullet.all_objs[0].get_inv_inertia_diag_local()
+    assert np.allclose([1 / i.x, 1 / i.y, 1 / i.z],
+                       [inertia.x, inertia.y, inertia.z], rtol=1E-5)
+
+    # Scale one cube. It must get its own shape.
+    obj = bullet_data.BulletData(scale=2, cshape=cs_cube)
+    assert bullet.setObjectData(1, obj).ok
+    assert len(bullet.shapeCache) == 3
+    assert bullet.collision_shapes[0] is not bullet.collision_shapes[1]
+
+    # Remove the original cubes. This must evict their shape.
+    assert bullet.removeObject([0]).ok
+    assert len(bullet.shapeCache) == 3
+    assert bullet.removeObject([2]).ok
+    assert len(bullet.shapeCache) == 2
+
+    # Turn the sphere into a cube with the same scale as object 1. Both must
+    # now share a shape and the sphere must leave the cache.
+    obj = bullet_data.BulletData(scale=2, cshape=cs_cube)
+    assert bullet.setObjectData(10, obj).ok
+    assert len(bullet.shapeCache) == 1
+    assert bullet.collision_shapes[1] is bullet.collision_shapes[10]
+
+    # Remove everything.
+    assert bullet.removeObject([1, 10]).data == 2
+    assert len(bullet.shapeCache) == len(bullet.collision_shapes) == 0
+
+    print('Test passed')
+
 if __name__ == '__main__':
+    test_assign_filter_groups()
+    test_shape_cache()
+    test_step_resident()
     test_modify_cshape()
     test_modify_size()
     test_modify_mass()
     test_update_object()
     test_getset_object()
+    test_getset_object_batch()
     test_remove_object()
     test_apply_force_and_torque()
     test_apply_force('applyForceAndTorque')
+    test_apply_force('applyForceAndTorqueBatch')
     test_apply_force('applyForce')
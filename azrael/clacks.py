@@ -18,29 +18,137 @@
 """
 Bridge between Websocket Client and Clerk.
 
-It does little more than wrapping a ``Client`` instance. As such it has
-the same capabilities.
+It relays all Websocket requests to Clerk via a single ZeroMQ socket (see
+``ClerkRelay``). As such it has the same capabilities as a ``Client``.
+
+Clacks also relays the state frames from Leonard (see ``statefeed``) to all
+Websockets that connect to '/statefeed'.
 """
 
 import os
 import sys
+import zmq
 import time
 import logging
+import itertools
+import collections
 import multiprocessing
+import tornado.ioloop
 import tornado.websocket
 import tornado.httpserver
 import zmq.eventloop.zmqstream
 
 import numpy as np
 
-import azrael.client
 import azrael.util as util
 import azrael.config as config
+import azrael.protocol as protocol
+import azrael.statefeed as statefeed
 import azrael.protocol_json as json
 
 from azrael.typecheck import typecheck
 
 
+class ClerkRelay():
+    """
+    Relay the requests of all Websockets to Clerk via one DEALER socket.
+
+    Every request is prefixed with a unique request ID, which Clerk returns
+    with the reply. The relay uses it to pass the reply to the handler that
+    sent the request. Neither operation blocks the Tornado event loop, which
+    means a slow Clerk reply does not hold up any other Websocket.
+
+    The relay forgets the requests of closed Websockets (see ``purge``), and
+    the requests that Clerk has not answered in time (see ``expire``).
+
+    :param str addr: Address of Clerk.
+    """
+    @typecheck
+    def __init__(self, addr_clerk: str=config.addr_clerk):
+        # Create a Class-specific logger.
+        name = '.'.join([__name__, self.__class__.__name__])
+        self.logit = logging.getLogger(name)
+
+        sock = zmq.Context.instance().socket(zmq.DEALER)
+        sock.setsockopt(zmq.LINGER, 0)
+        sock.connect(addr_clerk)
+        self.stream = zmq.eventloop.zmqstream.ZMQStream(sock)
+        self.stream.on_recv(self.dispatch)
+
+        # The handler and send time of all requests in flight (keyed by
+        # request ID). The entries are in the order they were sent.
+        self.pending = collections.OrderedDict()
+        self.reqIDs = itertools.count()
+
+    @typecheck
+    def send(self, handler, msg: bytes):
+        """
+        Send the request ``msg`` to Clerk on behalf of ``handler``.
+
+        The relay will pass the reply to ``handler.relayReply``.
+
+        :param WebsocketHandler handler: the origin of the request.
+        :param bytes msg: JSON encoded request.
+        """
+        reqID = next(self.reqIDs).to_bytes(8, 'little')
+        self.pending[reqID] = (handler, time.time())
+        self.stream.send_multipart([reqID, b'', msg])
+
+    def purge(self, handler):
+        """
+        Forget all requests in flight from ``handler``.
+
+        :param WebsocketHandler handler: the (closed) origin of the requests.
+        """
+        stale = [k for k, v in self.pending.items() if v[0] is handler]
+        for reqID in stale:
+            del self.pending[reqID]
+
+    @typecheck
+    def expire(self, timeout: (int, float)=None):
+        """
+        Answer all requests older than ``timeout`` seconds with an error.
+
+        This is the periodic callback that prevents requests which Clerk
+        drops (eg. because it restarted) from piling up. Clerk's replies to
+        these requests are dropped if they arrive later.
+
+        :param float timeout: defaults to ``config.clacks_relay_timeout``.
+        """
+        if timeout is None:
+            timeout = config.clacks_relay_timeout
+        cutoff = time.time() - timeout
+        while len(self.pending) > 0:
+            reqID, (handler, tsent) = next(iter(self.pending.items()))
+            if tsent > cutoff:
+                break
+            del self.pending[reqID]
+            try:
+                handler.returnErr({}, 'Clerk did not reply')
+            except tornado.websocket.WebSocketClosedError:
+                pass
+
+    def dispatch(self, frames):
+        """
+        Pass the reply from Clerk to the handler that sent the request.
+
+        This is the callback for the ZeroMQ stream. Replies for Websockets
+        that were closed in the meantime are dropped.
+
+        :param list frames: multipart message from Clerk.
+        """
+        if len(frames) != 3 or frames[1] != b'':
+            self.logit.warning('Invalid reply from Clerk')
+            return
+        handler, _ = self.pending.pop(frames[0], (None, None))
+        if handler is None:
+            return
+        try:
+            handler.relayReply(frames[2])
+        except tornado.websocket.WebSocketClosedError:
+            pass
+
+
 class WebsocketHandler(tornado.websocket.WebSocketHandler):
     """
     Clacks server.
@@ -49,11 +157,11 @@ class WebsocketHandler(tornado.websocket.WebSocketHandler):
     to facilitate browser access to Azrael/Clerk since most browsers support
     Websockets but not necessarily ZeroMQ.
 
-    Internally, every Websocket instance creates a standard ``Client``
-    instance, and uses to relay the request to a Clerk.
+    All Websockets share the same ``ClerkRelay`` to pass the requests to
+    Clerk.
 
-    Among the few exceptions that are not passed to the Client instance are
-    Pings directed specifically to this Clacks server.
+    Among the few exceptions that are not passed to Clerk are Pings directed
+    specifically to this Clacks server.
     """
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -62,14 +170,13 @@ class WebsocketHandler(tornado.websocket.WebSocketHandler):
         name = '.'.join([__name__, self.__class__.__name__])
         self.logit = logging.getLogger(name)
 
-    def open(self):
+    def initialize(self, relay):
         """
-        Create a Client instance.
+        Tornado hook to pass the shared ``ClerkRelay`` to the handler.
 
-        This method is a Tornado callback and triggers when a client initiates
-        a new Websocket connection.
+        :param ClerkRelay relay: relay to Clerk.
         """
-        self.client = azrael.client.Client()
+        self.relay = relay
 
     @typecheck
     def returnOk(self, data: dict, msg: str):
@@ -136,29 +243,157 @@ class WebsocketHandler(tornado.websocket.WebSocketHandler):
             # Handle ourselves: return the pong.
             self.returnOk({'response': 'pong clacks'}, '')
         else:
-            # Pass all other commands directly to the Client instnace which
-            # will (probably) send it to Clerk for processing.
-            ret = self.client.sendToClerk(cmd, payload)
+            # Pass all other commands to Clerk. The relay will call
+            # ``relayReply`` once the reply arrives.
+            try:
+                msg = json.dumps({'cmd': cmd, 'payload': payload})
+            except (ValueError, TypeError) as err:
+                self.returnErr({}, 'JSON encoding error')
+                return
+            self.relay.send(self, msg.encode('utf8'))
+
+    @typecheck
+    def relayReply(self, reply: bytes):
+        """
+        Pass the ``reply`` from Clerk to the Websocket client.
+
+        Affirmative replies go out verbatim because they already have the
+        correct format.
+
+        :param bytes reply: JSON encoded reply from Clerk.
+        """
+        try:
+            reply = reply.decode('utf8')
+            ret = json.loads(reply)
+        except (ValueError, TypeError) as err:
+            self.returnErr({}, 'JSON decoding error in Clacks')
+            return
 
-            if ret.ok:
-                self.returnOk(ret.data, ret.msg)
-            else:
-                self.returnErr({}, ret.msg)
+        # Returned JSON must always contain an 'ok' and 'payload' field.
+        if not (isinstance(ret, dict) and ('ok' in ret) and
+                ('payload' in ret)):
+            self.returnErr({}, 'Invalid response from Clerk')
+        elif ret['ok']:
+            self.write_message(reply, binary=False)
+        else:
+            self.returnErr({}, ret['msg'])
 
     def on_close(self):
         """
-        Disconnect Client from Azrael.
+        Log the disconnect.
 
         This method is a Tornado callback and triggers whenever the Websocket
-        is closed.
+        is closed. The relay drops the replies to all outstanding requests.
         """
-        if self.client is not None:
-            # Not strictly necessary but forcefully triggering the desctructor
-            # to close the ZeroMQ connection cannot be a bad idea.
-            del self.client
+        self.relay.purge(self)
         self.logit.debug('Connection closed')
 
 
+class StateFeedHandler(tornado.websocket.WebSocketHandler):
+    """
+    Push the state frames from Leonard to Websocket clients.
+
+    Clients may send a subscription at any time to restrict the pushed
+    objects and to select the encoding, eg.
+
+        {'objIDs': [1, 2], 'region': [[-1, -1, -1], [1, 1, 1]],
+         'encoding': 'float32'}
+
+    Both 'objIDs' and 'region' are optional (see
+    ``statefeed.selectObjects``). The default subscription contains all
+    objects in the 'float64' encoding.
+
+    Every pushed message has the format {'ok': True, 'msg': 'statevars',
+    'payload': payload} where ``payload`` is the output of
+    ``protocol.packStateRecords`` plus the 'tick' of the frame.
+    """
+    # All connected handlers.
+    subscribers = set()
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        # Create a Class-specific logger.
+        name = '.'.join([__name__, self.__class__.__name__])
+        self.logit = logging.getLogger(name)
+
+        # Default subscription: all objects.
+        self.subscription = (None, None, 'float64')
+
+    def open(self):
+        """
+        Register the handler for all future state frames.
+        """
+        StateFeedHandler.subscribers.add(self)
+
+    def on_close(self):
+        """
+        Unregister the handler.
+        """
+        StateFeedHandler.subscribers.discard(self)
+
+    @typecheck
+    def on_message(self, msg: str):
+        """
+        Update the subscription of this client.
+
+        :param str msg: JSON encoded subscription.
+        """
+        try:
+            msg = json.loads(msg)
+            objIDs, region = msg.get('objIDs'), msg.get('region')
+            encoding = msg.get('encoding', 'float64')
+            if objIDs is not None:
+                objIDs = tuple(int(_) for _ in objIDs)
+            if region is not None:
+                region = tuple(tuple(float(_) for _ in c) for c in region)
+                assert len(region) == 2
+                assert len(region[0]) == len(region[1]) == 3
+            assert encoding in protocol.SVEncodings and encoding != 'json'
+        except (TypeError, ValueError, AttributeError, AssertionError):
+            msg = {'ok': False, 'payload': {}, 'msg': 'Invalid subscription'}
+            self.write_message(json.dumps(msg), binary=False)
+            return
+
+        self.subscription = (objIDs, region, encoding)
+        msg = {'ok': True, 'payload': {}, 'msg': 'subscribed'}
+        self.write_message(json.dumps(msg), binary=False)
+
+    @classmethod
+    def broadcast(cls, frames):
+        """
+        Send the state frame ``frames`` to all subscribers.
+
+        This is the callback for the ZeroMQ stream of state frames. It
+        decodes every frame only once, and encodes it only once per distinct
+        subscription.
+
+        :param list frames: multipart message from ``statefeed``.
+        """
+        if len(cls.subscribers) == 0:
+            return
+        ret = statefeed.decodeFrame(frames)
+        if not ret.ok:
+            return
+        tick, objIDs, svs, _ = ret.data
+
+        cache = {}
+        for handler in list(cls.subscribers):
+            sub = handler.subscription
+            if sub not in cache:
+                wantIDs, region, encoding = sub
+                mask = statefeed.selectObjects(objIDs, svs, wantIDs, region)
+                payload = protocol.packStateRecords(
+                    objIDs[mask].tolist(), svs[mask], [], encoding)
+                payload['tick'] = tick
+                msg = {'ok': True, 'payload': payload, 'msg': 'statevars'}
+                cache[sub] = json.dumps(msg)
+            try:
+                handler.write_message(cache[sub], binary=False)
+            except tornado.websocket.WebSocketClosedError:
+                cls.subscribers.discard(handler)
+
+
 class ServeViewer(tornado.web.RequestHandler):
     """
     Serve start page.
@@ -202,8 +437,26 @@ class ClacksServer(multiprocessing.Process):
         handlers.append(('/static/(.*)', tornado.web.StaticFileHandler,
                          {'path': staticDir}))
 
-        # Websocket to Clacks.
-        handlers.append(('/websocket', WebsocketHandler))
+        # Websocket to Clacks. All Websockets share the same relay to Clerk.
+        relay = ClerkRelay()
+        handlers.append(('/websocket', WebsocketHandler, {'relay': relay}))
+
+        # Periodically answer the requests that Clerk did not reply to.
+        period = 1000 * config.clacks_relay_timeout / 2
+        tornado.ioloop.PeriodicCallback(relay.expire, period).start()
+
+        # Websocket for the state frames.
+        handlers.append(('/statefeed', StateFeedHandler))
+
+        # Subscribe to the state frames from Leonard and relay them to all
+        # '/statefeed' Websockets.
+        sock = zmq.Context.instance().socket(zmq.SUB)
+        sock.setsockopt(zmq.LINGER, 0)
+        sock.setsockopt(zmq.RCVHWM, 4)
+        sock.setsockopt(zmq.SUBSCRIBE, statefeed.TOPIC)
+        sock.connect(config.addr_leonard_pub)
+        stream = zmq.eventloop.zmqstream.ZMQStream(sock)
+        stream.on_recv(StateFeedHandler.broadcast)
 
         # Install the Websocket handler.
         app = tornado.web.Application(handlers)
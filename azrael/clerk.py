@@ -27,12 +27,15 @@ is identical).
 
 """
 import os
+import re
 import sys
 import zmq
 import pickle
 import IPython
 import cytoolz
 import logging
+import threading
+import collections
 import setproctitle
 import multiprocessing
 
@@ -45,6 +48,7 @@ import azrael.config as config
 import azrael.database as database
 import azrael.protocol as protocol
 import azrael.protocol_json as json
+import azrael.templatecache as templatecache
 import azrael.physics_interface as physAPI
 import azrael.bullet.bullet_data as bullet_data
 
@@ -56,6 +60,9 @@ ipshell = IPython.embed
 RetVal = util.RetVal
 Template = azrael.util.Template
 
+# Extracts the command word from a JSON encoded request (see ``Clerk.route``).
+_cmdRegex = re.compile(rb'"cmd"\s*:\s*"([^"]*)"')
+
 
 class Clerk(multiprocessing.Process):
     """
@@ -80,6 +87,13 @@ class Clerk(multiprocessing.Process):
         name = '.'.join([__name__, self.__class__.__name__])
         self.logit = logging.getLogger(name)
 
+        # Templates and the parts of object instances are immutable and can
+        # therefore be cached indefinitely.
+        self.templateCache = templatecache.TemplateCache(
+            config.clerk_template_cache_bytes)
+        self.instanceCache = templatecache.InstanceCache(
+            config.clerk_instance_cache_size)
+
         # Specify the decoding-processing-encoding triplet functions for
         # (almost) every command supported by Clerk. The only exceptions are
         # administrative commands (eg. ping). This dictionary will be used
@@ -105,6 +119,10 @@ class Clerk(multiprocessing.Process):
                 protocol.ToClerk_GetAllStateVariables_Decode,
                 self.getAllStateVariables,
                 protocol.FromClerk_GetAllStateVariables_Encode),
+            'get_statevar_region': (
+                protocol.ToClerk_GetStateVariablesInRegion_Decode,
+                self.getStateVariablesInRegion,
+                protocol.FromClerk_GetStateVariablesInRegion_Encode),
             'set_statevar': (
                 protocol.ToClerk_SetStateVector_Decode,
                 self.setStateVariable,
@@ -141,6 +159,10 @@ class Clerk(multiprocessing.Process):
                 protocol.ToClerk_ControlParts_Decode,
                 self.controlParts,
                 protocol.FromClerk_ControlParts_Encode),
+            'batch': (
+                protocol.ToClerk_Batch_Decode,
+                self.batch,
+                protocol.FromClerk_Batch_Encode),
             }
 
         # Insert default objects. None of them has an actual geometry but
@@ -159,12 +181,12 @@ class Clerk(multiprocessing.Process):
                       [], [])
         self.addTemplates([t1, t2, t3])
 
-    def runCommand(self, fun_decode, fun_process, fun_encode):
+    def runCommand(self, fun_decode, fun_process, fun_encode, payload):
         """
         Wrapper function to process a client request.
 
-        This wrapper will use ``fun_decode`` to convert the ZeroMQ byte stream
-        into  Python data types, then pass these data types to ``fun_process``
+        This wrapper will use ``fun_decode`` to convert the ``payload`` into
+        Python data types, then pass these data types to ``fun_process``
         for processing, and encodes the return values (also Python types) with
         ``fun_encode`` so that they can be sent back via ZeroMQ.
 
@@ -184,30 +206,137 @@ class Clerk(multiprocessing.Process):
         :param callable fun_decode: converter function (bytes --> Python)
         :param callable fun_process: processes the client request.
         :param callable fun_encode: converter function (Python --> bytes)
-        :return: **None**
+        Exceptions in any of the three functions are logged (with traceback)
+        and returned as an error. They must not reach the worker thread
+        because the broker would otherwise wait for its reply forever.
+
+        :param payload: the (JSON decoded) payload of the request.
+        :return: the encoded output of ``fun_process``.
+        :rtype: dict
         """
-        # Decode the binary data.
-        ok, out = fun_decode(self.payload)
-        if not ok:
-            # Error during decoding.
-            self.returnErr(self.last_addr, {}, out)
-        else:
+        try:
+            # Decode the binary data.
+            ok, out = fun_decode(payload)
+            if not ok:
+                # Error during decoding.
+                return RetVal(False, out, None)
+
             # Decoding was successful. Pass all returned parameters directly
             # to the processing method.
             ret = fun_process(*out)
-
             if ret.ok:
                 # Encode the output into a byte stream and return it.
                 ok, ret = fun_encode(ret.data)
-                self.returnOk(self.last_addr, ret, '')
+                return RetVal(True, None, ret)
             else:
                 # The processing method encountered an error.
-                self.returnErr(self.last_addr, {}, ret.msg)
+                return RetVal(False, ret.msg, None)
+        except Exception:
+            msg = 'Internal error in Clerk'
+            self.logit.exception(msg)
+            return RetVal(False, msg, None)
+
+    @typecheck
+    def processRequest(self, msg: bytes):
+        """
+        Process the client request ``msg`` and return the reply.
+
+        This method does not touch any sockets and is therefore safe to call
+        from several worker threads at once.
+
+        :param bytes msg: JSON encoded request.
+        :return: JSON encoded reply.
+        :rtype: bytes
+        """
+        # Decode the data.
+        try:
+            msg = json.loads(msg.decode('utf8'))
+        except (ValueError, TypeError) as err:
+            return self.returnErr({}, 'JSON decoding error in Clerk')
+
+        # Sanity check: every message must contain at least a command byte.
+        if not (isinstance(msg, dict) and ('cmd' in msg) and
+                ('payload' in msg)):
+            return self.returnErr({}, 'Invalid command format')
+
+        # Extract the command word and payload.
+        cmd, payload = msg['cmd'], msg['payload']
+
+        # The command word determines the action...
+        if cmd in self.codec:
+            # Look up the decode-process-encode functions for the current
+            # command. Then execute them.
+            enc, proc, dec = self.codec[cmd]
+            ret = self.runCommand(enc, proc, dec, payload)
+            if ret.ok:
+                return self.returnOk(ret.data, '')
+            else:
+                return self.returnErr({}, ret.msg)
+        else:
+            # Unknown command.
+            return self.returnErr({}, 'Invalid command <{}>'.format(cmd))
+
+    @typecheck
+    def route(self, msg: bytes):
+        """
+        Return the name of the worker pool for the request ``msg``.
+
+        The command word determines the pool (see ``config.clerk_workers``).
+        To avoid decoding the entire JSON request in the broker this method
+        only searches the first few hundred bytes for the 'cmd' field, which
+        is where all clients put it. Requests without recognisable command
+        go to the 'fast' pool, whose workers will then reply with the
+        appropriate error.
+
+        :param bytes msg: JSON encoded request.
+        :return: name of worker pool.
+        :rtype: str
+        """
+        match = _cmdRegex.search(msg, 0, 256)
+        if match is None:
+            return 'fast'
+        cmd = match.group(1).decode('utf8', 'replace')
+        return 'heavy' if cmd in config.clerk_heavy_commands else 'fast'
+
+    def runWorker(self, addr: str, ctx: zmq.Context):
+        """
+        Process the requests that the broker sends to ``addr``.
+
+        Every worker uses a REQ socket. It announces itself with a 'READY'
+        message and then replies to the requests the broker forwards to it.
+        Each reply implicitly tells the broker that the worker is idle again.
+
+        The worker returns the envelope of every request (ie. all frames
+        before the actual message) verbatim. It contains the client address
+        and, for DEALER clients, an arbitrary request ID.
+
+        This method will not return.
+
+        :param str addr: address of the broker socket for this pool.
+        :param zmq.Context ctx: ZeroMQ context of the broker.
+        """
+        sock = ctx.socket(zmq.REQ)
+        sock.connect(addr)
+        sock.send(b'READY')
+        while True:
+            data = sock.recv_multipart()
+            sock.send_multipart(data[:-1] + [self.processRequest(data[-1])])
 
     def run(self):
         """
         Initialise ZeroMQ and wait for client requests.
 
+        Clerk is a load balancing broker. It receives all client requests on
+        a ROUTER socket and forwards them to the next idle worker thread of
+        the pool that ``route`` selects. Every pool has its own queue, which
+        means that slow commands in one pool cannot delay the commands in
+        another.
+
+        Clients may use REQ or DEALER sockets. The latter can have many
+        requests in flight if they prefix every request with a unique ID
+        frame, ie. [reqID, b'', msg]. Clerk returns the ID with the reply
+        (see ``AsyncClient``).
+
         This method will not return.
 
         :raises: None
@@ -227,77 +356,85 @@ class Clerk(multiprocessing.Process):
         self.logit.info('Listening on <{}>'.format(addr))
         del addr
 
+        # Create one socket, the worker threads, and the request queue for
+        # every pool. The 'fast' pool always has at least one worker because
+        # it is also the fallback for requests that cannot be routed.
+        backends, idle, pending = {}, {}, {}
+        for pool in ('fast', 'heavy'):
+            numWorkers = config.clerk_workers.get(pool, 0)
+            if pool == 'fast':
+                numWorkers = max(numWorkers, 1)
+            if numWorkers == 0:
+                continue
+            addr = 'inproc://clerk_{}'.format(pool)
+            backends[pool] = ctx.socket(zmq.ROUTER)
+            backends[pool].bind(addr)
+            poller.register(backends[pool], zmq.POLLIN)
+            idle[pool] = collections.deque()
+            pending[pool] = collections.deque()
+            for ii in range(numWorkers):
+                worker = threading.Thread(
+                    target=self.runWorker, args=(addr, ctx), daemon=True)
+                worker.start()
+
         # Wait for socket activity.
         while True:
             sock = dict(poller.poll())
-            if not self.sock_cmd in sock:
-                continue
 
-            # Read from ROUTER socket and perform sanity checks.
-            data = self.sock_cmd.recv_multipart()
-            assert len(data) == 3
-            self.last_addr, empty, msg = data[0], data[1], data[2]
-            assert empty == b''
-            del data, empty
-
-            # Decode the data.
-            try:
-                msg = json.loads(msg.decode('utf8'))
-            except (ValueError, TypeError) as err:
-                self.returnErr(self.last_addr, {},
-                               'JSON decoding error in Clerk')
-                continue
-
-            # Sanity check: every message must contain at least a command byte.
-            if not (('cmd' in msg) and ('payload' in msg)):
-                self.returnErr(self.last_addr, {}, 'Invalid command format')
-                continue
-
-            # Extract the command word and payload.
-            cmd, self.payload = msg['cmd'], msg['payload']
-
-            # The command word determines the action...
-            if cmd in self.codec:
-                # Look up the decode-process-encode functions for the current
-                # command. Then execute them.
-                enc, proc, dec = self.codec[cmd]
-                self.runCommand(enc, proc, dec)
-            else:
-                # Unknown command.
-                self.returnErr(self.last_addr, {},
-                               'Invalid command <{}>'.format(cmd))
+            # Relay the worker replies to the clients and note the workers
+            # as idle.
+            for pool, backend in backends.items():
+                if backend not in sock:
+                    continue
+                data = backend.recv_multipart()
+                idle[pool].append(data[0])
+                if len(data) > 3:
+                    self.sock_cmd.send_multipart(data[2:])
+
+            # Queue the new client request in the pool for its command.
+            if self.sock_cmd in sock:
+                data = self.sock_cmd.recv_multipart()
+                if len(data) >= 3 and data[-2] == b'':
+                    pool = self.route(data[-1])
+                    pending[pool if pool in backends else 'fast'].append(data)
+
+            # Hand the queued requests to idle workers.
+            for pool, backend in backends.items():
+                while len(idle[pool]) > 0 and len(pending[pool]) > 0:
+                    worker = idle[pool].popleft()
+                    backend.send_multipart(
+                        [worker, b''] + pending[pool].popleft())
 
     @typecheck
-    def returnOk(self, addr, data: dict, msg: str=''):
+    def returnOk(self, data: dict, msg: str=''):
         """
-        Send affirmative reply.
+        Return an affirmative reply.
 
         This is a convenience method to enhance readability.
 
-        :param addr: ZeroMQ address as returned by the router socket.
         :param dict data: arbitrary data to pass back to client.
         :param str msg: text message to pass along.
-        :return: None
+        :return: JSON encoded reply.
+        :rtype: bytes
         """
         try:
             ret = json.dumps({'ok': True, 'payload': data, 'msg': msg})
         except (ValueError, TypeError) as err:
-            self.returnErr(addr, {}, 'JSON encoding error in Clerk')
-            return
+            return self.returnErr({}, 'JSON encoding error in Clerk')
 
-        self.sock_cmd.send_multipart([addr, b'', ret.encode('utf8')])
+        return ret.encode('utf8')
 
     @typecheck
-    def returnErr(self, addr, data: dict, msg: str=''):
+    def returnErr(self, data: dict, msg: str=''):
         """
-        Send negative reply and log a warning message.
+        Return a negative reply and log a warning message.
 
         This is a convenience method to enhance readability.
 
-        :param addr: ZeroMQ address as returned by the router socket.
         :param dict data: arbitrary data to pass back to client.
         :param str msg: message to pass along.
-        :return: None
+        :return: JSON encoded reply.
+        :rtype: bytes
         """
         try:
             # Convert the message to a byte string (if it is not already).
@@ -310,8 +447,7 @@ class Clerk(multiprocessing.Process):
         if isinstance(msg, str):
             self.logit.warning(msg)
 
-        # Send the message.
-        self.sock_cmd.send_multipart([addr, b'', ret.encode('utf8')])
+        return ret.encode('utf8')
 
     def pingClerk(self):
         """
@@ -323,6 +459,42 @@ class Clerk(multiprocessing.Process):
         """
         return RetVal(True, None, 'pong clerk')
 
+    @typecheck
+    def batch(self, cmds: list):
+        """
+        Process all ``cmds`` in order and return their results.
+
+        Every command is a (cmd, payload) tuple, ie. the same data that a
+        client would otherwise send in a dedicated request. Every result is
+        a dictionary with the 'ok', 'msg', and 'payload' fields of the reply
+        that Clerk would have sent for that request. A failed command does
+        not affect the others.
+
+        Batches must not contain further batches, or any of the
+        ``config.clerk_heavy_commands``, because they would otherwise block
+        the 'fast' worker pool.
+
+        :param list cmds: list of (cmd, payload) tuples.
+        :return: list of results.
+        :rtype: list
+        """
+        out = []
+        for cmd, payload in cmds:
+            if (cmd == 'batch') or (cmd in config.clerk_heavy_commands):
+                ret = RetVal(False, 'Cannot batch <{}>'.format(cmd), None)
+            elif cmd not in self.codec:
+                ret = RetVal(False, 'Invalid command <{}>'.format(cmd), None)
+            else:
+                enc, proc, dec = self.codec[cmd]
+                ret = self.runCommand(enc, proc, dec, payload)
+
+            if ret.ok:
+                out.append({'ok': True, 'msg': '', 'payload': ret.data})
+            else:
+                self.logit.warning(ret.msg)
+                out.append({'ok': False, 'msg': ret.msg, 'payload': {}})
+        return RetVal(True, None, out)
+
     # ----------------------------------------------------------------------
     # These methods service Client requests.
     # ----------------------------------------------------------------------
@@ -347,20 +519,22 @@ class Clerk(multiprocessing.Process):
         :rtype: bool
         :raises: None
         """
-        # Fetch the instance data for ``objID``.
-        ret = self.getObjectInstance(objID)
+        # Fetch the parts of ``objID``.
+        ret = self.getInstanceParts(objID)
         if not ret.ok:
             self.logit.warning(ret.msg)
             return RetVal(False, ret.msg, None)
         else:
-            boosters = ret.data['boosters']
-            factories = ret.data['factories']
+            booster_t = ret.data.boosters
+            factory_t = ret.data.factories
             del ret
 
         # Fetch the SV for objID (we need this to determine the orientation of
-        # the base object to which the parts are attached).
-        sv_parent = self.getStateVariables([objID])
-        if not sv_parent.ok:
+        # the base object to which the parts are attached). Only the physics
+        # state matters here, which is why this bypasses the 'lastChanged'
+        # lookup in ``getStateVariables``.
+        sv_parent = physAPI.getStateVariables([objID])
+        if not sv_parent.ok or sv_parent.data[objID] is None:
             msg = 'Could not retrieve SV for objID={}'.format(objID)
             self.logit.warning(msg)
             return RetVal(False, msg, None)
@@ -370,10 +544,6 @@ class Clerk(multiprocessing.Process):
         parent_orient = sv_parent.orientation
         quat = util.Quaternion(parent_orient[3], parent_orient[:3])
 
-        # Compile a list of all parts defined in the template.
-        booster_t = dict(zip([int(_.partID) for _ in boosters], boosters))
-        factory_t = dict(zip([int(_.partID) for _ in factories], factories))
-
         # Verify that all Booster commands have the correct type and specify
         # a valid Booster ID.
         for cmd in cmd_boosters:
@@ -662,19 +832,93 @@ class Clerk(multiprocessing.Process):
         :raises: None
         """
         # Retrieve the template. Return immediately if it does not exist.
-        ret = self.getRawTemplate(names)
+        ret = self.getCachedTemplates(names)
         if not ret.ok:
             self.logit.info(ret.msg)
             return ret
 
-        # Convenience.
-        fun = self._unpackTemplateData
+        # Return shallow copies of the decoded templates because the protocol
+        # encoder modifies them.
+        out = {k: dict(v.decoded) for (k, v) in ret.data.items()}
+        return RetVal(True, None, out)
+
+    @typecheck
+    def getCachedTemplates(self, names: list):
+        """
+        Return the cache entries for all templates in ``names``.
 
-        # Unpack the raw templates and insert them into a dictionary where the
-        # template names correspond to its keys.
-        out = {k: fun(v).data for (k, v) in ret.data.items()}
+        Every entry contains the raw database document and the decoded
+        template (see ``templatecache.CachedTemplate``). This method only
+        queries the database for templates that are not yet in the cache.
+        Like ``getRawTemplate``, it returns either all templates or none.
+
+        The decoded templates have the same format as the output of
+        ``_unpackTemplateData``, except that the geometry is stored in NumPy
+        arrays.
+
+        :param list(str) names: template IDs
+        :return: {name: CachedTemplate}
+        :rtype: dict
+        """
+        # Sanity check
+        tmp = [_ for _ in names if not isinstance(_, str)]
+        if len(tmp) > 0:
+            return RetVal(False, 'All template IDs must be strings', None)
+
+        # Fetch all missing templates from the database.
+        names = set(names)
+        out = self.templateCache.get(names)
+        missing = [_ for _ in names if _ not in out]
+        if len(missing) > 0:
+            ret = self.getRawTemplate(missing)
+            if not ret.ok:
+                return ret
+
+            # Decode the templates and add them to the cache.
+            for name, doc in ret.data.items():
+                decoded = self._unpackTemplateData(doc).data
+                decoded['vert'] = np.array(decoded['vert'], np.float64)
+                decoded['uv'] = np.array(decoded['uv'], np.float64)
+                decoded['rgb'] = np.array(decoded['rgb'])
+                out[name] = self.templateCache.put(name, doc, decoded)
         return RetVal(True, None, out)
 
+    @typecheck
+    def getInstanceParts(self, objID: int):
+        """
+        Return the template ID, boosters, and factories of ``objID``.
+
+        The parts of an object never change, which is why this method only
+        queries the instance database for objects that are not yet in the
+        instance cache. Unlike ``getObjectInstance`` it never fetches the
+        geometry.
+
+        :param int objID: objID
+        :return: parts of ``objID``.
+        :rtype: templatecache.CachedInstance
+        """
+        entry = self.instanceCache.get(objID)
+        if entry is not None:
+            return RetVal(True, None, entry)
+
+        # Fetch the parts from the database, but not the geometry.
+        doc = database.dbHandles['ObjInstances'].find_one(
+            {'objID': objID},
+            {'templateID': 1, 'boosters': 1, 'factories': 1})
+        if doc is None:
+            msg = 'Could not find instance data for objID <{}>'.format(objID)
+            self.logit.info(msg)
+            return RetVal(False, msg, None)
+
+        # Convert the byte strings to Booster and Factory objects.
+        boosters = doc.get('boosters', {}).values()
+        factories = doc.get('factories', {}).values()
+        boosters = [parts.fromstring(_) for _ in boosters]
+        factories = [parts.fromstring(_) for _ in factories]
+        entry = self.instanceCache.put(
+            objID, doc['templateID'], boosters, factories)
+        return RetVal(True, None, entry)
+
     @typecheck
     def getObjectInstance(self, objID: int):
         """
@@ -791,8 +1035,8 @@ class Clerk(multiprocessing.Process):
         SVs = [_[1] for _ in newObjects]
 
         with util.Timeit('spawn:1 getRawTemplate') as timeit:
-            # Fetch the raw templates for all ``names``.
-            ret = self.getRawTemplate(names)
+            # Fetch the templates for all ``names``.
+            ret = self.getCachedTemplates(names)
             if not ret.ok:
                 self.logit.info(ret.msg)
                 return ret
@@ -811,7 +1055,7 @@ class Clerk(multiprocessing.Process):
             # of objects to spawn.
             dbDocs = []
             for idx, name in enumerate(names):
-                tmp = dict(templates[name])
+                tmp = dict(templates[name].raw)
                 tmp['objID'] = objIDs[idx]
                 tmp['lastChanged'] = 0
                 tmp['templateID'] = name
@@ -826,7 +1070,7 @@ class Clerk(multiprocessing.Process):
             objs = []
             for objID, name, sv in zip(objIDs, names, SVs):
                 # Convenience.
-                t = templates[name]
+                t = templates[name].decoded
 
                 # Overwrite the user supplied collision shape with the one
                 # specified in the template. This is to enforce geometric
@@ -834,10 +1078,14 @@ class Clerk(multiprocessing.Process):
                 # things may happen (eg a space-ship collision shape in the
                 # template database with a simple sphere collision shape when
                 # it is spawned).
-                sv.cshape[:] = np.fromstring(t['cshape']).tolist()
+                sv.cshape[:] = t['cshape'].tolist()
 
                 # Add the object description to the list.
-                objs.append((objID, sv, t['AABB']))
+                objs.append((objID, sv, t['aabb']))
+
+                # The new object has the same parts as its template.
+                self.instanceCache.put(
+                    objID, name, t['boosters'], t['factories'])
 
             # Queue the spawn commands so that Leonard can pick them up.
             ret = physAPI.addCmdSpawn(objs)
@@ -857,13 +1105,14 @@ class Clerk(multiprocessing.Process):
         """
         ret = physAPI.addCmdRemoveObject(objID)
         database.dbHandles['ObjInstances'].remove({'objID': objID}, mult=True)
+        self.instanceCache.remove(objID)
         if ret.ok:
             return RetVal(True, None, None)
         else:
             return RetVal(False, ret.msg, None)
 
     @typecheck
-    def getStateVariables(self, objIDs: (list, tuple)):
+    def getStateVariables(self, objIDs: (list, tuple), encoding: str='json'):
         """
         Return the State Variables for all ``objIDs`` in a dictionary.
 
@@ -871,7 +1120,12 @@ class Clerk(multiprocessing.Process):
         values are either the State Variables (instance of ``BulletData``) or
         *None* (if the objID does not exist).
 
+        If ``encoding`` is not 'json' then the dictionary is wrapped into a
+        ``protocol.EncodedSV`` tuple to tell the protocol encoder which wire
+        format the client requested.
+
         :param list(int) objIDs: list of objects for which to returns the SV.
+        :param str encoding: wire encoding (see ``protocol.SVEncodings``).
         :return: {objID_1: SV_k, ...}
         :rtype: dict
         """
@@ -900,6 +1154,8 @@ class Clerk(multiprocessing.Process):
             else:
                 out[objID] = None
 
+        if encoding != 'json':
+            out = protocol.EncodedSV(encoding, out)
         return RetVal(True, None, out)
 
     @typecheck
@@ -1031,17 +1287,38 @@ class Clerk(multiprocessing.Process):
             return RetVal(True, None, ret.data)
 
     @typecheck
-    def getAllStateVariables(self, dummy=None):
+    def getStateVariablesInRegion(self, shape: str, params: dict,
+                                  encoding: str='json'):
+        """
+        Return the State Variables of all objects inside a region.
+
+        The region is a 'box', 'sphere', or view 'frustum' (see
+        ``physAPI.getObjectsInRegion`` for the ``params``). The return value
+        is the same as for ``getStateVariables``.
+
+        :param str shape: 'box', 'sphere', or 'frustum'.
+        :param dict params: shape parameters.
+        :param str encoding: wire encoding (see ``protocol.SVEncodings``).
+        :return: {objID_1: SV_k, ...}
+        :rtype: dict
+        """
+        with util.Timeit('physAPI.getRegion') as timeit:
+            ret = physAPI.getObjectsInRegion(shape, params)
+        if not ret.ok:
+            return ret
+        return self.getStateVariables(ret.data, encoding)
+
+    @typecheck
+    def getAllStateVariables(self, encoding: str='json'):
         """
         Return all State Variables in a dictionary.
 
         The dictionary will have the objIDs and State Variables as keys and
         values, respectively.
 
-        .. note::
-           The ``dummy`` argument is a placeholder because the ``runCommand``
-           function assumes that every method takes at least one argument.
+        See ``getStateVariables`` for the meaning of ``encoding``.
 
+        :param str encoding: wire encoding (see ``protocol.SVEncodings``).
         :return: {objID_1: SV_k, ...}
         :rtype: dict
         """
@@ -1068,4 +1345,7 @@ class Clerk(multiprocessing.Process):
         for objID in sv:
             if objID in docs:
                 out[objID] = sv[objID]._replace(lastChanged=docs[objID])
+
+        if encoding != 'json':
+            out = protocol.EncodedSV(encoding, out)
         return RetVal(True, None, out)
@@ -31,6 +31,7 @@ import numpy as np
 import azrael.parts as parts
 import azrael.config as config
 import azrael.protocol as protocol
+import azrael.statefeed as statefeed
 import azrael.protocol_json as json
 
 from azrael.util import RetVal
@@ -38,6 +39,37 @@ from azrael.typecheck import typecheck
 from azrael.bullet.bullet_data import BulletDataOverride, _BulletData
 
 
+@typecheck
+def decodeStateVariables(payload: dict):
+    """
+    Return the State Variables in ``payload`` as ``_BulletData`` tuples.
+
+    This wraps ``protocol.FromClerk_GetStateVariable_Decode`` for all commands
+    that return State Variables.
+
+    The binary encodings are not converted. Their State Variables are
+    returned as the (objIDs, records, missing objIDs) tuple of
+    ``protocol.unpackStateVariables`` instead.
+
+    :param dict payload: reply from Clerk.
+    :return: {objID: _BulletData} dictionary (*None* for unknown objects).
+    :rtype: dict
+    """
+    ret = protocol.FromClerk_GetStateVariable_Decode(payload)
+    if not ret.ok or 'encoding' in payload:
+        return ret
+
+    # Convert the returned data back into a named tuple (_BulletData).
+    out = {}
+    for objID, v in ret.data.items():
+        objID = int(objID)
+        if v is not None:
+            out[objID] = _BulletData(**v)
+        else:
+            out[objID] = None
+    return RetVal(True, None, out)
+
+
 class Client():
     """
     A Client for Clerk/Azrael.
@@ -93,10 +125,13 @@ class Client():
                 protocol.FromClerk_AddTemplates_Decode),
             'get_statevar': (
                 protocol.ToClerk_GetStateVariable_Encode,
-                protocol.FromClerk_GetStateVariable_Decode),
+                decodeStateVariables),
             'get_all_statevars': (
                 protocol.ToClerk_GetAllStateVariables_Encode,
-                protocol.FromClerk_GetAllStateVariables_Decode),
+                decodeStateVariables),
+            'get_statevar_region': (
+                protocol.ToClerk_GetStateVariablesInRegion_Encode,
+                decodeStateVariables),
             'set_statevar': (
                 protocol.ToClerk_SetStateVector_Encode,
                 protocol.FromClerk_SetStateVector_Decode),
@@ -109,6 +144,9 @@ class Client():
             'control_parts': (
                 protocol.ToClerk_ControlParts_Encode,
                 protocol.FromClerk_ControlParts_Decode),
+            'batch': (
+                protocol.ToClerk_Batch_Encode,
+                protocol.FromClerk_Batch_Decode),
             }
 
     def __del__(self):
@@ -167,8 +205,17 @@ class Client():
 
         # Send data and wait for response.
         self.send(payload)
-        payload = self.recv()
+        return self.parseReply(self.recv())
+
+    @typecheck
+    def parseReply(self, payload: str):
+        """
+        Return the 'ok' flag, message, and payload of the Clerk reply.
 
+        :param str payload: JSON encoded reply from Clerk.
+        :return: Payload data in whatever form it arrives.
+        :rtype: any
+        """
         # Decode the response.
         try:
             ret = json.loads(payload)
@@ -425,12 +472,22 @@ class Client():
         return self.serialiseAndSend('add_templates', templates)
 
     @typecheck
-    def getStateVariables(self, objIDs: (list, tuple, int)):
+    def getStateVariables(self, objIDs: (list, tuple, int),
+                          encoding: str='json'):
         """
         Return the State Variables for all ``objIDs`` in a dictionary.
 
+        The ``encoding`` specifies the wire format (see
+        ``protocol.SVEncodings``). The binary formats are considerably more
+        compact than 'json', but 'float32' loses precision. For them, this
+        method returns the tuple (objIDs, records, missing objIDs) instead of
+        a dictionary. The ``records`` are an N x ``bullet_data.packedSize``
+        array whose rows ``bullet_data.unpack`` converts to ``_BulletData``.
+
         :param list/int objIDs: query the SV for these objects
-        :return: dictionary of State Variables.
+        :param str encoding: wire encoding.
+        :return: dictionary of State Variables (see above for binary
+                 encodings).
         :rtype: dict
         """
         # If the user requested only a single State Variable wrap it into a
@@ -444,44 +501,118 @@ class Client():
             assert objID >= 0
 
         # Pass on the request to Clerk.
-        ret = self.serialiseAndSend('get_statevar', objIDs)
-        if not ret.ok:
-            return ret
-
-        # Convert the returned data back into a named tuple (_BulletData).
-        out = {}
-        for objID, v in ret.data.items():
-            objID = int(objID)
-            if v is not None:
-                out[objID] = _BulletData(**v)
-            else:
-                out[objID] = None
-
-        return RetVal(True, None, out)
+        return self.serialiseAndSend('get_statevar', objIDs, encoding)
 
     @typecheck
-    def getAllStateVariables(self):
+    def getAllStateVariables(self, encoding: str='json'):
         """
         Return the State Variables for all objects in the simulation.
 
+        See ``getStateVariables`` for the meaning of ``encoding``.
+
+        :param str encoding: wire encoding.
         :return: dictionary of State Variables.
         :rtype: dict
         """
         # Pass on the request to Clerk.
-        ret = self.serialiseAndSend('get_all_statevars')
-        if not ret.ok:
-            return ret
+        return self.serialiseAndSend('get_all_statevars', encoding)
 
-        # Convert the returned data back into a named tuple (_BulletData).
-        out = {}
-        for objID, v in ret.data.items():
-            objID = int(objID)
-            if v is not None:
-                out[objID] = _BulletData(**v)
-            else:
-                out[objID] = None
+    @typecheck
+    def getStateVariablesInRegion(self, shape: str, params: dict,
+                                  encoding: str='json'):
+        """
+        Return the State Variables for all objects inside a region.
 
-        return RetVal(True, None, out)
+        The region is a 'box', 'sphere', or view 'frustum'. Every object
+        counts as a sphere whose radius is its AABB. The ``params`` are the
+        keyword arguments of the corresponding query method in
+        ``spatialindex.SpatialIndex``. The ``getStateVariablesIn*`` methods
+        are convenience wrappers for this method.
+
+        :param str shape: 'box', 'sphere', or 'frustum'.
+        :param dict params: shape parameters.
+        :param str encoding: wire encoding.
+        :return: dictionary of State Variables.
+        :rtype: dict
+        """
+        return self.serialiseAndSend(
+            'get_statevar_region', shape, params, encoding)
+
+    @typecheck
+    def getStateVariablesInBox(self, lo: (tuple, list, np.ndarray),
+                               hi: (tuple, list, np.ndarray),
+                               encoding: str='json'):
+        """
+        Return the State Variables for all objects inside a box.
+
+        :param vec3 lo: minimum corner of the box.
+        :param vec3 hi: maximum corner of the box.
+        :param str encoding: wire encoding.
+        :return: dictionary of State Variables.
+        :rtype: dict
+        """
+        params = {'lo': list(lo), 'hi': list(hi)}
+        return self.getStateVariablesInRegion('box', params, encoding)
+
+    @typecheck
+    def getStateVariablesInSphere(self, centre: (tuple, list, np.ndarray),
+                                  radius: (int, float),
+                                  encoding: str='json'):
+        """
+        Return the State Variables for all objects inside a sphere.
+
+        :param vec3 centre: centre of the sphere.
+        :param float radius: radius of the sphere.
+        :param str encoding: wire encoding.
+        :return: dictionary of State Variables.
+        :rtype: dict
+        """
+        params = {'centre': list(centre), 'radius': radius}
+        return self.getStateVariablesInRegion('sphere', params, encoding)
+
+    @typecheck
+    def getStateVariablesInFrustum(
+            self, position: (tuple, list, np.ndarray),
+            view: (tuple, list, np.ndarray), up: (tuple, list, np.ndarray),
+            fov: (int, float), aspect: (int, float), near: (int, float),
+            far: (int, float), encoding: str='json'):
+        """
+        Return the State Variables for all objects inside a view frustum.
+
+        See ``spatialindex.frustumPlanes`` for the parameters, and
+        ``getStateVariables`` for ``encoding``.
+
+        :return: dictionary of State Variables.
+        :rtype: dict
+        """
+        params = {'position': list(position), 'view': list(view),
+                  'up': list(up), 'fov': fov, 'aspect': aspect,
+                  'near': near, 'far': far}
+        return self.getStateVariablesInRegion('frustum', params, encoding)
+
+    @typecheck
+    def subscribe(self, objIDs: (list, tuple)=None,
+                  region: (list, tuple)=None,
+                  addr: str=config.addr_leonard_pub):
+        """
+        Return a subscription to the state frames that Leonard publishes.
+
+        Unlike the ``getStateVariables*`` methods, the subscription does not
+        poll Clerk. Leonard pushes the State Variables after every physics
+        step instead. Use ``recv`` or ``recvLatest`` of the returned
+        ``statefeed.StateSubscriber`` to read them, and ``close`` to end the
+        subscription.
+
+        See ``statefeed.selectObjects`` for the meaning of ``objIDs`` and
+        ``region``.
+
+        :param list objIDs: (optional) only return these objects.
+        :param list region: (optional) only return objects in this region.
+        :param str addr: ZeroMQ address of the state feed.
+        :return: the subscription.
+        :rtype: statefeed.StateSubscriber
+        """
+        return statefeed.StateSubscriber(addr, objIDs, region)
 
     @typecheck
     def setStateVariable(self, objID: int, new_SV: BulletDataOverride):
@@ -523,3 +654,74 @@ class Client():
         :rtype: list of int
         """
         return self.serialiseAndSend('get_all_objids')
+
+    @typecheck
+    def batch(self, cmds: (list, tuple)):
+        """
+        Send all ``cmds`` to Clerk in a single request.
+
+        Every entry in ``cmds`` is a (cmd, args) tuple, where ``args`` are the
+        arguments for the ``ToClerk_*_Encode`` function of command ``cmd``,
+        eg. ('set_force', (objID, force, pos)). Clerk processes the commands
+        in order. The returned list contains one ``RetVal`` per command, just
+        like the one the dedicated method for that command would return.
+
+        This is much faster than sending the commands one by one when
+        controlling many objects. Clerk rejects commands that transfer a lot
+        of data (see ``config.clerk_heavy_commands``).
+
+        :param list cmds: list of (cmd, args) tuples.
+        :return: list of ``RetVal`` tuples.
+        :rtype: list
+        """
+        ret = self.encodeBatch(cmds)
+        if not ret.ok:
+            return ret
+        return self.decodeBatch(cmds, self.sendToClerk('batch', ret.data))
+
+    @typecheck
+    def encodeBatch(self, cmds: (list, tuple)):
+        """
+        Return the 'batch' payload for ``cmds`` (see ``batch``).
+
+        :param list cmds: list of (cmd, args) tuples.
+        :return: payload for the 'batch' command.
+        :rtype: dict
+        """
+        # Encode every command with its own codec.
+        payload = []
+        for cmd, args in cmds:
+            if cmd not in self.codec:
+                return RetVal(False, 'Invalid command <{}>'.format(cmd), None)
+            ok, data = self.codec[cmd][0](*args)
+            if not ok:
+                return RetVal(False, 'Protocol error', None)
+            payload.append((cmd, data))
+
+        ok, data = protocol.ToClerk_Batch_Encode(payload)
+        if not ok:
+            return RetVal(False, 'Protocol error', None)
+        return RetVal(True, None, data)
+
+    @typecheck
+    def decodeBatch(self, cmds: (list, tuple), ret: RetVal):
+        """
+        Decode the reply ``ret`` to the 'batch' request for ``cmds``.
+
+        :param list cmds: list of (cmd, args) tuples.
+        :param RetVal ret: reply from Clerk.
+        :return: list of ``RetVal`` tuples.
+        :rtype: list
+        """
+        if not ret.ok:
+            return ret
+        ret = protocol.FromClerk_Batch_Decode(ret.data)
+
+        # Decode every result with the codec of its command.
+        out = []
+        for (cmd, args), res in zip(cmds, ret.data):
+            if res['ok']:
+                out.append(self.codec[cmd][1](res['payload']))
+            else:
+                out.append(RetVal(False, res['msg'], None))
+        return RetVal(True, None, out)
@@ -18,8 +18,10 @@
 """
 Global configuration parameters.
 """
+import os
 import sys
 import logging
+import tempfile
 import netifaces
 
 # ---------------------------------------------------------------------------
@@ -78,3 +80,80 @@ except (ValueError, KeyError):
 # Address of the various Azrael services.
 addr_clerk = 'tcp://' + host_ip + ':5555'
 addr_leonard_pushpull = 'tcp://' + host_ip + ':5556'
+addr_leonard_cmd = 'tcp://' + host_ip + ':5557'
+addr_leonard_pub = 'tcp://' + host_ip + ':5558'
+
+# Clerk hands every request to a thread of one of these worker pools. Requests
+# for the ``clerk_heavy_commands`` go to the 'heavy' pool, all others to the
+# 'fast' pool. This ensures that large geometry uploads or downloads cannot
+# delay control commands.
+clerk_workers = {'fast': 2, 'heavy': 2}
+clerk_heavy_commands = (
+    'add_templates', 'get_templates', 'get_geometry', 'set_geometry',
+    'spawn', 'get_all_statevars', 'get_statevar_region')
+
+# Maximum size of the decoded templates, and maximum number of object
+# instances, that every Clerk keeps in memory.
+clerk_template_cache_bytes = 256 * 2 ** 20
+clerk_instance_cache_size = 100000
+
+# Clacks answers a Websocket request with an error if Clerk has not replied
+# within ``clacks_relay_timeout`` seconds.
+clacks_relay_timeout = 10.0
+
+# Transport for the commands from Clerk to Leonard ('mongo' or 'zeromq'). See
+# ``physics_interface.commandQueues``.
+cmd_transport = 'mongo'
+
+# Publish the State Vectors in a memory mapped table (see ``sharedstate``)
+# for Clerks on the same host. Leonard then only writes every
+# ``sv_checkpoint_interval``-th step to Mongo.
+sv_shared_memory = False
+sv_shared_path = os.path.join(
+    '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir(),
+    'azrael_sv')
+sv_shared_capacity = 65536
+sv_checkpoint_interval = 10
+
+# Leonard only writes objects to Mongo whose State Vector has changed by more
+# than this value since the last write. Objects whose velocities are below
+# it are written once with a 'resting' marker, and then skipped until they
+# move again.
+sv_sync_epsilon = 1E-6
+
+# Leonard publishes the State Vectors of all objects after every step on the
+# ``addr_leonard_pub`` socket (see ``statefeed``). Without shared memory,
+# Clerk builds its spatial index from them instead of the database.
+sv_publish = True
+
+# Every Leonard Worker queues at most ``leonard_worker_credits`` Work
+# Packages, and Leonard packs the collision sets into about
+# ``leonard_packages_per_worker`` Work Packages per Worker (see
+# ``scheduler``). Leonard requeues all pending Work Packages if no Worker
+# has replied for ``leonard_wp_timeout`` seconds.
+leonard_worker_credits = 2
+leonard_packages_per_worker = 2
+leonard_wp_timeout = 2.0
+
+# Leonard expects every Work Package back within ``leonard_wp_deadline_slack``
+# times its estimated cost, but at least ``leonard_wp_min_deadline`` seconds.
+# Afterwards it sends a duplicate to the next idle Worker and uses the first
+# result. If a step takes longer than ``leonard_tick_budget`` seconds then
+# Leonard either keeps waiting ('wait'), or carries the previous State
+# Vectors of the objects in the missing Work Packages forward ('carry').
+leonard_wp_deadline_slack = 4
+leonard_wp_min_deadline = 0.05
+leonard_tick_budget = 1.0
+leonard_tick_fallback = 'wait'
+
+# Leonard triggers a physics step every ``leonard_target_tick`` seconds if
+# possible.
+leonard_target_tick = 0.01
+
+# Leonard starts ``leonard_workers`` Workers, and then scales their number
+# between ``leonard_min_workers`` and ``leonard_max_workers`` such that a
+# step takes about ``leonard_target_tick`` seconds (see
+# ``scheduler.WorkerScaler``). The default leaves one core for Leonard.
+leonard_workers = 3
+leonard_min_workers = 1
+leonard_max_workers = max(1, (os.cpu_count() or 1) - 1)
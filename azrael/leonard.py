@@ -22,7 +22,8 @@ import os
 import sys
 import zmq
 import time
-import pickle
+import itertools
+import collections
 import pymongo
 import IPython
 import logging
@@ -31,9 +32,15 @@ import multiprocessing
 import numpy as np
 
 import azrael.database
+import azrael.scheduler
 import azrael.vectorgrid
 import azrael.util as util
 import azrael.config as config
+import azrael.objectstore
+import azrael.statefeed
+import azrael.protocol_json as json
+import azrael.sharedstate
+import azrael.workpackage
 import azrael.bullet.boost_bullet
 import azrael.physics_interface as physAPI
 import azrael.bullet.bullet_data as bullet_data
@@ -45,7 +52,6 @@ ipshell = IPython.embed
 RetVal = azrael.util.RetVal
 
 # Work package related.
-WPData = namedtuple('WPRecord', 'id sv force torque')
 WPMeta = namedtuple('WPAdmin', 'wpid dt maxsteps')
 
 # Convenience.
@@ -83,7 +89,7 @@ def sweeping(data: list, labels: np.ndarray, dim: str):
     # increment/decrement array used for convenient processing afterwards.
     arr_pos = np.zeros(N, np.float64)
     arr_lab = np.zeros(N, np.int64)
-    arr_inc = np.zeros(N, np.int8)
+    arr_inc = np.zeros(N, np.int64)
 
     # Fill the arrays.
     for ii in range(len(data)):
@@ -118,11 +124,159 @@ def sweeping(data: list, labels: np.ndarray, dim: str):
     return RetVal(True, None, out)
 
 
+def _sweepSortedEndpoints(rows: np.ndarray, inc: np.ndarray, numRows: int):
+    """
+    Return the set label for all ``numRows`` intervals.
+
+    The ``rows`` and ``inc`` arrays describe the start/stop points of all
+    intervals *after* they were sorted. The ``rows`` array denotes the interval
+    each point belongs to, and ``inc`` is +1 for start points and -1 for stop
+    points.
+
+    A set of overlapping intervals is complete whenever the cumulative sum of
+    ``inc`` drops back to zero. The label of every interval is therefore the
+    number of completed sets that precede its start point.
+
+    :param np.ndarray rows: interval index of every sorted point.
+    :param np.ndarray inc: +1 for start points and -1 for stop points.
+    :param int numRows: number of intervals.
+    :return: set label for every interval.
+    :rtype: np.ndarray
+    """
+    # Running sum of open intervals. Every zero marks the end of a set.
+    csum = np.cumsum(inc)
+    closed = (csum == 0)
+
+    # Safety check: this must never happen.
+    assert (len(csum) == 0) or (csum.min() >= 0)
+
+    # The set index of a point is the number of sets completed before it.
+    setIdx = np.cumsum(closed) - closed
+
+    # Every interval inherits the set index of its start point.
+    isStart = (inc > 0)
+    labels = np.zeros(numRows, np.int64)
+    labels[rows[isStart]] = setIdx[isStart]
+    return labels
+
+
+def _labelsToSets(labels: np.ndarray):
+    """
+    Return a list of index arrays, one for each unique value in ``labels``.
+
+    :param np.ndarray labels: integer label for every element.
+    :return: list of index arrays.
+    :rtype: list
+    """
+    if len(labels) == 0:
+        return []
+
+    # Sort the elements by label and split the result wherever the label
+    # changes.
+    idx = np.argsort(labels, kind='mergesort')
+    bounds = np.flatnonzero(np.diff(labels[idx])) + 1
+    return np.split(idx, bounds)
+
+
+@typecheck
+def sweepingVectorised(start: np.ndarray, stop: np.ndarray,
+                       groups: np.ndarray=None):
+    """
+    Return the label of the overlapping set for every interval.
+
+    This is the NumPy version of ``sweeping``. Instead of a list of
+    dictionaries it expects the start/stop positions of all intervals in a
+    single dimension as two arrays. Rather than a list of sets it returns an
+    integer array that contains the set label of every interval. The labels
+    are consecutive integers starting at zero.
+
+    The optional ``groups`` argument assigns every interval to a group.
+    Intervals in different groups never end up in the same set, even if they
+    overlap. This makes it possible to sweep all the sets from a previous
+    stage (eg. the overlapping sets in 'x') in a single pass.
+
+    At equal positions, start points precede stop points, ie. touching
+    intervals overlap.
+
+    :param np.ndarray start: start position of every interval.
+    :param np.ndarray stop: stop position of every interval.
+    :param np.ndarray groups: (optional) integer group label for every
+        interval.
+    :return: set label for every interval.
+    :rtype: np.ndarray
+    """
+    assert len(start) == len(stop)
+    N = len(start)
+    if groups is None:
+        groups = np.zeros(N, np.int64)
+    assert len(groups) == N
+
+    # Compile the start/stop positions, the interval they belong to, and the
+    # increment (+1 for start, -1 for stop) into flat arrays.
+    pos = np.concatenate((start, stop))
+    rows = np.tile(np.arange(N, dtype=np.int64), 2)
+    inc = np.repeat(np.array([1, -1], np.int64), N)
+
+    # Sort the points by group, then position, and let start points precede
+    # stop points at the same position.
+    idx = np.lexsort((-inc, pos, np.tile(groups, 2)))
+    labels = _sweepSortedEndpoints(rows[idx], inc[idx], N)
+    return RetVal(True, None, labels)
+
+
+@typecheck
+def computeCollisionSetsVectorised(objIDs: (tuple, list, np.ndarray),
+                                   pos: np.ndarray, aabbs: np.ndarray):
+    """
+    Return potential collision sets among all ``objIDs``.
+
+    This is the NumPy engine behind ``computeCollisionSetsAABB``. It expects
+    the positions and AABB sizes as packed arrays where the k-th row belongs
+    to ``objIDs[k]``.
+
+    Like ``computeCollisionSetsAABB`` it first determines the overlapping
+    sets in 'x', then the overlapping sets in 'y' within each of these, and
+    finally does the same in 'z'. However, all sets of a stage are swept
+    simultaneously (see ``sweepingVectorised``).
+
+    :param list objIDs: object IDs.
+    :param np.ndarray pos: N x 3 array of object positions.
+    :param np.ndarray aabbs: N array of AABB sizes.
+    :return: each list contains a unique set of overlapping objects.
+    :rtype: list of lists
+    """
+    # Sanity check.
+    pos = np.asarray(pos, np.float64)
+    aabbs = np.asarray(aabbs, np.float64)
+    if not (len(objIDs) == len(pos) == len(aabbs)):
+        return RetVal(False, 'objIDs, positions, and AABBs are inconsistent',
+                      None)
+    if len(objIDs) == 0:
+        return RetVal(True, None, [])
+    if pos.shape[1] != 3:
+        return RetVal(False, 'Positions must have three columns', None)
+
+    # Sweep the 'x', 'y', and 'z' dimension. Every stage uses the set labels
+    # of the previous one as groups.
+    labels = None
+    for dim in range(3):
+        start, stop = pos[:, dim] - aabbs, pos[:, dim] + aabbs
+        labels = sweepingVectorised(start, stop, labels).data
+
+    # Convert the labels back to object IDs.
+    objIDs = np.asarray(objIDs)
+    out = [objIDs[_].tolist() for _ in _labelsToSets(labels)]
+    return RetVal(True, None, out)
+
+
 @typecheck
 def computeCollisionSetsAABB(SVs: dict, AABBs: dict):
     """
     Return potential collision sets among all objects in ``SVs``.
 
+    This is a convenience wrapper around ``computeCollisionSetsVectorised``.
+    Objects whose SV or AABB is *None* are ignored.
+
     :param dict SVs: Dictionary of State Vectors.
     :param dict AABBs: Dictionary of AABBs.
     :return: each list contains a unique set of overlapping objects.
@@ -132,45 +286,461 @@ def computeCollisionSetsAABB(SVs: dict, AABBs: dict):
     if set(SVs.keys()) != set(AABBs.keys()):
         return RetVal(False, 'SVs and AABBs are inconsisten', None)
 
-    # The 'sweeping' function requires a list of dictionaries. Each dictionary
-    # must contain the min/max spatial extent in x/y/z direction.
-    data = []
-    IDs = list(SVs.keys())
-    for objID in IDs:
-        if (SVs[objID] is None) or (AABBs[objID] is None):
-            continue
-        sv, aabb = SVs[objID], AABBs[objID]
-        pos = sv.position
-        x0, x1 = pos[0] - aabb, pos[0] + aabb
-        y0, y1 = pos[1] - aabb, pos[1] + aabb
-        z0, z1 = pos[2] - aabb, pos[2] + aabb
-
-        data.append({'x': [x0, x1], 'y': [y0, y1], 'z': [z0, z1]})
+    # Pack the positions and AABBs of all objects into NumPy arrays.
+    IDs = [_ for _ in SVs if (SVs[_] is not None) and (AABBs[_] is not None)]
+    pos = np.array([SVs[_].position for _ in IDs], np.float64)
+    aabbs = np.array([AABBs[_] for _ in IDs], np.float64)
     del SVs, AABBs
 
-    # Enumerate the objects.
-    labels = np.arange(len(IDs))
+    return computeCollisionSetsVectorised(IDs, pos.reshape(-1, 3), aabbs)
+
 
-    # Determine the overlapping objects in 'x' direction.
-    stage_0 = sweeping(data, labels, 'x').data
+class CollisionSetStrategy():
+    """
+    Base class for all collision set strategies (broadphases).
 
-    # Determine which of the objects that overlap in 'x' also overlap in 'y'.
-    stage_1 = []
-    for subset in stage_0:
-        tmpData = [data[_] for _ in subset]
-        tmpLabels = np.array(tuple(subset), np.int64)
-        stage_1.extend(sweeping(tmpData, tmpLabels, 'y').data)
+    A strategy maintains the object IDs, positions, and AABB sizes of all
+    objects in the simulation. Leonard adds and removes objects with
+    ``insert`` and ``remove`` whenever it spawns or deletes them, updates
+    their positions with ``update`` before every physics step, and then asks
+    for the potential collision sets with ``computeCollisionSets``.
 
-    # Now determine the objects that overlap in all three dimensions.
-    stage_2 = []
-    for subset in stage_1:
-        tmpData = [data[_] for _ in subset]
-        tmpLabels = np.array(tuple(subset), np.int64)
-        stage_2.extend(sweeping(tmpData, tmpLabels, 'z').data)
+    Internally, every object occupies one row in the ``objIDs``, ``pos``, and
+    ``aabbs`` arrays. Derived classes can track row changes with the
+    ``_onInsert`` and ``_onRemove`` callbacks.
+
+    This class does not compute any collision sets itself.
+    """
+    def __init__(self):
+        # Object IDs, positions and AABB sizes of all objects.
+        self.objIDs = np.zeros(0, np.int64)
+        self.pos = np.zeros((0, 3), np.float64)
+        self.aabbs = np.zeros(0, np.float64)
+
+        # Map objIDs to rows.
+        self.rows = {}
+
+    def __len__(self):
+        return len(self.objIDs)
+
+    def __contains__(self, objID):
+        return objID in self.rows
+
+    @typecheck
+    def insert(self, objIDs: (tuple, list), pos: np.ndarray,
+               aabbs: np.ndarray):
+        """
+        Add the ``objIDs`` with positions ``pos`` and AABB sizes ``aabbs``.
+
+        :param list objIDs: IDs of new objects.
+        :param np.ndarray pos: N x 3 array of object positions.
+        :param np.ndarray aabbs: N array of AABB sizes.
+        :return: Success
+        """
+        # Sanity checks.
+        pos = np.asarray(pos, np.float64).reshape(-1, 3)
+        aabbs = np.asarray(aabbs, np.float64)
+        if not (len(objIDs) == len(pos) == len(aabbs)):
+            return RetVal(False, 'objIDs, positions, and AABBs mismatch', None)
+        if len(set(objIDs)) != len(objIDs):
+            return RetVal(False, 'objIDs are not unique', None)
+        if len([_ for _ in objIDs if _ in self.rows]) > 0:
+            return RetVal(False, 'At least one objID already exists', None)
+
+        # Append the new objects.
+        N = len(self.objIDs)
+        newRows = np.arange(N, N + len(objIDs), dtype=np.int64)
+        self.objIDs = np.concatenate((self.objIDs, np.array(objIDs, np.int64)))
+        self.pos = np.vstack((self.pos, pos))
+        self.aabbs = np.concatenate((self.aabbs, aabbs))
+        self.rows.update(zip(objIDs, newRows.tolist()))
+
+        self._onInsert(newRows)
+        return RetVal(True, None, None)
+
+    @typecheck
+    def remove(self, objIDs: (tuple, list)):
+        """
+        Remove ``objIDs`` and return the number of actually removed objects.
+
+        Non-existing objects are ignored.
+
+        The rows of the removed objects are filled with the last rows of the
+        arrays to keep them compact.
+
+        :param list objIDs: IDs of objects to remove.
+        :return: number of removed objects.
+        :rtype: int
+        """
+        rows = [self.rows.pop(_) for _ in set(objIDs) if _ in self.rows]
+        if len(rows) == 0:
+            return RetVal(True, None, 0)
+
+        # Flag the rows to remove.
+        N = len(self.objIDs)
+        newN = N - len(rows)
+        dead = np.zeros(N, bool)
+        dead[rows] = True
+
+        # The surviving rows beyond the new array size fill the holes of the
+        # removed rows before it.
+        holes = np.flatnonzero(dead[:newN])
+        movers = np.flatnonzero(~dead[newN:]) + newN
+        newRow = np.arange(N, dtype=np.int64)
+        newRow[movers] = holes
+
+        # Move the rows and shrink the arrays.
+        for name in ('objIDs', 'pos', 'aabbs'):
+            arr = getattr(self, name)
+            arr[holes] = arr[movers]
+            setattr(self, name, arr[:newN].copy())
+        self.rows.update(zip(self.objIDs[holes].tolist(), holes.tolist()))
+
+        self._onRemove(dead, newRow)
+        return RetVal(True, None, len(rows))
+
+    @typecheck
+    def update(self, SVs: dict):
+        """
+        Update the positions of all objects from ``SVs``.
+
+        The ``SVs`` dictionary must contain an entry for every object.
+
+        :param dict SVs: Dictionary of State Vectors.
+        :return: Success
+        """
+        try:
+            pos = [SVs[_].position for _ in self.objIDs.tolist()]
+        except KeyError:
+            return RetVal(False, 'SVs and broadphase are inconsistent', None)
+        self.pos = np.array(pos, np.float64).reshape(-1, 3)
+        return RetVal(True, None, None)
+
+    @typecheck
+    def updatePositions(self, objIDs: np.ndarray, pos: np.ndarray):
+        """
+        Update the positions of all objects from the ``objIDs`` and ``pos``
+        arrays.
+
+        The arrays may contain unused entries (objID -1) and be in any order,
+        but must contain every object of the broadphase.
+
+        :param np.ndarray objIDs: N array of object IDs.
+        :param np.ndarray pos: N x 3 array of positions.
+        :return: Success
+        """
+        if len(self.objIDs) == 0:
+            return RetVal(True, None, None)
+
+        # Find the index of every broadphase object in ``objIDs``.
+        order = np.argsort(objIDs, kind='mergesort')
+        idx = np.searchsorted(objIDs, self.objIDs, sorter=order)
+        idx = order[np.clip(idx, 0, len(order) - 1)]
+        if not np.array_equal(objIDs[idx], self.objIDs):
+            return RetVal(False, 'SVs and broadphase are inconsistent', None)
+        self.pos = np.array(pos[idx], np.float64)
+        return RetVal(True, None, None)
+
+    def _onInsert(self, newRows: np.ndarray):
+        """
+        Stub that triggers after ``newRows`` were appended.
+
+        :param np.ndarray newRows: indices of the new rows.
+        """
+        pass
+
+    def _onRemove(self, dead: np.ndarray, newRow: np.ndarray):
+        """
+        Stub that triggers after rows were removed.
+
+        The ``dead`` array flags the removed rows and ``newRow`` specifies the
+        new index of every surviving row (both refer to the old rows).
+
+        :param np.ndarray dead: Boolean flag for every old row.
+        :param np.ndarray newRow: new index of every old row.
+        """
+        pass
+
+    def computeCollisionSets(self):
+        """
+        Return potential collision sets among all objects.
+
+        :return: each list contains a unique set of overlapping objects.
+        :rtype: list of lists
+        """
+        return RetVal(False, 'Not implemented', None)
 
-    # Convert the labels back to object IDs.
-    out = [[IDs[objID] for objID in objIDs] for objIDs in stage_2]
-    return RetVal(True, None, out)
+
+class SweepAndPrune(CollisionSetStrategy):
+    """
+    Incremental Sweep-and-Prune broadphase.
+
+    This class computes the same collision sets as
+    ``computeCollisionSetsVectorised`` but retains the sorted start/stop
+    points of all AABBs from one call to the next. Since most objects only
+    move slightly between two physics steps the points are almost sorted
+    already, and the (stable) Timsort in NumPy will only have to fix up a few
+    of them. For temporally coherent scenes this is close to O(N).
+
+    The sorted points are stored as integers: ``2 * row`` denotes the start
+    point and ``2 * row + 1`` the stop point of that row.
+    """
+    def __init__(self):
+        super().__init__()
+
+        # The sorted start/stop points in each dimension.
+        self.order = [np.zeros(0, np.int64) for _ in range(3)]
+
+    def _onInsert(self, newRows: np.ndarray):
+        """
+        Append the start/stop points of the ``newRows``.
+
+        They will move to their correct place the next time the collision sets
+        are computed.
+        """
+        points = np.column_stack((2 * newRows, 2 * newRows + 1)).flatten()
+        self.order = [np.concatenate((_, points)) for _ in self.order]
+
+    def _onRemove(self, dead: np.ndarray, newRow: np.ndarray):
+        """
+        Remove the start/stop points of all ``dead`` rows and relabel the
+        moved ones. This leaves the relative order of all other points intact.
+        """
+        for dim, order in enumerate(self.order):
+            order = order[~dead[order >> 1]]
+            self.order[dim] = (newRow[order >> 1] << 1) | (order & 1)
+
+    def _sortDimension(self, dim: int):
+        """
+        Sort the start/stop points in dimension ``dim`` and return them.
+
+        The points from the last call serve as the initial order. NumPy uses
+        Timsort for stable float sorts, which is nearly linear if the points
+        are almost sorted already.
+
+        :param int dim: dimension (0, 1, or 2).
+        :return: sorted start/stop points.
+        :rtype: np.ndarray
+        """
+        # Compute the current coordinates of all points in the last order.
+        order = self.order[dim]
+        rows, isStop = order >> 1, order & 1
+        vals = self.pos[rows, dim] + (2 * isStop - 1) * self.aabbs[rows]
+
+        # Sort them.
+        idx = np.argsort(vals, kind='mergesort')
+        order, vals = order[idx], vals[idx]
+
+        # Start points must precede stop points at the same position. The
+        # stable sort cannot guarantee this if they swapped their order, in
+        # which case we fall back to a full sort.
+        isStop = order & 1
+        swapped = (vals[1:] == vals[:-1]) & (isStop[:-1] > isStop[1:])
+        if np.any(swapped):
+            order = order[np.lexsort((isStop, vals))]
+
+        self.order[dim] = order
+        return order
+
+    def computeCollisionSets(self):
+        """
+        Return potential collision sets among all objects.
+
+        The result is identical to ``computeCollisionSetsVectorised``.
+
+        :return: each list contains a unique set of overlapping objects.
+        :rtype: list of lists
+        """
+        N = len(self.objIDs)
+        if N == 0:
+            return RetVal(True, None, [])
+
+        labels = None
+        for dim in range(3):
+            order = self._sortDimension(dim)
+
+            # Group the points by the set labels of the previous stage. The
+            # sort is stable and retains the spatial order within each group.
+            if labels is not None:
+                order = order[np.argsort(labels[order >> 1], kind='mergesort')]
+
+            # Sweep the sorted points.
+            inc = 1 - 2 * (order & 1)
+            labels = _sweepSortedEndpoints(order >> 1, inc, N)
+
+        # Convert the labels back to object IDs.
+        out = [self.objIDs[_].tolist() for _ in _labelsToSets(labels)]
+        return RetVal(True, None, out)
+
+
+def _connectedComponents(numNodes: int, src: np.ndarray, dst: np.ndarray):
+    """
+    Return the connected component label of every node.
+
+    The graph has ``numNodes`` nodes and the edges ``src[i] <-> dst[i]``.
+    Every node receives the smallest node index in its component as label.
+
+    The function alternates between hooking the labels of all edge end
+    points to the smaller of the two, and pointer jumping to flatten the
+    resulting trees. Both steps are vectorised.
+
+    :param int numNodes: number of nodes.
+    :param np.ndarray src: first node of every edge.
+    :param np.ndarray dst: second node of every edge.
+    :return: component label for every node.
+    :rtype: np.ndarray
+    """
+    labels = np.arange(numNodes, dtype=np.int64)
+    while True:
+        # Hook the label of both end points to the smaller one.
+        minLabel = np.minimum(labels[src], labels[dst])
+        old = labels.copy()
+        np.minimum.at(labels, labels[src], minLabel)
+        np.minimum.at(labels, labels[dst], minLabel)
+
+        # Pointer jumping until every node points to its root.
+        while True:
+            tmp = labels[labels]
+            if np.array_equal(tmp, labels):
+                break
+            labels = tmp
+
+        if np.array_equal(old, labels):
+            return labels
+
+
+class SpatialHashGrid(CollisionSetStrategy):
+    """
+    Uniform grid broadphase.
+
+    All objects are hashed into the cells of a uniform grid, and only objects
+    sharing a cell are tested for overlap. Unlike Sweep-and-Prune, the
+    collision sets are the connected components of the actual AABB overlap
+    graph. The sets are thus never larger (but often smaller) than those of
+    ``SweepAndPrune``, especially in dense scenes where the projections of
+    the AABBs overlap on every axis.
+
+    The cell size defaults to the largest AABB width, excluding outliers that
+    are more than ``outlierFactor`` times larger than the median AABB. Every
+    other object spans at most two cells per axis, ie. at most eight cells.
+    The outliers (eg. the ground plane) are tested against all objects
+    directly instead.
+
+    :param float cellSize: fixed cell size (None derives it from the AABBs).
+    :param float outlierFactor: AABBs this much larger than the median do not
+        affect the cell size.
+    """
+    @typecheck
+    def __init__(self, cellSize: (int, float)=None,
+                 outlierFactor: (int, float)=4):
+        super().__init__()
+        self.cellSize = cellSize
+        self.outlierFactor = outlierFactor
+
+    def _computeCellSize(self):
+        """
+        Return the grid cell size.
+
+        :return: the cell size.
+        :rtype: float
+        """
+        if self.cellSize is not None:
+            h = float(self.cellSize)
+        else:
+            # Twice the largest AABB size that is not an outlier.
+            med = np.median(self.aabbs)
+            h = 2 * np.max(self.aabbs[self.aabbs <= self.outlierFactor * med])
+
+        # Points and zero sized AABBs still need a valid grid.
+        return h if h > 0 else 1.0
+
+    def _candidatePairs(self, h: float, small: np.ndarray):
+        """
+        Return all pairs of ``small`` rows that share at least one grid cell.
+
+        The returned pairs may contain duplicates.
+
+        :param float h: cell size.
+        :param np.ndarray small: the rows to hash into the grid.
+        :return: (src, dst) rows of all candidate pairs.
+        :rtype: tuple
+        """
+        # Lower and upper cell index of every AABB. By construction the
+        # difference is either 0 or 1 in every dimension.
+        pos, aabbs = self.pos[small], self.aabbs[small, None]
+        lo = np.floor((pos - aabbs) / h).astype(np.int64)
+        span = np.floor((pos + aabbs) / h).astype(np.int64) - lo
+
+        # Enumerate all (cell, row) combinations.
+        cells, rows = [], []
+        for ofs in itertools.product((0, 1), repeat=3):
+            ofs = np.array(ofs, np.int64)
+            mask = np.all(span >= ofs, axis=1)
+            cells.append(lo[mask] + ofs)
+            rows.append(small[mask])
+        cells, rows = np.vstack(cells), np.concatenate(rows)
+
+        # Sort by cell and assign a unique ID to every occupied cell.
+        idx = np.lexsort(cells.T[::-1])
+        cells, rows = cells[idx], rows[idx]
+        newCell = np.any(cells[1:] != cells[:-1], axis=1)
+        cellID = np.concatenate(([0], np.cumsum(newCell)))
+
+        # Pair every entry with its successors in the same cell. The
+        # candidates for distance d+1 are a subset of those for distance d,
+        # which keeps the total work proportional to the number of pairs.
+        src, dst = [], []
+        start = np.arange(len(rows) - 1)
+        dist = 1
+        while len(start) > 0:
+            start = start[start + dist < len(rows)]
+            start = start[cellID[start] == cellID[start + dist]]
+            src.append(rows[start])
+            dst.append(rows[start + dist])
+            dist += 1
+        return np.concatenate(src), np.concatenate(dst)
+
+    def computeCollisionSets(self):
+        """
+        Return potential collision sets among all objects.
+
+        Two objects are in the same set if their AABBs overlap, either
+        directly or via a chain of other objects.
+
+        :return: each list contains a unique set of overlapping objects.
+        :rtype: list of lists
+        """
+        N = len(self.objIDs)
+        if N == 0:
+            return RetVal(True, None, [])
+
+        # Objects wider than a cell are tested against all other objects.
+        h = self._computeCellSize()
+        isLarge = 2 * self.aabbs > h
+        src, dst = self._candidatePairs(h, np.flatnonzero(~isLarge))
+        src, dst = [src], [dst]
+        for row in np.flatnonzero(isLarge):
+            src.append(np.full(N, row, np.int64))
+            dst.append(np.arange(N, dtype=np.int64))
+        src, dst = np.concatenate(src), np.concatenate(dst)
+
+        # Keep only the pairs whose AABBs actually overlap.
+        dist = np.abs(self.pos[src] - self.pos[dst])
+        width = (self.aabbs[src] + self.aabbs[dst])[:, None]
+        overlap = np.all(dist <= width, axis=1)
+        src, dst = src[overlap], dst[overlap]
+
+        # Merge all overlapping objects into sets.
+        labels = _connectedComponents(N, src, dst)
+        out = [self.objIDs[_].tolist() for _ in _labelsToSets(labels)]
+        return RetVal(True, None, out)
+
+
+# All available collision set strategies.
+collisionSetStrategies = {
+    'sweeping': SweepAndPrune,
+    'grid': SpatialHashGrid,
+}
 
 
 class LeonardBase(multiprocessing.Process):
@@ -180,8 +750,12 @@ class LeonardBase(multiprocessing.Process):
     No physics is actually computed here. The class serves mostly as an
     interface for the actual Leonard implementations, as well as a test
     framework.
+
+    :param str broadphase: name of collision set strategy (see
+        ``collisionSetStrategies``).
     """
-    def __init__(self):
+    @typecheck
+    def __init__(self, broadphase: str='sweeping'):
         super().__init__()
 
         # Create a Class-specific logger.
@@ -193,10 +767,29 @@ class LeonardBase(multiprocessing.Process):
         # Create the DB handles.
         self._DB_SV = azrael.database.dbHandles['SV']
 
-        self.allObjects = {}
-        self.allAABBs = {}
-        self.allForces = {}
-        self.allTorques = {}
+        # Columnar store for all objects. The ``all*`` attributes are
+        # dictionary-like views (objID -> value) into it.
+        self.objects = azrael.objectstore.ObjectStore()
+        self.allObjects = self.objects.svView
+        self.allAABBs = self.objects.aabbView
+        self.allForces = self.objects.forceView
+        self.allTorques = self.objects.torqueView
+
+        # Memory mapped State Vector table (see ``publishSharedState``), and
+        # the number of ``syncObjects`` calls.
+        self.sharedState = None
+        self.syncCounter = 0
+
+        # Publisher for the state frames (see ``publishStateFrame``).
+        if config.sv_publish:
+            self.statePublisher = azrael.statefeed.getStatePublisher()
+        else:
+            self.statePublisher = None
+
+        # Broadphase to compute the collision sets. It retains its state from
+        # one step to the next.
+        assert broadphase in collisionSetStrategies
+        self.broadphase = collisionSetStrategies[broadphase]()
 
     def setup(self):
         """
@@ -235,6 +828,27 @@ class LeonardBase(multiprocessing.Process):
         gridForces = {objID: val for objID, val in zip(objIDs, ret.data)}
         return RetVal(True, None, gridForces)
 
+    @typecheck
+    def getGridForcesArray(self, positions: np.ndarray):
+        """
+        Return the grid forces at all ``positions`` as an N x 3 array.
+
+        Unlike ``getGridForces`` this method always succeeds. If the grid is
+        unavailable then all forces are zero.
+
+        :param np.ndarray positions: N x 3 array of positions.
+        :return: N x 3 array of forces.
+        :rtype: np.ndarray
+        """
+        if len(positions) == 0:
+            return np.zeros((0, 3), np.float64)
+
+        ret = azrael.vectorgrid.getValues('force', positions)
+        if not ret.ok:
+            self.logit.info(ret.msg)
+            return np.zeros((len(positions), 3), np.float64)
+        return ret.data
+
     @typecheck
     def step(self, dt: (int, float), maxsteps: int):
         """
@@ -248,38 +862,51 @@ class LeonardBase(multiprocessing.Process):
                              ``dt`` update.
         """
         self.processCommandQueue()
+        self.eulerStep(dt)
 
-        # Fetch the forces for all object positions.
-        idPos = {k: v.position for (k, v) in self.allObjects.items()}
-        ret = self.getGridForces(idPos)
-        if not ret.ok:
-            self.logit.info(ret.msg)
-            z = np.float64(0)
-            gridForces = {_: z for _ in idPos}
-        else:
-            gridForces = ret.data
-        del ret, idPos
+        # Synchronise the local object cache back to the database.
+        self.syncObjects(writeconcern=False)
 
-        # Iterate over all objects and update their SV information in Bullet.
-        for objID, sv in self.allObjects.items():
-            # Fetch the force vector for the current object from the DB.
-            force = np.array(self.allForces[objID], np.float64)
+    @typecheck
+    def eulerStep(self, dt: (int, float)):
+        """
+        Update velocity and position of all objects with an Euler step.
 
-            # Add the force defined on the 'force' grid.
-            force += gridForces[objID]
+        The update is a few array expressions directly on the object store,
+        which makes this engine suitable for large particle swarms that do
+        not require a rigid body engine.
 
-            # Update velocity and position.
-            vel = np.array(sv.velocityLin, np.float64) + 0.5 * force
-            pos = np.array(sv.position, np.float64)
-            sv.velocityLin[:] = vel.tolist()
-            sv.position[:] = (pos + dt * vel).tolist()
+        :param float dt: time step in seconds.
+        """
+        # Convenience.
+        store = self.objects
+        pos = store.column('position')
+        vel = store.column('velocityLin')
 
-            self.allForces[objID] = [0, 0, 0]
-            self.allTorques[objID] = [0, 0, 0]
-            self.allObjects[objID] = sv
+        # Add the forces defined on the 'force' grid.
+        force = store.column('force') + self.getGridForcesArray(pos)
 
-        # Synchronise the local object cache back to the database.
-        self.syncObjects(writeconcern=False)
+        # Update velocity and position of all objects (in place).
+        vel += 0.5 * force
+        pos += dt * vel
+        store.resetForces()
+
+    def computeCollisionSets(self):
+        """
+        Return potential collision sets among all objects in the local cache.
+
+        This method updates the object positions in the incremental
+        broadphase and defers to it for the actual computation.
+
+        :return: each list contains a unique set of overlapping objects.
+        :rtype: list of lists
+        """
+        store = self.objects
+        ret = self.broadphase.updatePositions(
+            store.objIDs, store.column('position'))
+        if not ret.ok:
+            return ret
+        return self.broadphase.computeCollisionSets()
 
     def processCommandQueue(self):
         """
@@ -287,7 +914,11 @@ class LeonardBase(multiprocessing.Process):
 
         Applied commands are automatically removed.
 
-        :return bool: Success.
+        The returned dictionary contains the objIDs of all 'spawned',
+        'removed', and 'modified' objects.
+
+        :return: IDs of affected objects.
+        :rtype: dict
         """
         # Fetch (and de-queue) all pending commands.
         ret = physAPI.dequeueCommands()
@@ -301,38 +932,50 @@ class LeonardBase(multiprocessing.Process):
         fields = BulletDataOverride._fields
 
         # Remove objects.
+        removed = []
         for doc in cmds['remove']:
             objID = doc['objID']
-            if objID in self.allObjects:
+            if objID in self.objects:
                 self._DB_SV.remove({'objID': objID})
-                del self.allObjects[objID]
-                del self.allForces[objID]
-                del self.allTorques[objID]
-                del self.allAABBs[objID]
+                removed.append(objID)
+        self.objects.remove(removed)
+        self.broadphase.remove(removed)
 
         # Spawn objects.
+        spawned = []
         for doc in cmds['spawn']:
             objID = doc['objID']
-            if objID in self.allObjects:
+            if objID in self.objects:
                 msg = 'Cannot spawn object since objID={} already exists'
                 self.logit.warning(msg.format(objID))
             else:
-                sv_old = doc['sv']
-                self.allObjects[objID] = _BulletData(*sv_old)
-                self.allForces[objID] = [0, 0, 0]
-                self.allTorques[objID] = [0, 0, 0]
-                self.allAABBs[objID] = float(doc['AABB'])
+                sv_old = _BulletData(*doc['sv'])
+                self.objects.add(objID, sv_old, float(doc['AABB']))
+                spawned.append(objID)
+
+        # Fill the holes of the removed objects.
+        self.objects.compact()
+
+        # Add the new objects to the broadphase.
+        if len(spawned) > 0:
+            rows = [self.objects.rows[_] for _ in spawned]
+            pos = self.objects.column('position')[rows]
+            aabbs = self.objects.column('aabb')[rows]
+            self.broadphase.insert(spawned, pos, aabbs)
 
         # Update State Vectors.
         fun = physAPI._updateBulletDataTuple
+        modified = []
         for doc in cmds['modify']:
             objID, sv_new = doc['objID'], doc['sv']
             if objID in self.allObjects:
+                modified.append(objID)
                 sv_new = BulletDataOverride(**dict(zip(fields, sv_new)))
                 sv_old = self.allObjects[objID]
                 sv_old = [getattr(sv_old, _) for _ in fields]
                 sv_old = BulletData(*sv_old)
                 self.allObjects[objID] = fun(sv_old, sv_new)
+        self.objects.markDirty(modified)
 
         # Update force- and torque values.
         for doc in cmds['force']:
@@ -341,34 +984,112 @@ class LeonardBase(multiprocessing.Process):
                 self.allForces[objID] = force
                 self.allTorques[objID] = torque
 
-        return RetVal(True, None, None)
+        changes = {'spawned': spawned, 'removed': removed,
+                   'modified': modified}
+        return RetVal(True, None, changes)
 
     def syncObjects(self, writeconcern: bool):
         """
-        Copy all local SVs to DB.
+        Copy all changed SVs to DB.
+
+        Only objects that have changed by more than ``config.sv_sync_epsilon``
+        since the last sync are written (see ``ObjectStore.dirtyRows``).
+        Every document has a 'resting' flag. Objects at rest are written once
+        with that flag set, and then skipped until they move again.
 
         The ``writeconcern`` flag is mostly for performance tuning. If set to
         *False* then the sync will not wait for an acknowledgement from the
         database after the write opration.
 
+        If ``config.sv_publish`` is set then this method also publishes a
+        state frame with all SVs (see ``publishStateFrame``).
+
+        If ``config.sv_shared_memory`` is set then this method publishes the
+        SVs in the shared memory table every time, but only writes every
+        ``config.sv_checkpoint_interval``-th call to the database (unless
+        ``writeconcern`` is *True*).
+
         :param bool writeconcern: disable write concern when set to *False*.
         """
+        self.syncCounter += 1
+        if self.statePublisher is not None:
+            self.publishStateFrame()
+        if config.sv_shared_memory:
+            self.publishSharedState()
+            checkpoint = self.syncCounter % config.sv_checkpoint_interval
+            if (not writeconcern) and (checkpoint != 0):
+                return
+
         # Return immediately if we have no objects to begin with.
-        if len(self.allObjects) == 0:
+        store = self.objects
+        if len(store) == 0:
             return
 
-        # Update (or insert if not exist) all objects. Use a Bulk operator to
-        # speed up the query.
+        # Find the objects that have changed since the last sync.
+        rows, resting = store.dirtyRows(config.sv_sync_epsilon)
+        util.logMetricQty('#SyncedObjects', len(rows))
+        if len(rows) == 0:
+            return
+
+        # Update (or insert if not exist) the changed objects. Use a Bulk
+        # operator to speed up the query.
+        objIDs = store.objIDs[rows].tolist()
+        aabbs = store.column('aabb')[rows].tolist()
         bulk = self._DB_SV.initialize_unordered_bulk_op()
-        for objID, sv in self.allObjects.items():
-            query = {'objID': objID}
-            data = {'objID': objID, 'sv': sv, 'AABB': self.allAABBs[objID]}
+        for ii, row in enumerate(rows.tolist()):
+            query = {'objID': objIDs[ii]}
+            data = {'objID': objIDs[ii], 'sv': store.getSV(row),
+                    'AABB': aabbs[ii], 'resting': bool(resting[ii])}
             bulk.find(query).upsert().update({'$set': data})
 
         if writeconcern:
             bulk.execute()
         else:
             bulk.execute({'w': 0, 'j': False})
+        store.markSynced(rows, resting)
+
+    def publishSharedState(self):
+        """
+        Publish all SVs in the shared memory table.
+
+        The table is created on demand at ``config.sv_shared_path``, which
+        invalidates the table of any previous Leonard.
+
+        :return: Success
+        """
+        if self.sharedState is None:
+            self.sharedState = azrael.sharedstate.SharedStateTable(
+                config.sv_shared_path, config.sv_shared_capacity, create=True)
+
+        # The store is compact after the commands were processed.
+        store = self.objects
+        rows = np.flatnonzero(store.objIDs >= 0)
+        ret = self.sharedState.publish(
+            store.objIDs[rows], store.getPacked(rows),
+            store.column('aabb')[rows])
+        if not ret.ok:
+            self.logit.error(ret.msg)
+        return ret
+
+    def publishStateFrame(self):
+        """
+        Publish the SVs of all objects via ``self.statePublisher``.
+
+        Publishing stops for good if the publisher cannot bind its socket,
+        eg. because another Leonard process has already bound it.
+
+        :return: Success
+        """
+        # The store is compact after the commands were processed.
+        store = self.objects
+        rows = np.flatnonzero(store.objIDs >= 0)
+        ret = self.statePublisher.publish(
+            self.syncCounter, store.objIDs[rows], store.getPacked(rows),
+            store.column('aabb')[rows])
+        if not ret.ok:
+            self.logit.warning(ret.msg + ' - state frames disabled')
+            self.statePublisher = None
+        return ret
 
     def processCommandsAndSync(self):
         """
@@ -389,15 +1110,19 @@ class LeonardBase(multiprocessing.Process):
         """
         setproctitle.setproctitle('killme ' + self.__class__.__name__)
 
-        # Initialisation.
+        # Initialisation. The shared State Vector table of a previous Leonard
+        # may be stale, eg. if it crashed.
+        if config.sv_shared_memory:
+            azrael.sharedstate.invalidateTable(config.sv_shared_path)
         self.setup()
         self.logit.debug('Setup complete.')
 
-        # Trigger the `step` method every 10ms, if possible.
+        # Trigger the `step` method every ``leonard_target_tick`` seconds,
+        # if possible.
         t0 = time.time()
         while True:
-            # Wait, if less than 10ms have passed, or proceed immediately.
-            sleep_time = 0.01 - (time.time() - t0)
+            # Wait, if the tick is not over yet, or proceed immediately.
+            sleep_time = config.leonard_target_tick - (time.time() - t0)
             if sleep_time > 0:
                 time.sleep(sleep_time)
 
@@ -415,15 +1140,46 @@ class LeonardBullet(LeonardBase):
 
     Unlike ``LeonardBase`` this class actually *does* update the physics.
     """
-    def __init__(self):
-        super().__init__()
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
         self.bullet = None
 
+        # Pre-allocated buffer for the State Vectors from Bullet.
+        self._bulletBuf = np.zeros((0, bullet_data.packedSize), np.float64)
+
     def setup(self):
         # Instantiate the Bullet engine. The (1, 0) parameters mean
         # the engine has ID '1' and does not build explicit pair caches.
         self.bullet = azrael.bullet.boost_bullet.PyBulletPhys(1)
 
+    def fetchFromBullet(self, objIDs: (tuple, list), rows: (tuple, list)):
+        """
+        Copy the State Vectors of ``objIDs`` from Bullet to ``rows`` of the
+        object store.
+
+        If Bullet does not know all objects then this method fetches them
+        one by one instead. Objects unknown to Bullet keep their State Vector.
+
+        :param list objIDs: IDs of the objects to fetch.
+        :param list rows: rows of these objects in the object store.
+        """
+        if len(objIDs) == 0:
+            return
+        if len(self._bulletBuf) < len(objIDs):
+            self._bulletBuf = np.zeros(
+                (2 * len(objIDs), bullet_data.packedSize), np.float64)
+        ret = self.bullet.getObjectDataBatch(objIDs, self._bulletBuf)
+        if ret.ok:
+            self.objects.setPacked(rows, ret.data)
+            return
+
+        # Fall back to fetching the objects individually.
+        self.logit.error('Unable to get all objects from Bullet')
+        for objID, row in zip(objIDs, rows):
+            ret = self.bullet.getObjectData([objID])
+            if ret.ok:
+                self.objects.setSV(row, ret.data)
+
     @typecheck
     def step(self, dt, maxsteps):
         """
@@ -438,50 +1194,30 @@ class LeonardBullet(LeonardBase):
         :param int maxsteps: maximum number of sub-steps to simulate for one
                              ``dt`` update.
         """
-
-        # Convenience.
-        vg = azrael.vectorgrid
-
         # Process pending commands.
         self.processCommandQueue()
 
-        # Fetch the forces for all object positions.
-        idPos = {k: v.position for (k, v) in self.allObjects.items()}
-        ret = self.getGridForces(idPos)
-        if not ret.ok:
-            self.logit.info(ret.msg)
-            z = np.float64(0)
-            gridForces = {_: z for _ in idPos}
-        else:
-            gridForces = ret.data
-        del ret, idPos
-
-        # Iterate over all objects and update them.
-        for objID, sv in self.allObjects.items():
-            # Pass the SV data from the DB to Bullet.
-            self.bullet.setObjectData(objID, sv)
-
-            # Convenience.
-            force, torque = self.allForces[objID], self.allTorques[objID]
+        # Add the forces defined on the 'force' grid to the user forces.
+        store = self.objects
+        force = store.column('force')
+        force = force + self.getGridForcesArray(store.column('position'))
+        torque = store.column('torque')
 
-            # Add the force defined on the 'force' grid.
-            force += gridForces[objID]
+        # Pass the SV data of all objects to Bullet.
+        objIDs, rows = list(store.rows.keys()), list(store.rows.values())
+        self.bullet.setObjectDataBatch(objIDs, store.getPacked(rows))
 
-            # Apply the force to the object.
-            self.bullet.applyForceAndTorque(objID, force, torque)
+        # Apply the final forces to the objects.
+        self.bullet.applyForceAndTorqueBatch(objIDs, force[rows], torque[rows])
 
         # Wait for Bullet to advance the simulation by one step.
         with util.Timeit('compute') as timeit:
-            self.bullet.compute(list(self.allObjects.keys()), dt, maxsteps)
+            self.bullet.compute(objIDs, dt, maxsteps)
 
         # Retrieve all objects from Bullet, overwrite the state variables that
         # the user wanted to change explicitly (if any)
-        for objID in self.allObjects:
-            ret = self.bullet.getObjectData([objID])
-            if ret.ok:
-                self.allObjects[objID] = ret.data
-            self.allForces[objID] = [0, 0, 0]
-            self.allTorques[objID] = [0, 0, 0]
+        self.fetchFromBullet(objIDs, rows)
+        store.resetForces()
 
         # Synchronise the local object cache back to the database.
         self.syncObjects(writeconcern=False)
@@ -516,59 +1252,108 @@ class LeonardSweeping(LeonardBullet):
 
         # Compute the collision sets.
         with util.Timeit('CCS') as timeit:
-            collSets = computeCollisionSetsAABB(self.allObjects, self.allAABBs)
+            collSets = self.computeCollisionSets()
         if not collSets.ok:
-            self.logit.error('ComputeCollisionSetsAABB returned an error')
+            self.logit.error('computeCollisionSets returned an error')
             sys.exit(1)
         collSets = collSets.data
 
         # Log the number of created collision sets.
         util.logMetricQty('#CollSets', len(collSets))
 
-        # Convenience.
-        vg = azrael.vectorgrid
+        # Add the forces defined on the 'force' grid to the user forces.
+        store = self.objects
+        force = store.column('force')
+        force = force + self.getGridForcesArray(store.column('position'))
+        torque = store.column('torque')
 
         # Process all subsets individually.
         for subset in collSets:
-            # Compile the subset dictionary for the current collision set.
-            coll_SV = {_: self.allObjects[_] for _ in subset}
+            # Pass the SV data of all objects in the set to Bullet.
+            rows = [store.rows[_] for _ in subset]
+            self.bullet.setObjectDataBatch(subset, store.getPacked(rows))
 
-            # Fetch the forces for all object positions.
-            idPos = {k: v.position for (k, v) in coll_SV.items()}
-            ret = self.getGridForces(idPos)
-            if not ret.ok:
-                self.logit.info(ret.msg)
-                z = np.float64(0)
-                gridForces = {_: z for _ in idPos}
-            else:
-                gridForces = ret.data
-            del ret, idPos
+            # Apply the final forces to the objects.
+            self.bullet.applyForceAndTorqueBatch(
+                subset, force[rows], torque[rows])
 
-            # Iterate over all objects and update them.
-            for objID, sv in coll_SV.items():
-                # Pass the SV data from the DB to Bullet.
-                self.bullet.setObjectData(objID, sv)
+            # Wait for Bullet to advance the simulation by one step.
+            with util.Timeit('compute') as timeit:
+                self.bullet.compute(subset, dt, maxsteps)
 
-                # Convenience.
-                force, torque = self.allForces[objID], self.allTorques[objID]
+            # Retrieve all objects from Bullet.
+            self.fetchFromBullet(subset, rows)
+        store.resetForces()
 
-                # Add the force defined on the 'force' grid.
-                force += gridForces[objID]
+        # Synchronise the local object cache back to the database.
+        self.syncObjects(writeconcern=False)
 
-                # Apply the final force to the object.
-                self.bullet.applyForceAndTorque(objID, force, torque)
 
-            # Wait for Bullet to advance the simulation by one step.
-            with util.Timeit('compute') as timeit:
-                self.bullet.compute(list(coll_SV.keys()), dt, maxsteps)
+class LeonardSweepingPersistent(LeonardSweeping):
+    """
+    Compute physics on independent collision sets in a persistent world.
 
-            # Retrieve all objects from Bullet.
-            for objID, sv in coll_SV.items():
-                ret = self.bullet.getObjectData([objID])
-                if ret.ok:
-                    self.allObjects[objID] = ret.data
-                self.allForces[objID] = [0, 0, 0]
-                self.allTorques[objID] = [0, 0, 0]
+    This is a modified version of ``LeonardSweeping``. The objects remain in
+    the Bullet world from one step to the next, and Bullet uses collision
+    filter groups instead of separate steps to keep the collision sets apart
+    (see ``PyBulletPhys.stepResident``).
+
+    Bullet is the authoritative source of the State Vectors. Leonard only
+    passes spawned and modified objects to Bullet, and removes deleted ones.
+    """
+    @typecheck
+    def step(self, dt, maxsteps):
+        """
+        Advance the simulation by ``dt`` using at most ``maxsteps``.
+
+        :param float dt: time step in seconds.
+        :param int maxsteps: maximum number of sub-steps to simulate for one
+                             ``dt`` update.
+        """
+        ret = self.processCommandQueue()
+        if not ret.ok:
+            return
+        changes = ret.data
+        self.bullet.removeObject(changes['removed'])
+
+        # Compute the collision sets.
+        with util.Timeit('CCS') as timeit:
+            collSets = self.computeCollisionSets()
+        if not collSets.ok:
+            self.logit.error('computeCollisionSets returned an error')
+            sys.exit(1)
+        collSets = collSets.data
+
+        # Log the number of created collision sets.
+        util.logMetricQty('#CollSets', len(collSets))
+
+        # Pass the new and modified objects to Bullet.
+        store = self.objects
+        objIDs = set(changes['spawned'] + changes['modified'])
+        objIDs = [_ for _ in objIDs if _ in store]
+        rows = [store.rows[_] for _ in objIDs]
+        self.bullet.setObjectDataBatch(objIDs, store.getPacked(rows))
+
+        # Add the forces defined on the 'force' grid to the user forces, and
+        # apply all non-zero ones. Bullet clears them after every step.
+        force = store.column('force')
+        force = force + self.getGridForcesArray(store.column('position'))
+        torque = store.column('torque')
+        active = np.any(force != 0, axis=1) | np.any(torque != 0, axis=1)
+        rows = np.flatnonzero(active & (store.objIDs >= 0))
+        self.bullet.applyForceAndTorqueBatch(
+            store.objIDs[rows].tolist(), force[rows], torque[rows])
+
+        # Wait for Bullet to advance the simulation by one step.
+        with util.Timeit('compute') as timeit:
+            ret = self.bullet.stepResident(collSets, dt, maxsteps)
+        if not ret.ok:
+            self.logit.error(ret.msg)
+
+        # Retrieve all objects from Bullet.
+        objIDs, rows = list(store.rows.keys()), list(store.rows.values())
+        self.fetchFromBullet(objIDs, rows)
+        store.resetForces()
 
         # Synchronise the local object cache back to the database.
         self.syncObjects(writeconcern=False)
@@ -582,8 +1367,17 @@ class LeonardDistributedZeroMQ(LeonardBase):
     Package is self contained and holds all the information Bullet requires to
     step the simulation.
 
-    This class is single threaded. All Bullet engines run sequentially in the
-    main thread. The work packages are distributed at random to the engines.
+    The ``WorkScheduler`` packs the collision sets into a few Work Packages of
+    similar (estimated) cost, and prefers the Worker that simulated the same
+    objects in the previous step. Leonard then sends them, most expensive
+    first, to the Workers over a ROUTER socket. Every Worker announces how
+    many Work Packages it is willing to queue (its credits) and gets one
+    credit back with every processed Work Package. Leonard never sends a
+    Work Package to a Worker without credits.
+
+    The Workers keep the Bullet bodies of their objects. Leonard therefore
+    only sends the State Vectors of objects that are new to the Worker, or
+    that were modified since (see ``compileWorkPackage``).
 
     This class uses the sweeping algorithm to determine collision sets, just
     like ``LeonardSweeping`` does.
@@ -591,9 +1385,18 @@ class LeonardDistributedZeroMQ(LeonardBase):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.workers = []
-        self.numWorkers = 3
         self.wpid_counter = 0
 
+        # Scale the number of Workers with the load, relative to the target
+        # step time rather than the (much larger) tick budget. The
+        # WorkerManager process reads the current pool size from
+        # ``poolSize``.
+        self.scaler = azrael.scheduler.WorkerScaler(
+            config.leonard_min_workers, config.leonard_max_workers,
+            config.leonard_workers, config.leonard_target_tick)
+        self.numWorkers = self.scaler.numWorkers
+        self.poolSize = multiprocessing.Value('i', self.numWorkers)
+
         # Worker terminate automatically after a certain number of processed
         # Work Packages. The precise number is a constructor argument and the
         # following two variables simply specify the range. The final number
@@ -601,6 +1404,21 @@ class LeonardDistributedZeroMQ(LeonardBase):
         # instance to avoid the situation where all die simultaneously).
         self.minSteps, self.maxSteps = (500, 700)
 
+        # Pack the collision sets into Work Packages.
+        self.scheduler = azrael.scheduler.WorkScheduler(
+            self.numWorkers, config.leonard_packages_per_worker)
+
+        # Credits and IDs of all Workers, keyed by their ZeroMQ identity.
+        self.workerCredits = {}
+        self.workerIDs = {}
+
+        # The Worker that has the up-to-date Bullet body of an object, the
+        # objects whose State Vector has changed since, and the objects
+        # every Worker must remove from its Bullet engine.
+        self.residentWorker = {}
+        self.overrides = set()
+        self.evictions = {}
+
     def __del__(self):
         """
         Kill all worker processes.
@@ -612,13 +1430,14 @@ class LeonardDistributedZeroMQ(LeonardBase):
 
     def setup(self):
         self.ctx = zmq.Context()
-        self.sock = self.ctx.socket(zmq.REP)
+        self.sock = self.ctx.socket(zmq.ROUTER)
+        self.sock.setsockopt(zmq.ROUTER_MANDATORY, 1)
         self.sock.bind(config.addr_leonard_pushpull)
 
         # Spawn the Workers.
         workermanager = WorkerManager(
             self.numWorkers, self.minSteps,
-            self.maxSteps, LeonardWorkerZeroMQ)
+            self.maxSteps, LeonardWorkerZeroMQ, self.poolSize)
         workermanager.start()
         self.logit.info('Setup complete')
 
@@ -639,147 +1458,551 @@ class LeonardDistributedZeroMQ(LeonardBase):
         """
         # Read queued commands and update the local object cache accordingly.
         with util.Timeit('Leonard:1.1  processCmdQueue') as timeit:
-            self.processCommandQueue()
+            ret = self.processCommandQueue()
+        if ret.ok:
+            self.updateResidents(ret.data)
 
         # Compute the collision sets.
         with util.Timeit('Leonard:1.2  CCS') as timeit:
-            collSets = computeCollisionSetsAABB(self.allObjects, self.allAABBs)
+            collSets = self.computeCollisionSets()
         if not collSets.ok:
-            self.logit.error('ComputeCollisionSetsAABB returned an error')
+            self.logit.error('computeCollisionSets returned an error')
             sys.exit(1)
         collSets = collSets.data
 
         # Log the number of created collision sets.
         util.logMetricQty('#CollSets', len(collSets))
 
-        # Put each collision set into its own Work Package.
+        # Pack the collision sets into Work Packages. The scheduler returns
+        # them in order of decreasing cost, and Python dictionaries preserve
+        # that order.
         with util.Timeit('Leonard:1.3  CreateWPs') as timeit:
-            all_WPs = {}
-            for subset in collSets:
-                # Compile the Work Package.
-                ret = self.createWorkPackage(list(subset), dt, maxsteps)
-                if not ret.ok:
-                    self.logit.error(ret.msg)
-                    return
-                all_WPs[ret.data['wpid']] = ret.data
+            all_WPs, affinity = {}, {}
+            packages = self.scheduler.assign(collSets, self.residentWorker)
+            for worker, objIDs in packages:
+                # Leonard only compiles the actual content of the Work
+                # Package when it sends it (see ``compileWorkPackage``).
+                wpid = self.wpid_counter
+                self.wpid_counter += 1
+                all_WPs[wpid] = {'wpid': wpid,
+                                 'wpmeta': (wpid, dt, maxsteps),
+                                 'objIDs': objIDs}
+                affinity[wpid] = worker
+        util.logMetricQty('#WorkPackages', len(all_WPs))
 
         with util.Timeit('Leonard:1.4  WPSendRecv') as timeit:
-            wpIdx = 0
-            worklist = list(all_WPs.keys())
-            while True:
-                # Wait for a message from a Worker. This message usually
-                # contains a processed Work Package. However, it may also be
-                # empty, most likely because the Worker has not received a Work
-                # Package from us yet.
-                msg = self.sock.recv()
-                if msg != b'':
-                    # Unpickle the message.
-                    msg = pickle.loads(msg)
-                    wpid = msg['wpid']
-
-                    # Ignore the message if its Work Package is not pending
-                    # anymore (most likely because multiple Workers processed
-                    # the same Work Package and the other Worker has already
-                    # returned it).
-                    if wpid in all_WPs:
-                        self.updateLocalCache(msg['wpdata'])
-
-                        # Decrement the Work Package Index if the wpIdx counter
-                        # is already past that work package. This simply
-                        # ensures that no WP is skipped simply because the
-                        # queue has shrunk.
-                        if worklist.index(wpid) < wpIdx:
-                            wpIdx -= 1
-
-                        # Remove the WP from the work list and the WP cache.
-                        worklist.remove(wpid)
-                        del all_WPs[wpid]
-
-                # Send an empty message to the Worker if now Work Packages are
-                # pending anymore. This empty message is important to avoid
-                # breaking the REQ/REP pattern enforced by ZeroMQ.
-                if len(all_WPs) == 0:
-                    self.sock.send(b'')
-                    break
-
-                # Pick the next pending Work Package and increment the index.
-                if wpIdx >= len(worklist):
-                    wpIdx = 0
-                wp = all_WPs[worklist[wpIdx]]
-                wpIdx += 1
-
-                # Send the Work Package to the Worker.
-                self.sock.send(pickle.dumps(wp))
+            stats = self.processWorkPackages(all_WPs, affinity)
+        self.scaleWorkers(stats)
 
         # Synchronise the local cache back to the database.
         with util.Timeit('Leonard:1.5  syncObjects') as timeit:
             self.syncObjects(writeconcern=False)
 
-    @typecheck
-    def createWorkPackage(self, objIDs: (tuple, list),
-                          dt: (int, float), maxsteps: int):
+    def processWorkPackages(self, all_WPs: dict, affinity: dict=None):
+        """
+        Send ``all_WPs`` to the Workers and wait until all have returned.
+
+        Every Work Package goes preferably to the Worker that ``affinity``
+        specifies for it (see ``nextWorkPackage``).
+
+        Every Work Package also has a deadline (see ``sendWorkPackage``).
+        Once it has passed, Leonard sends a duplicate to the next Worker
+        with spare credits and no other work. The first result wins, and
+        Leonard cancels the other copy.
+
+        Leonard requeues the Work Packages of Workers that quit (they send a
+        'bye' message), and of all Workers if none of them has sent anything
+        for ``config.leonard_wp_timeout`` seconds.
+
+        If ``config.leonard_tick_fallback`` is 'carry' then Leonard abandons
+        all pending Work Packages once the step took longer than
+        ``config.leonard_tick_budget``. Their objects keep their previous
+        State Vector (and forces) until the next step.
+
+        This method also logs the utilisation of every Worker in percent,
+        ie. the time it spent computing Work Packages relative to the total
+        time of this method.
+
+        The returned statistics contain the duration of this method
+        ('etime'), the average number of Work Packages per Worker that
+        waited for a Worker ('queueDepth'), and the fraction of the time the
+        Workers were idle ('idleRatio').
+
+        :param dict all_WPs: {wpid: wp} with the 'wpid', 'wpmeta', and
+            'objIDs' of every Work Package.
+        :param dict affinity: {wpid: worker} of the preferred Workers.
+        :return: statistics.
+        :rtype: dict
+        """
+        if affinity is None:
+            affinity = {}
+
+        # One queue per preferred Worker (*None* for no preference).
+        queues = collections.defaultdict(collections.deque)
+        for wpid in all_WPs:
+            queues[affinity.get(wpid, None)].append(wpid)
+
+        # The Workers that have a Work Package and their deadline, ie.
+        # {wpid: {worker: deadline}}.
+        inflight = {}
+        busy = {}
+        depth = []
+        t0 = lastMsg = time.time()
+        tickDeadline = t0 + config.leonard_tick_budget
+        carry = (config.leonard_tick_fallback == 'carry')
+
+        while len(all_WPs) > 0:
+            # Send Work Packages (and duplicates of overdue ones) to all
+            # Workers with credits.
+            self.dispatchWorkPackages(queues, all_WPs, inflight, tickDeadline)
+            depth.append(sum([len(_) for _ in queues.values()]))
+
+            # Abandon the remaining Work Packages if the step is over budget.
+            now = time.time()
+            if carry and (now >= tickDeadline):
+                self.abandonWorkPackages(all_WPs, inflight)
+                break
+
+            # Wait for a message from a Worker, but no longer than until the
+            # next deadline.
+            # Deadlines that have already passed only matter once a Worker
+            # has spare credits again, ie. when it sends a message anyway.
+            wakeup = [lastMsg + config.leonard_wp_timeout]
+            wakeup += [d for holders in inflight.values()
+                       for d in holders.values() if d > now]
+            if carry:
+                wakeup.append(tickDeadline)
+            wait = max(int(1000 * (min(wakeup) - now)), 0) + 1
+            if not self.sock.poll(wait):
+                if time.time() < lastMsg + config.leonard_wp_timeout:
+                    continue
+
+                # No Worker has replied for a long time. Requeue the pending
+                # Work Packages for the other Workers in case their Workers
+                # have died (no-op if we are still waiting for Workers to
+                # connect). The original Workers still have them, and get
+                # their credits back with the results. This way the credits
+                # of a slow Worker stay intact, whereas a dead one runs out
+                # of them.
+                if len(inflight) > 0:
+                    self.logit.warning('Requeueing {} Work Packages'
+                                       .format(len(inflight)))
+                queued = set().union(*queues.values())
+                for wpid in inflight:
+                    if wpid not in queued:
+                        queues[None].appendleft(wpid)
+                lastMsg = time.time()
+                continue
+            lastMsg = time.time()
+
+            # The message comprises the Worker identity, the message type,
+            # and the (optional) payload.
+            frames = self.sock.recv_multipart(copy=False)
+            worker, msgType = frames[0].bytes, frames[1].bytes
+            payload = frames[2:]
+
+            if msgType == b'ready':
+                # A new Worker announces itself and its credits.
+                info = json.loads(payload[0].bytes.decode('utf8'))
+                self.workerCredits[worker] = info['credits']
+                self.workerIDs[worker] = info['workerID']
+            elif msgType == b'bye':
+                # The Worker quit. Requeue its pending Work Packages unless
+                # another Worker has them as well.
+                self.dropWorker(worker)
+                for wpid, holders in list(inflight.items()):
+                    if holders.pop(worker, None) is None:
+                        continue
+                    if len(holders) == 0:
+                        del inflight[wpid]
+                        queues[None].appendleft(wpid)
+            elif msgType == b'cancelled':
+                # The Worker has dropped a Work Package we cancelled.
+                if worker in self.workerCredits:
+                    self.workerCredits[worker] += 1
+            elif msgType == b'result':
+                # Every result returns one credit to the Worker (unless it
+                # has quit already).
+                if worker in self.workerCredits:
+                    self.workerCredits[worker] += 1
+
+                ret = azrael.workpackage.decodeResult(payload)
+                if not ret.ok:
+                    self.logit.warning(ret.msg)
+                    continue
+                res = ret.data
+                wpid, objIDs = res.wpid, res.objIDs.tolist()
+
+                # Ignore the result if its Work Package is not pending
+                # anymore (most likely because another Worker has already
+                # returned it, or because Leonard has abandoned it).
+                holders = inflight.pop(wpid, {})
+                holders.pop(worker, None)
+                if wpid not in all_WPs:
+                    # The Worker has no use for these bodies anymore unless
+                    # they are already resident there. Those it does have
+                    # are one step ahead now (eg. because it processed a
+                    # requeued Work Package twice) and need their State
+                    # Vectors again.
+                    if worker in self.workerCredits:
+                        resident = self.residentWorker
+                        stale = [_ for _ in objIDs
+                                 if resident.get(_, None) != worker]
+                        self.evictions.setdefault(worker, set()).update(stale)
+                        self.overrides.update(set(objIDs) - set(stale))
+                    continue
+
+                # Cancel the duplicates of this Work Package.
+                for other in holders:
+                    self.cancelWorkPackage(wpid, other)
+
+                # Update the local cache, the resident objects, and the cost
+                # model. If the Worker failed then the objects keep their
+                # old State Vector, and the Worker will receive it again.
+                if res.ok:
+                    self.updateLocalCachePacked(res.objIDs, res.svs)
+                    self.setResidents(objIDs, worker)
+                else:
+                    self.logit.error('Worker could not process Work Package')
+                    self.overrides.update(objIDs)
+                self.scheduler.update(objIDs, res.elapsed)
+                busy[worker] = busy.get(worker, 0) + res.elapsed
+                del all_WPs[wpid]
+            else:
+                self.logit.warning('Invalid message type from Worker')
+
+        # Log the utilisation of every Worker.
+        etime = max(time.time() - t0, 1E-9)
+        for worker, elapsed in busy.items():
+            workerID = self.workerIDs.get(worker, None)
+            if workerID is None:
+                continue
+            util.logMetricQty('WorkerUtilisation_{}'.format(workerID),
+                              int(100 * elapsed / etime))
+
+        numWorkers = max(len(self.workerIDs), 1)
+        idle = 1 - sum(busy.values()) / (numWorkers * etime)
+        depth = sum(depth) / max(len(depth), 1) / numWorkers
+        return {'etime': etime, 'queueDepth': depth,
+                'idleRatio': min(max(idle, 0), 1)}
+
+    def scaleWorkers(self, stats: dict):
         """
-        Create a new Work Package (WP) and return its ID.
+        Update the size of the Worker pool based on the ``stats`` of the last
+        ``processWorkPackages`` call.
 
-        The Work Package will not be returned but uploaded to the DB directly.
+        The WorkerManager starts new Workers, whereas Leonard asks the
+        Workers with the highest IDs to quit. This method logs the pool size
+        ('WorkerPoolSize') and every change to it ('WorkerPoolScale').
 
-        A Work Package carries the necessary information for another rigid body
-        physics steps. The Worker can thus start its work immediately, at least
-        in terms of the rigid bodies (it may still want to incorporate other
-        data like grid forces, but that is up to the Worker implementation).
+        :param dict stats: statistics from ``processWorkPackages``.
+        """
+        old = self.scaler.numWorkers
+        new = self.scaler.update(
+            stats['etime'], stats['queueDepth'], stats['idleRatio'])
+        util.logMetricQty('WorkerPoolSize', new)
+        if new != old:
+            util.logMetricQty('WorkerPoolScale', new - old)
+            self.logit.info('Scaling Worker pool from {} to {}'
+                            .format(old, new))
+            self.numWorkers = new
+            self.scheduler.numWorkers = new
+            self.poolSize.value = new
+
+        # Ask all surplus Workers to quit (including those that have only
+        # just connected).
+        for worker, workerID in list(self.workerIDs.items()):
+            if workerID <= new:
+                continue
+            try:
+                self.sock.send_multipart([worker, b'quit'])
+            except zmq.ZMQError:
+                pass
+            self.dropWorker(worker)
+
+    def dispatchWorkPackages(self, queues: dict, all_WPs: dict,
+                             inflight: dict, tickDeadline: float):
+        """
+        Send Work Packages from ``queues`` to all Workers with credits.
+
+        Leonard hands out the Work Packages round robin, one per Worker and
+        round, so that the most expensive Work Packages (at the front of the
+        queues) end up on different Workers. Workers without queued Work
+        Packages receive a duplicate of an overdue one (see
+        ``overdueWorkPackage``).
+
+        :param dict queues: {worker: deque} of the wpids to send.
+        :param dict all_WPs: {wpid: wp} of all pending Work Packages.
+        :param dict inflight: {wpid: {worker: deadline}} of all Work Packages
+            that a Worker has, but not yet returned.
+        :param float tickDeadline: end of the tick budget.
+        """
+        while True:
+            workers = [k for k, v in self.workerCredits.items() if v > 0]
+            numSent = 0
+            for worker in workers:
+                wpid = self.nextWorkPackage(
+                    queues, all_WPs, worker, inflight)
+                if wpid is not None:
+                    if not self.sendWorkPackage(
+                            all_WPs[wpid], worker, inflight, tickDeadline):
+                        queues[None].appendleft(wpid)
+                        continue
+                else:
+                    wpid = self.overdueWorkPackage(inflight, worker)
+                    if wpid is None:
+                        continue
+                    if not self.sendWorkPackage(
+                            all_WPs[wpid], worker, inflight, tickDeadline):
+                        continue
+                numSent += 1
+            if numSent == 0:
+                return
+
+    def sendWorkPackage(self, wp: dict, worker, inflight: dict,
+                        tickDeadline: float):
+        """
+        Send Work Package ``wp`` to ``worker`` and return *True* on success.
+
+        The deadline for the Work Package is ``leonard_wp_deadline_slack``
+        times its estimated cost, but at least ``leonard_wp_min_deadline``
+        seconds. It never extends past the ``tickDeadline`` unless that has
+        already passed.
+
+        :param dict wp: Work Package with 'wpid', 'wpmeta', and 'objIDs'.
+        :param bytes worker: ZeroMQ identity of the Worker.
+        :param dict inflight: {wpid: {worker: deadline}}.
+        :param float tickDeadline: end of the tick budget.
+        :return: bool
+        """
+        frames = self.compileWorkPackage(wp, worker)
+        try:
+            self.sock.send_multipart([worker, b'wp'] + frames, copy=False)
+        except zmq.ZMQError:
+            # The Worker has disconnected.
+            self.dropWorker(worker)
+            return False
+        self.workerCredits[worker] -= 1
+
+        now = time.time()
+        cost = self.scheduler.cost(wp['objIDs'])
+        deadline = min(now + config.leonard_wp_deadline_slack * cost,
+                       tickDeadline)
+        deadline = max(deadline, now + config.leonard_wp_min_deadline)
+        inflight.setdefault(wp['wpid'], {})[worker] = deadline
+        return True
+
+    def overdueWorkPackage(self, inflight: dict, worker):
+        """
+        Return the wpid of the most overdue Work Package for ``worker``.
 
-        The ``dt`` and ``maxsteps`` arguments are for the underlying physics
-        engine.
+        Only Work Packages that exactly one other Worker has qualify, ie.
+        Leonard sends at most one duplicate of every Work Package.
 
-        .. note::
-           A work package contains only the objIDs but not their SV. The
-           ``getNextWorkPackage`` function takes care of compiling this
-           information.
+        Return *None* if no Work Package is overdue.
 
-        :param iterable objIDs: list of object IDs in the new work package.
-        :param float dt: time step for this work package.
-        :param int maxsteps: number of sub-steps for the time step.
-        :return: Work package ID
-        :rtype: int
+        :param dict inflight: {wpid: {worker: deadline}}.
+        :param bytes worker: ZeroMQ identity of the Worker.
+        :return: wpid or *None*.
         """
-        # Sanity check.
-        if len(objIDs) == 0:
-            return RetVal(False, 'Work package is empty', None)
+        now, out = time.time(), None
+        for wpid, holders in inflight.items():
+            if len(holders) != 1 or worker in holders:
+                continue
+            deadline = min(holders.values())
+            if deadline < now:
+                out, now = wpid, deadline
+        return out
+
+    def cancelWorkPackage(self, wpid: int, worker):
+        """
+        Tell ``worker`` to drop Work Package ``wpid``.
 
-        # Compile the State Vectors and forces for all objects into a list of
-        # ``WPData`` named tuples.
+        The Worker replies with 'cancelled' unless it has already started to
+        process the Work Package, in which case it returns the result as
+        usual.
+
+        :param int wpid: Work Package ID.
+        :param bytes worker: ZeroMQ identity of the Worker.
+        """
         try:
-            wpdata = [(objID, self.allObjects[objID],
-                       self.allForces[objID], self.allTorques[objID])
-                      for objID in objIDs]
-        except KeyError as err:
-            return RetVal(False, 'Cannot form WP', None)
+            self.sock.send_multipart(
+                [worker, b'cancel', str(wpid).encode('utf8')])
+        except zmq.ZMQError:
+            self.dropWorker(worker)
+
+    def abandonWorkPackages(self, all_WPs: dict, inflight: dict):
+        """
+        Abandon all Work Packages in ``all_WPs``.
+
+        Their objects keep their current State Vector and forces, and the
+        Workers will receive their State Vectors again in the next step.
+
+        :param dict all_WPs: {wpid: wp} of all pending Work Packages.
+        :param dict inflight: {wpid: {worker: deadline}}.
+        """
+        objIDs = [_ for wp in all_WPs.values() for _ in wp['objIDs']]
+        self.logit.warning(
+            'Tick budget exceeded: carrying {} objects in {} Work Packages '
+            'forward'.format(len(objIDs), len(all_WPs)))
+        util.logMetricQty('#AbandonedWPs', len(all_WPs))
+        self.overrides.update(objIDs)
+
+        for wpid, holders in inflight.items():
+            for worker in holders:
+                self.cancelWorkPackage(wpid, worker)
+        inflight.clear()
+        all_WPs.clear()
+
+    def dropWorker(self, worker):
+        """
+        Forget all about ``worker``.
+
+        The Bullet bodies of the Worker are gone as well. The next Worker to
+        simulate its objects therefore receives their State Vectors again.
+
+        :param bytes worker: ZeroMQ identity of the Worker.
+        """
+        self.workerCredits.pop(worker, None)
+        self.workerIDs.pop(worker, None)
+        self.evictions.pop(worker, None)
+
+        lost = [k for k, v in self.residentWorker.items() if v == worker]
+        for objID in lost:
+            del self.residentWorker[objID]
+        self.overrides.update(lost)
+
+    def nextWorkPackage(self, queues: dict, all_WPs: dict, worker,
+                        inflight: dict=None):
+        """
+        Return the wpid of the next Work Package for ``worker``.
+
+        The Worker gets its own Work Packages first, then those without
+        preferred Worker. Otherwise it steals the cheapest Work Package from
+        the Worker with the longest queue. It never gets a Work Package it
+        already has (according to ``inflight``).
 
-        # Form the content of the Work Package as it will appear in the DB.
-        data = {'wpid': self.wpid_counter,
-                'wpmeta': (self.wpid_counter, dt, maxsteps),
-                'wpdata': wpdata,
-                'ts': None}
-        self.wpid_counter += 1
-        return RetVal(True, None, data)
+        Return *None* if no Work Package is pending.
 
-    def updateLocalCache(self, wpdata):
+        :param dict queues: {worker: deque} of the wpids to send.
+        :param dict all_WPs: {wpid: wp} of all pending Work Packages.
+        :param bytes worker: ZeroMQ identity of the Worker.
+        :param dict inflight: {wpid: {worker: deadline}}.
+        :return: wpid or *None*.
         """
-        Copy every object from ``wpdata`` to the local cache.
+        if inflight is None:
+            inflight = {}
+
+        order = [(queues.get(worker, None), True),
+                 (queues.get(None, None), True)]
+        order += [(_, False) for _ in
+                  sorted(queues.values(), key=len, reverse=True)]
+
+        # Skip Work Packages that were requeued but returned since, and put
+        # back those the Worker already has.
+        held, out = [], None
+        for queue, fromFront in order:
+            while queue and (out is None):
+                wpid = queue.popleft() if fromFront else queue.pop()
+                if wpid not in all_WPs:
+                    continue
+                if worker in inflight.get(wpid, {}):
+                    held.append(wpid)
+                else:
+                    out = wpid
+            if out is not None:
+                break
+        if len(held) > 0:
+            queues.setdefault(None, collections.deque()).extendleft(
+                reversed(held))
+        return out
+
+    def compileWorkPackage(self, wp: dict, worker):
+        """
+        Return the multipart message for Work Package ``wp`` and ``worker``.
+
+        The message only contains the State Vectors of the objects that
+        ``worker`` does not already have an up-to-date Bullet body for. It
+        also lists all objects the Worker must remove from its Bullet engine
+        before it processes the Work Package (see ``workpackage`` for the
+        format).
+
+        :param dict wp: Work Package with 'wpid', 'wpmeta', and 'objIDs'.
+        :param bytes worker: ZeroMQ identity of the Worker.
+        :return: list of frames.
+        :rtype: list
+        """
+        store, meta = self.objects, WPMeta(*wp['wpmeta'])
+        resident, overrides = self.residentWorker, self.overrides
+        objIDs = wp['objIDs']
+        rows = np.fromiter(map(store.rows.__getitem__, objIDs), np.int64,
+                           len(objIDs))
+
+        # The objects whose State Vector the Worker needs.
+        svIdx = [idx for idx, objID in enumerate(objIDs)
+                 if resident.get(objID, None) != worker or
+                 objID in overrides]
+        svIdx = np.array(svIdx, np.int64)
+
+        forces = np.hstack((store.column('force')[rows],
+                            store.column('torque')[rows]))
+        evict = np.array(sorted(self.evictions.pop(worker, [])), np.int64)
+        return azrael.workpackage.encodeWorkPackage(
+            meta.wpid, meta.dt, meta.maxsteps, np.array(objIDs, np.int64),
+            svIdx, store.getPacked(rows[svIdx]),
+            store.column('position')[rows], forces, evict)
+
+    @typecheck
+    def setResidents(self, objIDs: (tuple, list), worker):
+        """
+        Record that ``worker`` has the up-to-date bodies of ``objIDs``.
 
-        The ``wpdata`` argument is a list of (objID, sv) tuples.
+        The Worker that had them before must remove them (unless it is gone
+        already).
 
-        The implicit assumption of this method is that ``wpdata`` is the
-        output of ``computePhysicsForWorkPackage`` from a Worker.
+        :param list objIDs: object IDs.
+        :param bytes worker: ZeroMQ identity of the Worker.
+        """
+        for objID in objIDs:
+            old = self.residentWorker.get(objID, None)
+            if (old in self.workerCredits) and (old != worker):
+                self.evictions.setdefault(old, set()).add(objID)
+            self.residentWorker[objID] = worker
+        self.overrides.difference_update(objIDs)
 
-        :param list wpdata: Content of Work Packge as returned by Workers.
+    @typecheck
+    def updateResidents(self, changes: dict):
         """
-        # Reset force and torque for all objects in the WP, and overwrite
-        # the old State Vector with the new one from the processed WP.
-        for (objID, sv) in wpdata:
-            self.allForces[objID] = [0, 0, 0]
-            self.allTorques[objID] = [0, 0, 0]
-            self.allObjects[objID] = _BulletData(*sv)
+        Update the resident objects with the ``changes`` from
+        ``processCommandQueue``.
+
+        The Workers must remove the bodies of removed objects, and receive
+        the State Vectors of modified objects again.
+
+        :param dict changes: the IDs of the 'removed' and 'modified' objects.
+        """
+        for objID in changes['removed']:
+            worker = self.residentWorker.pop(objID, None)
+            if worker in self.workerCredits:
+                self.evictions.setdefault(worker, set()).add(objID)
+        self.overrides.difference_update(changes['removed'])
+        self.overrides.update(changes['modified'])
+
+    @typecheck
+    def updateLocalCachePacked(self, objIDs: np.ndarray, svs: np.ndarray):
+        """
+        Overwrite the State Vectors of ``objIDs`` with the packed ``svs``
+        from a processed Work Package, and reset their forces and torques.
+
+        :param np.ndarray objIDs: N object IDs.
+        :param np.ndarray svs: N x ``bullet_data.packedSize`` array.
+        """
+        store = self.objects
+        rows = np.fromiter(map(store.rows.__getitem__, objIDs.tolist()),
+                           np.int64, len(objIDs))
+        store.setPacked(rows, svs)
+        store.column('force')[rows] = 0
+        store.column('torque')[rows] = 0
 
 
 class LeonardWorkerZeroMQ(multiprocessing.Process):
@@ -798,6 +2021,9 @@ class LeonardWorkerZeroMQ(multiprocessing.Process):
         assert stepsUntilQuit > 0
         self.stepsUntilQuit = stepsUntilQuit
 
+        # Leonard can ask the Worker to quit early.
+        self.quit = False
+
         # Create a Class-specific logger.
         name = '.'.join([__name__, self.__class__.__name__])
         self.logit = logging.getLogger(name)
@@ -837,73 +2063,133 @@ class LeonardWorkerZeroMQ(multiprocessing.Process):
         gridForces = {objID: val for objID, val in zip(objIDs, ret.data)}
         return RetVal(True, None, gridForces)
 
+    @typecheck
+    def getGridForcesArray(self, positions: np.ndarray):
+        """
+        Return the grid forces at all ``positions`` as an N x 3 array.
+
+        See ``LeonardBase.getGridForcesArray``.
+
+        :param np.ndarray positions: N x 3 array of positions.
+        :return: N x 3 array of forces.
+        :rtype: np.ndarray
+        """
+        if len(positions) == 0:
+            return np.zeros((0, 3), np.float64)
+
+        ret = azrael.vectorgrid.getValues('force', positions)
+        if not ret.ok:
+            self.logit.info(ret.msg)
+            return np.zeros((len(positions), 3), np.float64)
+        return ret.data
+
     def computePhysicsForWorkPackage(self, wp):
         """
         Compute a physics steps for all objects in ``wp``.
 
-        The output of this method is matched to the ``updateLocalCache`` in
-        Leonard itself.
+        The Bullet engine keeps the bodies of all objects between Work
+        Packages. It only receives the State Vectors that Leonard sent.
 
-        :param dict wp: Work Package content from ``createWorkPackage``.
-        :return dict: {'wpdata': list_of_SVs, 'wpid': wpid}
+        The output of this method is matched to the ``updateLocalCachePacked``
+        in Leonard itself.
+
+        :param WorkPackage wp: see ``workpackage.decodeWorkPackage``.
+        :return: N x ``bullet_data.packedSize`` array of new State Vectors.
+        :rtype: np.ndarray
         """
-        worklist, meta = wp['wpdata'], WPMeta(*wp['wpmeta'])
+        IDs = wp.objIDs.tolist()
 
         # Log the number of collision-sets in the current Work Package.
-        util.logMetricQty('Engine_{}'.format(self.workerID), len(worklist))
-
-        # Convenience: the WPData elements make the code more readable.
-        worklist = [WPData(*_) for _ in worklist]
+        util.logMetricQty('Engine_{}'.format(self.workerID), len(IDs))
 
-        # Convenience.
-        applyForceAndTorque = self.bullet.applyForceAndTorque
-        setObjectData = self.bullet.setObjectData
+        # Remove the objects Leonard has moved elsewhere.
+        if len(wp.evict) > 0:
+            self.bullet.removeObject(wp.evict.tolist())
 
-        # Add every object to the Bullet engine and set the force/torque.
+        # Update the objects in the Bullet engine and set the force/torque.
         with util.Timeit('Worker:1.1.0  applyforce') as timeit:
             with util.Timeit('Worker:1.1.1   grid') as timeit:
                 # Fetch the forces for all object positions.
-                idPos = {_.id: _.sv.position for _ in worklist}
-                ret = self.getGridForces(idPos)
-                if not ret.ok:
-                    self.logit.info(ret.msg)
-                    z = np.float64(0)
-                    gridForces = {_: z for _ in idPos}
-                else:
-                    gridForces = ret.data
-                del ret, idPos
+                forces = self.getGridForcesArray(wp.pos)
 
             with util.Timeit('Worker:1.1.1   updateGeo') as timeit:
-                for obj in worklist:
-                    # Update the object in Bullet and apply the force/torque.
-                    setObjectData(obj.id, obj.sv)
+                # Update (or create) the objects whose State Vector Leonard
+                # has sent.
+                if len(wp.svIdx) > 0:
+                    ret = self.bullet.setObjectDataBatch(
+                        wp.objIDs[wp.svIdx].tolist(), wp.svs)
+                    if not ret.ok:
+                        return ret
 
             with util.Timeit('Worker:1.1.1   updateForce') as timeit:
-                for obj in worklist:
-                    # Add the force defined on the 'force' grid.
-                    force = obj.force + gridForces[obj.id]
-                    applyForceAndTorque(obj.id, force, obj.torque)
+                # Add the forces from Leonard to those from the 'force'
+                # grid.
+                if wp.forces is None:
+                    torques = np.zeros_like(forces)
+                else:
+                    forces = forces + wp.forces[:, :3]
+                    torques = wp.forces[:, 3:]
+                ret = self.bullet.applyForceAndTorqueBatch(
+                    IDs, forces, torques)
+                if not ret.ok:
+                    return ret
 
         # Tell Bullet to advance the simulation for all objects in the
         # current work list.
         with util.Timeit('Worker:1.2.0  compute') as timeit:
-            IDs = [_.id for _ in worklist]
-            self.bullet.compute(IDs, meta.dt, meta.maxsteps)
+            ret = self.bullet.compute(IDs, wp.dt, wp.maxsteps)
+            if not ret.ok:
+                return ret
 
         with util.Timeit('Worker:1.3.0  fetchFromBullet') as timeit:
-            # Retrieve the objects from Bullet again and update them in the DB.
-            out = []
-            for obj in worklist:
-                ret = self.bullet.getObjectData([obj.id])
-                sv = ret.data
-                if not ret.ok:
-                    # Something went wrong. Reuse the old SV.
-                    sv = obj.sv
-                    self.logit.error('Unable to get all objects from Bullet')
-                out.append((obj.id, sv))
+            # Retrieve the objects from Bullet again.
+            ret = self.bullet.getObjectDataBatch(IDs)
+            if not ret.ok:
+                self.logit.error('Unable to get all objects from Bullet')
+        return ret
+
+    def receiveMessages(self, sock, pending: dict, block: bool):
+        """
+        Add the Work Packages from Leonard to ``pending``.
 
-        # Update the data and delete the WP.
-        return {'wpid': meta.wpid, 'wpdata': out}
+        This method fetches all queued messages from ``sock``. It removes
+        cancelled Work Packages from ``pending`` and confirms the
+        cancellation to Leonard. Cancellations for Work Packages that are
+        not pending anymore are ignored. A 'quit' message sets ``quit``.
+
+        Leonard does not send the evictions of a cancelled Work Package again.
+        The Worker therefore removes these objects immediately.
+
+        :param sock: ZeroMQ socket connected to Leonard.
+        :param dict pending: {wpid: wp} of all pending Work Packages.
+        :param bool block: wait for the first message.
+        """
+        flags = 0 if block else zmq.NOBLOCK
+        while True:
+            try:
+                frames = sock.recv_multipart(flags, copy=False)
+            except zmq.Again:
+                return
+            flags = zmq.NOBLOCK
+
+            msgType = frames[0].bytes
+            if msgType == b'wp':
+                ret = azrael.workpackage.decodeWorkPackage(frames[1:])
+                if not ret.ok:
+                    self.logit.error(ret.msg)
+                    continue
+                pending[ret.data.wpid] = ret.data
+            elif msgType == b'cancel':
+                wpid = frames[1].bytes
+                wp = pending.pop(int(wpid), None)
+                if wp is not None:
+                    if len(wp.evict) > 0:
+                        self.bullet.removeObject(wp.evict.tolist())
+                    sock.send_multipart([b'cancelled', wpid])
+            elif msgType == b'quit':
+                self.quit = True
+            else:
+                self.logit.error('Invalid message type from Leonard')
 
     @typecheck
     def run(self):
@@ -918,50 +2204,60 @@ class LeonardWorkerZeroMQ(multiprocessing.Process):
 
             # Setup ZeroMQ.
             ctx = zmq.Context()
-            sock = ctx.socket(zmq.REQ)
+            sock = ctx.socket(zmq.DEALER)
             sock.connect(config.addr_leonard_pushpull)
             self.logit.info('Worker {} connected'.format(self.workerID))
 
-            # Contact Leonard with an empty payload.
-            sock.send(b'')
+            # Tell Leonard how many Work Packages it may queue with us.
+            info = {'workerID': self.workerID,
+                    'credits': config.leonard_worker_credits}
+            sock.send_multipart([b'ready', json.dumps(info).encode('utf8')])
 
-            # Wait for messages from Leonard. If they contain a WP then process
-            # it and return the result, otherwise reply with an empty message.
+            # Convenience.
+            encodeResult = azrael.workpackage.encodeResult
+
+            # Process the Work Packages and return the results.
             numSteps = 0
             suq = self.stepsUntilQuit
+            pending = collections.OrderedDict()
             while numSteps < suq:
-                # Wait for the next message.
-                msg = sock.recv()
-
-                # If Leonard did not send a Work Package (probably because it
-                # does not have one right now) then wait for a short time
-                # before asking again to avoid spamming the network.
-                if msg == b'':
-                    time.sleep(0.003)
-                    sock.send(b'')
+                # Fetch all messages from Leonard (wait for one if we have
+                # nothing else to do). This ensures that cancellations take
+                # effect before we start the Work Package.
+                self.receiveMessages(sock, pending, block=len(pending) == 0)
+                if self.quit:
+                    break
+                if len(pending) == 0:
                     continue
+                wpid, wp = pending.popitem(last=False)
 
-                # Unpickle the Work Package.
-                wpdata = pickle.loads(msg)
-
-                # Process the Work Package.
+                # Process the Work Package and measure the compute time for
+                # the cost model of the scheduler.
+                t0 = time.time()
                 with util.Timeit('Worker:1.0.0 WPTotal') as timeit:
-                    wpdata = self.computePhysicsForWorkPackage(wpdata)
+                    ret = self.computePhysicsForWorkPackage(wp)
+                etime = time.time() - t0
 
-                # Pack up the Work Package and send it back to Leonard.
-                sock.send(pickle.dumps(wpdata))
+                # Send the new State Vectors back to Leonard.
+                frames = encodeResult(
+                    wp.wpid, ret.ok, etime, wp.objIDs, ret.data)
+                sock.send_multipart([b'result'] + frames, copy=False)
 
                 # Count the number of Work Packages we have processed.
                 numSteps += 1
 
+            # Tell Leonard to requeue the Work Packages we have not
+            # processed yet.
+            sock.send_multipart([b'bye'])
+
             # Log a last status message before terminating.
             self.logit.info('Worker {} terminated itself after {} steps'
                             .format(self.workerID, numSteps))
         except KeyboardInterrupt:
             print('Aborted Worker {}'.format(self.workerID))
 
-        # Terminate.
-        sock.close(linger=0)
+        # Terminate (give the 'bye' message a chance to go out).
+        sock.close(linger=500)
         ctx.destroy()
 
 
@@ -969,17 +2265,25 @@ class WorkerManager(multiprocessing.Process):
     """
     Launch Worker processes and restart them as necessary.
 
-    This class merely launches the inital set of workers and periodically
-    checks if any have died. If so, it joins these processes and replaces it
-    with a new Worker that has the same ID.
+    This class launches the inital set of workers and periodically checks if
+    any have died. If so, it joins these processes and replaces it with a new
+    Worker that has the same ID.
+
+    If ``poolSize`` is not *None* then it specifies the number of Workers
+    instead of ``numWorkers``. The Workers have the IDs 1 to ``poolSize``.
+    The manager starts new Workers when ``poolSize`` grows, and does not
+    restart Workers with a higher ID when it shrinks (Leonard asks them to
+    quit).
 
     :param int numWorker: number of Workers processes to spawn.
     :param int minSteps: see Worker
     :param int maxSteps: see Worker
     :param class workerCls: the class to instantiate.
+    :param poolSize: (optional) ``multiprocessing.Value`` with the number of
+        Workers.
     """
     def __init__(self, numWorkers: int, minSteps: int, maxSteps: int,
-                 workerCls):
+                 workerCls, poolSize=None):
         super().__init__()
 
         # Sanity checks.
@@ -992,45 +2296,43 @@ class WorkerManager(multiprocessing.Process):
         self.numWorkers = numWorkers
         self.workerCls = workerCls
         self.minSteps, self.maxSteps = minSteps, maxSteps
+        self.poolSize = poolSize
 
     def _run(self):
         """
-        Start the initial collection of Workers and ensure they remain alive.
+        Start the Workers and ensure the right number of them remains alive.
         """
         # Rename the process.
         setproctitle.setproctitle('killme ' + self.__class__.__name__)
 
-        # Spawn the initial collection of Workers.
-        workers = []
+        workers = {}
         delta = self.maxSteps - self.minSteps
-        for ii in range(self.numWorkers):
-            # Random number in [minSteps, maxSteps]. The process will
-            # automatically terminate after `suq` steps.
-            suq = self.minSteps + int(np.random.rand() * delta)
-
-            # Instantiate the process and add it to the list.
-            workers.append(self.workerCls(ii + 1, suq))
-            workers[-1].start()
-
-        # Periodically monitor the processes and restart any that have died.
         while True:
-            # Only check once a second.
-            time.sleep(1)
-            for workerID, proc in enumerate(workers):
-                # Skip current process if it is still running.
-                if proc.is_alive():
+            if self.poolSize is None:
+                numWorkers = self.numWorkers
+            else:
+                numWorkers = self.poolSize.value
+
+            # Join all Workers that have died to clear up the process table.
+            for workerID, proc in list(workers.items()):
+                if not proc.is_alive():
+                    proc.join()
+                    del workers[workerID]
+                    if workerID <= numWorkers:
+                        print('Restarted Worker {}'.format(workerID))
+
+            # Start the missing Workers. Every Worker automatically
+            # terminates after a random number of steps in [minSteps,
+            # maxSteps].
+            for workerID in range(1, numWorkers + 1):
+                if workerID in workers:
                     continue
-
-                # Process has died --> join it to clear up the process table.
-                proc.join()
-
-                # Create a new Worker with the same ID but a (possibly)
-                # different number of steps after which it must terminate.
                 suq = self.minSteps + int(np.random.rand() * delta)
-                proc = self.workerCls(workerID, suq)
-                proc.start()
-                workers[workerID] = proc
-                print('Restarted Worker {}'.format(workerID))
+                workers[workerID] = self.workerCls(workerID, suq)
+                workers[workerID].start()
+
+            # Check again shortly.
+            time.sleep(0.1)
 
     def run(self):
         """
@@ -0,0 +1,405 @@
+# Copyright 2014, Oliver Nagy <olitheolix@gmail.com>
+#
+# This file is part of Azrael (https://github.com/olitheolix/azrael)
+#
+# Azrael is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# Azrael is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with Azrael. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Columnar (struct-of-arrays) store for the objects in Leonard.
+
+Every State Vector field, as well as the force, torque, and AABB of an object
+lives in its own contiguous NumPy array. Every object occupies the same row in
+all of them. This makes it possible to update, say, the positions of all
+objects with a single NumPy operation instead of a Python loop over
+``_BulletData`` tuples.
+
+The ``ObjectStore.svView``, ``forceView``, ``torqueView``, and ``aabbView``
+objects provide a dictionary-like interface (objID -> value) for code that
+only deals with individual objects.
+
+The store also remembers the State Vector of every object at the time it was
+last written to the database. ``dirtyRows`` compares them to the current
+values to find the objects that must be written again.
+"""
+import IPython
+import numpy as np
+import azrael.util as util
+import azrael.bullet.bullet_data as bullet_data
+
+from collections.abc import Mapping
+from azrael.typecheck import typecheck
+from azrael.bullet.bullet_data import _BulletData
+
+ipshell = IPython.embed
+
+# Return value specification.
+RetVal = util.RetVal
+
+# The width of every column.
+_columnWidths = dict(zip(_BulletData._fields, bullet_data._BulletDataWidths))
+_columnWidths.update({'force': 3, 'torque': 3, 'aabb': 1})
+
+# The last synced (packed) State Vector, and the sync state (see
+# ``SYNC_DIRTY``, ``SYNC_MOVING``, and ``SYNC_RESTING``) of every object.
+_columnWidths.update({'synced': bullet_data.packedSize, 'syncState': 1})
+
+# Sync states: never synced (or explicitly modified), last synced while
+# moving, and last synced while at rest.
+SYNC_DIRTY, SYNC_MOVING, SYNC_RESTING = 0, 1, 2
+
+
+class ObjectStore():
+    """
+    Columnar store for State Vectors, forces, torques, and AABBs.
+
+    Removed objects leave a hole in the arrays. Their rows go onto a free list
+    and new objects will fill them first. ``compact`` moves the last objects
+    into the holes to make all rows dense again.
+
+    The columns always contain ``numRows`` rows. Unless the store is compact
+    some of them may be unused; they contain only zeros.
+
+    :param int capacity: initial number of rows.
+    """
+    @typecheck
+    def __init__(self, capacity: int=64):
+        capacity = max(capacity, 1)
+
+        # One array per column.
+        self._data = {name: np.zeros((capacity, width), np.float64)
+                      for name, width in _columnWidths.items()}
+
+        # The objID in every row (-1 for unused rows).
+        self._objIDs = -np.ones(capacity, np.int64)
+
+        # Map objIDs to rows.
+        self.rows = {}
+
+        # Unused rows below ``numRows``.
+        self.freeRows = []
+
+        # Number of rows in use (including holes).
+        self.numRows = 0
+
+        # Dictionary like views.
+        self.svView = _SVView(self)
+        self.forceView = _VectorView(self, 'force')
+        self.torqueView = _VectorView(self, 'torque')
+        self.aabbView = _ScalarView(self, 'aabb')
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __contains__(self, objID):
+        return objID in self.rows
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    @property
+    def objIDs(self):
+        """
+        The objID of every row (-1 for unused rows).
+        """
+        return self._objIDs[:self.numRows]
+
+    @property
+    def isCompact(self):
+        """
+        *True* if the store has no unused rows.
+        """
+        return len(self.freeRows) == 0
+
+    def column(self, name: str):
+        """
+        Return the ``name`` column of all rows.
+
+        The return value is a view into the store, ie. all modifications are
+        permanent. Single-valued columns (eg 'imass') are returned as 1D
+        arrays.
+
+        :param str name: column name (eg. 'position' or 'force').
+        :return: array with ``numRows`` rows.
+        :rtype: np.ndarray
+        """
+        col = self._data[name][:self.numRows]
+        return col[:, 0] if col.shape[1] == 1 else col
+
+    def _grow(self, capacity: int):
+        """
+        Enlarge all columns to hold ``capacity`` rows.
+        """
+        for name, col in self._data.items():
+            tmp = np.zeros((capacity, col.shape[1]), np.float64)
+            tmp[:len(col)] = col
+            self._data[name] = tmp
+        tmp = -np.ones(capacity, np.int64)
+        tmp[:len(self._objIDs)] = self._objIDs
+        self._objIDs = tmp
+
+    @typecheck
+    def add(self, objID: int, sv: _BulletData, aabb: (int, float)):
+        """
+        Add ``objID`` with State Vector ``sv`` and ``aabb``.
+
+        Force and torque are zero.
+
+        :param int objID: object ID.
+        :param _BulletData sv: State Vector.
+        :param float aabb: AABB size.
+        :return: the row of the new object.
+        """
+        if objID in self.rows:
+            msg = 'objID <{}> already exists'.format(objID)
+            return RetVal(False, msg, None)
+
+        # Re-use a free row or append a new one.
+        if len(self.freeRows) > 0:
+            row = self.freeRows.pop()
+        else:
+            if self.numRows == len(self._objIDs):
+                self._grow(2 * len(self._objIDs))
+            row = self.numRows
+            self.numRows += 1
+
+        self.rows[objID] = row
+        self._objIDs[row] = objID
+        self.setSV(row, sv)
+        self._data['aabb'][row] = aabb
+        return RetVal(True, None, row)
+
+    @typecheck
+    def remove(self, objIDs: (tuple, list)):
+        """
+        Remove all ``objIDs`` and return the number of removed objects.
+
+        Non-existing objects are ignored.
+
+        :param list objIDs: object IDs.
+        :return: number of removed objects.
+        """
+        cnt = 0
+        for objID in objIDs:
+            row = self.rows.pop(objID, None)
+            if row is None:
+                continue
+            for col in self._data.values():
+                col[row] = 0
+            self._objIDs[row] = -1
+            self.freeRows.append(row)
+            cnt += 1
+        return RetVal(True, None, cnt)
+
+    def compact(self):
+        """
+        Move the last objects into the unused rows.
+
+        Afterwards, the first ``numRows`` rows are all in use.
+
+        :return: Success
+        """
+        if self.isCompact:
+            return RetVal(True, None, None)
+
+        # The objects beyond the new size fill the holes before it.
+        newN = len(self.rows)
+        inUse = self._objIDs[:self.numRows] >= 0
+        holes = np.flatnonzero(~inUse[:newN])
+        movers = np.flatnonzero(inUse[newN:]) + newN
+        for col in self._data.values():
+            col[holes] = col[movers]
+            col[newN:self.numRows] = 0
+        self._objIDs[holes] = self._objIDs[movers]
+        self._objIDs[newN:self.numRows] = -1
+        self.rows.update(zip(self._objIDs[holes].tolist(), holes.tolist()))
+
+        self.freeRows = []
+        self.numRows = newN
+        return RetVal(True, None, None)
+
+    def getSV(self, row: int):
+        """
+        Return the State Vector in ``row``.
+
+        :param int row: row index.
+        :return: State Vector.
+        :rtype: _BulletData
+        """
+        data = self._data
+        out = {}
+        for name in _BulletData._fields:
+            val = data[name][row].tolist()
+            out[name] = val[0] if len(val) == 1 else val
+        out['lastChanged'] = int(out['lastChanged'])
+        return _BulletData(**out)
+
+    def setSV(self, row: int, sv: _BulletData):
+        """
+        Overwrite the State Vector in ``row`` with ``sv``.
+
+        :param int row: row index.
+        :param _BulletData sv: State Vector.
+        """
+        data = self._data
+        for name, val in zip(_BulletData._fields, sv):
+            data[name][row] = val
+
+    def getPacked(self, rows: np.ndarray):
+        """
+        Return the packed State Vectors (see ``bullet_data.pack``) of ``rows``.
+
+        :param np.ndarray rows: row indices.
+        :return: N x ``bullet_data.packedSize`` array.
+        :rtype: np.ndarray
+        """
+        cols = [self._data[_][rows] for _ in _BulletData._fields]
+        return np.hstack(cols)
+
+    def setPacked(self, rows: np.ndarray, data: np.ndarray):
+        """
+        Overwrite the State Vectors in ``rows`` with the packed ``data``.
+
+        :param np.ndarray rows: row indices.
+        :param np.ndarray data: N x ``bullet_data.packedSize`` array.
+        """
+        for name, sl in bullet_data._BulletDataSlices.items():
+            self._data[name][rows] = data[:, sl]
+
+    @typecheck
+    def markDirty(self, objIDs: (tuple, list)):
+        """
+        Force ``objIDs`` to appear in the next ``dirtyRows`` result.
+
+        Non-existing objects are ignored.
+
+        :param list objIDs: object IDs.
+        """
+        rows = [self.rows[_] for _ in objIDs if _ in self.rows]
+        self._data['syncState'][rows] = SYNC_DIRTY
+
+    @typecheck
+    def dirtyRows(self, epsilon: (int, float)):
+        """
+        Return the rows that must be synced, and whether they are at rest.
+
+        An object is at rest if none of its linear- or angular velocity
+        components exceeds ``epsilon``. The returned rows comprise
+
+        * objects that were never synced or explicitly marked dirty,
+        * moving objects whose State Vector has changed by more than
+          ``epsilon`` since the last sync,
+        * objects that have started- or stopped moving since the last sync.
+
+        Resting objects that were already synced at rest are not returned,
+        even if their State Vector has drifted a little.
+
+        :param float epsilon: change threshold.
+        :return: (rows, resting)
+        :rtype: (np.ndarray, np.ndarray)
+        """
+        rows = np.flatnonzero(self.objIDs >= 0)
+        data = self._data
+        state = data['syncState'][rows, 0]
+
+        # Determine the objects at rest.
+        vel = np.hstack((data['velocityLin'][rows],
+                         data['velocityRot'][rows]))
+        resting = np.all(np.abs(vel) <= epsilon, axis=1)
+
+        # Determine the objects whose State Vector has changed.
+        delta = np.abs(self.getPacked(rows) - data['synced'][rows])
+        changed = np.any(delta > epsilon, axis=1)
+
+        dirty = (state == SYNC_DIRTY)
+        dirty |= resting & (state != SYNC_RESTING)
+        dirty |= ~resting & ((state == SYNC_RESTING) | changed)
+        return rows[dirty], resting[dirty]
+
+    def markSynced(self, rows: np.ndarray, resting: np.ndarray):
+        """
+        Record the current State Vectors of ``rows`` as synced.
+
+        :param np.ndarray rows: row indices.
+        :param np.ndarray resting: *True* for the rows at rest.
+        """
+        self._data['synced'][rows] = self.getPacked(rows)
+        self._data['syncState'][rows, 0] = np.where(
+            resting, SYNC_RESTING, SYNC_MOVING)
+
+    def resetForces(self):
+        """
+        Set the force and torque of all objects to zero.
+        """
+        self._data['force'][:self.numRows] = 0
+        self._data['torque'][:self.numRows] = 0
+
+
+class _StoreView(Mapping):
+    """
+    Base class for dictionary-like views (objID -> value) of a store column.
+
+    Assigning to a non-existing objID raises a ``KeyError``; use
+    ``ObjectStore.add`` to add objects.
+    """
+    def __init__(self, store: ObjectStore):
+        self.store = store
+
+    def __len__(self):
+        return len(self.store.rows)
+
+    def __iter__(self):
+        return iter(self.store.rows)
+
+    def __contains__(self, objID):
+        return objID in self.store.rows
+
+    def __getitem__(self, objID):
+        return self._get(self.store.rows[objID])
+
+    def __setitem__(self, objID, value):
+        self._set(self.store.rows[objID], value)
+
+
+class _SVView(_StoreView):
+    """
+    Map objIDs to their ``_BulletData`` State Vectors.
+    """
+    def _get(self, row):
+        return self.store.getSV(row)
+
+    def _set(self, row, sv):
+        self.store.setSV(row, sv)
+
+
+class _VectorView(_StoreView):
+    """
+    Map objIDs to the values in a vector column (as lists).
+    """
+    def __init__(self, store: ObjectStore, name: str):
+        super().__init__(store)
+        self.name = name
+
+    def _get(self, row):
+        return self.store._data[self.name][row].tolist()
+
+    def _set(self, row, value):
+        self.store._data[self.name][row] = value
+
+
+class _ScalarView(_VectorView):
+    """
+    Map objIDs to the values in a single-valued column (as floats).
+    """
+    def _get(self, row):
+        return float(self.store._data[self.name][row, 0])
@@ -20,13 +20,20 @@ Specify and implement the necessary functions to create, access and manipulate
 state variables.
 """
 
+import os
 import sys
+import zmq
+import pickle
 import logging
+import threading
 import IPython
 import numpy as np
 import azrael.util as util
 import azrael.config as config
 import azrael.database as database
+import azrael.statefeed as statefeed
+import azrael.sharedstate as sharedstate
+import azrael.spatialindex as spatialindex
 import azrael.bullet.bullet_data as bullet_data
 
 from azrael.typecheck import typecheck
@@ -44,12 +51,236 @@ RetVal = util.RetVal
 logit = logging.getLogger('azrael.' + __name__)
 
 
+class CommandQueueMongo():
+    """
+    Command queue in the 'Commands' collection of Mongo.
+
+    The queue retains only the first command for every (cmd, objID)
+    combination until Leonard de-queues it.
+    """
+    @typecheck
+    def put(self, cmd: str, docs: (tuple, list)):
+        """
+        Enqueue the ``cmd`` command for all ``docs``.
+
+        Every document is a dictionary with at least an 'objID' key. Spawn
+        commands fail if one of their objIDs is already queued.
+
+        :param str cmd: command ('spawn', 'remove', 'modify', 'force').
+        :param list docs: command documents.
+        :return: Success
+        """
+        if len(docs) == 0:
+            return RetVal(True, None, None)
+
+        # Insert every document unless a document with matching query
+        # already exists.
+        db = database.dbHandles['Commands']
+        bulk = db.initialize_unordered_bulk_op()
+        for doc in docs:
+            query = {'cmd': cmd, 'objID': doc['objID']}
+            data = {k: v for (k, v) in doc.items() if k != 'objID'}
+            data = data if len(data) > 0 else query
+            bulk.find(query).upsert().update({'$setOnInsert': data})
+        ret = bulk.execute()
+
+        if (cmd == 'spawn') and (ret['nMatched'] > 0):
+            # It should be impossible for this to happen if the object IDs
+            # come from ``database.getUniqueObjectIDs``.
+            msg = 'At least one objID already existed --> serious bug'
+            logit.error(msg)
+            return RetVal(False, msg, None)
+        return RetVal(True, None, None)
+
+    def get(self):
+        """
+        Return and de-queue all commands currently in the queue.
+
+        :return: list of command documents.
+        """
+        # Query all pending commands and delete them from the queue.
+        db = database.dbHandles['Commands']
+        docs = list(db.find())
+        db.remove({'_id': {'$in': [_['_id'] for _ in docs]}})
+        return RetVal(True, None, docs)
+
+
+class CommandQueueZeroMQ():
+    """
+    In-memory command stream from Clerk to Leonard.
+
+    Clerk pushes every batch of commands into a ZeroMQ PUSH socket and Leonard
+    drains its PULL socket once per physics step. Like the Mongo queue, this
+    queue retains only the first command for every (cmd, objID) combination
+    within one physics step.
+
+    Unlike the Mongo queue, the spawn command cannot detect duplicate objIDs.
+    Leonard will ignore (and log) them instead.
+
+    The sockets are created on demand in the process that uses them. Leonard
+    binds the PULL socket; it must thus run in exactly one process. All
+    threads of a process share the PUSH socket (see ``getCommandQueue``), and
+    a lock serialises access to it. Leonard thus receives the commands of
+    every process in the order they were issued.
+
+    If Leonard is down then the PUSH socket buffers up to ``hwm`` batches.
+    Beyond that ``put`` fails instead of blocking the caller.
+
+    :param str addr: address of the command stream.
+    :param int hwm: maximum number of buffered batches.
+    """
+    @typecheck
+    def __init__(self, addr: str=config.addr_leonard_cmd, hwm: int=1000):
+        self.addr = addr
+        self.hwm = hwm
+        self.lock = threading.Lock()
+        self.sock_push = None
+        self.sock_pull = None
+
+    @typecheck
+    def put(self, cmd: str, docs: (tuple, list)):
+        """
+        Enqueue the ``cmd`` command for all ``docs``.
+
+        :param str cmd: command ('spawn', 'remove', 'modify', 'force').
+        :param list docs: command documents.
+        :return: Success
+        """
+        if len(docs) == 0:
+            return RetVal(True, None, None)
+
+        msg = pickle.dumps([dict(doc, cmd=cmd) for doc in docs])
+        with self.lock:
+            if self.sock_push is None:
+                self.sock_push = zmq.Context.instance().socket(zmq.PUSH)
+                self.sock_push.setsockopt(zmq.LINGER, 0)
+                self.sock_push.setsockopt(zmq.SNDHWM, self.hwm)
+                self.sock_push.connect(self.addr)
+
+            try:
+                self.sock_push.send(msg, zmq.NOBLOCK)
+            except zmq.Again:
+                msg = 'Command queue is full (is Leonard running?)'
+                logit.warning(msg)
+                return RetVal(False, msg, None)
+        return RetVal(True, None, None)
+
+    def get(self):
+        """
+        Return and de-queue all commands currently in the queue.
+
+        :return: list of command documents.
+        """
+        if self.sock_pull is None:
+            self.sock_pull = zmq.Context.instance().socket(zmq.PULL)
+            self.sock_pull.setsockopt(zmq.LINGER, 0)
+            self.sock_pull.bind(self.addr)
+
+        # Drain the socket and keep only the first command for every
+        # (cmd, objID) combination.
+        docs, seen = [], set()
+        while True:
+            try:
+                msg = self.sock_pull.recv(zmq.NOBLOCK)
+            except zmq.Again:
+                break
+            for doc in pickle.loads(msg):
+                key = (doc['cmd'], doc['objID'])
+                if key not in seen:
+                    seen.add(key)
+                    docs.append(doc)
+        return RetVal(True, None, docs)
+
+
+# All available command queues.
+commandQueues = {
+    'mongo': CommandQueueMongo,
+    'zeromq': CommandQueueZeroMQ,
+}
+
+# The command queue of the current process and its PID. The PID ensures
+# that forked processes create their own queue.
+_cmdQueue = (None, None)
+_cmdQueueLock = threading.Lock()
+
+
+def getCommandQueue():
+    """
+    Return the command queue of the current process.
+
+    All threads share the same queue. This preserves the order of their
+    commands.
+
+    The ``config.cmd_transport`` variable specifies the queue type.
+
+    :return: command queue instance.
+    """
+    global _cmdQueue
+    with _cmdQueueLock:
+        if _cmdQueue[1] != os.getpid():
+            _cmdQueue = (commandQueues[config.cmd_transport](), os.getpid())
+        return _cmdQueue[0]
+
+
+# The shared State Vector table of the current process and its PID.
+_sharedState = (None, None)
+
+
+def _getSharedState():
+    """
+    Return the shared State Vector table, or *None* if it is unavailable.
+
+    The table only exists if ``config.sv_shared_memory`` is set, and only
+    after Leonard has published the first State Vectors. All query functions
+    fall back to the database if this function returns *None*.
+
+    This function opens the table again once Leonard has invalidated it
+    (see ``sharedstate.invalidateTable``).
+
+    :return: ``SharedStateTable`` instance or *None*.
+    """
+    global _sharedState
+    if not config.sv_shared_memory:
+        return None
+    table, pid = _sharedState
+    if (table is None) or (pid != os.getpid()) or (not table.valid):
+        # Other threads may still use the old table. It will close once
+        # they are done with it.
+        _sharedState = (None, None)
+        try:
+            table = sharedstate.SharedStateTable(config.sv_shared_path)
+        except (OSError, ValueError, AssertionError):
+            return None
+        _sharedState = (table, os.getpid())
+    return _sharedState[0]
+
+
+def _snapshotSharedState(objIDs=None):
+    """
+    Return a snapshot of the shared State Vector table.
+
+    :param list objIDs: (optional) the objects to return (default: all).
+    :return: (objIDs, svs, aabbs) or *None* if the table is unavailable.
+    """
+    table = _getSharedState()
+    if table is None:
+        return None
+    ret = table.snapshot(objIDs)
+    if not ret.ok:
+        logit.warning(ret.msg)
+        return None
+    return ret.data[1:]
+
+
 def getNumObjects():
     """
     Return the number of objects in the simulation.
 
     :returns int: number of objects in simulation.
     """
+    snap = _snapshotSharedState()
+    if snap is not None:
+        return len(snap[0])
     return database.dbHandles['SV'].count()
 
 
@@ -60,12 +291,10 @@ def dequeueCommands():
 
     :return QueuedCommands: a tuple with lists for each command.
     """
-    # Convenience.
-    db = database.dbHandles['Commands']
-
-    # Query all pending commands and delete them from the queue.
-    docs = list(db.find())
-    ret = db.remove({'_id': {'$in': [_['_id'] for _ in docs]}})
+    ret = getCommandQueue().get()
+    if not ret.ok:
+        return ret
+    docs = ret.data
 
     # Split the commands into categories.
     spawn = [_ for _ in docs if _['cmd'] == 'spawn']
@@ -116,27 +345,9 @@ def addCmdSpawn(objData: (tuple, list)):
             return RetVal(False, msg, None)
 
     # Meta data for spawn command.
-    db = database.dbHandles['Commands']
-    bulk = db.initialize_unordered_bulk_op()
-    for objID, sv, aabb in objData:
-        query = {'cmd': 'spawn', 'objID': objID}
-        data = {'sv': sv, 'AABB': float(aabb)}
-
-        # Insert this document unless a document with matching query already
-        # exists.
-        bulk.find(query).upsert().update({'$setOnInsert': data})
-
-    ret = bulk.execute()
-    if ret['nMatched'] > 0:
-        # A template with name ``templateID`` already existed --> failure.
-        # It should be impossible for this to happen if the object IDs come
-        # from ``database.getUniqueObjectIDs``.
-        msg = 'At least one objID already existed --> serious bug'
-        logit.error(msg)
-        return RetVal(False, msg, None)
-    else:
-        # All objIDs were unique --> success.
-        return RetVal(True, None, None)
+    docs = [{'objID': objID, 'sv': sv, 'AABB': float(aabb)}
+            for objID, sv, aabb in objData]
+    return getCommandQueue().put('spawn', docs)
 
 
 @typecheck
@@ -147,16 +358,10 @@ def addCmdRemoveObject(objID: int):
     Leonard will process the queue (and thus this command) once per physics
     cycle. However, it is impossible to determine when exactly.
 
-    .. note:: This function always succeeds.
-
     :param int objID: ID of object to delete.
     :return: Success.
     """
-    # The 'data' is dummy because Mongo's 'update' requires one.
-    db = database.dbHandles['Commands']
-    data = query = {'cmd': 'remove', 'objID': objID}
-    db.update(query, {'$setOnInsert': data}, upsert=True)
-    return RetVal(True, None, None)
+    return getCommandQueue().put('remove', [{'objID': objID}])
 
 
 @typecheck
@@ -197,14 +402,8 @@ def addCmdModifyStateVariable(objID: int, data: BulletDataOverride):
         if isinstance(val, np.ndarray):
             data[idx] = val.tolist()
 
-    # Save the new SVs to the DB (overwrite existing ones).
-    db = database.dbHandles['Commands']
-    query = {'cmd': 'modify', 'objID': objID}
-    data = {'sv': data}
-    db.update(query, {'$setOnInsert': data},  upsert=True)
-
-    # This function was successful if exactly one document was updated.
-    return RetVal(True, None, None)
+    # Queue the new SVs.
+    return getCommandQueue().put('modify', [{'objID': objID, 'sv': data}])
 
 
 @typecheck
@@ -228,13 +427,9 @@ def addCmdSetForceAndTorque(objID: int, force: list, torque: list):
     if not (len(force) == len(torque) == 3):
         return RetVal(False, 'force or torque has invalid length', None)
 
-    # Update the DB.
-    db = database.dbHandles['Commands']
-    query = {'cmd': 'force', 'objID': objID}
-    data = {'force': force, 'torque': torque}
-    db.update(query, {'$setOnInsert': data}, upsert=True)
-
-    return RetVal(True, None, None)
+    # Queue the command.
+    doc = {'objID': objID, 'force': force, 'torque': torque}
+    return getCommandQueue().put('force', [doc])
 
 
 @typecheck
@@ -254,8 +449,15 @@ def getStateVariables(objIDs: (list, tuple)):
             logit.warning(msg)
             return RetVal(False, msg, None)
 
-    # Retrieve the state variables.
+    # Retrieve the state variables from the shared table if possible.
     out = {_: None for _ in objIDs}
+    snap = _snapshotSharedState(objIDs)
+    if snap is not None:
+        for objID, sv in zip(snap[0].tolist(), snap[1]):
+            out[objID] = bullet_data.unpack(sv)
+        return RetVal(True, None, out)
+
+    # Retrieve the state variables.
     with util.Timeit('physAPI.1_getSV') as timeit:
         tmp = list(database.dbHandles['SV'].find({'objID': {'$in': objIDs}}))
 
@@ -284,11 +486,15 @@ def getAABB(objIDs: (list, tuple)):
             logit.warning(msg)
             return RetVal(False, msg, None)
 
-    # Retrieve the state variables.
-    out = list(database.dbHandles['SV'].find({'objID': {'$in': objIDs}}))
-
-    # Put all AABBs into a dictionary to simplify sorting afterwards.
-    out = {_['objID']: np.array(_['AABB'], np.float64) for _ in out}
+    # Put all AABBs into a dictionary to simplify sorting afterwards. Use the
+    # shared table if possible.
+    snap = _snapshotSharedState(objIDs)
+    if snap is not None:
+        out = {objID: np.array(aabb, np.float64)
+               for objID, aabb in zip(snap[0].tolist(), snap[2])}
+    else:
+        out = list(database.dbHandles['SV'].find({'objID': {'$in': objIDs}}))
+        out = {_['objID']: np.array(_['AABB'], np.float64) for _ in out}
 
     # Compile the AABB values into a list ordered by ``objIDs``. Insert a None
     # element if a particular objID has no AABB (probably means the object was
@@ -343,6 +549,13 @@ def getAllStateVariables():
     :return: dictionary of state variables with object IDs as keys.
     :rtype: dict
     """
+    # Use the shared table if possible.
+    snap = _snapshotSharedState()
+    if snap is not None:
+        out = {objID: bullet_data.unpack(sv)
+               for objID, sv in zip(snap[0].tolist(), snap[1])}
+        return RetVal(True, None, out)
+
     # Compile all object IDs and state variables into a dictionary.
     out = {}
     for doc in database.dbHandles['SV'].find():
@@ -351,6 +564,105 @@ def getAllStateVariables():
     return RetVal(True, None, out)
 
 
+# The state feed listener of the current process and its PID.
+_stateFeed = (None, None)
+_stateFeedLock = threading.Lock()
+
+
+def _getStateFeed():
+    """
+    Return the listener for the state frames of Leonard, or *None*.
+
+    The listener only exists if ``config.sv_publish`` is set. Every process
+    starts its own listener on the first call.
+
+    :return: ``statefeed.StateFeedListener`` instance or *None*.
+    """
+    global _stateFeed
+    if not config.sv_publish:
+        return None
+    with _stateFeedLock:
+        if (_stateFeed[0] is None) or (_stateFeed[1] != os.getpid()):
+            listener = statefeed.StateFeedListener()
+            listener.start()
+            _stateFeed = (listener, os.getpid())
+    return _stateFeed[0]
+
+
+# The latest spatial index, and the source and generation of its data.
+_spatialIndex = (None, None)
+
+
+def _getSpatialIndex():
+    """
+    Return a spatial index of all objects.
+
+    The index comes from the shared State Vector table if it is available,
+    and from the latest state frame of Leonard otherwise (see
+    ``statefeed.StateFeedListener``). Either way, it is only rebuilt when
+    Leonard has published new data, ie. at most once per physics step.
+
+    Without shared memory and state frames, eg. before the first frame has
+    arrived, every call compiles the index from the database.
+
+    :return: ``spatialindex.SpatialIndex`` instance.
+    """
+    global _spatialIndex
+    position = bullet_data._BulletDataSlices['position']
+
+    # Re-use the index if Leonard has not published new data since.
+    table = _getSharedState()
+    if table is not None:
+        if _spatialIndex[1] == ('shared', table.epoch, table.generation):
+            return _spatialIndex[0]
+        ret = table.snapshot()
+        if ret.ok:
+            gen, objIDs, svs, aabbs = ret.data
+            index = spatialindex.SpatialIndex(objIDs, svs[:, position], aabbs)
+            _spatialIndex = (index, ('shared', table.epoch, gen))
+            return index
+
+    # Same for the state frames. Every frame is a new tuple.
+    listener = _getStateFeed()
+    frame = None if listener is None else listener.frame
+    if frame is not None:
+        key = _spatialIndex[1]
+        if (key is not None) and (key[0] == 'feed') and (key[1] is frame):
+            return _spatialIndex[0]
+        tick, objIDs, svs, aabbs = frame
+        index = spatialindex.SpatialIndex(objIDs, svs[:, position], aabbs)
+        _spatialIndex = (index, ('feed', frame))
+        return index
+
+    # Compile the index from the database.
+    objIDs, pos, aabbs = [], [], []
+    for doc in database.dbHandles['SV'].find():
+        objIDs.append(doc['objID'])
+        pos.append(_BulletData(*doc['sv']).position)
+        aabbs.append(doc['AABB'])
+    return spatialindex.SpatialIndex(
+        np.array(objIDs, np.int64), np.array(pos, np.float64),
+        np.array(aabbs, np.float64))
+
+
+@typecheck
+def getObjectsInRegion(shape: str, params: dict):
+    """
+    Return the IDs of all objects inside a region.
+
+    The region is a 'box', 'sphere', or view 'frustum', and ``params``
+    contains the keyword arguments for the corresponding query method of
+    ``spatialindex.SpatialIndex`` (eg. {'centre': [0, 0, 0], 'radius': 1}
+    for a sphere). Every object counts as a sphere whose radius is its AABB.
+
+    :param str shape: 'box', 'sphere', or 'frustum'.
+    :param dict params: shape parameters.
+    :return: sorted list of object IDs.
+    :rtype: list
+    """
+    return _getSpatialIndex().query(shape, params)
+
+
 def getAllObjectIDs():
     """
     Return all object IDs in the simulation.
@@ -358,6 +670,11 @@ def getAllObjectIDs():
     :return: list of all object IDs in the simulation.
     :rtype: list
     """
+    # Use the shared table if possible.
+    snap = _snapshotSharedState()
+    if snap is not None:
+        return RetVal(True, None, snap[0].tolist())
+
     # Compile and return the list of all object IDs.
     out = [_['objID'] for _ in database.dbHandles['SV'].find()]
     return RetVal(True, None, out)
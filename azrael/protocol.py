@@ -40,10 +40,12 @@ agnostic encodings of strings, JSON objects, or C-arrays (via NumPy). This
 should make it possible to write clients in other languages.
 """
 
+import base64
 import IPython
 import numpy as np
 import azrael.util
 import azrael.parts as parts
+import azrael.spatialindex as spatialindex
 import azrael.bullet.bullet_data as bullet_data
 import azrael.physics_interface as physics_interface
 
@@ -54,6 +56,91 @@ ipshell = IPython.embed
 RetVal = azrael.util.RetVal
 Template = azrael.util.Template
 
+# Wire encodings for State Variables. 'json' sends one dictionary per
+# object. The others send one fixed-layout record per object (see
+# ``packStateVariables``) with the respective (little endian) data type.
+SVEncodings = {'json': None, 'float64': '<f8', 'float32': '<f4'}
+
+# State Variables in a particular encoding. Clerk returns this type instead
+# of a plain {objID: sv} dictionary if the client requested a binary encoding.
+EncodedSV = namedtuple('EncodedSV', 'encoding data')
+
+
+@typecheck
+def packStateVariables(data: dict, encoding: str):
+    """
+    Return the State Variables in ``data`` as a packed binary record array.
+
+    This is a convenience wrapper around ``packStateRecords`` for {objID: sv}
+    dictionaries (*None* values denote missing objects).
+
+    :param dict data: {objID: sv} dictionary (*None* values are allowed).
+    :param str encoding: one of the binary ``SVEncodings``.
+    :return: packed State Variables.
+    :rtype: dict
+    """
+    objIDs = [k for k, v in data.items() if v is not None]
+    missing = [k for k, v in data.items() if v is None]
+    records = np.zeros((len(objIDs), bullet_data.packedSize), np.float64)
+    for idx, objID in enumerate(objIDs):
+        records[idx] = bullet_data.pack(data[objID])
+    return packStateRecords(objIDs, records, missing, encoding)
+
+
+@typecheck
+def packStateRecords(objIDs: (list, tuple), records: np.ndarray,
+                     missing: (list, tuple), encoding: str):
+    """
+    Return the packed State Vectors ``records`` of ``objIDs`` for the wire.
+
+    Every record is a ``bullet_data.pack`` State Vector in the data type
+    specified by ``encoding`` (see ``SVEncodings``). The returned dictionary
+    contains
+
+    * 'encoding': the value of ``encoding``,
+    * 'layout': list of [field name, width] pairs for one record,
+    * 'objIDs': objIDs of the records,
+    * 'missing': objIDs without State Variable,
+    * 'data': Base64 encoded records.
+
+    JavaScript clients can decode the records with a ``Float64Array`` or
+    ``Float32Array``, Python clients with ``unpackStateVariables``.
+
+    :param list objIDs: objIDs of the records.
+    :param np.ndarray records: N x ``bullet_data.packedSize`` array.
+    :param list missing: objIDs without State Variable.
+    :param str encoding: one of the binary ``SVEncodings``.
+    :return: packed State Variables.
+    :rtype: dict
+    """
+    buf = records.astype(SVEncodings[encoding])
+    layout = [[name, width] for name, width in zip(
+        bullet_data._BulletData._fields, bullet_data._BulletDataWidths)]
+    return {'encoding': encoding, 'layout': layout, 'objIDs': list(objIDs),
+            'missing': list(missing),
+            'data': base64.b64encode(buf.tobytes()).decode('ascii')}
+
+
+@typecheck
+def unpackStateVariables(payload: dict):
+    """
+    Return the objIDs and records of the packed State Variables ``payload``.
+
+    This is the inverse of ``packStateRecords``. The records are returned
+    as an N x ``bullet_data.packedSize`` float64 array whose rows
+    ``bullet_data.unpack`` can convert to ``_BulletData`` tuples.
+
+    :param dict payload: output of ``packStateRecords``.
+    :return: (objIDs, records, missing objIDs)
+    :rtype: tuple
+    """
+    dtype = SVEncodings[payload['encoding']]
+    buf = base64.b64decode(payload['data'])
+    buf = np.frombuffer(buf, dtype).astype(np.float64)
+    objIDs = np.array(payload['objIDs'], np.int64)
+    buf = buf.reshape(len(objIDs), bullet_data.packedSize)
+    return objIDs, buf, payload['missing']
+
 
 # ---------------------------------------------------------------------------
 # Ping
@@ -364,19 +451,33 @@ def FromClerk_SetGeometry_Decode(dummyarg):
 
 
 @typecheck
-def ToClerk_GetStateVariable_Encode(objIDs: (list, tuple)):
+def ToClerk_GetStateVariable_Encode(objIDs: (list, tuple),
+                                    encoding: str='json'):
     for objID in objIDs:
         assert isinstance(objID, int)
-    return True, {'objIDs': objIDs}
+    assert encoding in SVEncodings
+    return True, {'objIDs': objIDs, 'encoding': encoding}
 
 
 @typecheck
 def ToClerk_GetStateVariable_Decode(payload: dict):
-    return True, (payload['objIDs'], )
+    encoding = payload.get('encoding', 'json')
+    if encoding not in SVEncodings:
+        return False, 'Unknown encoding <{}>'.format(encoding)
+    if encoding == 'json':
+        return True, (payload['objIDs'], )
+    return True, (payload['objIDs'], encoding)
 
 
 @typecheck
-def FromClerk_GetStateVariable_Encode(data: dict):
+def FromClerk_GetStateVariable_Encode(data: (dict, EncodedSV)):
+    # Binary encodings.
+    if isinstance(data, EncodedSV):
+        if data.encoding != 'json':
+            return True, packStateVariables(data.data, data.encoding)
+        data = data.data
+
+    # JSON encoding.
     fields = bullet_data._BulletData._fields
     for k, v in data.items():
         if v is None:
@@ -388,7 +489,13 @@ def FromClerk_GetStateVariable_Encode(data: dict):
 
 @typecheck
 def FromClerk_GetStateVariable_Decode(payload: dict):
-    return RetVal(True, None, payload['data'])
+    # JSON encoding.
+    if 'encoding' not in payload:
+        return RetVal(True, None, payload['data'])
+
+    # Binary encodings: return the records as they are. Converting every
+    # record to a dictionary would squander the purpose of these encodings.
+    return RetVal(True, None, unpackStateVariables(payload))
 
 
 # ---------------------------------------------------------------------------
@@ -397,13 +504,19 @@ def FromClerk_GetStateVariable_Decode(payload: dict):
 
 
 @typecheck
-def ToClerk_GetAllStateVariables_Encode():
-    return True, None
+def ToClerk_GetAllStateVariables_Encode(encoding: str='json'):
+    assert encoding in SVEncodings
+    return True, {'encoding': encoding}
 
 
 @typecheck
 def ToClerk_GetAllStateVariables_Decode(payload: dict):
-    return True, (None, )
+    if payload is None:
+        return True, ('json', )
+    encoding = payload.get('encoding', 'json')
+    if encoding not in SVEncodings:
+        return False, 'Unknown encoding <{}>'.format(encoding)
+    return True, (encoding, )
 
 # Reuse the protocol for 'getStateVariables' for the data that comes
 # back from Clerk.
@@ -411,6 +524,40 @@ FromClerk_GetAllStateVariables_Encode = FromClerk_GetStateVariable_Encode
 FromClerk_GetAllStateVariables_Decode = FromClerk_GetStateVariable_Decode
 
 
+# ---------------------------------------------------------------------------
+# GetStateVariablesInRegion
+# ---------------------------------------------------------------------------
+
+
+@typecheck
+def ToClerk_GetStateVariablesInRegion_Encode(
+        shape: str, params: dict, encoding: str='json'):
+    assert shape in spatialindex.queryShapes
+    assert encoding in SVEncodings
+    return True, {'shape': shape, 'params': params, 'encoding': encoding}
+
+
+@typecheck
+def ToClerk_GetStateVariablesInRegion_Decode(payload: dict):
+    try:
+        shape, params = payload['shape'], payload['params']
+        encoding = payload.get('encoding', 'json')
+    except KeyError:
+        return False, 'Missing shape or parameters'
+    if shape not in spatialindex.queryShapes:
+        return False, 'Unknown shape <{}>'.format(shape)
+    if not isinstance(params, dict):
+        return False, 'Parameters must be a dictionary'
+    if encoding not in SVEncodings:
+        return False, 'Unknown encoding <{}>'.format(encoding)
+    return True, (shape, params, encoding)
+
+# Reuse the protocol for 'getStateVariables' for the data that comes
+# back from Clerk.
+FromClerk_GetStateVariablesInRegion_Encode = FromClerk_GetStateVariable_Encode
+FromClerk_GetStateVariablesInRegion_Decode = FromClerk_GetStateVariable_Decode
+
+
 # ---------------------------------------------------------------------------
 # Spawn
 # ---------------------------------------------------------------------------
@@ -509,3 +656,40 @@ def FromClerk_ControlParts_Encode(objIDs: (list, tuple)):
 @typecheck
 def FromClerk_ControlParts_Decode(payload: dict):
     return RetVal(True, None, payload['objIDs'])
+
+
+# ---------------------------------------------------------------------------
+# Batch
+# ---------------------------------------------------------------------------
+
+
+@typecheck
+def ToClerk_Batch_Encode(cmds: (list, tuple)):
+    # Every command is a (cmd, payload) tuple where ``payload`` is the output
+    # of the respective ``ToClerk_*_Encode`` function.
+    for cmd, payload in cmds:
+        assert isinstance(cmd, str)
+        assert isinstance(payload, dict)
+    return True, {'cmds': [{'cmd': c, 'payload': p} for c, p in cmds]}
+
+
+@typecheck
+def ToClerk_Batch_Decode(payload: dict):
+    cmds = []
+    for cmd in payload['cmds']:
+        if not (isinstance(cmd, dict) and ('cmd' in cmd) and
+                ('payload' in cmd)):
+            return False, 'Invalid command format'
+        cmds.append((cmd['cmd'], cmd['payload']))
+    return True, (cmds, )
+
+
+@typecheck
+def FromClerk_Batch_Encode(results: (list, tuple)):
+    # Every result is a {'ok': bool, 'msg': str, 'payload': dict} dictionary.
+    return True, {'results': results}
+
+
+@typecheck
+def FromClerk_Batch_Decode(payload: dict):
+    return RetVal(True, None, payload['results'])
@@ -0,0 +1,269 @@
+# Copyright 2014, Oliver Nagy <olitheolix@gmail.com>
+#
+# This file is part of Azrael (https://github.com/olitheolix/azrael)
+#
+# Azrael is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# Azrael is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with Azrael. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Pack collision sets into Work Packages for ``LeonardDistributedZeroMQ``.
+
+Every collision set is independent and could go into its own Work Package.
+However, most collision sets contain only one or two objects, and the cost
+to send, unpack, and return a Work Package would then dominate. The
+``WorkScheduler`` therefore packs the collision sets into a few Work
+Packages of similar cost.
+
+The cost model estimates the compute time of every object. It starts with
+``objCost`` for all objects and then uses the measured compute time of
+the last Work Package each object was in. Every Work Package also has a
+fixed ``overhead``.
+
+The scheduler can also keep collision sets with the Worker that simulated
+their objects in the previous step (see ``assign``). That Worker still has
+the Bullet bodies of these objects and does not need their State Vectors
+again.
+
+The ``WorkerScaler`` decides how many Workers Leonard should have.
+"""
+import heapq
+import numpy as np
+
+from azrael.typecheck import typecheck
+
+
+class WorkScheduler():
+    """
+    Pack collision sets into Work Packages.
+
+    The scheduler aims for ``packagesPerWorker`` Work Packages per Worker so
+    that fast Workers can pick up the slack of slow ones.
+
+    :param int numWorkers: number of Workers.
+    :param int packagesPerWorker: target number of Work Packages per Worker.
+    :param float overhead: fixed cost of every Work Package in seconds.
+    :param float objCost: initial cost of every object in seconds.
+    :param float smoothing: weight of the newest measurement in the cost
+        estimate of an object (must be in (0, 1]).
+    """
+    @typecheck
+    def __init__(self, numWorkers: int, packagesPerWorker: int=2,
+                 overhead: (int, float)=1E-3, objCost: (int, float)=1E-4,
+                 smoothing: (int, float)=0.5):
+        assert numWorkers > 0 and packagesPerWorker > 0
+        assert 0 < smoothing <= 1
+        self.numWorkers = numWorkers
+        self.packagesPerWorker = packagesPerWorker
+        self.overhead = float(overhead)
+        self.defaultCost = float(objCost)
+        self.smoothing = float(smoothing)
+
+        # Cost estimate for every object.
+        self.objCost = {}
+
+    @typecheck
+    def cost(self, objIDs: (list, tuple, set)):
+        """
+        Return the estimated compute time for a Work Package with ``objIDs``.
+
+        :param list objIDs: object IDs.
+        :return: estimated cost in seconds.
+        :rtype: float
+        """
+        get, default = self.objCost.get, self.defaultCost
+        return self.overhead + sum([get(_, default) for _ in objIDs])
+
+    @typecheck
+    def pack(self, collSets: (list, tuple)):
+        """
+        Return the Work Packages for ``collSets``.
+
+        Every Work Package is a list of object IDs and contains one or more
+        complete collision sets. See ``assign`` for details.
+
+        :param list collSets: list of collision sets (iterables of objIDs).
+        :return: list of Work Packages (lists of objIDs), sorted by cost
+            (largest first).
+        :rtype: list
+        """
+        return [objIDs for _, objIDs in self.assign(collSets, {})]
+
+    @typecheck
+    def assign(self, collSets: (list, tuple), affinity: dict):
+        """
+        Return the Work Packages for ``collSets`` and their preferred Worker.
+
+        Every collision set prefers the Worker that ``affinity`` specifies
+        for most of its objects (*None* if there is no such Worker).
+        Collision sets that cost more than the target cost per Work Package
+        go into their own Work Package. The others are packed (largest
+        first) into the Work Package for the same Worker with the smallest
+        cost so far, unless that would exceed the target cost.
+
+        This method also forgets the cost estimates of all objects that are
+        not in any collision set, ie. objects that do not exist anymore.
+
+        :param list collSets: list of collision sets (iterables of objIDs).
+        :param dict affinity: {objID: worker} of the objects that should
+            stay with a particular Worker.
+        :return: list of (worker, objIDs) tuples, sorted by cost (largest
+            first).
+        :rtype: list
+        """
+        if len(collSets) == 0:
+            self.objCost = {}
+            return []
+
+        # Forget all objects that are not in any collision set anymore.
+        get, default = self.objCost.get, self.defaultCost
+        self.objCost = {objID: get(objID, default)
+                        for cs in collSets for objID in cs}
+
+        # Cost of every collision set (without the overhead) and the target
+        # cost for every Work Package.
+        costs = [sum([self.objCost[_] for _ in cs]) for cs in collSets]
+        numPackages = self.numWorkers * self.packagesPerWorker
+        target = max(sum(costs) / numPackages, self.overhead)
+
+        # Pack the collision sets, starting with the most expensive one. Every
+        # Worker has its own heap with the (cost, index) of all its Work
+        # Packages that still have room.
+        packages, heaps = [], {}
+        for idx in np.argsort(costs)[::-1]:
+            cs, c = collSets[idx], costs[idx]
+
+            # Determine the preferred Worker of the collision set.
+            workers = [affinity.get(_, None) for _ in cs]
+            worker = max(set(workers), key=workers.count)
+
+            if c >= target:
+                packages.append([c, worker, list(cs)])
+                continue
+            heap = heaps.setdefault(worker, [])
+            if len(heap) > 0 and heap[0][0] + c <= target:
+                load, pkg = heapq.heappop(heap)
+            else:
+                load, pkg = 0, len(packages)
+                packages.append([0, worker, []])
+            packages[pkg][0] += c
+            packages[pkg][2].extend(cs)
+            heapq.heappush(heap, (load + c, pkg))
+
+        packages.sort(key=lambda _: _[0], reverse=True)
+        return [(worker, objIDs) for _, worker, objIDs in packages]
+
+    @typecheck
+    def update(self, objIDs: (list, tuple), elapsed: (int, float)):
+        """
+        Update the cost estimates with the measured compute time ``elapsed``
+        for a Work Package with ``objIDs``.
+
+        The compute time (minus the overhead) is split evenly among all
+        objects.
+
+        :param list objIDs: object IDs in the Work Package.
+        :param float elapsed: measured compute time in seconds.
+        """
+        if len(objIDs) == 0:
+            return
+        sample = max(elapsed - self.overhead, 0) / len(objIDs)
+        a, default = self.smoothing, self.defaultCost
+        for objID in objIDs:
+            old = self.objCost.get(objID, default)
+            self.objCost[objID] = (1 - a) * old + a * sample
+
+
+class WorkerScaler():
+    """
+    Decide how many Workers Leonard needs.
+
+    The pool is overloaded if a step takes more than ``upLoad`` of the
+    ``budget`` and the Workers are busy, ie. Work Packages had to wait for a
+    Worker or the Workers were idle less than ``idleLow`` of the time. More
+    Workers would not help if the step is slow but the Workers are idle.
+
+    The pool is underloaded if a step takes less than ``downLoad`` of the
+    ``budget`` and the Workers were idle more than ``idleHigh`` of the time.
+
+    For hysteresis, the pool only grows after ``upSteps`` consecutive
+    overloaded steps, and only shrinks after ``downSteps`` consecutive
+    underloaded ones. It then ignores the next ``cooldown`` steps. The pool
+    grows by 50% (at least one Worker) but only shrinks by one Worker at a
+    time.
+
+    :param int minWorkers: minimum number of Workers.
+    :param int maxWorkers: maximum number of Workers.
+    :param int numWorkers: initial number of Workers.
+    :param float budget: target duration of a step in seconds.
+    """
+    @typecheck
+    def __init__(self, minWorkers: int, maxWorkers: int, numWorkers: int,
+                 budget: (int, float), upLoad: (int, float)=0.8,
+                 downLoad: (int, float)=0.3, idleLow: (int, float)=0.2,
+                 idleHigh: (int, float)=0.5, upSteps: int=3,
+                 downSteps: int=20, cooldown: int=10):
+        assert 0 < minWorkers <= maxWorkers
+        assert budget > 0 and 0 <= downLoad < upLoad
+        assert 0 <= idleLow < idleHigh <= 1
+        self.minWorkers, self.maxWorkers = minWorkers, maxWorkers
+        self.numWorkers = min(max(numWorkers, minWorkers), maxWorkers)
+        self.budget = float(budget)
+        self.upLoad, self.downLoad = upLoad, downLoad
+        self.idleLow, self.idleHigh = idleLow, idleHigh
+        self.upSteps, self.downSteps = upSteps, downSteps
+        self.cooldown = cooldown
+
+        # Number of consecutive over- and underloaded steps, and the number
+        # of steps to ignore.
+        self.numOver = self.numUnder = self.numIgnore = 0
+
+    @typecheck
+    def update(self, etime: (int, float), queueDepth: (int, float),
+               idleRatio: (int, float)):
+        """
+        Return the number of Workers after a step with the measured values.
+
+        :param float etime: duration of the step in seconds.
+        :param float queueDepth: average number of Work Packages per Worker
+            that waited for a Worker.
+        :param float idleRatio: fraction of the step the Workers were idle.
+        :return: number of Workers.
+        :rtype: int
+        """
+        load = etime / self.budget
+        busy = (queueDepth >= 1) or (idleRatio < self.idleLow)
+        if (load > self.upLoad) and busy:
+            self.numOver, self.numUnder = self.numOver + 1, 0
+        elif (load < self.downLoad) and (idleRatio > self.idleHigh):
+            self.numOver, self.numUnder = 0, self.numUnder + 1
+        else:
+            self.numOver = self.numUnder = 0
+
+        if self.numIgnore > 0:
+            self.numIgnore -= 1
+            return self.numWorkers
+
+        num = self.numWorkers
+        if self.numOver >= self.upSteps:
+            num = min(num + max(1, num // 2), self.maxWorkers)
+        elif self.numUnder >= self.downSteps:
+            num = max(num - 1, self.minWorkers)
+        else:
+            return num
+
+        # Reset the counters and start the cooldown.
+        if num != self.numWorkers:
+            self.numIgnore = self.cooldown
+        self.numOver = self.numUnder = 0
+        self.numWorkers = num
+        return num
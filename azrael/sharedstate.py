@@ -0,0 +1,259 @@
+# Copyright 2014, Oliver Nagy <olitheolix@gmail.com>
+#
+# This file is part of Azrael (https://github.com/olitheolix/azrael)
+#
+# Azrael is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# Azrael is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with Azrael. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Memory mapped State Vector table for co-located processes.
+
+Leonard publishes the State Vectors of all objects into a memory mapped file
+after every physics step, and Clerk reads them from there instead of querying
+Mongo.
+
+The table contains two buffers. The (single) writer always fills the buffer
+that readers do not currently use, then makes it the active buffer and
+increments the generation counter. Readers note the generation counter,
+copy the data from the active buffer, and retry if the generation counter has
+changed in the meantime (seqlock).
+
+The file layout is:
+
+* header: 8 int64 values (magic, capacity, generation, active buffer, number
+  of objects in buffer 0 and buffer 1, epoch, one reserved value),
+* objIDs: 2 x capacity int64 values (sorted in ascending order),
+* data: 2 x capacity x (``bullet_data.packedSize`` + 1) float64 values (the
+  packed State Vector and the AABB of every object).
+
+Every new table has a random epoch, which distinguishes its generations from
+those of previous tables. A new Leonard invalidates the table of its
+predecessor (see ``invalidateTable``) because that one may be stale, eg.
+after a crash. Readers must then open the table again.
+"""
+import os
+import mmap
+import IPython
+import numpy as np
+import azrael.util as util
+import azrael.bullet.bullet_data as bullet_data
+
+from azrael.typecheck import typecheck
+
+ipshell = IPython.embed
+
+# Return value specification.
+RetVal = util.RetVal
+
+# Identifies valid table files.
+_MAGIC = 0x417a7261656c5356
+
+# Indices into the header.
+_H_MAGIC, _H_CAPACITY, _H_GENERATION, _H_ACTIVE, _H_COUNT = 0, 1, 2, 3, 4
+_H_EPOCH = 6
+_HEADER_SIZE = 8
+
+# Number of float64 values per object (packed State Vector and AABB).
+_ROW_SIZE = bullet_data.packedSize + 1
+
+
+class SharedStateTable():
+    """
+    Double buffered State Vector table in a memory mapped file.
+
+    Only one process must ``publish`` data, but any number of processes may
+    read ``snapshot``s concurrently.
+
+    :param str path: file name of the table.
+    :param int capacity: maximum number of objects (only for ``create``).
+    :param bool create: create a new table (invalidates existing tables).
+    """
+    @typecheck
+    def __init__(self, path: str, capacity: int=65536, create: bool=False):
+        self.path = path
+
+        # Create a new file rather than overwrite the old one that readers
+        # may still have mapped.
+        if create:
+            invalidateTable(path)
+            size = self._fileSize(capacity)
+            with open(path, 'wb') as fd:
+                fd.truncate(size)
+
+        # Map the file into memory.
+        with open(path, 'r+b') as fd:
+            self.mm = mmap.mmap(fd.fileno(), 0)
+
+        # Map the header, and verify the file.
+        self.header = np.frombuffer(self.mm, np.int64, _HEADER_SIZE)
+        if create:
+            self.header[:] = 0
+            self.header[_H_CAPACITY] = capacity
+            self.header[_H_EPOCH] = int.from_bytes(os.urandom(7), 'little')
+            self.header[_H_MAGIC] = _MAGIC
+        assert self.header[_H_MAGIC] == _MAGIC
+        self.capacity = int(self.header[_H_CAPACITY])
+        assert len(self.mm) == self._fileSize(self.capacity)
+
+        # Map the objID and data arrays of both buffers.
+        cap = self.capacity
+        ofs = 8 * _HEADER_SIZE
+        self.objIDs = np.frombuffer(self.mm, np.int64, 2 * cap, ofs)
+        self.objIDs = self.objIDs.reshape(2, cap)
+        ofs += 8 * 2 * cap
+        self.data = np.frombuffer(
+            self.mm, np.float64, 2 * cap * _ROW_SIZE, ofs)
+        self.data = self.data.reshape(2, cap, _ROW_SIZE)
+
+    @staticmethod
+    def _fileSize(capacity: int):
+        """
+        Return the file size of a table for ``capacity`` objects.
+        """
+        return 8 * (_HEADER_SIZE + 2 * capacity * (1 + _ROW_SIZE))
+
+    @property
+    def generation(self):
+        """
+        The number of published snapshots.
+        """
+        return int(self.header[_H_GENERATION])
+
+    @property
+    def epoch(self):
+        """
+        The random ID of this table.
+        """
+        return int(self.header[_H_EPOCH])
+
+    @property
+    def valid(self):
+        """
+        *False* if the table was invalidated.
+        """
+        return int(self.header[_H_MAGIC]) == _MAGIC
+
+    def invalidate(self):
+        """
+        Tell all readers that this table is stale.
+        """
+        self.header[_H_MAGIC] = 0
+
+    def close(self):
+        """
+        Unmap the file.
+        """
+        # The NumPy views must disappear before the map can close.
+        self.header = self.objIDs = self.data = None
+        self.mm.close()
+
+    @typecheck
+    def publish(self, objIDs: np.ndarray, svs: np.ndarray, aabbs: np.ndarray):
+        """
+        Publish the State Vectors ``svs`` and ``aabbs`` of ``objIDs``.
+
+        The State Vectors must be in the ``bullet_data.pack`` format.
+
+        :param np.ndarray objIDs: N object IDs.
+        :param np.ndarray svs: N x ``bullet_data.packedSize`` array.
+        :param np.ndarray aabbs: N AABB sizes.
+        :return: the new generation.
+        """
+        N = len(objIDs)
+        if N > self.capacity:
+            msg = 'Table can only hold {} objects'.format(self.capacity)
+            return RetVal(False, msg, None)
+
+        # Fill the inactive buffer with the objects sorted by objID.
+        buf = 1 - int(self.header[_H_ACTIVE])
+        order = np.argsort(objIDs, kind='mergesort')
+        self.objIDs[buf, :N] = objIDs[order]
+        self.data[buf, :N, :-1] = svs[order]
+        self.data[buf, :N, -1] = aabbs[order]
+        self.header[_H_COUNT + buf] = N
+
+        # Activate the buffer and increment the generation.
+        self.header[_H_ACTIVE] = buf
+        self.header[_H_GENERATION] += 1
+        return RetVal(True, None, self.generation)
+
+    @typecheck
+    def snapshot(self, objIDs: (tuple, list, np.ndarray)=None,
+                 retries: int=100):
+        """
+        Return a consistent copy of the current table content.
+
+        If ``objIDs`` is *None* then return all objects, otherwise only the
+        specified ones. Missing objects do not appear in the output.
+
+        The return value is a tuple (generation, objIDs, svs, aabbs) of the
+        snapshot. The ``svs`` are in the ``bullet_data.pack`` format.
+
+        :param list objIDs: (optional) the objects to return.
+        :param int retries: give up after this many concurrent updates.
+        :return: (generation, objIDs, svs, aabbs)
+        :rtype: tuple
+        """
+        for ii in range(retries):
+            if not self.valid:
+                return RetVal(False, 'Table was invalidated', None)
+
+            # Note the generation *before* the active buffer.
+            gen = int(self.header[_H_GENERATION])
+            buf = int(self.header[_H_ACTIVE])
+            N = int(self.header[_H_COUNT + buf])
+            if N > self.capacity:
+                continue
+
+            # Find the rows to copy.
+            IDs = self.objIDs[buf, :N]
+            if objIDs is None:
+                rows = slice(0, N)
+            else:
+                want = np.asarray(objIDs, np.int64)
+                rows = np.clip(np.searchsorted(IDs, want), 0, max(N - 1, 0))
+                rows = rows[IDs[rows] == want] if N > 0 else rows[:0]
+
+            # Copy the data.
+            outIDs = np.array(IDs[rows])
+            out = np.array(self.data[buf, rows])
+
+            # Return the data unless the writer has published in the meantime.
+            if gen == int(self.header[_H_GENERATION]):
+                ret = (gen, outIDs, out[:, :-1], out[:, -1])
+                return RetVal(True, None, ret)
+        return RetVal(False, 'Could not read consistent snapshot', None)
+
+
+@typecheck
+def invalidateTable(path: str):
+    """
+    Invalidate and remove the table at ``path``, if there is one.
+
+    Readers that have the old table mapped notice the invalidation with
+    their next ``snapshot``.
+
+    :param str path: file name of the table.
+    """
+    try:
+        table = SharedStateTable(path)
+    except (OSError, ValueError, AssertionError):
+        table = None
+    if table is not None:
+        table.invalidate()
+        table.close()
+
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
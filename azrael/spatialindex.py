@@ -0,0 +1,303 @@
+# Copyright 2014, Oliver Nagy <olitheolix@gmail.com>
+#
+# This file is part of Azrael (https://github.com/olitheolix/azrael)
+#
+# Azrael is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# Azrael is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with Azrael. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Spatial index to find the objects inside a box, sphere, or view frustum.
+
+Every object is approximated by a sphere whose radius is the AABB value of
+that object. A query returns all objects whose sphere intersects the query
+shape (the frustum test is conservative, ie. it may return objects near the
+frustum corners that are actually outside).
+
+The index is a uniform grid stored in compressed row format: the objects are
+sorted by the (linearised) cell of their centre, and a query only inspects
+the cells that overlap the bounding box of the query shape. Objects larger
+than a cell (eg. the ground plane) bypass the grid and are always tested
+directly.
+"""
+import IPython
+import numpy as np
+import azrael.util as util
+
+from azrael.typecheck import typecheck
+
+ipshell = IPython.embed
+
+# Return value specification.
+RetVal = util.RetVal
+
+
+@typecheck
+def frustumPlanes(position: (tuple, list, np.ndarray),
+                  view: (tuple, list, np.ndarray),
+                  up: (tuple, list, np.ndarray),
+                  fov: (int, float), aspect: (int, float),
+                  near: (int, float), far: (int, float)):
+    """
+    Return the planes and corners of a view frustum.
+
+    The planes are returned as a 6 x 4 array. Every row contains the inward
+    pointing unit normal and the offset of a plane, ie. a point ``p`` is
+    inside the frustum if ``dot(n, p) + d >= 0`` for all planes.
+
+    :param vec3 position: camera position.
+    :param vec3 view: view direction.
+    :param vec3 up: up direction (must not be parallel to ``view``).
+    :param float fov: vertical field of view in degrees.
+    :param float aspect: aspect ratio (width / height).
+    :param float near: distance to the near plane.
+    :param float far: distance to the far plane.
+    :return: (planes, corners)
+    :rtype: (np.ndarray, np.ndarray)
+    """
+    pos = np.array(position, np.float64)
+    fwd = np.array(view, np.float64)
+    fwd /= np.linalg.norm(fwd)
+    right = np.cross(fwd, np.array(up, np.float64))
+    right /= np.linalg.norm(right)
+    up = np.cross(right, fwd)
+
+    # The eight corners of the frustum.
+    tan = np.tan(np.radians(fov) / 2)
+    corners = []
+    for dist in (near, far):
+        h = dist * tan
+        w = h * aspect
+        centre = pos + dist * fwd
+        for sx, sy in ((-1, -1), (1, -1), (1, 1), (-1, 1)):
+            corners.append(centre + sx * w * right + sy * h * up)
+    corners = np.array(corners)
+
+    # Compile the planes from three corners each, and flip them where
+    # necessary so that the normals point towards the frustum centre.
+    centroid = corners.mean(axis=0)
+    planes = []
+    for a, b, c in ((0, 1, 2), (4, 5, 6), (0, 3, 7),
+                    (1, 2, 6), (0, 1, 5), (3, 2, 6)):
+        n = np.cross(corners[b] - corners[a], corners[c] - corners[a])
+        n /= np.linalg.norm(n)
+        d = -np.dot(n, corners[a])
+        if np.dot(n, centroid) + d < 0:
+            n, d = -n, -d
+        planes.append(np.hstack((n, d)))
+    return np.array(planes), corners
+
+
+class SpatialIndex():
+    """
+    Uniform grid of object spheres.
+
+    The cell size defaults to the cube root of the average volume per object
+    (based on the bounding box of all object centres), but no smaller than
+    the largest object that is not an outlier (see ``SpatialHashGrid`` in
+    Leonard).
+
+    :param np.ndarray objIDs: N object IDs.
+    :param np.ndarray pos: N x 3 array of object positions.
+    :param np.ndarray radii: N object radii (ie. AABB values).
+    :param float cellSize: fixed cell size (None derives it from the data).
+    :param float outlierFactor: radii this much larger than the median do not
+        affect the cell size.
+    """
+    @typecheck
+    def __init__(self, objIDs: np.ndarray, pos: np.ndarray,
+                 radii: np.ndarray, cellSize: (int, float)=None,
+                 outlierFactor: (int, float)=4):
+        self.objIDs = np.asarray(objIDs, np.int64)
+        self.pos = np.asarray(pos, np.float64).reshape(-1, 3)
+        self.radii = np.asarray(radii, np.float64)
+        N = len(self.objIDs)
+
+        # Determine the cell size.
+        if N == 0:
+            cellSize = 1.0
+        elif cellSize is None:
+            med = np.median(self.radii)
+            small = self.radii <= outlierFactor * max(med, 1E-9)
+            extent = np.ptp(self.pos, axis=0)
+            volume = np.prod(np.maximum(extent, 1E-9))
+            cellSize = max((volume / N) ** (1 / 3),
+                           2 * np.max(self.radii[small]))
+        self.cellSize = float(max(cellSize, 1E-9))
+
+        # Objects larger than half a cell bypass the grid.
+        large = self.radii > self.cellSize / 2
+        self.large = np.flatnonzero(large)
+        small = np.flatnonzero(~large)
+
+        # Grid coordinates of all objects in the grid.
+        cells = np.floor(self.pos[small] / self.cellSize).astype(np.int64)
+        if len(small) > 0:
+            self.cellMin = cells.min(axis=0)
+            self.dims = cells.max(axis=0) - self.cellMin + 1
+        else:
+            self.cellMin = np.zeros(3, np.int64)
+            self.dims = np.ones(3, np.int64)
+
+        # Sort the objects by their linearised cell key, and note where every
+        # (occupied) cell starts and stops in the sorted array.
+        keys = self._linearise(cells - self.cellMin)
+        order = np.argsort(keys, kind='mergesort')
+        self.sorted = small[order]
+        self.keys, self.start, counts = np.unique(
+            keys[order], return_index=True, return_counts=True)
+        self.stop = self.start + counts
+
+    def __len__(self):
+        return len(self.objIDs)
+
+    def _linearise(self, cells: np.ndarray):
+        """
+        Return the linear keys of the (non-negative) grid ``cells``.
+        """
+        return (cells[:, 0] * self.dims[1] + cells[:, 1]) * self.dims[2] + \
+            cells[:, 2]
+
+    def _candidates(self, lo: np.ndarray, hi: np.ndarray):
+        """
+        Return the indices of all objects that may overlap the box [lo, hi].
+
+        :param np.ndarray lo: minimum corner of the box.
+        :param np.ndarray hi: maximum corner of the box.
+        :return: object indices.
+        :rtype: np.ndarray
+        """
+        # Expand the box by half a cell to account for the object radii, and
+        # clip it to the occupied part of the grid.
+        h = self.cellSize
+        c0 = np.floor((lo - h / 2) / h).astype(np.int64) - self.cellMin
+        c1 = np.floor((hi + h / 2) / h).astype(np.int64) - self.cellMin
+        c0 = np.maximum(c0, 0)
+        c1 = np.minimum(c1, self.dims - 1)
+        if np.any(c1 < c0) or len(self.keys) == 0:
+            return self.large
+
+        # Test all objects if the box spans more cells than there are
+        # occupied cells.
+        numCells = np.prod(c1 - c0 + 1)
+        if numCells > len(self.keys):
+            return np.arange(len(self.objIDs))
+
+        # Look up the occupied cells in the box.
+        grid = np.mgrid[c0[0]:c1[0] + 1, c0[1]:c1[1] + 1, c0[2]:c1[2] + 1]
+        keys = self._linearise(grid.reshape(3, -1).T)
+        idx = np.searchsorted(self.keys, keys)
+        valid = idx < len(self.keys)
+        idx, keys = idx[valid], keys[valid]
+        idx = idx[self.keys[idx] == keys]
+
+        # Gather the objects in those cells.
+        start, stop = self.start[idx], self.stop[idx]
+        counts = stop - start
+        if counts.sum() == 0:
+            return self.large
+        offsets = np.repeat(start - np.cumsum(counts) + counts, counts)
+        rows = offsets + np.arange(counts.sum())
+        return np.concatenate((self.sorted[rows], self.large))
+
+    @typecheck
+    def queryBox(self, lo: (tuple, list, np.ndarray),
+                 hi: (tuple, list, np.ndarray)):
+        """
+        Return the objIDs of all objects that intersect the box [lo, hi].
+
+        :param vec3 lo: minimum corner.
+        :param vec3 hi: maximum corner.
+        :return: sorted objIDs.
+        :rtype: np.ndarray
+        """
+        lo = np.array(lo, np.float64)
+        hi = np.array(hi, np.float64)
+        idx = self._candidates(lo, hi)
+
+        # Squared distance from the sphere centres to the box.
+        pos = self.pos[idx]
+        delta = pos - np.clip(pos, lo, hi)
+        hit = np.sum(delta ** 2, axis=1) <= self.radii[idx] ** 2
+        return np.sort(self.objIDs[idx[hit]])
+
+    @typecheck
+    def querySphere(self, centre: (tuple, list, np.ndarray),
+                    radius: (int, float)):
+        """
+        Return the objIDs of all objects that intersect the sphere.
+
+        :param vec3 centre: sphere centre.
+        :param float radius: sphere radius.
+        :return: sorted objIDs.
+        :rtype: np.ndarray
+        """
+        centre = np.array(centre, np.float64)
+        idx = self._candidates(centre - radius, centre + radius)
+
+        dist = np.sum((self.pos[idx] - centre) ** 2, axis=1)
+        hit = dist <= (self.radii[idx] + radius) ** 2
+        return np.sort(self.objIDs[idx[hit]])
+
+    @typecheck
+    def queryFrustum(self, position: (tuple, list, np.ndarray),
+                     view: (tuple, list, np.ndarray),
+                     up: (tuple, list, np.ndarray),
+                     fov: (int, float), aspect: (int, float),
+                     near: (int, float), far: (int, float)):
+        """
+        Return the objIDs of all objects that intersect the view frustum.
+
+        See ``frustumPlanes`` for the parameters.
+
+        :return: sorted objIDs.
+        :rtype: np.ndarray
+        """
+        planes, corners = frustumPlanes(
+            position, view, up, fov, aspect, near, far)
+        idx = self._candidates(corners.min(axis=0), corners.max(axis=0))
+
+        # Signed distance of the sphere centres to all planes.
+        dist = np.dot(self.pos[idx], planes[:, :3].T) + planes[:, 3]
+        hit = np.all(dist >= -self.radii[idx, None], axis=1)
+        return np.sort(self.objIDs[idx[hit]])
+
+    @typecheck
+    def query(self, shape: str, params: dict):
+        """
+        Dispatch the query for ``shape`` with ``params`` to the query method.
+
+        Valid shapes are 'box' (``queryBox``), 'sphere' (``querySphere``) and
+        'frustum' (``queryFrustum``). The ``params`` contain the keyword
+        arguments for the respective query method.
+
+        :param str shape: query shape.
+        :param dict params: keyword arguments for the query.
+        :return: sorted objIDs.
+        :rtype: list
+        """
+        fun = queryShapes.get(shape, None)
+        if fun is None:
+            return RetVal(False, 'Unknown shape <{}>'.format(shape), None)
+        try:
+            out = fun(self, **params)
+        except (TypeError, ValueError, AssertionError):
+            return RetVal(False, 'Invalid query parameters', None)
+        return RetVal(True, None, out.tolist())
+
+
+# All supported query shapes.
+queryShapes = {
+    'box': SpatialIndex.queryBox,
+    'sphere': SpatialIndex.querySphere,
+    'frustum': SpatialIndex.queryFrustum,
+}
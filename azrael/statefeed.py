@@ -0,0 +1,309 @@
+# Copyright 2014, Oliver Nagy <olitheolix@gmail.com>
+#
+# This file is part of Azrael (https://github.com/olitheolix/azrael)
+#
+# Azrael is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# Azrael is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with Azrael. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Publish/subscribe channel for the State Vectors of all objects.
+
+Leonard publishes one state frame per physics step on a ZeroMQ PUB socket.
+Any number of subscribers (eg. viewers, controllers, or Clacks) can connect
+to it instead of polling Clerk. Clerk itself builds its spatial index from
+the latest frame (see ``StateFeedListener``).
+
+A state frame is a multipart message:
+
+* ``TOPIC``,
+* JSON header with the 'tick' counter and the number of objects ('count'),
+* objIDs as little endian int64 values,
+* packed State Vectors (see ``bullet_data.pack``) as little endian float64
+  values,
+* AABB sizes as little endian float64 values.
+
+Subscribers can restrict a frame to particular objIDs and/or an axis aligned
+region with ``selectObjects``.
+"""
+import os
+import zmq
+import IPython
+import threading
+import numpy as np
+import azrael.util as util
+import azrael.protocol_json as json
+import azrael.config as config
+import azrael.bullet.bullet_data as bullet_data
+
+from azrael.typecheck import typecheck
+
+ipshell = IPython.embed
+
+# Return value specification.
+RetVal = util.RetVal
+
+# Topic of all state frames.
+TOPIC = b'sv'
+
+
+@typecheck
+def encodeFrame(tick: int, objIDs: np.ndarray, svs: np.ndarray,
+                aabbs: np.ndarray):
+    """
+    Return the multipart message for a state frame.
+
+    :param int tick: frame counter.
+    :param np.ndarray objIDs: N object IDs.
+    :param np.ndarray svs: N x ``bullet_data.packedSize`` array.
+    :param np.ndarray aabbs: N AABB sizes.
+    :return: list of frames.
+    :rtype: list
+    """
+    header = {'tick': tick, 'count': len(objIDs)}
+    return [TOPIC, json.dumps(header).encode('utf8'),
+            objIDs.astype('<i8').tobytes(), svs.astype('<f8').tobytes(),
+            aabbs.astype('<f8').tobytes()]
+
+
+@typecheck
+def decodeFrame(frames: (list, tuple)):
+    """
+    Return the tick, objIDs, State Vectors, and AABBs of a state frame.
+
+    This is the inverse of ``encodeFrame``.
+
+    :param list frames: the parts of the multipart message.
+    :return: (tick, objIDs, svs, aabbs)
+    :rtype: tuple
+    """
+    if len(frames) != 5 or bytes(frames[0]) != TOPIC:
+        return RetVal(False, 'Invalid state frame', None)
+
+    try:
+        header = json.loads(bytes(frames[1]).decode('utf8'))
+        objIDs = np.frombuffer(frames[2], '<i8')
+        svs = np.frombuffer(frames[3], '<f8')
+        svs = svs.reshape(header['count'], bullet_data.packedSize)
+        aabbs = np.frombuffer(frames[4], '<f8')
+    except (ValueError, KeyError, TypeError):
+        return RetVal(False, 'Invalid state frame', None)
+    if not (len(objIDs) == len(aabbs) == header['count']):
+        return RetVal(False, 'Invalid state frame', None)
+    return RetVal(True, None, (header['tick'], objIDs, svs, aabbs))
+
+
+@typecheck
+def selectObjects(objIDs: np.ndarray, svs: np.ndarray,
+                  wantIDs: (list, tuple, np.ndarray)=None,
+                  region: (list, tuple, np.ndarray)=None):
+    """
+    Return a Boolean mask for the objects of interest in a state frame.
+
+    An object is of interest if it is in ``wantIDs`` (unless *None*), and if
+    its position is inside the axis aligned box ``region`` (unless *None*).
+    The ``region`` is specified by its minimum- and maximum corner, eg
+    [[-1, -1, -1], [1, 1, 1]].
+
+    :param np.ndarray objIDs: N object IDs.
+    :param np.ndarray svs: N x ``bullet_data.packedSize`` array.
+    :param list wantIDs: (optional) objIDs of interest.
+    :param list region: (optional) minimum- and maximum corner of the region.
+    :return: Boolean array with N entries.
+    :rtype: np.ndarray
+    """
+    mask = np.ones(len(objIDs), bool)
+    if wantIDs is not None:
+        mask &= np.isin(objIDs, np.asarray(wantIDs, np.int64))
+    if region is not None:
+        lo, hi = np.asarray(region, np.float64)
+        pos = svs[:, bullet_data._BulletDataSlices['position']]
+        mask &= np.all((lo <= pos) & (pos <= hi), axis=1)
+    return mask
+
+
+class StatePublisher():
+    """
+    Publish state frames on a ZeroMQ PUB socket.
+
+    The socket binds to ``addr`` on the first call to ``publish``. Slow
+    subscribers do not slow down the publisher; they miss frames instead.
+
+    :param str addr: ZeroMQ address of the PUB socket.
+    """
+    @typecheck
+    def __init__(self, addr: str=config.addr_leonard_pub):
+        self.addr = addr
+        self.sock = None
+
+    def close(self):
+        """
+        Close the socket.
+        """
+        if self.sock is not None:
+            self.sock.close(linger=0)
+            self.sock = None
+
+    @typecheck
+    def publish(self, tick: int, objIDs: np.ndarray, svs: np.ndarray,
+                aabbs: np.ndarray):
+        """
+        Publish the State Vectors ``svs`` and ``aabbs`` of ``objIDs``.
+
+        :param int tick: frame counter.
+        :param np.ndarray objIDs: N object IDs.
+        :param np.ndarray svs: N x ``bullet_data.packedSize`` array.
+        :param np.ndarray aabbs: N AABB sizes.
+        :return: Success
+        """
+        if self.sock is None:
+            sock = zmq.Context.instance().socket(zmq.PUB)
+            sock.setsockopt(zmq.LINGER, 0)
+            sock.setsockopt(zmq.SNDHWM, 4)
+            try:
+                sock.bind(self.addr)
+            except zmq.ZMQError as err:
+                sock.close(linger=0)
+                msg = 'Cannot bind <{}>: {}'.format(self.addr, err)
+                return RetVal(False, msg, None)
+            self.sock = sock
+
+        frames = encodeFrame(tick, objIDs, svs, aabbs)
+        self.sock.send_multipart(frames, copy=False)
+        return RetVal(True, None, None)
+
+
+class StateSubscriber():
+    """
+    Receive (filtered) state frames from a ``StatePublisher``.
+
+    See ``selectObjects`` for the meaning of ``objIDs`` and ``region``.
+
+    :param str addr: ZeroMQ address of the publisher.
+    :param list objIDs: (optional) only return these objects.
+    :param list region: (optional) only return objects in this region.
+    """
+    @typecheck
+    def __init__(self, addr: str=config.addr_leonard_pub,
+                 objIDs: (list, tuple)=None, region: (list, tuple)=None):
+        self.objIDs = objIDs
+        self.region = region
+
+        self.sock = zmq.Context.instance().socket(zmq.SUB)
+        self.sock.setsockopt(zmq.LINGER, 0)
+        self.sock.setsockopt(zmq.RCVHWM, 4)
+        self.sock.setsockopt(zmq.SUBSCRIBE, TOPIC)
+        self.sock.connect(addr)
+
+    def close(self):
+        """
+        Close the socket.
+        """
+        if self.sock is not None:
+            self.sock.close(linger=0)
+            self.sock = None
+
+    @typecheck
+    def recv(self, timeout: (int, float)=None):
+        """
+        Return the next state frame.
+
+        The returned State Vectors are a dictionary {objID: sv}, just like
+        the one returned by ``Client.getAllStateVariables``.
+
+        :param float timeout: maximum wait time in seconds (*None* = forever).
+        :return: (tick, {objID: sv})
+        :rtype: tuple
+        """
+        if timeout is not None:
+            if not self.sock.poll(int(1000 * timeout)):
+                return RetVal(False, 'Timeout', None)
+        return self._select(self.sock.recv_multipart())
+
+    @typecheck
+    def recvLatest(self, timeout: (int, float)=None):
+        """
+        Return the newest state frame and skip all older ones.
+
+        This is for clients like viewers that only need the current state,
+        but may not keep up with the frame rate of Leonard.
+
+        :param float timeout: maximum wait time in seconds (*None* = forever).
+        :return: (tick, {objID: sv})
+        :rtype: tuple
+        """
+        if timeout is not None:
+            if not self.sock.poll(int(1000 * timeout)):
+                return RetVal(False, 'Timeout', None)
+        frames = self.sock.recv_multipart()
+        while self.sock.poll(0):
+            frames = self.sock.recv_multipart()
+        return self._select(frames)
+
+    def _select(self, frames):
+        """
+        Return the objects of interest in the state frame ``frames``.
+        """
+        ret = decodeFrame(frames)
+        if not ret.ok:
+            return ret
+        tick, objIDs, svs, _ = ret.data
+
+        # Only return the objects of interest.
+        mask = selectObjects(objIDs, svs, self.objIDs, self.region)
+        out = {objID: bullet_data.unpack(sv)
+               for objID, sv in zip(objIDs[mask].tolist(), svs[mask])}
+        return RetVal(True, None, (tick, out))
+
+
+class StateFeedListener(threading.Thread):
+    """
+    Receive the state frames in a daemon thread and keep the latest one.
+
+    The ``frame`` attribute is *None* until the first frame arrives.
+    Afterwards it is the (tick, objIDs, svs, aabbs) tuple of ``decodeFrame``.
+    Every new frame replaces the tuple as a whole, which means readers never
+    see a partially updated frame.
+
+    :param str addr: ZeroMQ address of the publisher.
+    """
+    @typecheck
+    def __init__(self, addr: str=config.addr_leonard_pub):
+        super().__init__(daemon=True)
+        self.addr = addr
+        self.frame = None
+
+    def run(self):
+        sub = StateSubscriber(self.addr)
+        while True:
+            ret = decodeFrame(sub.sock.recv_multipart())
+            if ret.ok:
+                self.frame = ret.data
+
+
+# The state publisher of the current process and its PID.
+_publisher = (None, None)
+
+
+def getStatePublisher():
+    """
+    Return the state publisher of the current process.
+
+    All Leonard instances in a process share the same publisher because only
+    one socket can bind to ``config.addr_leonard_pub``.
+
+    :return: ``StatePublisher`` instance.
+    """
+    global _publisher
+    if (_publisher[0] is None) or (_publisher[1] != os.getpid()):
+        _publisher = (StatePublisher(), os.getpid())
+    return _publisher[0]
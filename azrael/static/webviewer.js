@@ -205,17 +205,77 @@ function getStateVariable(objID) {
 }
 
 
+/*
+  Convert the packed (binary) State Variables from Clerk into a dictionary of
+  {objID: SV} objects.
+*/
+function decodePackedStateVariables(payload) {
+    // Decode the Base64 string and interpret the bytes as float values.
+    var raw = atob(payload.data)
+    var bytes = new Uint8Array(raw.length)
+    for (var ii=0; ii < raw.length; ii++) bytes[ii] = raw.charCodeAt(ii);
+    if (payload.encoding == 'float32') {
+        var values = new Float32Array(bytes.buffer)
+    } else {
+        var values = new Float64Array(bytes.buffer)
+    }
+
+    // Determine the record size from the layout.
+    var recSize = 0
+    for (var ii=0; ii < payload.layout.length; ii++) {
+        recSize += payload.layout[ii][1]
+    }
+
+    // Unpack the record of every object.
+    var out = {}
+    for (var ii=0; ii < payload.objIDs.length; ii++) {
+        var sv = {}
+        var ofs = ii * recSize
+        for (var jj=0; jj < payload.layout.length; jj++) {
+            var name = payload.layout[jj][0], width = payload.layout[jj][1]
+            if (width == 1) {
+                sv[name] = values[ofs]
+            } else {
+                sv[name] = Array.prototype.slice.call(
+                    values.subarray(ofs, ofs + width))
+            }
+            ofs += width
+        }
+        out[payload.objIDs[ii]] = sv
+    }
+    for (var ii=0; ii < payload.missing.length; ii++) {
+        out[payload.missing[ii]] = null
+    }
+    return out
+}
+
+
 function getAllStateVariables() {
-    var cmd = {'cmd': 'get_all_statevars', 'payload': {}}
+    var cmd = {'cmd': 'get_all_statevars', 'payload': {'encoding': 'float64'}}
     cmd = JSON.stringify(cmd)
     var dec = function (msg) {
         var parsed = JSON.parse(msg.data)
-        return {'ok': parsed.ok, 'sv': parsed.payload.data}
+        if (parsed.ok == false) return {'ok': false, 'sv': null};
+        return {'ok': true, 'sv': decodePackedStateVariables(parsed.payload)}
     };
     return [cmd, dec]
 }
 
 
+/*
+  Wait for the next state frame from the '/statefeed' Websocket. The command
+  is null because there is nothing to send to Clacks.
+*/
+function nextStateFrame() {
+    var dec = function (msg) {
+        var parsed = JSON.parse(msg.data)
+        if (parsed.ok == false) return {'ok': false, 'sv': null};
+        return {'ok': true, 'sv': decodePackedStateVariables(parsed.payload)}
+    };
+    return [null, dec]
+}
+
+
 function arrayEqual(arr1, arr2) {
     if ((arr1 == undefined) || (arr2 == undefined)) return false;
     if (arr1.length != arr2.length) return false;
@@ -319,8 +379,8 @@ function* mycoroutine(connection) {
     // Query the state variables of all visible objects and update
     // their position on the screen.
     while (true) {
-        // Get the SV for all objects.
-        msg = yield getAllStateVariables()
+        // Get the SV for all objects from the next state frame.
+        msg = yield nextStateFrame()
         if (msg.ok == false) {console.log('Error getStateVariables'); return;}
         var allSVs = msg.sv
 
@@ -514,6 +574,35 @@ window.onload = function() {
     var connection = new WebSocket('ws://' + window.location.host + '/websocket');
     var protocol = mycoroutine(connection);
 
+    // Create the Websocket for the state frames, and the decoder that waits
+    // for the next frame (if any).
+    var feed = new WebSocket('ws://' + window.location.host + '/statefeed');
+    var feedDecoder = undefined
+
+    // Pass the next command from the co-routine either to Clacks, or wait
+    // for the next state frame if the command is null.
+    var dispatch = function(next) {
+        if (next.done == true) {
+            console.log('Finished')
+            return
+        }
+        if (next.value[0] == null) {
+            feedDecoder = next.value[1]
+        } else {
+            connection.decoder = next.value[1]
+            connection.send(next.value[0])
+        }
+    }
+
+    // Pass state frames to the co-routine if it waits for one.
+    feed.onmessage = function(msg) {
+        if ((feedDecoder == undefined) ||
+            (JSON.parse(msg.data).msg != 'statevars')) return;
+        var decoder = feedDecoder
+        feedDecoder = undefined
+        dispatch(protocol.next(decoder(msg)))
+    }
+
     // Error handler.
     connection.onerror = function(error) {
         console.log('Error detected: ' + error);
@@ -535,11 +624,7 @@ window.onload = function() {
         // Start the co-routine. It will return with two variables: 1)
         // the command for Clerk and 2) the Websocket callback
         // function that can interpret Clerk's response.
-        var next = protocol.next()
-
-        // Store the callback function and send the command to Clacks.
-        this.decoder = next.value[1]
-        connection.send(next.value[0])
+        dispatch(protocol.next())
     }
 
     connection.onmessage = function(msg) {
@@ -547,14 +632,6 @@ window.onload = function() {
         // and pass the result to the co-routine. This will return
         // yet another command plus a callback function that can
         // interpret the response.
-        var next = protocol.next(this.decoder(msg))
-        if (next.done == true) {
-            console.log('Finished')
-            return
-        }
-
-        // Store the callback and dispatch the command.
-        this.decoder = next.value[1]
-        connection.send(next.value[0])
+        dispatch(protocol.next(this.decoder(msg)))
     }
 }
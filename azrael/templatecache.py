@@ -0,0 +1,206 @@
+# Copyright 2014, Oliver Nagy <olitheolix@gmail.com>
+#
+# This file is part of Azrael (https://github.com/olitheolix/azrael)
+#
+# Azrael is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# Azrael is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with Azrael. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+In-process caches for templates and object instances.
+
+Templates never change once they are in the database. Clerk can therefore
+keep the raw database document (to copy it into the instance database when
+it spawns an object) and the decoded template (to serve ``getTemplates``)
+in memory.
+
+The parts of an object instance never change either. Clerk caches them
+(without the geometry) for ``controlParts``.
+
+Both caches evict the least recently used entries once they exceed their
+limit. All methods are thread safe.
+"""
+import threading
+import collections
+import numpy as np
+
+from azrael.typecheck import typecheck
+
+# A cached template: the raw database document, the decoded template, and
+# the (approximate) size of both in bytes.
+CachedTemplate = collections.namedtuple('CachedTemplate', 'raw decoded size')
+
+# The parts of an object instance. The ``boosters`` and ``factories`` are
+# {partID: part} dictionaries.
+CachedInstance = collections.namedtuple(
+    'CachedInstance', 'templateID boosters factories')
+
+
+def _nbytes(val):
+    """
+    Return the approximate size of ``val`` in bytes.
+
+    Only counts the bulk data (arrays, byte strings, and the elements of
+    lists and dictionaries) because that is what dominates the size of a
+    template.
+    """
+    if isinstance(val, np.ndarray):
+        return val.nbytes
+    if isinstance(val, (bytes, str)):
+        return len(val)
+    if isinstance(val, dict):
+        return sum([_nbytes(_) for _ in val.values()])
+    if isinstance(val, (list, tuple)):
+        return sum([_nbytes(_) for _ in val]) + 8 * len(val)
+    return 8
+
+
+class TemplateCache():
+    """
+    Least recently used cache of templates with a limit in bytes.
+
+    :param int maxBytes: maximum size of all cached templates.
+    """
+    @typecheck
+    def __init__(self, maxBytes: int):
+        self.maxBytes = maxBytes
+        self.nbytes = 0
+        self.hits = self.misses = 0
+        self.lock = threading.Lock()
+        self.templates = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self.templates)
+
+    def clear(self):
+        """
+        Remove all templates from the cache.
+        """
+        with self.lock:
+            self.templates.clear()
+            self.nbytes = 0
+
+    @typecheck
+    def get(self, names: (list, tuple, set)):
+        """
+        Return the cached templates among ``names``.
+
+        :param list names: template names.
+        :return: {name: CachedTemplate} for all cached ``names``.
+        :rtype: dict
+        """
+        out = {}
+        with self.lock:
+            for name in names:
+                entry = self.templates.get(name, None)
+                if entry is None:
+                    self.misses += 1
+                else:
+                    self.hits += 1
+                    self.templates.move_to_end(name)
+                    out[name] = entry
+        return out
+
+    @typecheck
+    def put(self, name: str, raw: dict, decoded: dict):
+        """
+        Add the template ``name`` to the cache and return its entry.
+
+        The cache evicts the least recently used templates to make room for
+        the new one. Templates larger than the entire cache are not cached
+        at all.
+
+        :param str name: template name.
+        :param dict raw: database document of the template.
+        :param dict decoded: decoded template.
+        :return: cache entry.
+        :rtype: CachedTemplate
+        """
+        entry = CachedTemplate(raw, decoded, _nbytes(raw) + _nbytes(decoded))
+        if entry.size > self.maxBytes:
+            return entry
+
+        with self.lock:
+            old = self.templates.pop(name, None)
+            if old is not None:
+                self.nbytes -= old.size
+            while self.nbytes + entry.size > self.maxBytes:
+                _, old = self.templates.popitem(last=False)
+                self.nbytes -= old.size
+            self.templates[name] = entry
+            self.nbytes += entry.size
+        return entry
+
+
+class InstanceCache():
+    """
+    Least recently used cache of object instance parts.
+
+    :param int maxEntries: maximum number of cached objects.
+    """
+    @typecheck
+    def __init__(self, maxEntries: int):
+        self.maxEntries = maxEntries
+        self.lock = threading.Lock()
+        self.instances = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self.instances)
+
+    @typecheck
+    def get(self, objID: int):
+        """
+        Return the cached parts of ``objID``, or *None*.
+
+        :param int objID: object ID.
+        :return: cache entry.
+        :rtype: CachedInstance
+        """
+        with self.lock:
+            entry = self.instances.get(objID, None)
+            if entry is not None:
+                self.instances.move_to_end(objID)
+        return entry
+
+    @typecheck
+    def put(self, objID: int, templateID: str, boosters: (list, tuple),
+            factories: (list, tuple)):
+        """
+        Add the parts of ``objID`` to the cache and return its entry.
+
+        :param int objID: object ID.
+        :param str templateID: template from which ``objID`` was spawned.
+        :param list boosters: ``parts.Booster`` instances.
+        :param list factories: ``parts.Factory`` instances.
+        :return: cache entry.
+        :rtype: CachedInstance
+        """
+        entry = CachedInstance(
+            templateID,
+            {int(_.partID): _ for _ in boosters},
+            {int(_.partID): _ for _ in factories})
+        with self.lock:
+            self.instances.pop(objID, None)
+            while len(self.instances) >= max(self.maxEntries, 1):
+                self.instances.popitem(last=False)
+            self.instances[objID] = entry
+        return entry
+
+    @typecheck
+    def remove(self, objID: int):
+        """
+        Remove ``objID`` from the cache (if it is cached).
+
+        :param int objID: object ID.
+        """
+        with self.lock:
+            self.instances.pop(objID, None)
@@ -0,0 +1,139 @@
+# Copyright 2014, Oliver Nagy <olitheolix@gmail.com>
+#
+# This file is part of Azrael (https://github.com/olitheolix/azrael)
+#
+# Azrael is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# Azrael is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with Azrael. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Test the asyncio version of the client.
+"""
+import zmq
+import asyncio
+import IPython
+import zmq.asyncio
+import numpy as np
+
+import azrael.asyncclient
+import azrael.protocol_json as json
+import azrael.bullet.bullet_data as bullet_data
+
+from azrael.test.test_clerk import getLeonard, killAzrael
+from azrael.test.test_clerk import startAzrael, stopAzrael
+
+ipshell = IPython.embed
+AsyncClient = azrael.asyncclient.AsyncClient
+
+
+def test_reply_matching():
+    """
+    Match out-of-order replies to their requests.
+
+    A minimal ROUTER socket plays the role of Clerk. It collects several
+    requests before it replies to them in reverse order.
+    """
+    addr = 'tcp://127.0.0.1:5599'
+    ctx = zmq.asyncio.Context()
+    server = ctx.socket(zmq.ROUTER)
+    server.linger = 0
+    server.bind(addr)
+
+    async def serve(num):
+        # Collect ``num`` requests, then reply in reverse order.
+        reqs = [await server.recv_multipart() for _ in range(num)]
+        for client, reqID, empty, msg in reversed(reqs):
+            msg = json.loads(msg.decode('utf8'))
+            reply = {'ok': True, 'msg': '',
+                     'payload': {'response': msg['payload']['objID']}}
+            reply = json.dumps(reply).encode('utf8')
+            await server.send_multipart([client, reqID, b'', reply])
+
+    async def run(client, num):
+        reqs = [client.sendToClerk('x', {'objID': _}) for _ in range(num)]
+        _, rets = await asyncio.gather(serve(num), asyncio.gather(*reqs))
+        return rets
+
+    client = AsyncClient(addr)
+    try:
+        loop = asyncio.new_event_loop()
+        rets = loop.run_until_complete(run(client, 20))
+        assert [_.data['response'] for _ in rets] == list(range(20))
+
+        # The reader task must have finished because there are no more
+        # requests in flight.
+        assert len(client.pending) == 0 and client.reader.done()
+
+        # The client must support further requests.
+        rets = loop.run_until_complete(run(client, 2))
+        assert [_.data['response'] for _ in rets] == [0, 1]
+        loop.close()
+    finally:
+        client.close()
+        server.close(linger=0)
+        ctx.term()
+    print('Test passed')
+
+
+def test_concurrent_requests():
+    """
+    Issue many concurrent requests to Clerk.
+    """
+    killAzrael()
+
+    # Reset the SV database and start the necessary services.
+    leo = getLeonard()
+    clerk, client, clacks = startAzrael('ZeroMQ')
+
+    async def run(client):
+        # Spawn several objects concurrently.
+        num = 20
+        new_obj = {'template': '_templateNone', 'position': np.zeros(3)}
+        rets = await asyncio.gather(*[client.spawn([new_obj])
+                                      for _ in range(num)])
+        assert all([_.ok for _ in rets])
+        objIDs = sorted([_.data[0] for _ in rets])
+        assert objIDs == list(range(1, num + 1))
+        leo.processCommandsAndSync()
+
+        # Query all objects concurrently, and with a batch request.
+        rets = await asyncio.gather(*[client.getStateVariables(_)
+                                      for _ in objIDs])
+        for objID, ret in zip(objIDs, rets):
+            assert ret.ok
+            assert isinstance(ret.data[objID], bullet_data._BulletData)
+        cmds = [('get_statevar', ([_], )) for _ in objIDs]
+        ret = await client.batch(cmds)
+        assert ret.ok and all([_.ok for _ in ret.data])
+
+        # Invalid templates must not be sent.
+        ret = await client.addTemplates([('foo', )])
+        assert not ret.ok
+
+        assert (await client.ping()).data == 'pong clerk'
+
+    aclient = AsyncClient()
+    try:
+        loop = asyncio.new_event_loop()
+        loop.run_until_complete(run(aclient))
+        loop.close()
+    finally:
+        aclient.close()
+
+    # Shutdown the services.
+    stopAzrael(clerk, clacks)
+    print('Test passed')
+
+
+if __name__ == '__main__':
+    test_reply_matching()
+    test_concurrent_requests()
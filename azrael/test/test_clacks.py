@@ -12,6 +12,7 @@ import azrael.clacks
 import azrael.vectorgrid
 import azrael.wsclient
 import azrael.config as config
+import azrael.protocol_json as json
 
 WSClient = azrael.wsclient.WSClient
 
@@ -125,6 +126,74 @@ def test_ping_clerk():
     print('Test passed')
 
 
+def test_relay_many_websockets():
+    """
+    Relay interleaved requests from several Websockets to Clerk.
+    """
+    # Start the necessary services.
+    clerk, client, clacks = startAzrael('Websocket')
+    clients = [client] + [WSClient('ws://127.0.0.1:8080/websocket', 1)
+                          for _ in range(4)]
+
+    # Send one request from every Websocket before reading any replies. Every
+    # Websocket must receive the reply to its own request.
+    for ii, cl in enumerate(clients):
+        payload = {'objIDs': [ii + 1]}
+        cl.send(json.dumps({'cmd': 'get_statevar', 'payload': payload}))
+    for ii, cl in enumerate(clients):
+        ret = json.loads(cl.recv())
+        assert ret['ok'] and ret['payload']['data'] == {str(ii + 1): None}
+
+    for cl in clients:
+        assert cl.ping().data == 'pong clerk'
+
+    # Shutdown the services.
+    stopAzrael(clerk, clacks)
+    print('Test passed')
+
+
+def test_relay_purge_expire():
+    """
+    The relay must forget the requests of closed Websockets, and answer the
+    requests that Clerk does not reply to with an error.
+    """
+    class HandlerForTest():
+        def __init__(self):
+            self.errors = []
+
+        def returnErr(self, data, msg):
+            self.errors.append(msg)
+
+    # Nothing listens at this address, ie. Clerk never replies.
+    relay = azrael.clacks.ClerkRelay('tcp://127.0.0.1:5599')
+    h1, h2 = HandlerForTest(), HandlerForTest()
+    for handler in (h1, h2, h1, h2):
+        relay.send(handler, b'{}')
+    assert len(relay.pending) == 4
+
+    # Close the first Websocket.
+    relay.purge(h1)
+    assert [_[0] for _ in relay.pending.values()] == [h2, h2]
+
+    # Young requests must survive, old ones expire with an error.
+    relay.expire(10)
+    assert len(relay.pending) == 2 and h2.errors == []
+    first = next(iter(relay.pending))
+    relay.pending[first] = (h2, time.time() - 20)
+    relay.expire(10)
+    assert len(relay.pending) == 1 and first not in relay.pending
+    assert h2.errors == ['Clerk did not reply'] and h1.errors == []
+
+    # A late reply from Clerk must be dropped.
+    relay.dispatch([first, b'', b'{}'])
+    relay.expire(0)
+    assert len(relay.pending) == 0 and len(h2.errors) == 2
+    relay.stream.close()
+    print('Test passed')
+
+
 if __name__ == '__main__':
     test_ping_clacks()
     test_ping_clerk()
+    test_relay_many_websockets()
+    test_relay_purge_expire()
@@ -30,12 +30,16 @@ import azrael.util
 import azrael.clerk
 import azrael.client
 import azrael.parts as parts
+import azrael.config as config
+import azrael.database as database
+import azrael.protocol as protocol
 import azrael.protocol_json as json
 import azrael.physics_interface as physAPI
 import azrael.bullet.bullet_data as bullet_data
 
 from azrael.test.test_clacks import startAzrael, stopAzrael
 from azrael.test.test_leonard import getLeonard, killAzrael
+from azrael.test.test_leonard import syncAndWaitForFrame
 from azrael.bullet.test_boost_bullet import isEqualBD
 
 
@@ -110,6 +114,74 @@ def test_ping():
     print('Test passed')
 
 
+def test_route_commands():
+    """
+    Clerk must route every command to the correct worker pool and process
+    requests without touching any sockets.
+    """
+    killAzrael()
+    clerk = azrael.clerk.Clerk()
+
+    # The command word determines the pool. Requests that cannot be routed
+    # go to the 'fast' pool.
+    def route(cmd):
+        msg = json.dumps({'cmd': cmd, 'payload': {}})
+        return clerk.route(msg.encode('utf8'))
+    assert route('ping_clerk') == 'fast'
+    assert route('get_statevar') == 'fast'
+    assert route('spawn') == 'heavy'
+    assert route('get_all_statevars') == 'heavy'
+    assert clerk.route(b'invalid_cmd') == 'fast'
+
+    # Process requests directly.
+    msg = json.dumps({'cmd': 'ping_clerk', 'payload': {}}).encode('utf8')
+    ret = json.loads(clerk.processRequest(msg).decode('utf8'))
+    assert ret['ok'] and ret['payload'] == {'response': 'pong clerk'}
+    ret = json.loads(clerk.processRequest(b'invalid_cmd').decode('utf8'))
+    assert ret == {'ok': False, 'payload': 'JSON decoding error in Clerk',
+                   'msg': 'JSON decoding error in Clerk'}
+
+    killAzrael()
+    print('Test passed')
+
+
+def test_exception_in_command():
+    """
+    A command that raises an exception must return an error instead of
+    killing the worker thread that processes it.
+    """
+    killAzrael()
+
+    def raiseError(payload):
+        raise KeyError('payload')
+
+    clerk = azrael.clerk.Clerk()
+    clerk.codec['raise_error'] = (
+        raiseError, clerk.pingClerk, protocol.FromClerk_Ping_Encode)
+
+    # Process the request directly.
+    msg = json.dumps({'cmd': 'raise_error', 'payload': {}}).encode('utf8')
+    ret = json.loads(clerk.processRequest(msg).decode('utf8'))
+    assert ret['ok'] is False and ret['msg'] == 'Internal error in Clerk'
+
+    # Send more such requests than the 'fast' pool has worker threads. Clerk
+    # must still reply to all of them, and to the next request.
+    clerk.start()
+    client = ClientTest()
+    for ii in range(2 * config.clerk_workers['fast'] + 1):
+        ok, ret = client.testSend(msg)
+        assert (ok, ret) == (False, 'Internal error in Clerk')
+    ret = client.ping()
+    assert (ret.ok, ret.data) == (True, 'pong clerk')
+
+    # Terminate the Clerk.
+    clerk.terminate()
+    clerk.join()
+
+    killAzrael()
+    print('Test passed')
+
+
 def test_spawn():
     """
     Test the 'spawn' command in the Clerk.
@@ -169,6 +241,78 @@ def test_spawn():
     print('Test passed')
 
 
+def test_template_cache():
+    """
+    Clerk must serve known templates from its cache.
+    """
+    killAzrael()
+
+    # Instantiate a Clerk and spawn an object to cache the template.
+    clerk = azrael.clerk.Clerk()
+    sv = bullet_data.BulletData(cshape=[0, 1, 1, 1])
+    ret = clerk.spawn([('_templateCube', sv)])
+    assert (ret.ok, ret.data) == (True, (1, ))
+    assert len(clerk.templateCache) > 0
+
+    # Remove all templates from the database. Clerk must still be able to
+    # spawn and return the cached template, but not the others.
+    database.dbHandles['Templates'].remove({})
+    ret = clerk.spawn([('_templateCube', sv)])
+    assert (ret.ok, ret.data) == (True, (2, ))
+    assert np.array_equal(sv.cshape, [4, 1, 1, 1])
+    ret = clerk.getTemplates(['_templateCube'])
+    assert ret.ok
+    assert np.array_equal(ret.data['_templateCube']['cshape'], [4, 1, 1, 1])
+
+    clerk.templateCache.clear()
+    assert not clerk.spawn([('_templateCube', sv)]).ok
+    assert not clerk.getTemplates(['_templateCube']).ok
+
+    print('Test passed')
+
+
+def test_instance_cache():
+    """
+    ``controlParts`` must use the cached parts of an object.
+    """
+    killAzrael()
+
+    # Reset the SV database and instantiate a Leonard and a Clerk.
+    leo = getLeonard()
+    clerk = azrael.clerk.Clerk()
+
+    # Add a template with one booster and spawn it.
+    z = np.zeros(3)
+    b0 = parts.Booster(partID=0, pos=z, direction=[0, 0, 1], max_force=0.5)
+    t1 = Template('t1', np.array([0, 1, 1, 1], np.float64),
+                  [], [], [], [b0], [])
+    assert clerk.addTemplates([t1]).ok
+    ret = clerk.spawn([(t1.name, bullet_data.BulletData())])
+    assert (ret.ok, ret.data) == (True, (1, ))
+    leo.processCommandsAndSync()
+
+    # Spawning must have cached the parts.
+    ret = clerk.getInstanceParts(1)
+    assert ret.ok and ret.data.templateID == t1.name
+    assert list(ret.data.boosters.keys()) == [0]
+
+    # Remove the geometry and parts from the database. Booster commands must
+    # still work because they only use the cache.
+    database.dbHandles['ObjInstances'].update(
+        {'objID': 1}, {'$unset': {'geo': 1, 'boosters': 1}})
+    cmd = parts.CmdBooster(partID=0, force_mag=2)
+    assert clerk.controlParts(1, [cmd], []).ok
+    leo.processCommandsAndSync()
+    assert np.array_equal(leo.allForces[1], [0, 0, 2])
+
+    # Removing the object must invalidate the cache entry.
+    assert clerk.removeObject(1).ok
+    assert not clerk.getInstanceParts(1).ok
+    assert not clerk.controlParts(1, [cmd], []).ok
+
+    print('Test passed')
+
+
 def test_delete():
     """
     Test the 'removeObject' command in the Clerk.
@@ -326,6 +470,51 @@ def test_getAllStateVariables():
     print('Test passed')
 
 
+def test_getStateVariablesInRegion():
+    """
+    Test the 'getStateVariablesInRegion' command in the Clerk.
+    """
+    killAzrael()
+
+    # Reset the SV database and instantiate a Leonard and a Clerk.
+    leo = getLeonard()
+    clerk = azrael.clerk.Clerk()
+    templateID = '_templateNone'
+
+    # Spawn three objects along the x-axis.
+    objs = [(templateID, bullet_data.BulletData(position=[_, 0, 0]))
+            for _ in (0, 5, 10)]
+    ret = clerk.spawn(objs)
+    assert ret.ok
+    objIDs = ret.data
+    syncAndWaitForFrame(leo)
+
+    # Box.
+    ret = clerk.getStateVariablesInRegion(
+        'box', {'lo': [4, -1, -1], 'hi': [20, 1, 1]})
+    assert ret.ok and sorted(ret.data.keys()) == list(objIDs[1:])
+    assert isEqualBD(ret.data[objIDs[2]], objs[2][1])
+
+    # Sphere.
+    ret = clerk.getStateVariablesInRegion(
+        'sphere', {'centre': [0, 0, 0], 'radius': 6})
+    assert ret.ok and sorted(ret.data.keys()) == list(objIDs[:2])
+
+    # Frustum that looks down the negative x-axis from x=7.
+    params = {'position': [7, 0, 0], 'view': [-1, 0, 0], 'up': [0, 1, 0],
+              'fov': 45, 'aspect': 1, 'near': 0.1, 'far': 100}
+    ret = clerk.getStateVariablesInRegion('frustum', params)
+    assert ret.ok and sorted(ret.data.keys()) == list(objIDs[:2])
+
+    # Invalid shapes and parameters.
+    assert not clerk.getStateVariablesInRegion('cone', {}).ok
+    assert not clerk.getStateVariablesInRegion('box', {'lo': [0, 0, 0]}).ok
+
+    # Kill all spawned Client processes.
+    killAzrael()
+    print('Test passed')
+
+
 def test_set_force():
     """
     Set and retrieve force and torque values.
@@ -1249,6 +1438,7 @@ def test_instanceDB_checksum():
 
 if __name__ == '__main__':
     test_getAllStateVariables()
+    test_getStateVariablesInRegion()
     test_add_get_template_single()
     test_add_get_template_multi()
     test_getGeometry()
@@ -1263,7 +1453,11 @@ if __name__ == '__main__':
     test_get_object_template_id()
     test_get_statevar()
     test_spawn()
+    test_template_cache()
+    test_instance_cache()
     test_delete()
     test_set_force()
     test_ping()
+    test_route_commands()
+    test_exception_in_command()
     test_invalid()
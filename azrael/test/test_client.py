@@ -230,6 +230,58 @@ def test_setStateVariable(client_type):
     print('Test passed')
 
 
+@pytest.mark.parametrize('client_type', ['Websocket', 'ZeroMQ'])
+def test_batch(client_type):
+    """
+    Send several commands to Clerk in a single request.
+    """
+    killAzrael()
+
+    # Reset the SV database and instantiate a Leonard.
+    leo = getLeonard()
+
+    # Start the necessary services.
+    clerk, client, clacks = startAzrael(client_type)
+
+    # Spawn two objects.
+    new_obj = {'template': '_templateNone', 'position': np.zeros(3)}
+    ret = client.spawn([new_obj, new_obj])
+    assert ret.ok and (ret.data == (1, 2))
+    leo.processCommandsAndSync()
+
+    # Move both objects, apply a force, and query an object. The heavy
+    # 'spawn' and the unknown objID must fail without affecting the others.
+    new_sv = bullet_data.BulletDataOverride(position=[1, 2, 3])
+    force, pos = np.array([1, 2, 3], np.float64), np.zeros(3)
+    cmds = [('set_statevar', (1, tuple(new_sv))),
+            ('set_statevar', (2, tuple(new_sv))),
+            ('set_force', (2, force, pos)),
+            ('spawn', ([], )),
+            ('get_template_id', (10, )),
+            ('get_statevar', ([1], ))]
+    ret = client.batch(cmds)
+    assert ret.ok and len(ret.data) == len(cmds)
+    assert [_.ok for _ in ret.data] == [True, True, True, False, False, True]
+    assert ret.data[3].msg == 'Cannot batch <spawn>'
+    assert isinstance(ret.data[5].data[1], bullet_data._BulletData)
+
+    # The commands must have come into effect.
+    leo.processCommandsAndSync()
+    ret = client.batch([('get_statevar', ([1, 2], ))])
+    assert ret.ok
+    ret_svs = ret.data[0].data
+    assert np.array_equal(ret_svs[1].position, new_sv.position)
+    assert np.array_equal(ret_svs[2].position, new_sv.position)
+    assert np.array_equal(leo.allForces[2], force)
+
+    # Unknown commands must not be sent at all.
+    assert not client.batch([('blah', ())]).ok
+
+    # Shutdown the services.
+    stopAzrael(clerk, clacks)
+    print('Test passed')
+
+
 @pytest.mark.parametrize('client_type', ['Websocket', 'ZeroMQ'])
 def test_getAllObjectIDs(client_type):
     """
@@ -615,6 +667,7 @@ def test_setGeometry(client_type):
 if __name__ == '__main__':
     for _transport_type in ('ZeroMQ', 'Websocket'):
         test_setStateVariable(_transport_type)
+        test_batch(_transport_type)
         test_setGeometry(_transport_type)
         test_spawn_and_delete_one_client(_transport_type)
         test_spawn_and_get_state_variables(_transport_type)
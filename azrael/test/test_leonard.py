@@ -1,14 +1,20 @@
 import sys
+import zmq
+import json
 import time
 import pytest
 import IPython
+import threading
 import subprocess
 import azrael.clerk
+import azrael.config as config
 import azrael.client
 import azrael.clacks
 import azrael.leonard
 import azrael.database
 import azrael.vectorgrid
+import azrael.scheduler
+import azrael.workpackage
 import azrael.physics_interface as physAPI
 import azrael.bullet.bullet_data as bullet_data
 
@@ -25,6 +31,7 @@ allEngines = [
     azrael.leonard.LeonardBase,
     azrael.leonard.LeonardBullet,
     azrael.leonard.LeonardSweeping,
+    azrael.leonard.LeonardSweepingPersistent,
     azrael.leonard.LeonardDistributedZeroMQ]
 
 
@@ -42,6 +49,26 @@ def getLeonard(LeonardCls=azrael.leonard.LeonardBase):
     return leo
 
 
+def syncAndWaitForFrame(leo):
+    """
+    Process the commands of ``leo``, sync it, and wait until the state feed
+    listener of this process has received the resulting state frame.
+
+    The state frames arrive asynchronously. This function ensures that the
+    spatial index of ``physics_interface`` is up to date.
+    """
+    listener = physAPI._getStateFeed()
+    for ii in range(100):
+        old = listener.frame
+        leo.processCommandsAndSync()
+        for jj in range(10):
+            frame = listener.frame
+            if (frame is not old) and (frame[0] == leo.syncCounter):
+                return
+            time.sleep(0.01)
+    assert False
+
+
 @pytest.mark.parametrize('clsLeonard', allEngines)
 def test_getGridForces(clsLeonard):
     """
@@ -438,6 +465,417 @@ def test_sweeping_3objects():
     print('Test passed')
 
 
+def test_sweeping_vectorised():
+    """
+    The NumPy version of the Sweeping algorithm must find the same sets as
+    the original one.
+    """
+    # Convenience.
+    sweeping = azrael.leonard.sweeping
+    sweepingVectorised = azrael.leonard.sweepingVectorised
+
+    def labelsToSets(labels):
+        # Convert the set labels into a sorted list of sorted lists.
+        out = {}
+        for idx, label in enumerate(labels):
+            out.setdefault(label, []).append(idx)
+        return sorted(out.values())
+
+    # No interval at all.
+    empty = np.array([], np.float64)
+    assert len(sweepingVectorised(empty, empty).data) == 0
+
+    # First overlaps with second, second overlaps with third, but third does
+    # not overlap with first. All three must end up in the same set.
+    start = np.array([1, 1.5, 3], np.float64)
+    stop = np.array([2, 4, 6], np.float64)
+    res = sweepingVectorised(start, stop).data
+    assert labelsToSets(res) == [[0, 1, 2]]
+
+    # First and third overlap.
+    start = np.array([1, 10, 0], np.float64)
+    stop = np.array([2, 11, 1.5], np.float64)
+    res = sweepingVectorised(start, stop).data
+    assert labelsToSets(res) == [[0, 2], [1]]
+
+    # Same intervals, but the first and third are in different groups.
+    groups = np.array([0, 0, 1], np.int64)
+    res = sweepingVectorised(start, stop, groups).data
+    assert labelsToSets(res) == [[0], [1], [2]]
+
+    # Compare both implementations on random intervals.
+    for ii in range(10):
+        N = 100
+        start = 10 * np.random.rand(N)
+        stop = start + 0.2 * np.random.rand(N)
+        data = [{'x': [x0, x1]} for x0, x1 in zip(start, stop)]
+        ref = sweeping(data, np.arange(N), 'x').data
+        res = sweepingVectorised(start, stop).data
+        assert sorted([sorted(_) for _ in ref]) == labelsToSets(res)
+
+    print('Test passed')
+
+
+def computeCollisionSetsLegacy(objIDs: list, pos: np.ndarray,
+                               aabbs: np.ndarray):
+    """
+    Reference implementation of ``computeCollisionSetsVectorised`` that
+    sweeps every set of the previous stage separately with ``sweeping``.
+    """
+    data = [{'x': [p[0] - a, p[0] + a],
+             'y': [p[1] - a, p[1] + a],
+             'z': [p[2] - a, p[2] + a]} for p, a in zip(pos, aabbs)]
+
+    # Determine the overlapping sets in 'x', then the overlapping sets in
+    # 'y' within each of these, and finally the same in 'z'.
+    sets = [set(range(len(objIDs)))]
+    for dim in ('x', 'y', 'z'):
+        stage = []
+        for subset in sets:
+            tmpData = [data[_] for _ in subset]
+            tmpLabels = np.array(tuple(subset), np.int64)
+            ret = azrael.leonard.sweeping(tmpData, tmpLabels, dim)
+            assert ret.ok
+            stage.extend(ret.data)
+        sets = stage
+    return [[objIDs[_] for _ in subset] for subset in sets]
+
+
+def test_computeCollisionSetsVectorised():
+    """
+    The NumPy engine must find the same collision sets as the original
+    ``sweeping`` based pipeline, and never separate two objects whose AABBs
+    overlap.
+    """
+    # Convenience.
+    BulletData = bullet_data.BulletData
+    ccs = azrael.leonard.computeCollisionSetsAABB
+    ccsVec = azrael.leonard.computeCollisionSetsVectorised
+
+    # No objects.
+    ret = ccsVec([], np.zeros((0, 3)), np.zeros(0))
+    assert ret.ok and ret.data == []
+
+    # Inconsistent input.
+    assert not ccsVec([1, 2], np.zeros((1, 3)), np.zeros(2)).ok
+
+    # Random scenes, from sparse (mostly singletons) to dense (a few large
+    # sets).
+    N = 200
+    objIDs = list(range(10, 10 + N))
+    for size in (20, 8, 4):
+        pos = size * np.random.rand(N, 3)
+        aabbs = 0.5 * np.random.rand(N)
+        ret = ccsVec(objIDs, pos, aabbs)
+        assert ret.ok
+        res = sorted([sorted(_) for _ in ret.data])
+
+        # Every object must be in exactly one set, and all object IDs must
+        # be native Python integers.
+        assert sorted(sum(res, [])) == objIDs
+        assert all([isinstance(_, int) for _ in sum(res, [])])
+
+        # Compare with the original pipeline.
+        ref = computeCollisionSetsLegacy(objIDs, pos, aabbs)
+        assert res == sorted([sorted(_) for _ in ref])
+
+        # Brute force: all pairs of overlapping AABBs must share a set.
+        setOf = {objID: ii for ii, subset in enumerate(res)
+                 for objID in subset}
+        dist = np.abs(pos[:, None, :] - pos[None, :, :])
+        overlap = np.all(dist <= (aabbs[:, None] + aabbs[None, :])[:, :, None],
+                         axis=2)
+        for ii, jj in zip(*np.nonzero(overlap)):
+            assert setOf[objIDs[ii]] == setOf[objIDs[jj]]
+
+        # The dictionary based wrapper must return the same sets.
+        SVs = {_: BulletData(position=p) for _, p in zip(objIDs, pos)}
+        AABBs = {_: float(a) for _, a in zip(objIDs, aabbs)}
+        ret = ccs(SVs, AABBs)
+        assert ret.ok
+        assert res == sorted([sorted(_) for _ in ret.data])
+
+    print('Test passed')
+
+
+def test_sweepAndPrune():
+    """
+    The incremental broadphase must always return the same collision sets as
+    ``computeCollisionSetsVectorised``, no matter how objects move, spawn, or
+    disappear.
+    """
+    # Convenience.
+    BulletData = bullet_data.BulletData
+    ccsVec = azrael.leonard.computeCollisionSetsVectorised
+
+    def verify(sap, SVs, AABBs):
+        # Compute the collision sets with the broadphase.
+        assert sap.update(SVs).ok
+        ret = sap.computeCollisionSets()
+        assert ret.ok
+        res = sorted([sorted(_) for _ in ret.data])
+
+        # Compute the reference collision sets from scratch.
+        IDs = list(SVs.keys())
+        pos = np.array([SVs[_].position for _ in IDs])
+        aabbs = np.array([AABBs[_] for _ in IDs])
+        ret = ccsVec(IDs, pos.reshape(-1, 3), aabbs)
+        assert ret.ok
+        assert res == sorted([sorted(_) for _ in ret.data])
+
+    # An empty broadphase must return no sets.
+    sap = azrael.leonard.SweepAndPrune()
+    assert sap.computeCollisionSets().data == []
+
+    # Insert a random scene.
+    N = 100
+    objIDs = list(range(N))
+    pos = 10 * np.random.rand(N, 3)
+    aabbs = 0.5 * np.random.rand(N)
+    assert sap.insert(objIDs, pos, aabbs).ok
+    SVs = {_: BulletData(position=p) for _, p in zip(objIDs, pos)}
+    AABBs = dict(zip(objIDs, aabbs))
+    verify(sap, SVs, AABBs)
+
+    # Must not insert objects that already exist.
+    assert not sap.insert([0], np.zeros((1, 3)), np.ones(1)).ok
+    assert len(sap) == N
+
+    for ii in range(10):
+        # Move all objects slightly.
+        for objID, sv in SVs.items():
+            p = np.array(sv.position) + 0.2 * (np.random.rand(3) - 0.5)
+            SVs[objID] = BulletData(position=p)
+        verify(sap, SVs, AABBs)
+
+        # Remove some objects (including a non-existing one).
+        victims = list(np.random.choice(list(SVs.keys()), 5, replace=False))
+        victims = [int(_) for _ in victims]
+        assert sap.remove(victims + [-1]).data == 5
+        for objID in victims:
+            del SVs[objID], AABBs[objID]
+        verify(sap, SVs, AABBs)
+
+        # Spawn new objects.
+        newIDs = list(range(N + 5 * ii, N + 5 * ii + 5))
+        pos = 10 * np.random.rand(5, 3)
+        aabbs = 0.5 * np.random.rand(5)
+        assert sap.insert(newIDs, pos, aabbs).ok
+        SVs.update({_: BulletData(position=p) for _, p in zip(newIDs, pos)})
+        AABBs.update(zip(newIDs, aabbs))
+        verify(sap, SVs, AABBs)
+
+    print('Test passed')
+
+
+def test_spatialHashGrid():
+    """
+    The grid broadphase must put every pair of overlapping objects into the
+    same set, and every one of its sets must be a connected subset of a
+    Sweep-and-Prune set.
+    """
+    def overlap(pos, aabbs, ii, jj):
+        return np.all(np.abs(pos[ii] - pos[jj]) <= aabbs[ii] + aabbs[jj])
+
+    def verify(pos, aabbs, grid):
+        N = len(aabbs)
+        objIDs = list(range(N))
+        assert grid.insert(objIDs, pos, aabbs).ok
+        ret = grid.computeCollisionSets()
+        assert ret.ok
+        gridSets = [set(_) for _ in ret.data]
+        assert sorted(sum(ret.data, [])) == objIDs
+
+        # Overlapping objects must be in the same set.
+        setID = {objID: idx for idx, s in enumerate(gridSets) for objID in s}
+        for ii in range(N):
+            for jj in range(ii + 1, N):
+                if overlap(pos, aabbs, ii, jj):
+                    assert setID[ii] == setID[jj]
+
+        # Every grid set must be a subset of a Sweep-and-Prune set.
+        sap = azrael.leonard.SweepAndPrune()
+        assert sap.insert(objIDs, pos, aabbs).ok
+        sapSets = [set(_) for _ in sap.computeCollisionSets().data]
+        for s in gridSets:
+            assert any(s.issubset(_) for _ in sapSets)
+
+    # An empty grid must return no sets.
+    grid = azrael.leonard.SpatialHashGrid()
+    assert grid.computeCollisionSets().data == []
+
+    # Two objects that touch, and a third one that does not.
+    pos = np.array([[0, 0, 0], [2, 0, 0], [5, 0, 0]], np.float64)
+    aabbs = np.ones(3)
+    grid = azrael.leonard.SpatialHashGrid()
+    assert grid.insert([0, 1, 2], pos, aabbs).ok
+    ret = grid.computeCollisionSets()
+    assert sorted([sorted(_) for _ in ret.data]) == [[0, 1], [2]]
+
+    # Random scenes with derived and fixed cell sizes.
+    N = 200
+    pos = 10 * np.random.rand(N, 3)
+    aabbs = 0.5 * np.random.rand(N)
+    verify(pos, aabbs, azrael.leonard.SpatialHashGrid())
+    verify(pos, aabbs, azrael.leonard.SpatialHashGrid(cellSize=0.3))
+    verify(pos, aabbs, azrael.leonard.SpatialHashGrid(cellSize=20))
+
+    # A large ground object does not inflate the cell size but must still
+    # merge everything it touches.
+    pos[0], aabbs[0] = (5, 5, -50), 50
+    verify(pos, aabbs, azrael.leonard.SpatialHashGrid())
+
+    # Points (zero sized AABBs) at identical positions must overlap.
+    pos = np.zeros((4, 3))
+    aabbs = np.zeros(4)
+    grid = azrael.leonard.SpatialHashGrid()
+    assert grid.insert([0, 1, 2, 3], pos, aabbs).ok
+    assert grid.computeCollisionSets().data == [[0, 1, 2, 3]]
+    print('Test passed')
+
+
+def eulerStepLoop(leo, dt: (int, float)):
+    """
+    Reference implementation of ``LeonardBase.eulerStep`` that integrates
+    one object of ``leo`` at a time.
+    """
+    # Fetch the forces for all object positions.
+    idPos = {k: v.position for (k, v) in leo.allObjects.items()}
+    ret = leo.getGridForces(idPos)
+    if not ret.ok:
+        z = np.float64(0)
+        gridForces = {_: z for _ in idPos}
+    else:
+        gridForces = ret.data
+    del ret, idPos
+
+    # Iterate over all objects and update their SV information.
+    for objID, sv in leo.allObjects.items():
+        # Fetch the force vector for the current object and add the force
+        # defined on the 'force' grid.
+        force = np.array(leo.allForces[objID], np.float64)
+        force += gridForces[objID]
+
+        # Update velocity and position.
+        vel = np.array(sv.velocityLin, np.float64) + 0.5 * force
+        pos = np.array(sv.position, np.float64)
+        sv.velocityLin[:] = vel.tolist()
+        sv.position[:] = (pos + dt * vel).tolist()
+
+        leo.allForces[objID] = [0, 0, 0]
+        leo.allTorques[objID] = [0, 0, 0]
+        leo.allObjects[objID] = sv
+
+
+def test_eulerStep():
+    """
+    The vectorised Euler step must produce the same State Vectors as the
+    per-object reference implementation, including the grid forces.
+    """
+    killAzrael()
+
+    # Convenience.
+    vg = azrael.vectorgrid
+    BulletData = bullet_data.BulletData
+
+    # Define a force grid with a constant value in a small region.
+    assert vg.deleteAllGrids().ok
+    assert vg.defineGrid(name='force', vecDim=3, granularity=1).ok
+    force = np.ones((4, 4, 4, 3))
+    assert vg.setRegion('force', np.zeros(3), force).ok
+
+    # Two Leonards with the same random objects and forces.
+    leo_ref = getLeonard(azrael.leonard.LeonardBase)
+    leo_vec = getLeonard(azrael.leonard.LeonardBase)
+    for objID in range(1, 21):
+        sv = BulletData(position=8 * np.random.rand(3),
+                        velocityLin=np.random.rand(3))
+        force = np.random.rand(3).tolist()
+        for leo in (leo_ref, leo_vec):
+            assert leo.objects.add(objID, sv, 1).ok
+            leo.allForces[objID] = force
+            leo.allTorques[objID] = force
+
+    # Integrate a few times and compare the results.
+    for ii in range(3):
+        eulerStepLoop(leo_ref, 0.5)
+        leo_vec.eulerStep(0.5)
+        for objID in leo_ref.allObjects:
+            sv_ref = leo_ref.allObjects[objID]
+            sv_vec = leo_vec.allObjects[objID]
+            assert np.allclose(sv_ref.position, sv_vec.position)
+            assert np.allclose(sv_ref.velocityLin, sv_vec.velocityLin)
+            assert leo_vec.allForces[objID] == [0, 0, 0]
+            assert leo_vec.allTorques[objID] == [0, 0, 0]
+    print('Test passed')
+
+
+def test_fetchFromBullet():
+    """
+    ``fetchFromBullet`` must fetch the objects one by one if Bullet does not
+    know all of them, and leave the unknown ones unchanged.
+    """
+    killAzrael()
+
+    # Bullet replacement that only knows the objects in ``svs``.
+    class BulletForTest():
+        def __init__(self, svs):
+            self.svs = svs
+
+        def getObjectData(self, objIDs):
+            if objIDs[0] not in self.svs:
+                return azrael.leonard.RetVal(False, 'Unknown', None)
+            return azrael.leonard.RetVal(True, None, self.svs[objIDs[0]])
+
+        def getObjectDataBatch(self, objIDs, out):
+            if not set(objIDs).issubset(self.svs):
+                return azrael.leonard.RetVal(False, 'Unknown', None)
+            out = out[:len(objIDs)]
+            for row, objID in zip(out, objIDs):
+                row[:] = bullet_data.pack(self.svs[objID])
+            return azrael.leonard.RetVal(True, None, out)
+
+    # Three objects in Leonard.
+    leo = azrael.leonard.LeonardBullet()
+    for objID in (1, 2, 3):
+        sv = bullet_data.BulletData(position=[objID, 0, 0])
+        assert leo.objects.add(objID, sv, 1).ok
+    objIDs, rows = [1, 2, 3], [leo.objects.rows[_] for _ in (1, 2, 3)]
+    sv_new = {_: bullet_data.BulletData(position=[10 * _, 0, 0])
+              for _ in objIDs}
+
+    # Bullet knows all objects.
+    leo.bullet = BulletForTest(sv_new)
+    leo.fetchFromBullet(objIDs, rows)
+    for objID in objIDs:
+        assert isEqualBD(leo.allObjects[objID], sv_new[objID])
+
+    # Bullet does not know the second object.
+    sv_new = {_: bullet_data.BulletData(position=[0, _, 0]) for _ in (1, 3)}
+    leo.bullet = BulletForTest(sv_new)
+    leo.fetchFromBullet(objIDs, rows)
+    assert isEqualBD(leo.allObjects[1], sv_new[1])
+    assert leo.allObjects[2].position == [20, 0, 0]
+    assert isEqualBD(leo.allObjects[3], sv_new[3])
+
+    # Cleanup.
+    killAzrael()
+    print('Test passed')
+
+
+def test_broadphase_setting():
+    """
+    Leonard must use the broadphase specified in its constructor.
+    """
+    killAzrael()
+
+    leo = azrael.leonard.LeonardBase(broadphase='grid')
+    assert isinstance(leo.broadphase, azrael.leonard.SpatialHashGrid)
+    leo = azrael.leonard.LeonardBase()
+    assert isinstance(leo.broadphase, azrael.leonard.SweepAndPrune)
+    print('Test passed')
+
+
 @pytest.mark.parametrize('dim', [0, 1, 2])
 def test_computeCollisionSetsAABB(dim):
     """
@@ -580,93 +1018,572 @@ def test_force_grid(clsLeonard):
     print('Test passed')
 
 
-def test_createWorkPackages():
+def test_compileWorkPackage():
     """
-    Create a Work Package and verify its content.
+    Compile a Work Package and verify its content.
     """
     killAzrael()
 
     # Get a Leonard instance.
-    leo = getLeonard(azrael.leonard.LeonardDistributedZeroMQ)
+    leo = azrael.leonard.LeonardDistributedZeroMQ()
 
     # Constants.
     id_1, id_2 = 1, 2
     aabb, dt, maxsteps = 1, 2, 3
-
-    # Invalid call: list of IDs must not be empty.
-    assert not leo.createWorkPackage([], dt, maxsteps).ok
-
-    # Invalid call: Leonard has not object with ID 10.
-    assert not leo.createWorkPackage([10], dt, maxsteps).ok
+    decode = azrael.workpackage.decodeWorkPackage
 
     # Test data.
-    sv_1 = bullet_data.BulletData(imass=1)
-    sv_2 = bullet_data.BulletData(imass=2)
+    sv_1 = bullet_data.BulletData(imass=1, position=[1, 2, 3])
+    sv_2 = bullet_data.BulletData(imass=2, position=[4, 5, 6])
 
     # Add two new objects to Leonard.
-    tmp = [(id_1, sv_1, aabb), (id_2, sv_2, aabb)]
-    assert physAPI.addCmdSpawn(tmp).ok
-    leo.processCommandsAndSync()
+    assert leo.objects.add(id_1, sv_1, aabb).ok
+    assert leo.objects.add(id_2, sv_2, aabb).ok
+
+    # Compile a Work Package with one object.
+    wp = {'wpid': 0, 'wpmeta': (0, dt, maxsteps), 'objIDs': [id_1]}
+    ret = decode(leo.compileWorkPackage(wp, b'w1'))
+    assert ret.ok
+    assert (ret.data.wpid, ret.data.dt, ret.data.maxsteps) == (0, dt, maxsteps)
+    assert ret.data.objIDs.tolist() == [id_1]
 
-    # Create a Work Package with two objects. The WPID must be 1.
-    ret = leo.createWorkPackage([id_1], dt, maxsteps)
-    ret_wpid, ret_wpdata = ret.data['wpid'], ret.data['wpdata']
-    assert (ret.ok, ret_wpid, len(ret_wpdata)) == (True, 0, 1)
-
-    # Create a second WP. This one must have WPID=2 and contain two objects.
-    ret = leo.createWorkPackage([id_1, id_2], dt, maxsteps)
-    ret_wpid, ret_wpdata = ret.data['wpid'], ret.data['wpdata']
-    assert (ret.ok, ret_wpid, len(ret_wpdata)) == (True, 1, 2)
-
-    # Check the WP content.
-    WPData = azrael.leonard.WPData
-    WPMeta = azrael.leonard.WPMeta
-    data = [WPData(*_) for _ in ret.data['wpdata']]
-    meta = WPMeta(*ret.data['wpmeta'])
-    assert (meta.dt, meta.maxsteps) == (dt, maxsteps)
-    assert (ret.ok, len(data)) == (True, 2)
-    assert (data[0].id, data[1].id) == (id_1, id_2)
-    assert isEqualBD(data[0].sv, sv_1)
-    assert isEqualBD(data[1].sv, sv_2)
-    assert np.array_equal(data[0].force, [0, 0, 0])
-    assert np.array_equal(data[1].force, [0, 0, 0])
+    # Compile a second Work Package with both objects.
+    wp = {'wpid': 1, 'wpmeta': (1, dt, maxsteps), 'objIDs': [id_1, id_2]}
+    ret = decode(leo.compileWorkPackage(wp, b'w1'))
+    assert ret.ok
+    data = ret.data
+    assert (data.wpid, data.dt, data.maxsteps) == (1, dt, maxsteps)
+
+    # Check the WP content. All forces are zero and must not be sent.
+    assert data.objIDs.tolist() == [id_1, id_2]
+    assert data.svIdx.tolist() == [0, 1]
+    assert isEqualBD(bullet_data.unpack(data.svs[0]), sv_1)
+    assert isEqualBD(bullet_data.unpack(data.svs[1]), sv_2)
+    assert np.array_equal(data.pos, [sv_1.position, sv_2.position])
+    assert data.forces is None
+    assert len(data.evict) == 0
+
+    # Apply a force and torque to the second object.
+    leo.allForces[id_2] = [1, 2, 3]
+    leo.allTorques[id_2] = [4, 5, 6]
+    ret = decode(leo.compileWorkPackage(wp, b'w1'))
+    assert ret.ok
+    assert np.array_equal(ret.data.forces, [[0, 0, 0, 0, 0, 0],
+                                            [1, 2, 3, 4, 5, 6]])
 
     # Cleanup.
     killAzrael()
     print('Test passed')
 
 
-def test_updateLocalCache():
+def test_updateLocalCachePacked():
     """
     Update the local object cache in Leonard based on a Work Package.
     """
     killAzrael()
 
     # Get a Leonard instance.
-    leo = getLeonard(azrael.leonard.LeonardDistributedZeroMQ)
+    leo = azrael.leonard.LeonardDistributedZeroMQ()
 
     # Convenience.
-    WPData = azrael.leonard.WPData
     data_1 = bullet_data.BulletData(imass=1)
     data_2 = bullet_data.BulletData(imass=2)
     id_1, id_2, aabb = 1, 2, 1
 
-    # Spawn new objects.
-    tmp = [(id_1, data_1, aabb), (id_2, data_2, aabb)]
-    assert physAPI.addCmdSpawn(tmp).ok
-    leo.processCommandsAndSync()
-
-    # Create a Work Package and verify its content.
-    ret = leo.createWorkPackage([id_1, id_2], dt=3, maxsteps=4)
+    # Spawn new objects and apply a force to both.
+    assert leo.objects.add(id_1, data_1, aabb).ok
+    assert leo.objects.add(id_2, data_2, aabb).ok
+    for objID in (id_1, id_2):
+        leo.allForces[objID] = [1, 2, 3]
+        leo.allTorques[objID] = [4, 5, 6]
 
     # Create a new State Vector to replace the old one.
     data_3 = bullet_data.BulletData(imass=4, position=[1, 2, 3])
-    newWP = [(id_1, data_3)]
+    objIDs = np.array([id_1], np.int64)
+    svs = np.array([bullet_data.pack(data_3)])
 
-    # Check the State Vector for objID=id_1 before and after the update.
+    # Check the State Vector for objID=id_1 before and after the update. The
+    # force and torque of that object must be reset as well.
     assert isEqualBD(leo.allObjects[id_1], data_1)
-    leo.updateLocalCache(newWP)
+    leo.updateLocalCachePacked(objIDs, svs)
     assert isEqualBD(leo.allObjects[id_1], data_3)
+    assert np.array_equal(leo.allForces[id_1], [0, 0, 0])
+    assert np.array_equal(leo.allTorques[id_1], [0, 0, 0])
+
+    # The other object must be unaffected.
+    assert isEqualBD(leo.allObjects[id_2], data_2)
+    assert np.array_equal(leo.allForces[id_2], [1, 2, 3])
+    assert np.array_equal(leo.allTorques[id_2], [4, 5, 6])
+
+    # Cleanup.
+    killAzrael()
+    print('Test passed')
+
+
+def test_residentWorkers():
+    """
+    Leonard must only send the State Vectors of objects whose up-to-date
+    Bullet body the Worker does not have, and tell the Workers which bodies
+    to remove.
+    """
+    killAzrael()
+
+    # Get a Leonard instance.
+    leo = azrael.leonard.LeonardDistributedZeroMQ()
+
+    # Three objects and two Workers.
+    for objID in (1, 2, 3):
+        sv = bullet_data.BulletData(imass=objID, position=[objID, 0, 0])
+        assert leo.objects.add(objID, sv, 1).ok
+    w1, w2 = b'w1', b'w2'
+    leo.workerCredits.update({w1: 2, w2: 2})
+
+    def compileWP(objIDs, worker):
+        wp = {'wpid': 0, 'wpmeta': (0, 0.5, 10), 'objIDs': objIDs}
+        ret = azrael.workpackage.decodeWorkPackage(
+            leo.compileWorkPackage(wp, worker))
+        assert ret.ok
+        return ret.data
+
+    # No Worker has any bodies yet.
+    wp = compileWP([1, 2, 3], w1)
+    rows = [leo.objects.rows[_] for _ in (1, 2, 3)]
+    assert wp.objIDs.tolist() == [1, 2, 3]
+    assert wp.svIdx.tolist() == [0, 1, 2]
+    assert np.array_equal(wp.svs, leo.objects.getPacked(rows))
+    assert np.array_equal(wp.pos[:, 0], [1, 2, 3])
+    assert len(wp.evict) == 0
+
+    # Worker 1 has returned all objects. It must not receive their State
+    # Vectors again, unless they were modified in the meantime.
+    leo.setResidents([1, 2, 3], w1)
+    assert len(compileWP([1, 2, 3], w1).svIdx) == 0
+    assert compileWP([1, 2, 3], w2).svIdx.tolist() == [0, 1, 2]
+    leo.updateResidents({'removed': [], 'modified': [2]})
+    assert compileWP([1, 2, 3], w1).svIdx.tolist() == [1]
+
+    # Worker 2 takes over objects 2 and 3. Worker 1 must remove them before
+    # it processes its next Work Package (but only once).
+    leo.setResidents([2, 3], w2)
+    assert leo.overrides == set()
+    assert leo.evictions == {w1: {2, 3}}
+    assert compileWP([1], w1).evict.tolist() == [2, 3]
+    assert len(compileWP([1], w1).evict) == 0
+
+    # Removed objects must disappear from their Worker.
+    leo.updateResidents({'removed': [3], 'modified': []})
+    assert 3 not in leo.residentWorker
+    assert leo.evictions == {w2: {3}}
+
+    # Worker 2 quits. Its objects must not be resident anywhere, and Leonard
+    # must not accumulate evictions for it.
+    leo.dropWorker(w2)
+    assert set(leo.residentWorker.values()) == {w1}
+    assert leo.overrides == {2}
+    assert w2 not in leo.evictions
+    assert compileWP([1, 2], w1).svIdx.tolist() == [1]
+
+    leo.setResidents([2], w1)
+    leo.updateResidents({'removed': [1], 'modified': []})
+    assert leo.evictions == {w1: {1}}
+    assert leo.residentWorker == {2: w1}
+
+    # Cleanup.
+    killAzrael()
+    print('Test passed')
+
+
+class FakeBullet():
+    """
+    Stand-in for ``PyBulletPhys`` that only keeps the packed State Vectors.
+    """
+    def __init__(self):
+        self.bodies = {}
+
+    def removeObject(self, objIDs: (list, tuple)):
+        for objID in objIDs:
+            self.bodies.pop(objID, None)
+        return azrael.leonard.RetVal(True, None, None)
+
+
+class WorkerForTest(azrael.leonard.LeonardWorkerZeroMQ):
+    """
+    Leonard Worker that moves every object by one unit along the x-axis
+    instead of asking Bullet, and takes ``delay`` seconds per Work Package.
+
+    If ``delay`` is *None* then the Worker blocks until ``gate`` is set.
+
+    Like a real Worker it keeps the bodies of its objects and fails if
+    Leonard did not send the State Vector of an object it does not have.
+    """
+    def __init__(self, workerID, stepsUntilQuit: int, delay: float):
+        super().__init__(workerID, stepsUntilQuit)
+        self.bullet = FakeBullet()
+        self.delay = delay
+        self.gate = threading.Event()
+        if delay is not None:
+            self.gate.set()
+
+    def computePhysicsForWorkPackage(self, wp):
+        self.gate.wait()
+        time.sleep(self.delay or 0)
+        bodies = self.bullet.bodies
+        self.bullet.removeObject(wp.evict.tolist())
+        for objID, sv in zip(wp.objIDs[wp.svIdx].tolist(), wp.svs):
+            bodies[objID] = np.array(sv)
+
+        objIDs = wp.objIDs.tolist()
+        if not set(objIDs).issubset(bodies):
+            return azrael.leonard.RetVal(False, 'Unknown object', None)
+        x = bullet_data._BulletDataSlices['position'].start
+        for objID in objIDs:
+            bodies[objID][x] += 1
+        svs = np.array([bodies[_] for _ in objIDs])
+        return azrael.leonard.RetVal(True, None, svs)
+
+
+def getLeonardZeroMQ(numObjects: int):
+    """
+    Return a ``LeonardDistributedZeroMQ`` instance with ``numObjects``
+    objects at position (objID, 0, 0), but without any Workers.
+    """
+    leo = azrael.leonard.LeonardDistributedZeroMQ()
+    leo.ctx = zmq.Context()
+    leo.sock = leo.ctx.socket(zmq.ROUTER)
+    leo.sock.setsockopt(zmq.ROUTER_MANDATORY, 1)
+    leo.sock.bind(config.addr_leonard_pushpull)
+    for objID in range(1, numObjects + 1):
+        sv = bullet_data.BulletData(position=[objID, 0, 0])
+        assert leo.objects.add(objID, sv, 1).ok
+    return leo
+
+
+def startWorkersForTest(leo, delays: list, stepsUntilQuit: int=1000):
+    """
+    Start one ``WorkerForTest`` thread per entry in ``delays`` and wait until
+    ``leo`` has registered all of them.
+
+    :return: list of (worker, ZeroMQ identity, thread) tuples.
+    """
+    out = []
+    for delay in delays:
+        workerID = len(leo.workerIDs) + 1
+        worker = WorkerForTest(workerID, stepsUntilQuit, delay)
+        thread = threading.Thread(target=worker.run, daemon=True)
+        thread.start()
+
+        # Process the 'ready' message of the Worker.
+        assert leo.sock.poll(5000)
+        ident, msgType, payload = leo.sock.recv_multipart()
+        assert msgType == b'ready'
+        info = json.loads(payload.decode('utf8'))
+        assert info['workerID'] == workerID
+        leo.workerCredits[ident] = info['credits']
+        leo.workerIDs[ident] = info['workerID']
+        out.append((worker, ident, thread))
+    return out
+
+
+def stopWorkersForTest(leo, workers: list):
+    """
+    Ask all ``workers`` (see ``startWorkersForTest``) to quit and close the
+    socket of ``leo``.
+    """
+    for worker, ident, thread in workers:
+        if thread.is_alive():
+            leo.sock.send_multipart([ident, b'quit'])
+        thread.join(5)
+        assert not thread.is_alive()
+    leo.sock.close(linger=0)
+    leo.ctx.destroy()
+
+
+def makeWorkPackages(leo, packages: list):
+    """
+    Return the Work Packages (see ``LeonardDistributedZeroMQ.step``) for the
+    lists of objIDs in ``packages``.
+    """
+    all_WPs = {}
+    for objIDs in packages:
+        wpid = leo.wpid_counter
+        leo.wpid_counter += 1
+        all_WPs[wpid] = {'wpid': wpid, 'wpmeta': (wpid, 0.1, 10),
+                         'objIDs': objIDs}
+    return all_WPs
+
+
+def getPositionsX(leo):
+    """
+    Return {objID: x-position} of all objects in ``leo``.
+    """
+    return {k: v.position[0] for k, v in leo.allObjects.items()}
+
+
+def verifyWorkerBodies(leo, workers: list):
+    """
+    Every Worker must have the bodies of the objects that are resident on
+    it, plus those it has not been asked to remove yet.
+    """
+    for worker, ident, thread in workers:
+        resident = {k for k, v in leo.residentWorker.items() if v == ident}
+        bodies = set(worker.bullet.bodies)
+        assert resident <= bodies
+        assert bodies - resident <= leo.evictions.get(ident, set())
+
+
+def test_worker_cancel():
+    """
+    A Worker must drop cancelled Work Packages, confirm the cancellation,
+    and still remove the objects the cancelled Work Package evicted.
+    """
+    # Leonard and Worker on either end of a DEALER/ROUTER pair.
+    ctx = zmq.Context()
+    router = ctx.socket(zmq.ROUTER)
+    router.bind('inproc://test_worker_cancel')
+    dealer = ctx.socket(zmq.DEALER)
+    dealer.connect('inproc://test_worker_cancel')
+    dealer.send_multipart([b'ready'])
+    ident, _ = router.recv_multipart()
+
+    # The Worker has the bodies of objects 1 and 2.
+    worker = WorkerForTest(1, 10, 0)
+    worker.bullet.bodies = {1: None, 2: None}
+
+    # Send a Work Package that evicts object 1, and another one.
+    sv = bullet_data.pack(bullet_data.BulletData())
+    for wpid, evict in ((0, [1]), (1, [])):
+        frames = azrael.workpackage.encodeWorkPackage(
+            wpid, 0.1, 10, np.array([3]), np.array([0]), np.array([sv]),
+            np.zeros((1, 3)), np.zeros((1, 6)), np.array(evict, np.int64))
+        router.send_multipart([ident, b'wp'] + frames)
+
+    pending = {}
+    worker.receiveMessages(dealer, pending, block=True)
+    assert set(pending) == {0, 1}
+
+    # Cancel both Work Packages. The cancellation for the second one is
+    # ignored because the Worker already has processed it.
+    del pending[1]
+    router.send_multipart([ident, b'cancel', b'0'])
+    router.send_multipart([ident, b'cancel', b'1'])
+    time.sleep(0.1)
+    worker.receiveMessages(dealer, pending, block=False)
+    assert pending == {}
+    assert set(worker.bullet.bodies) == {2}
+    assert router.recv_multipart() == [ident, b'cancelled', b'0']
+    assert not router.poll(100)
+
+    # A 'quit' message sets the flag.
+    assert worker.quit is False
+    router.send_multipart([ident, b'quit'])
+    worker.receiveMessages(dealer, pending, block=True)
+    assert worker.quit is True
+
+    router.close(linger=0)
+    dealer.close(linger=0)
+    ctx.destroy()
+    print('Test passed')
+
+
+def test_processWorkPackages_slowWorker():
+    """
+    Idle Workers must steal Work Packages from a slow Worker and duplicate
+    those that are overdue. The first result wins and Leonard cancels the
+    other copy.
+    """
+    killAzrael()
+
+    # Four objects and a stuck and a fast Worker.
+    leo = getLeonardZeroMQ(4)
+    workers = startWorkersForTest(leo, [None, 0])
+    (slow, id_slow, _), (fast, id_fast, _) = workers
+
+    # All Work Packages prefer the slow Worker.
+    all_WPs = makeWorkPackages(leo, [[1], [2], [3], [4]])
+    affinity = {_: id_slow for _ in all_WPs}
+    stats = leo.processWorkPackages(all_WPs, affinity)
+    assert len(all_WPs) == 0
+
+    # The step must not have waited for the slow Worker, ie. not until the
+    # Work Package timeout, and every object must have moved exactly once.
+    assert stats['etime'] < config.leonard_wp_timeout / 2
+    assert getPositionsX(leo) == {1: 2, 2: 3, 3: 4, 4: 5}
+    assert set(leo.residentWorker.values()) == {id_fast}
+    assert leo.overrides == set()
+
+    # The slow Worker still has its Work Packages. It will return the one it
+    # has started, and confirm the cancellation of the other.
+    assert leo.workerCredits == {id_slow: 0, id_fast: 2}
+    slow.gate.set()
+    time.sleep(0.5)
+
+    # Stop the fast Worker. The next step must then process the outstanding
+    # messages of both Workers, return all credits of the slow Worker, and
+    # tell it to remove the stale body of the first object.
+    leo.sock.send_multipart([id_fast, b'quit'])
+    workers[1][2].join(5)
+    all_WPs = makeWorkPackages(leo, [[1, 2, 3, 4]])
+    leo.processWorkPackages(all_WPs)
+    assert getPositionsX(leo) == {1: 3, 2: 4, 3: 5, 4: 6}
+    assert leo.workerCredits == {id_slow: 2}
+    assert leo.residentWorker == {_: id_slow for _ in (1, 2, 3, 4)}
+    assert leo.evictions == {}
+    verifyWorkerBodies(leo, workers[:1])
+
+    # Cleanup.
+    stopWorkersForTest(leo, workers)
+    killAzrael()
+    print('Test passed')
+
+
+def test_processWorkPackages_credits():
+    """
+    Leonard must conserve the credits of every Worker across 'ready',
+    'result', and 'bye' messages, as well as when it requeues the Work
+    Packages of Workers that have not replied in time.
+    """
+    killAzrael()
+
+    timeout = config.leonard_wp_timeout
+    credits = config.leonard_worker_credits
+    try:
+        # The first Worker quits after three Work Packages.
+        leo = getLeonardZeroMQ(8)
+        workers = startWorkersForTest(leo, [0], stepsUntilQuit=3)
+        workers += startWorkersForTest(leo, [0.05])
+        (_, id_1, thread_1), (_, id_2, _) = workers
+        assert leo.workerCredits == {id_1: credits, id_2: credits}
+
+        # Leonard must requeue the Work Packages the first Worker has not
+        # processed, and the second Worker must get all its credits back.
+        all_WPs = makeWorkPackages(leo, [[_] for _ in range(1, 9)])
+        leo.processWorkPackages(all_WPs)
+        thread_1.join(5)
+        assert getPositionsX(leo) == {_: _ + 1 for _ in range(1, 9)}
+        assert leo.workerCredits == {id_2: credits}
+        assert set(leo.residentWorker.values()) <= {id_1, id_2}
+
+        # The bodies of the first Worker are gone.
+        all_WPs = makeWorkPackages(leo, [list(range(1, 9))])
+        leo.processWorkPackages(all_WPs)
+        assert getPositionsX(leo) == {_: _ + 2 for _ in range(1, 9)}
+        assert leo.workerCredits == {id_2: credits}
+        assert leo.residentWorker == {_: id_2 for _ in range(1, 9)}
+        stopWorkersForTest(leo, workers)
+
+        # A single Worker that is slower than the timeout.
+        config.leonard_wp_timeout = 0.2
+        leo = getLeonardZeroMQ(1)
+        workers = startWorkersForTest(leo, [0.5])
+        worker, ident, _ = workers[0]
+
+        # Leonard requeues the Work Package but must neither send it to the
+        # same Worker again nor take away its credits.
+        all_WPs = makeWorkPackages(leo, [[1]])
+        stats = leo.processWorkPackages(all_WPs)
+        assert stats['etime'] >= 0.5
+        assert getPositionsX(leo) == {1: 2}
+        assert leo.workerCredits == {ident: credits}
+        assert leo.residentWorker == {1: ident}
+
+        # The Worker must have processed it only once.
+        worker.delay = 0
+        all_WPs = makeWorkPackages(leo, [[1]])
+        leo.processWorkPackages(all_WPs)
+        assert getPositionsX(leo) == {1: 3}
+        assert leo.workerCredits == {ident: credits}
+        verifyWorkerBodies(leo, workers)
+        assert not leo.sock.poll(200)
+    finally:
+        config.leonard_wp_timeout = timeout
+
+    # Cleanup.
+    stopWorkersForTest(leo, workers)
+    killAzrael()
+    print('Test passed')
+
+
+def test_workerScaler_defaults():
+    """
+    With the default configuration the Worker pool must grow if the steps
+    take about as long as the target tick, and shrink if they are much
+    shorter and the Workers idle.
+    """
+    killAzrael()
+
+    # Leonard must scale the pool relative to the target tick.
+    leo = azrael.leonard.LeonardDistributedZeroMQ()
+    target = config.leonard_target_tick
+    assert leo.scaler.budget == target
+
+    # Same scaler but with enough headroom to grow on every machine.
+    scaler = azrael.scheduler.WorkerScaler(1, 8, config.leonard_workers,
+                                           target)
+    num = scaler.numWorkers
+
+    # Busy Workers and steps that take almost the whole tick.
+    for ii in range(scaler.upSteps):
+        assert scaler.numWorkers == num
+        scaler.update(0.9 * target, 2, 0.05)
+    assert scaler.numWorkers > num
+
+    # Steps that finish within half the tick must neither grow nor shrink
+    # the pool.
+    num = scaler.numWorkers
+    for ii in range(3 * scaler.downSteps):
+        scaler.update(0.5 * target, 0, 0.6)
+    assert scaler.numWorkers == num
+
+    # Short steps with idle Workers eventually shrink the pool.
+    for ii in range(3 * scaler.downSteps):
+        scaler.update(0.1 * target, 0, 0.9)
+    assert 1 <= scaler.numWorkers < num
+
+    print('Test passed')
+
+
+def test_processWorkPackages_carry():
+    """
+    If the step exceeds the tick budget in 'carry' mode then Leonard must
+    abandon the pending Work Packages and keep the current State Vectors of
+    their objects.
+    """
+    killAzrael()
+
+    budget, fallback = config.leonard_tick_budget, config.leonard_tick_fallback
+    config.leonard_tick_budget, config.leonard_tick_fallback = 0.1, 'carry'
+    try:
+        leo = getLeonardZeroMQ(2)
+        workers = startWorkersForTest(leo, [None])
+        worker, ident, _ = workers[0]
+
+        # The Worker is stuck and cannot finish within the budget. Leonard
+        # must give up after the budget, and well before the Work Package
+        # timeout.
+        all_WPs = makeWorkPackages(leo, [[1], [2]])
+        stats = leo.processWorkPackages(all_WPs)
+        assert len(all_WPs) == 0
+        assert 0.1 <= stats['etime'] < config.leonard_wp_timeout / 2
+        assert getPositionsX(leo) == {1: 1, 2: 2}
+        assert leo.residentWorker == {}
+        assert leo.overrides == {1, 2}
+
+        # The Worker returns the stale result of the first Work Package and
+        # confirms the cancellation of the second one. Leonard must then
+        # return all its credits, and send all State Vectors again.
+        worker.gate.set()
+        time.sleep(0.5)
+        config.leonard_tick_budget = 5.0
+        all_WPs = makeWorkPackages(leo, [[1, 2]])
+        leo.processWorkPackages(all_WPs)
+        assert getPositionsX(leo) == {1: 2, 2: 3}
+        assert leo.workerCredits == {ident: 2}
+        assert leo.overrides == set()
+        verifyWorkerBodies(leo, workers)
+        stopWorkersForTest(leo, workers)
+    finally:
+        config.leonard_tick_budget = budget
+        config.leonard_tick_fallback = fallback
 
     # Cleanup.
     killAzrael()
@@ -732,8 +1649,16 @@ def test_processCommandQueue():
 
 if __name__ == '__main__':
     test_processCommandQueue()
-    test_createWorkPackages()
-    test_updateLocalCache()
+    test_residentWorkers()
+    test_worker_cancel()
+    test_processWorkPackages_slowWorker()
+    test_processWorkPackages_credits()
+    test_workerScaler_defaults()
+    test_processWorkPackages_carry()
+    test_compileWorkPackage()
+    test_updateLocalCachePacked()
+    test_eulerStep()
+    test_fetchFromBullet()
 
     test_worker_respawn()
     test_sweeping_2objects()
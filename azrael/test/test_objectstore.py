@@ -0,0 +1,170 @@
+import pytest
+import IPython
+import numpy as np
+import azrael.objectstore as objectstore
+import azrael.bullet.bullet_data as bullet_data
+
+ipshell = IPython.embed
+
+
+def test_pack_unpack():
+    """
+    Packing and unpacking a State Vector must return the original.
+    """
+    sv = bullet_data.BulletData(
+        scale=2, imass=3, restitution=0.5, orientation=[0, 1, 0, 0],
+        position=[1, 2, 3], velocityLin=[4, 5, 6], velocityRot=[7, 8, 9],
+        cshape=[3, 1, 2, 3], axesLockLin=[1, 0, 1], axesLockRot=[0, 1, 0],
+        lastChanged=5)
+
+    data = bullet_data.pack(sv)
+    assert data.shape == (bullet_data.packedSize, )
+    assert bullet_data.unpack(data) == sv
+    print('Test passed')
+
+
+def test_add_remove_compact():
+    """
+    Add- and remove objects, and verify the row book keeping.
+    """
+    BulletData = bullet_data.BulletData
+    store = objectstore.ObjectStore(capacity=2)
+    assert len(store) == 0
+
+    # Add three objects (requires the arrays to grow).
+    for objID in range(1, 4):
+        sv = BulletData(position=[objID, 0, 0])
+        assert store.add(objID, sv, 0.5 * objID).ok
+    assert not store.add(1, BulletData(), 1).ok
+    assert len(store) == store.numRows == 3
+    assert store.objIDs.tolist() == [1, 2, 3]
+    assert store.column('position')[:, 0].tolist() == [1, 2, 3]
+    assert store.column('aabb').tolist() == [0.5, 1, 1.5]
+
+    # The views must behave like dictionaries.
+    assert set(store.svView.keys()) == {1, 2, 3}
+    assert store.svView[2].position == [2, 0, 0]
+    assert store.forceView[2] == store.torqueView[2] == [0, 0, 0]
+    assert store.aabbView[2] == 1.0
+    store.forceView[2] = [1, 2, 3]
+    assert store.forceView[2] == [1, 2, 3]
+    with pytest.raises(KeyError):
+        store.forceView[10] = [1, 2, 3]
+
+    # Remove the first object. This must leave a hole.
+    assert store.remove([1, 10]).data == 1
+    assert 1 not in store and 1 not in store.svView
+    assert store.numRows == 3 and not store.isCompact
+    assert store.objIDs.tolist() == [-1, 2, 3]
+
+    # A new object must fill the hole.
+    assert store.add(4, BulletData(position=[4, 0, 0]), 2).ok
+    assert store.objIDs.tolist() == [4, 2, 3]
+    assert store.isCompact
+
+    # Remove two objects and compact the store.
+    assert store.remove([4, 2]).data == 2
+    assert store.compact().ok
+    assert store.numRows == len(store) == 1
+    assert store.objIDs.tolist() == [3]
+    assert store.rows == {3: 0}
+    assert store.svView[3].position == [3, 0, 0]
+    assert store.aabbView[3] == 1.5
+    print('Test passed')
+
+
+def test_columns():
+    """
+    Columns are writable views, and the packed State Vectors must match the
+    ``_BulletData`` tuples.
+    """
+    BulletData = bullet_data.BulletData
+    store = objectstore.ObjectStore()
+    for objID in range(10):
+        sv = BulletData(imass=objID, position=np.random.rand(3))
+        assert store.add(objID, sv, 1).ok
+
+    # Modify all positions and forces with vectorised operations.
+    store.column('position')[:] = 1
+    store.column('force')[:] = 2
+    assert store.svView[5].position == [1, 1, 1]
+    assert store.forceView[5] == [2, 2, 2]
+    assert store.column('imass').tolist() == list(range(10))
+
+    store.resetForces()
+    assert np.all(store.column('force') == 0)
+
+    # Packed State Vectors.
+    rows = np.array([2, 7])
+    data = store.getPacked(rows)
+    assert data.shape == (2, bullet_data.packedSize)
+    assert bullet_data.unpack(data[1]) == store.svView[7]
+
+    data[:, bullet_data._BulletDataSlices['position']] = 3
+    store.setPacked(rows, data)
+    assert store.svView[7].position == [3, 3, 3]
+    assert store.svView[6].position == [1, 1, 1]
+    print('Test passed')
+
+
+def test_dirty_rows():
+    """
+    Only new, modified, moving, and newly resting objects must be dirty.
+    """
+    BulletData = bullet_data.BulletData
+    store = objectstore.ObjectStore()
+    eps = 1E-6
+
+    # Object 1 moves, object 2 is at rest.
+    assert store.add(1, BulletData(velocityLin=[1, 0, 0]), 1).ok
+    assert store.add(2, BulletData(), 1).ok
+
+    # All objects are dirty before the first sync.
+    rows, resting = store.dirtyRows(eps)
+    assert store.objIDs[rows].tolist() == [1, 2]
+    assert resting.tolist() == [False, True]
+    store.markSynced(rows, resting)
+    assert len(store.dirtyRows(eps)[0]) == 0
+
+    # Move object 1, and let object 2 drift by less than epsilon.
+    store.column('position')[0, 0] += 1
+    store.column('position')[1, 0] += eps / 2
+    rows, resting = store.dirtyRows(eps)
+    assert store.objIDs[rows].tolist() == [1]
+    store.markSynced(rows, resting)
+
+    # Resting objects must not become dirty if they drift, but explicitly
+    # modified objects must.
+    store.column('position')[1, 0] += 1
+    assert len(store.dirtyRows(eps)[0]) == 0
+    store.markDirty([2, 10])
+    rows, resting = store.dirtyRows(eps)
+    assert store.objIDs[rows].tolist() == [2] and resting.tolist() == [True]
+    store.markSynced(rows, resting)
+
+    # Object 1 comes to rest: report it once with the resting flag.
+    store.column('velocityLin')[0] = 0
+    rows, resting = store.dirtyRows(eps)
+    assert store.objIDs[rows].tolist() == [1] and resting.tolist() == [True]
+    store.markSynced(rows, resting)
+    assert len(store.dirtyRows(eps)[0]) == 0
+
+    # Object 2 starts to move.
+    store.column('velocityRot')[1, 2] = 1
+    rows, resting = store.dirtyRows(eps)
+    assert store.objIDs[rows].tolist() == [2] and resting.tolist() == [False]
+
+    # Compaction must preserve the sync state.
+    store.markSynced(rows, resting)
+    assert store.add(3, BulletData(), 1).ok
+    assert store.remove([1]).ok and store.compact().ok
+    rows, resting = store.dirtyRows(eps)
+    assert store.objIDs[rows].tolist() == [3]
+    print('Test passed')
+
+
+if __name__ == '__main__':
+    test_pack_unpack()
+    test_add_remove_compact()
+    test_columns()
+    test_dirty_rows()
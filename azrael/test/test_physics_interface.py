@@ -15,18 +15,22 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with Azrael. If not, see <http://www.gnu.org/licenses/>.
 
+import os
 import sys
+import time
+import threading
 import pytest
 import cytoolz
 import IPython
 import numpy as np
 
 import azrael.leonard as leonard
+import azrael.database as database
 import azrael.physics_interface as physAPI
 import azrael.bullet.bullet_data as bullet_data
 
 from azrael.test.test_clacks import killAzrael
-from azrael.test.test_leonard import getLeonard
+from azrael.test.test_leonard import getLeonard, syncAndWaitForFrame
 from azrael.bullet.test_boost_bullet import isEqualBD
 
 ipshell = IPython.embed
@@ -199,11 +203,30 @@ def test_add_same():
     print('Test passed')
 
 
-def test_commandQueue():
+def useCommandQueue(transport: str):
+    """
+    Make the current process use a new command queue of type ``transport``.
+
+    The ZeroMQ queue uses an in-process address because Leonard and Clerk
+    share the same process in these tests.
+
+    :param str transport: 'mongo' or 'zeromq'.
+    """
+    if transport == 'zeromq':
+        queue = physAPI.CommandQueueZeroMQ('inproc://test_cmd_queue')
+    else:
+        queue = physAPI.commandQueues[transport]()
+    physAPI._cmdQueue = (queue, os.getpid())
+    return queue
+
+
+@pytest.mark.parametrize('transport', ['mongo', 'zeromq'])
+def test_commandQueue(transport):
     """
     Add-, query, and remove commands from the command queue.
     """
     killAzrael()
+    queue = useCommandQueue(transport)
 
     # Reset the SV database and instantiate a Leonard.
     leo = getLeonard()
@@ -288,6 +311,98 @@ def test_commandQueue():
     assert len(ret.data['modify']) == 2
     assert len(ret.data['force']) == 2
 
+    # Restore the default command queue.
+    physAPI._cmdQueue = (None, None)
+    if transport == 'zeromq':
+        queue.sock_push.close()
+        queue.sock_pull.close()
+    print('Test passed')
+
+
+def test_commandQueue_zeromq_dedupe():
+    """
+    The ZeroMQ command stream must only retain the first command for every
+    (cmd, objID) combination within one batch.
+    """
+    queue = physAPI.CommandQueueZeroMQ('inproc://test_cmd_dedupe')
+
+    # Bind the PULL socket and ensure the queue is empty.
+    ret = queue.get()
+    assert ret.ok and ret.data == []
+
+    # Queue several commands, some of which are duplicates.
+    assert queue.put('force', [{'objID': 1, 'force': [1], 'torque': [2]}]).ok
+    assert queue.put('force', [{'objID': 1, 'force': [3], 'torque': [4]}]).ok
+    assert queue.put('force', [{'objID': 2, 'force': [5], 'torque': [6]}]).ok
+    assert queue.put('remove', [{'objID': 1}, {'objID': 1}]).ok
+    assert queue.put('spawn', []).ok
+
+    ret = queue.get()
+    assert ret.ok
+    docs = sorted(ret.data, key=lambda _: (_['cmd'], _['objID']))
+    assert docs == [
+        {'cmd': 'force', 'objID': 1, 'force': [1], 'torque': [2]},
+        {'cmd': 'force', 'objID': 2, 'force': [5], 'torque': [6]},
+        {'cmd': 'remove', 'objID': 1}]
+
+    # The queue must now be empty.
+    assert queue.get().data == []
+    queue.sock_push.close()
+    queue.sock_pull.close()
+    print('Test passed')
+
+
+def test_commandQueue_zeromq_threads():
+    """
+    All threads must share the ZeroMQ command stream so that Leonard receives
+    their commands in the order they were issued.
+    """
+    queue = useCommandQueue('zeromq')
+    assert queue.get().ok
+
+    # Two threads issue a force command for the same object, one after the
+    # other. The queue retains the first one.
+    def setForce(val):
+        assert physAPI.addCmdSetForceAndTorque(1, [val] * 3, [0] * 3).ok
+        assert physAPI.getCommandQueue() is queue
+
+    for val in range(1, 11):
+        thread = threading.Thread(target=setForce, args=(val, ))
+        thread.start()
+        thread.join()
+    ret = physAPI.dequeueCommands()
+    assert ret.ok
+    assert [_['force'] for _ in ret.data['force']] == [[1, 1, 1]]
+
+    # Restore the default command queue.
+    physAPI._cmdQueue = (None, None)
+    queue.sock_push.close()
+    queue.sock_pull.close()
+    print('Test passed')
+
+
+def test_commandQueue_zeromq_full():
+    """
+    The ZeroMQ command stream must return an error instead of blocking if
+    Leonard does not drain it.
+    """
+    queue = physAPI.CommandQueueZeroMQ('inproc://test_cmd_full', hwm=2)
+    doc = [{'objID': 1}]
+
+    # Nobody drains the queue: the third batch must fail without blocking.
+    t0 = time.time()
+    assert queue.put('remove', doc).ok
+    assert queue.put('remove', doc).ok
+    assert not queue.put('remove', doc).ok
+    assert time.time() - t0 < 1
+
+    # The queue accepts commands again once Leonard has drained it.
+    assert queue.get().ok
+    time.sleep(0.1)
+    assert queue.get().ok
+    assert queue.put('remove', doc).ok
+    queue.sock_push.close()
+    queue.sock_pull.close()
     print('Test passed')
 
 
@@ -487,8 +602,59 @@ def test_set_get_AABB():
     assert np.array_equal(ret.data, [1.5, None])
 
 
+def test_getObjectsInRegion_cache():
+    """
+    Region queries must re-use the spatial index until Leonard publishes a
+    new state frame.
+    """
+    killAzrael()
+
+    # Reset the SV database and instantiate a Leonard.
+    leo = getLeonard()
+    params = {'centre': [0, 0, 0], 'radius': 10}
+
+    # No object yet.
+    syncAndWaitForFrame(leo)
+    assert physAPI.getObjectsInRegion('sphere', params).data == []
+
+    # Spawn two objects.
+    objs = [(1, BulletData(position=[0, 0, 0]), 1),
+            (2, BulletData(position=[5, 0, 0]), 1)]
+    assert physAPI.addCmdSpawn(objs).ok
+    syncAndWaitForFrame(leo)
+    index = physAPI._getSpatialIndex()
+    assert physAPI.getObjectsInRegion('sphere', params).data == [1, 2]
+
+    # Modify the database behind Leonard's back. The query must neither use
+    # the database nor rebuild the index.
+    database.dbHandles['SV'].remove({'objID': 2})
+    assert physAPI.getObjectsInRegion('sphere', params).data == [1, 2]
+    assert physAPI._getSpatialIndex() is index
+
+    # Removing an object must invalidate the index.
+    assert physAPI.addCmdRemoveObject(1).ok
+    syncAndWaitForFrame(leo)
+    assert physAPI.getObjectsInRegion('sphere', params).data == [2]
+
+    # Moving an object must invalidate it as well.
+    assert physAPI.addCmdSpawn([(3, BulletData(position=[20, 0, 0]), 1)]).ok
+    syncAndWaitForFrame(leo)
+    assert physAPI.getObjectsInRegion('sphere', params).data == [2]
+    sv = BulletDataOverride(position=[1, 0, 0])
+    assert physAPI.addCmdModifyStateVariable(3, sv).ok
+    syncAndWaitForFrame(leo)
+    assert physAPI.getObjectsInRegion('sphere', params).data == [2, 3]
+
+    print('Test passed')
+
+
 if __name__ == '__main__':
-    test_commandQueue()
+    test_getObjectsInRegion_cache()
+    test_commandQueue_zeromq_dedupe()
+    test_commandQueue_zeromq_threads()
+    test_commandQueue_zeromq_full()
+    test_commandQueue('mongo')
+    test_commandQueue('zeromq')
     test_BulletDataOverride()
     test_set_get_AABB()
     test_StateVariable_tuple()
@@ -206,7 +206,49 @@ def test_GetStateVariable():
     print('Test passed')
 
 
+@pytest.mark.parametrize('encoding', ['float64', 'float32'])
+def test_GetStateVariable_binary(encoding):
+    """
+    Test the binary encodings for State Variables.
+    """
+    objs = [bullet_data.BulletData(position=[1, 2, 3], lastChanged=5),
+            bullet_data.BulletData(velocityLin=[-1, 0.5, 0])]
+    objIDs = [1, 2]
+
+    # The client requests the binary encoding. Unknown encodings must be
+    # rejected.
+    ok, enc = protocol.ToClerk_GetStateVariable_Encode(objIDs, encoding)
+    enc = json.loads(json.dumps(enc))
+    ok, dec = protocol.ToClerk_GetStateVariable_Decode(enc)
+    assert ok and dec == (objIDs, encoding)
+    ok, dec = protocol.ToClerk_GetAllStateVariables_Decode({'encoding': 'x'})
+    assert not ok
+
+    # Clerk encodes the data. Object 3 does not exist.
+    data = {1: objs[0], 2: objs[1], 3: None}
+    ok, enc = protocol.FromClerk_GetStateVariable_Encode(
+        protocol.EncodedSV(encoding, data))
+    enc = json.loads(json.dumps(enc))
+    assert enc['objIDs'] == objIDs and enc['missing'] == [3]
+
+    # The client must receive the raw records as a NumPy array.
+    ret = protocol.FromClerk_GetStateVariable_Decode(enc)
+    assert ret.ok
+    ids, records, missing = ret.data
+    assert ids.tolist() == objIDs and missing == [3]
+    assert records.shape == (2, bullet_data.packedSize)
+
+    # Every record must unpack to the original State Variable.
+    dec_sv = dict(zip(objIDs, [bullet_data.unpack(_) for _ in records]))
+    assert isEqualBD(dec_sv[1], objs[0])
+    assert isEqualBD(dec_sv[2], objs[1])
+    assert dec_sv[1].lastChanged == 5
+    print('Test passed')
+
+
 if __name__ == '__main__':
+    test_GetStateVariable_binary('float64')
+    test_GetStateVariable_binary('float32')
     test_GetStateVariable()
     test_send_command()
     test_encoding_add_get_template()
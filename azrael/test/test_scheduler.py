@@ -0,0 +1,140 @@
+import IPython
+import numpy as np
+import azrael.scheduler as scheduler
+
+ipshell = IPython.embed
+
+
+def test_pack():
+    """
+    Pack collision sets into Work Packages.
+    """
+    sched = scheduler.WorkScheduler(
+        numWorkers=2, packagesPerWorker=2, overhead=0, objCost=1)
+
+    # No collision sets, no Work Packages.
+    assert sched.pack([]) == []
+
+    # 100 single objects must be packed into 4 Work Packages with 25
+    # objects each.
+    collSets = [{_} for _ in range(100)]
+    wps = sched.pack(collSets)
+    assert len(wps) == 4
+    assert [len(_) for _ in wps] == [25, 25, 25, 25]
+    assert sorted(sum(wps, [])) == list(range(100))
+
+    # A collision set larger than the target cost must get its own Work
+    # Package, and collision sets must never be split.
+    collSets = [set(range(100, 150))] + [{_} for _ in range(30)] + \
+        [{200, 201}, {202, 203}]
+    wps = sched.pack(collSets)
+    assert sorted(wps[0]) == list(range(100, 150))
+    for wp in wps:
+        assert (200 in wp) == (201 in wp)
+        assert (202 in wp) == (203 in wp)
+    assert sorted(sum(wps, [])) == \
+        list(range(30)) + list(range(100, 150)) + [200, 201, 202, 203]
+    print('Test passed')
+
+
+def test_cost_model():
+    """
+    Measured compute times must affect the packing.
+    """
+    sched = scheduler.WorkScheduler(
+        numWorkers=1, packagesPerWorker=2, overhead=0.1, objCost=1,
+        smoothing=1)
+    assert sched.cost([1, 2]) == 2.1
+
+    # Object 0 turned out to be expensive, and the others cheap.
+    sched.update([0], 10.1)
+    sched.update(list(range(1, 11)), 1.1)
+    assert np.isclose(sched.cost([0]), 10.1)
+    assert np.isclose(sched.cost([1, 2]), 0.3)
+
+    # Object 0 must therefore get its own Work Package.
+    wps = sched.pack([{_} for _ in range(11)])
+    assert wps[0] == [0] and sorted(wps[1]) == list(range(1, 11))
+
+    # Packing must forget all objects that do not exist anymore.
+    sched.pack([{1}])
+    assert list(sched.objCost.keys()) == [1]
+    print('Test passed')
+
+
+def test_affinity():
+    """
+    Collision sets must stay with the Worker their objects are on.
+    """
+    sched = scheduler.WorkScheduler(
+        numWorkers=2, packagesPerWorker=1, overhead=0, objCost=1)
+
+    # Objects 0-9 are on Worker 'a', objects 10-19 on Worker 'b', and the
+    # remaining ones are new.
+    affinity = {_: 'a' for _ in range(10)}
+    affinity.update({_: 'b' for _ in range(10, 20)})
+    collSets = [{_} for _ in range(30)]
+    wps = sched.assign(collSets, affinity)
+    assert sorted(sum([_[1] for _ in wps], [])) == list(range(30))
+    for worker, objIDs in wps:
+        assert set(affinity.get(_, None) for _ in objIDs) == {worker}
+
+    # A collision set must go to the Worker that has most of its objects.
+    wps = sched.assign([[0, 1, 10], [11, 12, 2]], affinity)
+    assert sorted(wps) == [('a', [0, 1, 10]), ('b', [11, 12, 2])]
+
+    # Without affinity, ``assign`` is the same as ``pack``.
+    wps = sched.assign(collSets, {})
+    assert [_[0] for _ in wps] == [None] * len(wps)
+    assert [_[1] for _ in wps] == sched.pack(collSets)
+    print('Test passed')
+
+
+def test_worker_scaler():
+    """
+    Grow and shrink the Worker pool with hysteresis.
+    """
+    scaler = scheduler.WorkerScaler(
+        minWorkers=2, maxWorkers=8, numWorkers=3, budget=1,
+        upSteps=2, downSteps=3, cooldown=2)
+    assert scaler.numWorkers == 3
+
+    # Slow steps with busy Workers must grow the pool, but only after two
+    # consecutive steps.
+    assert scaler.update(0.9, 2, 0.0) == 3
+    assert scaler.update(0.9, 2, 0.0) == 4
+
+    # The next two steps must be ignored (cooldown).
+    assert scaler.update(0.9, 2, 0.0) == 4
+    assert scaler.update(0.9, 2, 0.0) == 4
+    assert scaler.update(0.9, 2, 0.0) == 6
+
+    # Slow steps with idle Workers must not grow the pool, and a single
+    # fast step must reset the counter.
+    scaler.numIgnore = 0
+    assert scaler.update(0.9, 0, 0.9) == 6
+    assert scaler.update(0.9, 0, 0.9) == 6
+    assert scaler.update(0.9, 2, 0.0) == 6
+    assert scaler.update(0.5, 0, 0.0) == 6
+    assert scaler.update(0.9, 2, 0.0) == 6
+
+    # The pool must never exceed the maximum.
+    for ii in range(20):
+        scaler.update(0.9, 2, 0.0)
+    assert scaler.numWorkers == 8
+
+    # Fast steps with idle Workers must shrink the pool one Worker at a
+    # time, but never below the minimum.
+    scaler.numIgnore = 0
+    assert [scaler.update(0.1, 0, 0.9) for _ in range(3)] == [8, 8, 7]
+    for ii in range(100):
+        scaler.update(0.1, 0, 0.9)
+    assert scaler.numWorkers == 2
+    print('Test passed')
+
+
+if __name__ == '__main__':
+    test_pack()
+    test_cost_model()
+    test_affinity()
+    test_worker_scaler()
@@ -0,0 +1,170 @@
+import os
+import pytest
+import IPython
+import tempfile
+import numpy as np
+import azrael.sharedstate as sharedstate
+import azrael.bullet.bullet_data as bullet_data
+
+ipshell = IPython.embed
+
+
+def makeTable(capacity=16):
+    """
+    Return a new table in a temporary file and the file name.
+    """
+    fd, fname = tempfile.mkstemp(prefix='azrael_sv_')
+    os.close(fd)
+    return sharedstate.SharedStateTable(fname, capacity, create=True), fname
+
+
+def makeSVs(objIDs):
+    """
+    Return packed State Vectors whose position encodes the objID.
+    """
+    svs = []
+    for objID in objIDs:
+        sv = bullet_data.BulletData(position=[objID, 2 * objID, 0])
+        svs.append(bullet_data.pack(sv))
+    return np.array(svs, np.float64)
+
+
+def test_publish_snapshot():
+    """
+    Publish State Vectors and read them back.
+    """
+    table, fname = makeTable()
+    try:
+        # The table is initially empty.
+        assert table.generation == 0
+        gen, IDs, svs, aabbs = table.snapshot().data
+        assert gen == 0 and len(IDs) == len(svs) == len(aabbs) == 0
+
+        # Publish unsorted objects.
+        objIDs = np.array([5, 1, 3], np.int64)
+        ret = table.publish(objIDs, makeSVs(objIDs), 0.5 * objIDs)
+        assert ret.ok and ret.data == table.generation == 1
+
+        # The snapshot must contain all objects, sorted by objID.
+        gen, IDs, svs, aabbs = table.snapshot().data
+        assert gen == 1
+        assert IDs.tolist() == [1, 3, 5]
+        assert aabbs.tolist() == [0.5, 1.5, 2.5]
+        assert bullet_data.unpack(svs[1]).position == [3, 6, 0]
+
+        # Query a subset. Unknown objects must not appear in the output.
+        gen, IDs, svs, aabbs = table.snapshot([5, 2, 1]).data
+        assert IDs.tolist() == [5, 1]
+        assert bullet_data.unpack(svs[0]).position == [5, 10, 0]
+
+        # Snapshots are copies.
+        svs[:] = 0
+        assert bullet_data.unpack(table.snapshot([5]).data[2][0]) != \
+            bullet_data.unpack(svs[0])
+    finally:
+        table.close()
+        os.remove(fname)
+    print('Test passed')
+
+
+def test_double_buffering():
+    """
+    Every publication must alternate the buffers and increase the generation.
+    """
+    table, fname = makeTable()
+    try:
+        for ii in range(1, 5):
+            objIDs = np.arange(ii, dtype=np.int64)
+            assert table.publish(objIDs, makeSVs(objIDs), objIDs * 1.0).ok
+            assert int(table.header[sharedstate._H_ACTIVE]) == ii % 2
+            gen, IDs, _, _ = table.snapshot().data
+            assert gen == ii and IDs.tolist() == list(range(ii))
+
+        # Publishing no objects at all is valid.
+        objIDs = np.zeros(0, np.int64)
+        svs = np.zeros((0, bullet_data.packedSize))
+        assert table.publish(objIDs, svs, np.zeros(0)).ok
+        assert len(table.snapshot([1, 2]).data[1]) == 0
+
+        # The table cannot hold more than ``capacity`` objects.
+        objIDs = np.arange(table.capacity + 1, dtype=np.int64)
+        assert not table.publish(objIDs, makeSVs(objIDs), objIDs * 1.0).ok
+    finally:
+        table.close()
+        os.remove(fname)
+    print('Test passed')
+
+
+def test_reopen():
+    """
+    A second instance of the same file must see the published data.
+    """
+    writer, fname = makeTable(capacity=8)
+    try:
+        reader = sharedstate.SharedStateTable(fname)
+        assert reader.capacity == 8
+
+        objIDs = np.array([2, 4], np.int64)
+        assert writer.publish(objIDs, makeSVs(objIDs), objIDs * 1.0).ok
+        gen, IDs, svs, _ = reader.snapshot().data
+        assert gen == 1 and IDs.tolist() == [2, 4]
+        assert bullet_data.unpack(svs[1]).position == [4, 8, 0]
+        reader.close()
+
+        # Opening a file that is not a table must fail.
+        with open(fname, 'wb') as fd:
+            fd.write(bytes(64))
+        with pytest.raises(AssertionError):
+            sharedstate.SharedStateTable(fname)
+    finally:
+        writer.close()
+        os.remove(fname)
+    print('Test passed')
+
+
+def test_invalidate():
+    """
+    Readers must notice when Leonard invalidates or replaces the table.
+    """
+    writer, fname = makeTable()
+    try:
+        reader = sharedstate.SharedStateTable(fname)
+        objIDs = np.array([1, 2], np.int64)
+        assert writer.publish(objIDs, makeSVs(objIDs), objIDs * 1.0).ok
+        assert reader.valid and reader.snapshot().ok
+        epoch = writer.epoch
+
+        # Invalidate the table. This also removes the file.
+        sharedstate.invalidateTable(fname)
+        assert not reader.valid and not reader.snapshot().ok
+        assert not os.path.exists(fname)
+        reader.close()
+        writer.close()
+
+        # A new table at the same path starts with generation 0 and a new
+        # epoch.
+        writer = sharedstate.SharedStateTable(fname, 16, create=True)
+        assert writer.generation == 0 and writer.epoch != epoch
+        reader = sharedstate.SharedStateTable(fname)
+        assert reader.valid and reader.epoch == writer.epoch
+        assert reader.snapshot().data[0] == 0
+
+        # Creating yet another table at the same path must invalidate the
+        # readers of the current one.
+        new = sharedstate.SharedStateTable(fname, 16, create=True)
+        assert not reader.valid and not reader.snapshot().ok
+        assert new.valid and new.epoch != writer.epoch
+        reader.close()
+        writer.close()
+        new.close()
+    finally:
+        if os.path.exists(fname):
+            os.remove(fname)
+    print('Test passed')
+
+
+if __name__ == '__main__':
+    test_publish_snapshot()
+    test_double_buffering()
+    test_reopen()
+    test_invalidate()
@@ -0,0 +1,102 @@
+import IPython
+import numpy as np
+import azrael.spatialindex as spatialindex
+
+ipshell = IPython.embed
+
+
+def randomScene(num, seed):
+    """
+    Return objIDs, positions, and radii of ``num`` random objects.
+
+    The first object is much larger than all others (eg. a ground plane).
+    """
+    rng = np.random.RandomState(seed)
+    objIDs = rng.permutation(10 * num + 1)[:num].astype(np.int64)
+    pos = rng.uniform(-50, 50, (num, 3))
+    radii = rng.uniform(0.1, 2, num)
+    if num > 0:
+        radii[0] = 500
+    return objIDs, pos, radii, rng
+
+
+def test_frustum_planes():
+    """
+    The frustum planes must point inwards.
+    """
+    planes, corners = spatialindex.frustumPlanes(
+        [0, 0, 0], [0, 0, -1], [0, 1, 0], 90, 2, 1, 10)
+    assert planes.shape == (6, 4) and corners.shape == (8, 3)
+
+    # Points inside- and outside the frustum.
+    def isInside(p):
+        return np.all(np.dot(planes[:, :3], p) + planes[:, 3] >= 0)
+    assert isInside([0, 0, -5])
+    assert isInside([9, 4, -5])
+    assert not isInside([0, 0, 5])
+    assert not isInside([0, 0, -0.5])
+    assert not isInside([0, 0, -11])
+    assert not isInside([0, 6, -5])
+    print('Test passed')
+
+
+def test_queries_match_brute_force():
+    """
+    All queries must return the same objects as a brute force search.
+    """
+    for num in (0, 1, 10, 300):
+        objIDs, pos, radii, rng = randomScene(num, num)
+        index = spatialindex.SpatialIndex(objIDs, pos, radii)
+        assert len(index) == num
+
+        for ii in range(20):
+            # Box.
+            lo = rng.uniform(-60, 40, 3)
+            hi = lo + rng.uniform(0, 40, 3)
+            delta = pos - np.clip(pos, lo, hi)
+            hit = np.sum(delta ** 2, axis=1) <= radii ** 2
+            assert np.array_equal(index.queryBox(lo, hi),
+                                  np.sort(objIDs[hit]))
+
+            # Sphere.
+            centre, radius = rng.uniform(-50, 50, 3), rng.uniform(0, 30)
+            dist = np.sum((pos - centre) ** 2, axis=1)
+            hit = dist <= (radii + radius) ** 2
+            assert np.array_equal(index.querySphere(centre, radius),
+                                  np.sort(objIDs[hit]))
+
+            # Frustum.
+            cam = {'position': rng.uniform(-50, 50, 3),
+                   'view': rng.normal(size=3), 'up': [0, 1, 0],
+                   'fov': 60, 'aspect': 1.5, 'near': 0.1, 'far': 40}
+            planes, _ = spatialindex.frustumPlanes(**cam)
+            dist = np.dot(pos, planes[:, :3].T) + planes[:, 3]
+            hit = np.all(dist >= -radii[:, None], axis=1)
+            assert np.array_equal(index.queryFrustum(**cam),
+                                  np.sort(objIDs[hit]))
+    print('Test passed')
+
+
+def test_query_dispatch():
+    """
+    Dispatch queries by shape name and reject invalid ones.
+    """
+    objIDs = np.array([1, 2, 3], np.int64)
+    pos = np.array([[0, 0, 0], [5, 0, 0], [10, 0, 0]], np.float64)
+    index = spatialindex.SpatialIndex(objIDs, pos, np.ones(3))
+
+    ret = index.query('sphere', {'centre': [0, 0, 0], 'radius': 4.5})
+    assert ret.ok and ret.data == [1, 2]
+    ret = index.query('box', {'lo': [9, -1, -1], 'hi': [20, 1, 1]})
+    assert ret.ok and ret.data == [3]
+
+    assert not index.query('cone', {}).ok
+    assert not index.query('box', {'lo': [0, 0, 0]}).ok
+    assert not index.query('sphere', {'centre': [0, 0, 0], 'foo': 1}).ok
+    print('Test passed')
+
+
+if __name__ == '__main__':
+    test_frustum_planes()
+    test_queries_match_brute_force()
+    test_query_dispatch()
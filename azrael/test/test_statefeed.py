@@ -0,0 +1,178 @@
+import time
+import IPython
+import numpy as np
+import azrael.client
+import azrael.statefeed as statefeed
+import azrael.bullet.bullet_data as bullet_data
+
+ipshell = IPython.embed
+
+
+def makeFrame(num):
+    """
+    Return objIDs, packed State Vectors, and AABBs for ``num`` objects.
+
+    The objIDs are 1..num and object <i> is at position (i, 0, 0) and has
+    AABB i / 2.
+    """
+    objIDs = np.arange(1, num + 1, dtype=np.int64)
+    svs = [bullet_data.pack(bullet_data.BulletData(position=[_, 0, 0]))
+           for _ in objIDs]
+    return objIDs, np.array(svs), objIDs / 2
+
+
+def test_encode_decode_select():
+    """
+    Encode and decode state frames, and select objects of interest.
+    """
+    objIDs, svs, aabbs = makeFrame(5)
+
+    # Decoding an encoded frame must return the original data.
+    frames = statefeed.encodeFrame(3, objIDs, svs, aabbs)
+    ret = statefeed.decodeFrame(frames)
+    assert ret.ok
+    tick, out_ids, out_svs, out_aabbs = ret.data
+    assert tick == 3
+    assert np.array_equal(out_ids, objIDs) and np.array_equal(out_svs, svs)
+    assert np.array_equal(out_aabbs, aabbs)
+
+    # Invalid frames must be rejected.
+    assert not statefeed.decodeFrame(frames[:4]).ok
+    assert not statefeed.decodeFrame([b'x'] + frames[1:]).ok
+    assert not statefeed.decodeFrame(frames[:3] + [b'123', frames[4]]).ok
+    assert not statefeed.decodeFrame(frames[:4] + [frames[4][8:]]).ok
+
+    # Select objects by objID and/or region.
+    select = statefeed.selectObjects
+    assert select(objIDs, svs).all()
+    mask = select(objIDs, svs, wantIDs=[2, 4, 10])
+    assert objIDs[mask].tolist() == [2, 4]
+    mask = select(objIDs, svs, region=[[2.5, -1, -1], [10, 1, 1]])
+    assert objIDs[mask].tolist() == [3, 4, 5]
+    mask = select(objIDs, svs, [2, 4], [[2.5, -1, -1], [10, 1, 1]])
+    assert objIDs[mask].tolist() == [4]
+    print('Test passed')
+
+
+def test_publish_subscribe():
+    """
+    Publish state frames and receive them with several subscribers.
+    """
+    addr = 'inproc://test_statefeed'
+    pub = statefeed.StatePublisher(addr)
+    objIDs, svs, aabbs = makeFrame(5)
+
+    # Bind the publisher, then connect two subscribers.
+    assert pub.publish(0, objIDs, svs, aabbs).ok
+    sub_all = statefeed.StateSubscriber(addr)
+    sub_some = statefeed.StateSubscriber(
+        addr, objIDs=[1, 2, 3], region=[[1.5, -1, -1], [10, 1, 1]])
+
+    try:
+        # Keep publishing until the (asynchronous) subscriptions took effect.
+        for tick in range(1, 100):
+            assert pub.publish(tick, objIDs, svs, aabbs).ok
+            if sub_all.sock.poll(10) and sub_some.sock.poll(10):
+                break
+            time.sleep(0.01)
+
+        ret = sub_all.recv(timeout=1)
+        assert ret.ok
+        tick, data = ret.data
+        assert sorted(data.keys()) == [1, 2, 3, 4, 5]
+        assert data[4].position == [4, 0, 0]
+
+        ret = sub_some.recv(timeout=1)
+        assert ret.ok
+        assert sorted(ret.data[1].keys()) == [2, 3]
+
+        # Drain the subscriber. Afterwards it must time out.
+        while sub_all.sock.poll(10):
+            sub_all.sock.recv_multipart()
+        assert not sub_all.recv(timeout=0.05).ok
+    finally:
+        sub_all.close()
+        sub_some.close()
+        pub.close()
+    print('Test passed')
+
+
+def test_client_subscribe_latest():
+    """
+    Subscribe via the Client and skip the frames that are already outdated.
+    """
+    addr = 'inproc://test_statefeed_client'
+    pub = statefeed.StatePublisher(addr)
+    objIDs, svs, aabbs = makeFrame(5)
+    assert pub.publish(0, objIDs, svs, aabbs).ok
+    client = azrael.client.Client()
+    sub = client.subscribe(objIDs=[2, 4], addr=addr)
+
+    try:
+        # Wait until the subscription took effect, and drain the frames.
+        for tick in range(1, 100):
+            assert pub.publish(tick, objIDs, svs, aabbs).ok
+            if sub.sock.poll(10):
+                break
+            time.sleep(0.01)
+        while sub.sock.poll(10):
+            sub.sock.recv_multipart()
+
+        # Publish several frames. Only the newest one must be returned.
+        for tick in (200, 201, 202):
+            assert pub.publish(tick, objIDs, svs, aabbs).ok
+        assert sub.sock.poll(1000)
+        time.sleep(0.05)
+        ret = sub.recvLatest(timeout=1)
+        assert ret.ok
+        tick, data = ret.data
+        assert tick == 202 and sorted(data.keys()) == [2, 4]
+        assert not sub.recvLatest(timeout=0.05).ok
+    finally:
+        sub.close()
+        pub.close()
+    print('Test passed')
+
+
+def test_listener():
+    """
+    The listener must keep the latest state frame.
+    """
+    addr = 'inproc://test_statefeed_listener'
+    pub = statefeed.StatePublisher(addr)
+    objIDs, svs, aabbs = makeFrame(3)
+    assert pub.publish(0, objIDs, svs, aabbs).ok
+    listener = statefeed.StateFeedListener(addr)
+    assert listener.frame is None
+    listener.start()
+
+    try:
+        # Keep publishing until the listener has received a frame.
+        for tick in range(1, 100):
+            assert pub.publish(tick, objIDs, svs, aabbs).ok
+            time.sleep(0.01)
+            if listener.frame is not None:
+                break
+        assert listener.frame is not None
+
+        # Every new frame replaces the previous one.
+        frame = listener.frame
+        assert pub.publish(500, objIDs[:2], svs[:2], aabbs[:2]).ok
+        for ii in range(100):
+            if listener.frame[0] == 500:
+                break
+            time.sleep(0.01)
+        assert listener.frame is not frame
+        tick, out_ids, out_svs, out_aabbs = listener.frame
+        assert tick == 500 and out_ids.tolist() == [1, 2]
+        assert out_aabbs.tolist() == [0.5, 1]
+    finally:
+        pub.close()
+    print('Test passed')
+
+
+if __name__ == '__main__':
+    test_encode_decode_select()
+    test_publish_subscribe()
+    test_client_subscribe_latest()
+    test_listener()
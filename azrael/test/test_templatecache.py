@@ -0,0 +1,105 @@
+import IPython
+import numpy as np
+import azrael.parts as parts
+import azrael.templatecache as templatecache
+
+ipshell = IPython.embed
+
+
+def makeTemplate(size):
+    """
+    Return a raw and decoded template whose geometry has ``size`` bytes.
+    """
+    raw = {'geo': bytes(size)}
+    decoded = {'vert': np.zeros(size // 8, np.float64)}
+    return raw, decoded
+
+
+def test_get_put():
+    """
+    Add templates to the cache and retrieve them again.
+    """
+    cache = templatecache.TemplateCache(10000)
+    assert len(cache) == 0 and cache.nbytes == 0
+    assert cache.get(['foo']) == {}
+    assert (cache.hits, cache.misses) == (0, 1)
+
+    raw, decoded = makeTemplate(800)
+    entry = cache.put('foo', raw, decoded)
+    assert entry.raw is raw and entry.decoded is decoded
+    assert entry.size >= 1600 and cache.nbytes == entry.size
+
+    ret = cache.get(['foo', 'bar'])
+    assert list(ret.keys()) == ['foo'] and ret['foo'] is entry
+    assert (cache.hits, cache.misses) == (1, 2)
+
+    # Replacing a template must not change the total size.
+    cache.put('foo', raw, decoded)
+    assert len(cache) == 1 and cache.nbytes == entry.size
+
+    cache.clear()
+    assert len(cache) == 0 and cache.nbytes == 0
+    print('Test passed')
+
+
+def test_eviction():
+    """
+    The cache must evict the least recently used templates.
+    """
+    size = templatecache.TemplateCache(10000).put(
+        'x', *makeTemplate(800)).size
+    cache = templatecache.TemplateCache(3 * size)
+
+    for name in ('a', 'b', 'c'):
+        cache.put(name, *makeTemplate(800))
+    assert len(cache) == 3
+
+    # Use 'a', which makes 'b' the least recently used template.
+    assert 'a' in cache.get(['a'])
+    cache.put('d', *makeTemplate(800))
+    assert sorted(cache.get(['a', 'b', 'c', 'd']).keys()) == ['a', 'c', 'd']
+    assert cache.nbytes <= cache.maxBytes
+
+    # Templates larger than the cache are returned but not cached.
+    entry = cache.put('huge', *makeTemplate(4 * size))
+    assert entry.size > cache.maxBytes
+    assert len(cache) == 3 and cache.get(['huge']) == {}
+    print('Test passed')
+
+
+def test_instance_cache():
+    """
+    Add, evict, and remove object instances.
+    """
+    z = np.zeros(3)
+    b0 = parts.Booster(partID=0, pos=z, direction=[0, 0, 1], max_force=0.5)
+    b3 = parts.Booster(partID=3, pos=z, direction=[0, 0, 1], max_force=0.5)
+    f1 = parts.Factory(partID=1, pos=z, direction=[0, 0, 1],
+                       templateID='foo', exit_speed=[0.1, 0.5])
+
+    cache = templatecache.InstanceCache(2)
+    assert cache.get(1) is None
+
+    # The parts must be indexed by their partID.
+    entry = cache.put(1, 'foo', [b0, b3], [f1])
+    assert entry.templateID == 'foo'
+    assert entry.boosters == {0: b0, 3: b3} and entry.factories == {1: f1}
+    assert cache.get(1) is entry
+
+    # Adding a third object must evict the least recently used one.
+    cache.put(2, 'bar', [], [])
+    assert cache.get(1) is entry
+    cache.put(3, 'bar', [], [])
+    assert len(cache) == 2
+    assert cache.get(2) is None and cache.get(1) is entry
+
+    cache.remove(1)
+    cache.remove(10)
+    assert cache.get(1) is None and len(cache) == 1
+    print('Test passed')
+
+
+if __name__ == '__main__':
+    test_get_put()
+    test_eviction()
+    test_instance_cache()
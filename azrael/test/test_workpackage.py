@@ -0,0 +1,106 @@
+import zmq
+import IPython
+import numpy as np
+import azrael.workpackage as workpackage
+import azrael.bullet.bullet_data as bullet_data
+
+ipshell = IPython.embed
+
+
+def makeData(num):
+    """
+    Return objIDs, packed State Vectors, and forces for ``num`` objects.
+    """
+    objIDs = np.arange(1, num + 1, dtype=np.int64)
+    svs = np.array([bullet_data.pack(bullet_data.BulletData(
+        position=[_, 0, 0], imass=_)) for _ in range(1, num + 1)])
+    forces = np.arange(6 * num, dtype=np.float64).reshape(num, 6)
+    return objIDs, svs, forces
+
+
+def test_encode_decode():
+    """
+    Encode and decode Work Packages and their results.
+    """
+    objIDs, svs, forces = makeData(4)
+    pos = svs[:, bullet_data._BulletDataSlices['position']]
+    svIdx = np.array([1, 3], np.int64)
+    evict = np.array([10, 11], np.int64)
+
+    # Decoding an encoded Work Package must return the original data.
+    frames = workpackage.encodeWorkPackage(
+        5, 0.5, 10, objIDs, svIdx, svs[svIdx], pos, forces, evict)
+    ret = workpackage.decodeWorkPackage(frames)
+    assert ret.ok
+    wp = ret.data
+    assert (wp.wpid, wp.dt, wp.maxsteps) == (5, 0.5, 10)
+    assert np.array_equal(wp.objIDs, objIDs)
+    assert np.array_equal(wp.svIdx, svIdx)
+    assert np.array_equal(wp.svs, svs[svIdx])
+    assert np.array_equal(wp.pos, pos)
+    assert np.array_equal(wp.forces, forces)
+    assert np.array_equal(wp.evict, evict)
+
+    # Zero forces, no State Vectors, and nothing to evict.
+    empty = np.zeros(0, np.int64)
+    frames = workpackage.encodeWorkPackage(
+        6, 0.5, 10, objIDs, empty, svs[empty], pos, 0 * forces, empty)
+    assert len(frames[5]) == 0
+    wp = workpackage.decodeWorkPackage(frames).data
+    assert wp.forces is None
+    assert len(wp.svIdx) == len(wp.svs) == len(wp.evict) == 0
+
+    # Invalid Work Packages must be rejected.
+    assert not workpackage.decodeWorkPackage(frames[:6]).ok
+    assert not workpackage.decodeWorkPackage([b'x'] + frames[1:]).ok
+    assert not workpackage.decodeWorkPackage(
+        frames[:4] + [b'123'] + frames[5:]).ok
+
+    # Results.
+    frames = workpackage.encodeResult(5, True, 0.25, objIDs, svs)
+    ret = workpackage.decodeResult(frames)
+    assert ret.ok
+    res = ret.data
+    assert (res.wpid, res.ok, res.elapsed) == (5, True, 0.25)
+    assert np.array_equal(res.objIDs, objIDs)
+    assert np.array_equal(res.svs, svs)
+
+    frames = workpackage.encodeResult(5, False, 0.25, objIDs, svs)
+    res = workpackage.decodeResult(frames).data
+    assert res.ok is False and res.svs is None
+    assert not workpackage.decodeResult(frames[:2]).ok
+    print('Test passed')
+
+
+def test_zeromq_zero_copy():
+    """
+    Send a Work Package without copying its arrays.
+    """
+    objIDs, svs, forces = makeData(100)
+    pos = svs[:, bullet_data._BulletDataSlices['position']]
+    svIdx = np.arange(100, dtype=np.int64)
+
+    ctx = zmq.Context()
+    sock_a, sock_b = ctx.socket(zmq.PAIR), ctx.socket(zmq.PAIR)
+    try:
+        sock_a.bind('inproc://test_workpackage')
+        sock_b.connect('inproc://test_workpackage')
+
+        frames = workpackage.encodeWorkPackage(
+            1, 0.1, 1, objIDs, svIdx, svs, pos, forces, objIDs[:0])
+        sock_a.send_multipart(frames, copy=False)
+        ret = workpackage.decodeWorkPackage(
+            sock_b.recv_multipart(copy=False))
+        assert ret.ok
+        assert np.array_equal(ret.data.svs, svs)
+        assert np.array_equal(ret.data.forces, forces)
+    finally:
+        sock_a.close(linger=0)
+        sock_b.close(linger=0)
+        ctx.term()
+    print('Test passed')
+
+
+if __name__ == '__main__':
+    test_encode_decode()
+    test_zeromq_zero_copy()
@@ -228,7 +228,7 @@ def _encodeData(px: int, py: int, pz: int, strPos, val: list):
 
 
 @typecheck
-def getValues(name: str, positions: (tuple, list)):
+def getValues(name: str, positions: (tuple, list, np.ndarray)):
     """
     Return the value at ``positions`` in a tuple of NumPy arrays.
 
@@ -0,0 +1,192 @@
+# Copyright 2014, Oliver Nagy <olitheolix@gmail.com>
+#
+# This file is part of Azrael (https://github.com/olitheolix/azrael)
+#
+# Azrael is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# Azrael is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with Azrael. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Binary format of the Work Packages between Leonard and its Workers.
+
+A Work Package is a multipart message:
+
+* JSON header with 'wpid', 'dt', 'maxsteps', and the number of objects
+  ('count'),
+* objIDs as little endian int64 values,
+* indices of the objects whose State Vector is in the Work Package (the
+  Worker already has the others) as little endian int64 values,
+* their packed State Vectors (see ``bullet_data.pack``),
+* positions of all objects (N x 3),
+* forces and torques of all objects (N x 6), or an empty frame if all are
+  zero,
+* objIDs the Worker must remove from its engine.
+
+The result of a Work Package is a multipart message:
+
+* JSON header with 'wpid', 'ok', the compute time ('elapsed'), and the
+  number of objects ('count'),
+* objIDs as little endian int64 values,
+* packed State Vectors of all objects (no frame content if 'ok' is *False*).
+
+All floating point values are little endian float64 values. The encoders
+return NumPy arrays instead of bytes, which ZeroMQ can send without copying
+them (``copy=False``). The decoders return read-only arrays that share the
+memory of the frames.
+"""
+import IPython
+import numpy as np
+import azrael.util as util
+import azrael.protocol_json as json
+import azrael.bullet.bullet_data as bullet_data
+
+from collections import namedtuple
+from azrael.typecheck import typecheck
+
+ipshell = IPython.embed
+
+# Return value specification.
+RetVal = util.RetVal
+
+# Decoded Work Packages and results.
+WorkPackage = namedtuple('WorkPackage',
+                         'wpid dt maxsteps objIDs svIdx svs pos forces evict')
+WPResult = namedtuple('WPResult', 'wpid ok elapsed objIDs svs')
+
+
+def _frombuffer(frame, dtype: str, shape: tuple):
+    """
+    Return the content of ``frame`` as an array with ``shape``.
+    """
+    return np.frombuffer(memoryview(frame), dtype).reshape(shape)
+
+
+@typecheck
+def encodeWorkPackage(wpid: int, dt: (int, float), maxsteps: int,
+                      objIDs: np.ndarray, svIdx: np.ndarray,
+                      svs: np.ndarray, pos: np.ndarray, forces: np.ndarray,
+                      evict: np.ndarray):
+    """
+    Return the multipart message for a Work Package.
+
+    :param int wpid: Work Package ID.
+    :param float dt: time step.
+    :param int maxsteps: maximum number of sub-steps.
+    :param np.ndarray objIDs: N object IDs.
+    :param np.ndarray svIdx: M indices into ``objIDs``.
+    :param np.ndarray svs: M x ``bullet_data.packedSize`` array.
+    :param np.ndarray pos: N x 3 array of positions.
+    :param np.ndarray forces: N x 6 array of forces and torques.
+    :param np.ndarray evict: objIDs to remove.
+    :return: list of frames.
+    :rtype: list
+    """
+    header = {'wpid': wpid, 'dt': dt, 'maxsteps': maxsteps,
+              'count': len(objIDs)}
+    if not np.any(forces):
+        forces = b''
+    else:
+        forces = np.ascontiguousarray(forces, '<f8')
+    return [json.dumps(header).encode('utf8'),
+            np.ascontiguousarray(objIDs, '<i8'),
+            np.ascontiguousarray(svIdx, '<i8'),
+            np.ascontiguousarray(svs, '<f8'),
+            np.ascontiguousarray(pos, '<f8'),
+            forces,
+            np.ascontiguousarray(evict, '<i8')]
+
+
+@typecheck
+def decodeWorkPackage(frames: (list, tuple)):
+    """
+    Return the ``WorkPackage`` in the multipart message ``frames``.
+
+    This is the inverse of ``encodeWorkPackage``. The 'forces' field is
+    *None* if all forces and torques are zero.
+
+    :param list frames: the parts of the multipart message.
+    :return: ``WorkPackage`` instance.
+    :rtype: WorkPackage
+    """
+    if len(frames) != 7:
+        return RetVal(False, 'Invalid Work Package', None)
+
+    try:
+        header = json.loads(bytes(frames[0]).decode('utf8'))
+        N = header['count']
+        objIDs = _frombuffer(frames[1], '<i8', (N,))
+        svIdx = _frombuffer(frames[2], '<i8', (-1,))
+        svs = _frombuffer(frames[3], '<f8', (-1, bullet_data.packedSize))
+        pos = _frombuffer(frames[4], '<f8', (N, 3))
+        forces = _frombuffer(frames[5], '<f8', (-1, 6))
+        evict = _frombuffer(frames[6], '<i8', (-1,))
+        wp = WorkPackage(header['wpid'], header['dt'], header['maxsteps'],
+                         objIDs, svIdx, svs, pos, forces, evict)
+    except (ValueError, KeyError, TypeError):
+        return RetVal(False, 'Invalid Work Package', None)
+
+    if len(svIdx) != len(svs) or len(forces) not in (0, N):
+        return RetVal(False, 'Invalid Work Package', None)
+    if len(forces) == 0:
+        wp = wp._replace(forces=None)
+    return RetVal(True, None, wp)
+
+
+@typecheck
+def encodeResult(wpid: int, ok: bool, elapsed: (int, float),
+                 objIDs: np.ndarray, svs: np.ndarray):
+    """
+    Return the multipart message for the result of a Work Package.
+
+    :param int wpid: Work Package ID.
+    :param bool ok: *False* if the Worker could not process the Work Package.
+    :param float elapsed: compute time in seconds.
+    :param np.ndarray objIDs: N object IDs.
+    :param np.ndarray svs: N x ``bullet_data.packedSize`` array (ignored
+        unless ``ok`` is *True*).
+    :return: list of frames.
+    :rtype: list
+    """
+    header = {'wpid': wpid, 'ok': ok, 'elapsed': elapsed,
+              'count': len(objIDs)}
+    svs = np.ascontiguousarray(svs, '<f8') if ok else b''
+    return [json.dumps(header).encode('utf8'),
+            np.ascontiguousarray(objIDs, '<i8'), svs]
+
+
+@typecheck
+def decodeResult(frames: (list, tuple)):
+    """
+    Return the ``WPResult`` in the multipart message ``frames``.
+
+    This is the inverse of ``encodeResult``. The 'svs' field is *None* if
+    'ok' is *False*.
+
+    :param list frames: the parts of the multipart message.
+    :return: ``WPResult`` instance.
+    :rtype: WPResult
+    """
+    if len(frames) != 3:
+        return RetVal(False, 'Invalid Work Package result', None)
+
+    try:
+        header = json.loads(bytes(frames[0]).decode('utf8'))
+        N, ok = header['count'], header['ok']
+        objIDs = _frombuffer(frames[1], '<i8', (N,))
+        if ok:
+            svs = _frombuffer(frames[2], '<f8', (N, bullet_data.packedSize))
+        else:
+            svs = None
+        res = WPResult(header['wpid'], ok, header['elapsed'], objIDs, svs)
+    except (ValueError, KeyError, TypeError):
+        return RetVal(False, 'Invalid Work Package result', None)
+    return RetVal(True, None, res)
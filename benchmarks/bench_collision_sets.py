@@ -0,0 +1,219 @@
+#!/usr/bin/python3
+
+# Copyright 2014, Oliver Nagy <olitheolix@gmail.com>
+#
+# This file is part of Azrael (https://github.com/olitheolix/azrael)
+#
+# Azrael is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# Azrael is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with Azrael. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Benchmark the collision set computation.
+
+Compare the original (per object) Sweeping implementation with the NumPy
+engine in ``leonard.computeCollisionSetsVectorised`` for different numbers of
+objects.
+
+The second table compares the two collision set strategies (Sweep-and-Prune
+and the uniform grid) in terms of run time and number of sets. Smaller sets
+mean less work for the physics engines.
+
+The objects are distributed uniformly inside a cube whose size grows with the
+number of objects to keep the density constant. The optional ground object
+is a large AABB below all other objects that touches the bottom layer.
+"""
+
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+
+# Augment the Python path so that we can include the main project.
+p = os.path.dirname(os.path.abspath(__file__))
+p = os.path.join(p, '..')
+sys.path.insert(0, p)
+del p
+
+import azrael.leonard as leonard
+
+
+def parseCommandLine():
+    """
+    Parse program arguments.
+    """
+    # Create the parser.
+    parser = argparse.ArgumentParser(
+        description=('Benchmark the collision set computation'),
+        formatter_class=argparse.RawTextHelpFormatter)
+
+    # Shorthand.
+    padd = parser.add_argument
+
+    # Add the command line options.
+    padd('--sizes', metavar='N1,N2,...', type=str,
+         default='1000,10000,100000',
+         help='Number of objects for each benchmark run')
+    padd('--repeat', metavar='N', type=int, default=3,
+         help='Number of repetitions (the fastest one counts)')
+    padd('--density', metavar='D', type=float, default=0.001,
+         help='Number of objects per unit volume')
+    padd('--ground', action='store_true', default=False,
+         help='Add a large ground object to the broadphase comparison')
+
+    # Run the parser.
+    param = parser.parse_args()
+    try:
+        param.sizes = [int(_) for _ in param.sizes.split(',')]
+        assert min(param.sizes) > 0
+        assert param.repeat > 0
+        assert param.density > 0
+    except (TypeError, ValueError, AssertionError):
+        print('Invalid arguments')
+        sys.exit(1)
+    return param
+
+
+def computeCollisionSetsLegacy(objIDs, pos, aabbs):
+    """
+    Return the collision sets with the original Sweeping implementation.
+
+    This is a verbatim copy of the original ``computeCollisionSetsAABB``
+    except that it takes the same packed arrays as the NumPy engine.
+    """
+    # The 'sweeping' function requires a list of dictionaries. Each dictionary
+    # must contain the min/max spatial extent in x/y/z direction.
+    data = []
+    for (x, y, z), aabb in zip(pos.tolist(), aabbs.tolist()):
+        data.append({'x': [x - aabb, x + aabb],
+                     'y': [y - aabb, y + aabb],
+                     'z': [z - aabb, z + aabb]})
+
+    # Enumerate the objects.
+    labels = np.arange(len(objIDs))
+
+    # Determine the overlapping objects in 'x' direction.
+    stage_0 = leonard.sweeping(data, labels, 'x').data
+
+    # Determine which of the objects that overlap in 'x' also overlap in 'y'.
+    stage_1 = []
+    for subset in stage_0:
+        tmpData = [data[_] for _ in subset]
+        tmpLabels = np.array(tuple(subset), np.int64)
+        stage_1.extend(leonard.sweeping(tmpData, tmpLabels, 'y').data)
+
+    # Now determine the objects that overlap in all three dimensions.
+    stage_2 = []
+    for subset in stage_1:
+        tmpData = [data[_] for _ in subset]
+        tmpLabels = np.array(tuple(subset), np.int64)
+        stage_2.extend(leonard.sweeping(tmpData, tmpLabels, 'z').data)
+
+    # Convert the labels back to object IDs.
+    return [[objIDs[_] for _ in subset] for subset in stage_2]
+
+
+def createScene(numObjects, density):
+    """
+    Return object IDs, positions, and AABBs for ``numObjects`` random objects.
+    """
+    # Side length of the cube that contains all objects.
+    size = (numObjects / density) ** (1 / 3)
+
+    objIDs = list(range(1, numObjects + 1))
+    pos = size * np.random.rand(numObjects, 3)
+    aabbs = 0.5 + 0.5 * np.random.rand(numObjects)
+    return objIDs, pos, aabbs
+
+
+def addGround(objIDs, pos, aabbs):
+    """
+    Return the scene with an additional large object below all others.
+    """
+    size = np.max(pos)
+    objIDs = [0] + objIDs
+    pos = np.vstack(([size / 2, size / 2, -size / 2 + 1], pos))
+    aabbs = np.concatenate(([size / 2], aabbs))
+    return objIDs, pos, aabbs
+
+
+def computeWithStrategy(name, objIDs, pos, aabbs):
+    """
+    Return the collision sets computed by the strategy ``name``.
+
+    This includes the time to insert all objects.
+    """
+    broadphase = leonard.collisionSetStrategies[name]()
+    assert broadphase.insert(objIDs, pos, aabbs).ok
+    ret = broadphase.computeCollisionSets()
+    assert ret.ok
+    return ret.data
+
+
+def timeit(func, repeat, *args):
+    """
+    Return the fastest run time of ``func(*args)`` and its last output.
+    """
+    etime = []
+    for ii in range(repeat):
+        t0 = time.time()
+        out = func(*args)
+        etime.append(time.time() - t0)
+    return min(etime), out
+
+
+def main():
+    param = parseCommandLine()
+
+    print('{:>8} | {:>8} | {:>10} | {:>10} | {:>7}'.format(
+        '#Objects', '#Sets', 'Legacy', 'NumPy', 'Speedup'))
+    for numObjects in param.sizes:
+        objIDs, pos, aabbs = createScene(numObjects, param.density)
+
+        # Time both implementations.
+        t_leg, sets_leg = timeit(computeCollisionSetsLegacy, param.repeat,
+                                 objIDs, pos, aabbs)
+        t_vec, ret = timeit(leonard.computeCollisionSetsVectorised,
+                            param.repeat, objIDs, pos, aabbs)
+        assert ret.ok
+        sets_vec = ret.data
+
+        # Both implementations must find the same sets.
+        sets_leg = sorted([sorted(_) for _ in sets_leg])
+        sets_vec = sorted([sorted(_) for _ in sets_vec])
+        assert sets_leg == sets_vec
+
+        print('{:8,} | {:8,} | {:8.1f}ms | {:8.1f}ms | {:6.1f}x'.format(
+            numObjects, len(sets_vec), 1000 * t_leg, 1000 * t_vec,
+            t_leg / t_vec))
+
+    # Compare the collision set strategies.
+    print('\n{:>8} | {:>10} | {:>10} | {:>10} | {:>10}'.format(
+        '#Objects', 'Sweeping', '#Sets', 'Grid', '#Sets'))
+    for numObjects in param.sizes:
+        objIDs, pos, aabbs = createScene(numObjects, param.density)
+        if param.ground:
+            objIDs, pos, aabbs = addGround(objIDs, pos, aabbs)
+
+        out = []
+        for name in ('sweeping', 'grid'):
+            etime, sets = timeit(computeWithStrategy, param.repeat,
+                                 name, objIDs, pos, aabbs)
+            out.extend([1000 * etime, len(sets)])
+        print('{:8,} | {:8.1f}ms | {:10,} | {:8.1f}ms | {:10,}'.format(
+            numObjects, *out))
+
+
+if __name__ == '__main__':
+    main()
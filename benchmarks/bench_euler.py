@@ -0,0 +1,144 @@
+#!/usr/bin/python3
+
+# Copyright 2014, Oliver Nagy <olitheolix@gmail.com>
+#
+# This file is part of Azrael (https://github.com/olitheolix/azrael)
+#
+# Azrael is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# Azrael is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with Azrael. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Benchmark the vectorised Euler step of ``LeonardBase`` against the
+per-object reference loop from the Leonard tests.
+
+Only the integrator itself is timed. The grid force queries are replaced with
+zero forces because they are database bound and identical for both
+integrators. Neither Leonard needs a running database for this benchmark.
+"""
+
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+
+# Augment the Python path so that we can include the main project.
+p = os.path.dirname(os.path.abspath(__file__))
+p = os.path.join(p, '..')
+sys.path.insert(0, p)
+del p
+
+import azrael.leonard as leonard
+import azrael.database as database
+import azrael.bullet.bullet_data as bullet_data
+
+from azrael.test.test_leonard import eulerStepLoop
+
+
+def parseCommandLine():
+    """
+    Parse program arguments.
+    """
+    # Create the parser.
+    parser = argparse.ArgumentParser(
+        description=('Benchmark the Euler step of Leonard'),
+        formatter_class=argparse.RawTextHelpFormatter)
+
+    # Shorthand.
+    padd = parser.add_argument
+
+    # Add the command line options.
+    padd('--sizes', metavar='N1,N2,...', type=str,
+         default='1000,10000,100000',
+         help='Number of objects for each benchmark run')
+    padd('--repeat', metavar='N', type=int, default=3,
+         help='Number of repetitions (the fastest one counts)')
+
+    # Run the parser.
+    param = parser.parse_args()
+    try:
+        param.sizes = [int(_) for _ in param.sizes.split(',')]
+        assert min(param.sizes) > 0
+        assert param.repeat > 0
+    except (TypeError, ValueError, AssertionError):
+        print('Invalid arguments')
+        sys.exit(1)
+    return param
+
+
+class LeonardNoGrid(leonard.LeonardBase):
+    """
+    ``LeonardBase`` without grid forces.
+    """
+    def getGridForces(self, idPos: dict):
+        z = np.zeros(3, np.float64)
+        return leonard.RetVal(True, None, {_: z for _ in idPos})
+
+    def getGridForcesArray(self, positions: np.ndarray):
+        return np.zeros((len(positions), 3), np.float64)
+
+
+def createLeonard(cls, numObjects):
+    """
+    Return a ``cls`` instance with ``numObjects`` random objects.
+    """
+    np.random.seed(1)
+    leo = cls()
+    for objID in range(1, numObjects + 1):
+        sv = bullet_data.BulletData(position=np.random.rand(3),
+                                    velocityLin=np.random.rand(3))
+        leo.objects.add(objID, sv, 1)
+        leo.allForces[objID] = np.random.rand(3)
+    return leo
+
+
+def timeit(eulerStep, repeat):
+    """
+    Return the fastest run time of ``eulerStep``.
+    """
+    etime = []
+    for ii in range(repeat):
+        t0 = time.time()
+        eulerStep(0.1)
+        etime.append(time.time() - t0)
+    return min(etime)
+
+
+def main():
+    param = parseCommandLine()
+
+    # Leonard requires the database handles but this benchmark never uses
+    # them.
+    database.init()
+
+    print('{:>8} | {:>10} | {:>10} | {:>7}'.format(
+        '#Objects', 'Loop', 'Vectorised', 'Speedup'))
+    for numObjects in param.sizes:
+        leo_loop = createLeonard(LeonardNoGrid, numObjects)
+        leo_vec = createLeonard(LeonardNoGrid, numObjects)
+
+        t_loop = timeit(lambda dt: eulerStepLoop(leo_loop, dt), param.repeat)
+        t_vec = timeit(leo_vec.eulerStep, param.repeat)
+
+        # Both must arrive at the same positions.
+        pos_loop = leo_loop.objects.column('position')
+        pos_vec = leo_vec.objects.column('position')
+        assert np.allclose(pos_loop, pos_vec)
+
+        print('{:8,} | {:8.1f}ms | {:8.2f}ms | {:6.0f}x'.format(
+            numObjects, 1000 * t_loop, 1000 * t_vec, t_loop / t_vec))
+
+
+if __name__ == '__main__':
+    main()
@@ -352,17 +352,14 @@ class ViewerWidget(QtOpenGL.QGLWidget):
         return (cs_old != cs_new)
 
     def loadGeometry(self):
-        # Retrieve the state variables of all objects.
-        self.oldSVs = self.newSVs
+        # Fetch the newest state frame from Leonard. Nothing has changed if
+        # there is none.
         with util.Timeit('viewer.getSV') as timeit:
-            ret = self.client.getAllStateVariables()
+            ret = self.subscriber.recvLatest(timeout=0)
         if not ret.ok:
-            print('Could not retrieve the state variables -- Abort')
-            self.close()
-
-        # Prune the list to remove all those objects for which the State
-        # Vector is None.
-        self.newSVs = {k: v for k, v in ret.data.items() if v is not None}
+            return
+        self.oldSVs = self.newSVs
+        self.newSVs = ret.data[1]
 
         # Delete those local objects that have been removed in Azrael.
         for objID in self.oldSVs:
@@ -539,6 +536,10 @@ class ViewerWidget(QtOpenGL.QGLWidget):
         # Connect to Azrael.
         self.client = azrael.client.Client(addr_clerk=self.addr_server)
 
+        # Subscribe to the State Variables of all objects instead of polling
+        # Clerk for them.
+        self.subscriber = self.client.subscribe()
+
         print('Client connected')
 
         # Define a template for projectiles.